@@ -0,0 +1,399 @@
+"""Completion history and the time series behind ``/api/analytics``.
+
+``date_time_created`` and ``date_time_completed`` are ISO strings with a
+UTC offset, which neither compare correctly across offsets nor bucket
+without parsing.  Migration 12 gives ``objectives``, ``tasks`` and their
+archive tables ``created_epoch`` and ``completed_epoch`` (Unix seconds),
+kept in step with the strings by triggers, and an append-only
+``lifecycle_events`` table fed by triggers on every writer:
+
+- ``created`` and ``completed`` when a row is inserted, at the row's own
+  times, unless its earlier events already say so (undo, restores);
+- ``completed`` and ``reopened`` when ``status`` enters or leaves
+  ``complete``;
+- ``deleted``, and ``restored`` when undo brings the row back;
+- ``moved_out`` and ``moved_in`` when a row, or a task through its
+  objective, changes area.
+
+Every event carries the area it counts against and the row's status, so
+each type's effect on the number of open (not complete) rows is known and
+the backlog of any bucket is a running sum.  Archiving is not an event: an
+archived row stays complete.
+
+:class:`AnalyticsCache` groups the events into day or week buckets of
+local time (``ANALYTICS_UTC_OFFSET`` minutes from UTC) with one
+``GROUP BY`` over the ``(entity, at)`` index.  Buckets that ended are
+kept and never queried again; only the current one is read per request.
+An event landing in an ended bucket, e.g. an import of old rows, drops
+the cached buckets from that one on.
+"""
+import time
+import os
+import threading
+from datetime import date, timedelta
+
+try:
+    from .cache import data_version
+except ImportError:  # pragma: no cover - executed only when run as script
+    from cache import data_version
+
+# minutes east of UTC of the day boundaries (default: Pacific standard time)
+ANALYTICS_UTC_OFFSET = int(os.environ.get('ANALYTICS_UTC_OFFSET', -480))
+# most buckets one response may span
+ANALYTICS_MAX_BUCKETS = int(os.environ.get('ANALYTICS_MAX_BUCKETS', 366))
+
+ANALYTICS_ENTITIES = ('objectives', 'tasks')
+EPOCH_COLUMNS = ('created_epoch', 'completed_epoch')
+EVENT_TYPES = ('created', 'completed', 'reopened', 'deleted', 'restored', 'moved_out', 'moved_in')
+# days per bucket, and days from the epoch (a Thursday) to the first bucket start
+UNITS = {'day': (1, 0), 'week': (7, -3)}
+# buckets shown when the request gives no ``since``
+DEFAULT_BUCKETS = {'day': 30, 'week': 12}
+
+# Unix seconds of an ISO time string; NULL when it does not parse
+EPOCH = "CAST(strftime('%s', {}) AS INTEGER)"
+NOW = EPOCH.format("'now'")
+# the area a task counts against: its own, else its objective's
+TASK_AREA = 'IFNULL({row}.area_key, (SELECT area_key FROM objectives WHERE key = {row}.objective_key))'
+
+
+def epoch_triggers():
+    """Triggers deriving the epoch columns from the time strings."""
+    triggers = []
+    for table in ANALYTICS_ENTITIES:
+        update = (f"UPDATE {table} SET created_epoch = {EPOCH.format('NEW.date_time_created')}, "
+                  f"completed_epoch = {EPOCH.format('NEW.date_time_completed')} WHERE key = NEW.key;")
+        triggers += [
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_insert_epoch AFTER INSERT ON {table}
+            BEGIN
+                {update}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_update_epoch
+            AFTER UPDATE OF date_time_created, date_time_completed ON {table}
+            WHEN NEW.date_time_created IS NOT OLD.date_time_created
+                OR NEW.date_time_completed IS NOT OLD.date_time_completed
+            BEGIN
+                {update}
+            END
+            ''',
+        ]
+    return triggers
+
+
+def backfill_epochs(conn):
+    """Fill the epoch columns of rows written before migration 12."""
+    for table in (*ANALYTICS_ENTITIES, 'archived_objectives', 'archived_tasks'):
+        conn.execute(
+            f"UPDATE {table} SET created_epoch = {EPOCH.format('date_time_created')}, "
+            f"completed_epoch = {EPOCH.format('date_time_completed')}"
+        )
+
+
+def _last(table, row, column, types=None):
+    """``column`` of the newest event of ``row``'s key, optionally among ``types``."""
+    where = f" AND type IN ({', '.join(repr(t) for t in types)})" if types else ''
+    return (f"(SELECT {column} FROM lifecycle_events WHERE entity = '{table}' AND key = {row}.key{where} "
+            f"ORDER BY id DESC LIMIT 1)")
+
+
+def _event(table, row, kind, at, area):
+    return (f"INSERT INTO lifecycle_events (entity, key, area_key, type, status, at, created) "
+            f"SELECT '{table}', {row}.key, {area}, '{kind}', {row}.status, {at}, "
+            f"IFNULL({EPOCH.format(f'{row}.date_time_created')}, {NOW})")
+
+
+def lifecycle_triggers():
+    """Triggers appending ``lifecycle_events`` for objectives and tasks."""
+    triggers = []
+    for table in ANALYTICS_ENTITIES:
+        area = TASK_AREA if table == 'tasks' else '{row}.area_key'
+        created = f"IFNULL({EPOCH.format('NEW.date_time_created')}, {NOW})"
+        completed = f"IFNULL({EPOCH.format('NEW.date_time_completed')}, {created})"
+        # the area the row's earlier events counted it against
+        counted = _last(table, 'OLD', 'area_key')
+        archived = f"EXISTS (SELECT 1 FROM archived_{table} WHERE key = OLD.key)"
+        triggers += [
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_insert_lifecycle AFTER INSERT ON {table}
+            BEGIN
+                {_event(table, 'NEW', 'restored', NOW, area.format(row='NEW'))}
+                WHERE {_last(table, 'NEW', 'type', ('deleted', 'restored'))} = 'deleted';
+                {_event(table, 'NEW', 'created', created, area.format(row='NEW'))}
+                WHERE NOT EXISTS (SELECT 1 FROM lifecycle_events
+                                  WHERE entity = '{table}' AND key = NEW.key AND type = 'created');
+                {_event(table, 'NEW', 'completed', completed, area.format(row='NEW'))}
+                WHERE NEW.status IS 'complete'
+                    AND {_last(table, 'NEW', 'type', ('completed', 'reopened'))} IS NOT 'completed';
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_status_lifecycle AFTER UPDATE OF status ON {table}
+            WHEN (NEW.status IS 'complete') != (OLD.status IS 'complete')
+            BEGIN
+                {_event(table, 'NEW', 'completed', NOW, counted)} WHERE NEW.status IS 'complete';
+                {_event(table, 'NEW', 'reopened', NOW, counted)} WHERE OLD.status IS 'complete';
+            END
+            ''',
+            # archiving moves the row out first; it stays complete
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_delete_lifecycle AFTER DELETE ON {table}
+            WHEN NOT {archived}
+            BEGIN
+                {_event(table, 'OLD', 'deleted', NOW, counted)};
+            END
+            ''',
+        ]
+    moves = {
+        'tasks': ('AFTER UPDATE OF area_key, objective_key ON tasks', 'NEW', TASK_AREA.format(row='NEW')),
+        'objectives': ('AFTER UPDATE OF area_key ON objectives', 'NEW', 'NEW.area_key'),
+    }
+    for table, (event, row, area) in moves.items():
+        counted = _last(table, 'OLD', 'area_key')
+        tasks = ''
+        if table == 'objectives':
+            # its tasks move along with it
+            task_counted = _last('tasks', 't', 'area_key')
+            tasks = f'''
+                {_event('tasks', 't', 'moved_out', NOW, task_counted)} FROM tasks t WHERE t.objective_key = NEW.key;
+                {_event('tasks', 't', 'moved_in', NOW, 'NEW.area_key')} FROM tasks t WHERE t.objective_key = NEW.key;
+            '''
+        triggers.append(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_move_lifecycle {event}
+            WHEN {area} IS NOT {counted}
+            BEGIN
+                {_event(table, 'OLD', 'moved_out', NOW, counted)};
+                {_event(table, row, 'moved_in', NOW, area)};
+                {tasks}
+            END
+        ''')
+    return triggers
+
+
+def backfill_lifecycle(conn):
+    """Record the creation and completion of rows written before migration 12.
+
+    Archived rows are included; their tasks count against the area of
+    their objective, archived or not.
+    """
+    for table, source in ((t, s) for t in ANALYTICS_ENTITIES for s in (t, f'archived_{t}')):
+        if table == 'tasks':
+            area = ('IFNULL(r.area_key, (SELECT area_key FROM objectives WHERE key = r.objective_key UNION ALL '
+                    'SELECT area_key FROM archived_objectives WHERE key = r.objective_key LIMIT 1))')
+        else:
+            area = 'r.area_key'
+        created = f'IFNULL(r.created_epoch, {NOW})'
+        for kind, at, where in (('created', created, ''),
+                                ('completed', f'IFNULL(r.completed_epoch, {created})', "WHERE r.status IS 'complete'")):
+            conn.execute(
+                f"INSERT INTO lifecycle_events (entity, key, area_key, type, status, at, created) "
+                f"SELECT '{table}', r.key, {area}, '{kind}', r.status, {at}, {created} "
+                f"FROM {source} r {where} ORDER BY {at}"
+            )
+
+
+def open_delta(kind, events, open_events):
+    """Change in the number of open rows from ``events`` of ``kind``.
+
+    ``open_events`` is how many of them left the row not complete.
+    """
+    if kind == 'created' or kind == 'reopened':
+        return events
+    if kind == 'completed':
+        return -events
+    if kind in ('restored', 'moved_in'):
+        return open_events
+    return -open_events
+
+
+def local_day(day):
+    """Days from 1970-01-01 to ``day``."""
+    return (day - date(1970, 1, 1)).days
+
+
+def bucket_of(unit, day):
+    """Bucket holding local day number ``day``."""
+    days, first = UNITS[unit]
+    return (day - first) // days
+
+
+def bucket_start(unit, bucket):
+    """First day of ``bucket``, as a date."""
+    days, first = UNITS[unit]
+    return date(1970, 1, 1) + timedelta(days=bucket * days + first)
+
+
+def _empty():
+    return {**dict.fromkeys(EVENT_TYPES, 0), 'open_delta': 0, 'cycle_count': 0, 'cycle_seconds': 0, 'cycle_max': 0}
+
+
+class AnalyticsCache:
+    """One worker's cache of closed analytics buckets.
+
+    Parameters
+    ----------
+    utc_offset : int
+        Minutes east of UTC at which local days start.
+    """
+
+    def __init__(self, utc_offset=ANALYTICS_UTC_OFFSET):
+        self.offset = utc_offset * 60
+        self._lock = threading.Lock()
+        self._buckets = {}   # (entity, unit) -> bucket -> area -> counts
+        self._closed = {}    # (entity, unit) -> first bucket not cached
+        self._seen = None    # (instance_id, newest event id) the cache reflects
+        self.buckets_computed = 0
+        self.queries = 0
+
+    def today(self, now=None):
+        """Local day number of ``now`` (Unix seconds, default the current time)."""
+        return (int(time.time() if now is None else now) + self.offset) // 86400
+
+    def _group(self, conn, entity, unit, start_day, end_day=None):
+        """Aggregate the events from local day ``start_day`` up to ``end_day``."""
+        days, first = UNITS[unit]
+        where, params = 'entity = ? AND at >= ?', [entity, start_day * 86400 - self.offset]
+        if end_day is not None:
+            where += ' AND at < ?'
+            params.append(end_day * 86400 - self.offset)
+        self.queries += 1
+        rows = conn.execute(
+            f"SELECT ((at + ?) / 86400 - ?) / ? AS bucket, IFNULL(area_key, '') AS area, type, COUNT(*), "
+            f"SUM(status IS NOT 'complete'), SUM(at - created), MAX(at - created) "
+            f"FROM lifecycle_events WHERE {where} GROUP BY bucket, area, type",
+            [self.offset, first, days, *params],
+        )
+        buckets = {}
+        for bucket, area, kind, events, open_events, cycle_seconds, cycle_max in rows:
+            counts = buckets.setdefault(bucket, {}).setdefault(area, _empty())
+            counts[kind] += events
+            counts['open_delta'] += open_delta(kind, events, open_events)
+            if kind == 'completed':
+                counts['cycle_count'] += events
+                counts['cycle_seconds'] += cycle_seconds
+                counts['cycle_max'] = max(counts['cycle_max'], cycle_max)
+        return buckets
+
+    def _invalidate(self, conn):
+        """Drop cached buckets that events written since the last call fall in."""
+        instance = data_version(conn)[0]
+        last = self._seen[1] if self._seen and self._seen[0] == instance else None
+        if last is None:
+            # first call, or another database (restored, or replaced)
+            self._buckets.clear()
+            self._closed.clear()
+            newest = conn.execute('SELECT MAX(id) FROM lifecycle_events').fetchone()[0]
+        else:
+            earliest, newest = conn.execute(
+                'SELECT MIN(at), MAX(id) FROM lifecycle_events WHERE id > ?', (last,)
+            ).fetchone()
+            if earliest is not None:
+                day = (earliest + self.offset) // 86400
+                for (entity, unit), closed in list(self._closed.items()):
+                    bucket = bucket_of(unit, day)
+                    if bucket < closed:
+                        self._closed[(entity, unit)] = bucket
+                        cached = self._buckets[(entity, unit)]
+                        for stale in [b for b in cached if b >= bucket]:
+                            del cached[stale]
+        self._seen = (instance, newest if newest is not None else last or 0)
+
+    def series(self, conn, entity, unit, now=None):
+        """Counts per bucket and area of ``entity``, from its first event on.
+
+        Returns
+        -------
+        dict
+            ``{bucket: {area_key: counts}}`` with ``counts`` holding the
+            number of events of each type, ``open_delta`` and the
+            ``cycle_count``/``cycle_seconds``/``cycle_max`` of the
+            completions.  The current bucket (and any after it) is read
+            afresh; the earlier ones come from the cache.
+        """
+        current = bucket_of(unit, self.today(now))
+        with self._lock:
+            began = not conn.in_transaction
+            if began:
+                # the watermark and the buckets from one snapshot
+                conn.execute('BEGIN')
+            try:
+                self._invalidate(conn)
+                key = (entity, unit)
+                cached = self._buckets.setdefault(key, {})
+                closed = self._closed.get(key)
+                if closed is None:
+                    first = conn.execute(
+                        'SELECT MIN(at) FROM lifecycle_events WHERE entity = ?', (entity,)
+                    ).fetchone()[0]
+                    closed = current if first is None else min(bucket_of(unit, (first + self.offset) // 86400),
+                                                                current)
+                if closed < current:
+                    days, offset = UNITS[unit]
+                    cached.update(self._group(
+                        conn, entity, unit, closed * days + offset, current * days + offset))
+                    self.buckets_computed += current - closed
+                self._closed[key] = current
+                days, offset = UNITS[unit]
+                recent = self._group(conn, entity, unit, current * days + offset)
+            finally:
+                if began:
+                    conn.rollback()
+            return {**cached, **recent}
+
+    def stats(self):
+        return {
+            'buckets_cached': sum(len(b) for b in self._buckets.values()),
+            'buckets_computed': self.buckets_computed,
+            'queries': self.queries,
+        }
+
+
+def _summary(counts):
+    result = {kind: counts[kind] for kind in EVENT_TYPES}
+    result['cycle_time'] = {
+        'count': counts['cycle_count'],
+        'mean_hours': round(counts['cycle_seconds'] / counts['cycle_count'] / 3600, 2)
+        if counts['cycle_count'] else None,
+        'max_hours': round(counts['cycle_max'] / 3600, 2) if counts['cycle_count'] else None,
+    }
+    return result
+
+
+def _add(total, counts):
+    for name, value in counts.items():
+        total[name] = max(total[name], value) if name == 'cycle_max' else total[name] + value
+
+
+def build_report(series, unit, first, last, area_key=None):
+    """API form of ``series`` for the buckets ``first`` to ``last``.
+
+    Each bucket has the event counts, the completions' cycle time and the
+    number of rows ``open`` at its end, in total and per area.  Without
+    ``area_key`` every area is reported; with it only that one.
+    """
+    # backlogs are running sums from the first bucket on
+    backlog = {}
+    for bucket in (b for b in series if b < first):
+        for area, counts in series[bucket].items():
+            if area_key in (None, area):
+                backlog[area] = backlog.get(area, 0) + counts['open_delta']
+    buckets, total = [], _empty()
+    for bucket in range(first, last + 1):
+        areas = {area: counts for area, counts in series.get(bucket, {}).items() if area_key in (None, area)}
+        merged = _empty()
+        for area, counts in areas.items():
+            _add(merged, counts)
+            backlog[area] = backlog.get(area, 0) + counts['open_delta']
+        _add(total, merged)
+        buckets.append({
+            'start': bucket_start(unit, bucket).isoformat(),
+            **_summary(merged),
+            'open': sum(backlog.values()),
+            'areas': {
+                area: {**_summary(areas.get(area, _empty())), 'open': backlog[area]}
+                for area in sorted(backlog) if area in areas or backlog[area]
+            },
+        })
+    return {'buckets': buckets, 'total': _summary(total)}
@@ -1,59 +1,253 @@
-"""Flask application entry point."""
+"""Flask application entry point.
+
+:func:`create_app` builds the application.  ``app`` (``app:app`` for
+gunicorn) is created from it on first access, so importing the module is
+cheap; with gunicorn's ``preload_app`` the master builds it, schema setup
+included, once before forking the workers.
+"""
 import os
+import time
+# the start of the boot, for the boot-to-first-response time
+BOOT_STARTED = time.perf_counter()
 import logging
 logging.basicConfig(level=logging.INFO)
-from flask import Flask, jsonify
+from flask import Flask, current_app, jsonify
 from flask_cors import CORS
 
 try:
-    from .database import get_db, init_db, log_action_for_undo, get_pacific_time
-    from .utils import parse_json, shift_tasks_after_delete
-    from .routes import areas, objectives, tasks, undo
+    from .database import (
+        DB_PATH, TENANT_DIR, TENANT_HEADER, get_db, get_writer, get_router, writer_run, current_shard,
+        select_tenant, close_db, pool_stats, init_db, prepare_db, connect, get_pacific_time,
+    )
+    from .history import log_action_for_undo, UndoBuffer, HistoryPruner, history_stats, prune_history
+    from .ordering import make_ordering
+    from .cache import ResponseCache, serve_cached, store_response
+    from .events import ChangeFeed, prune_changes
+    from .readmodel import ReadModel, READ_MODEL
+    from .sync import prune_tombstones
+    from .metrics import METRICS, Registry, start_timer, record_response, record_exception
+    from .tracing import QUERY_TRACE, QueryTracer, finish_request
+    from .backup import BackupScheduler
+    from .archive import Archiver
+    from .progress import PROGRESS_CHECK_INTERVAL, check_progress
+    from .analytics import AnalyticsCache
+    from .utils import (
+        parse_json, parse_list_args, query_page, completion_filters, list_response,
+        shift_tasks_after_delete, insert_row,
+    )
+    from .routes import (
+        areas, objectives, tasks, tree, undo, batch, events, changes, search, metrics, transfer, backup, archive,
+        stats, analytics, tenants,
+    )
 except ImportError:  # pragma: no cover - executed only when run as script
-    from database import get_db, init_db, log_action_for_undo, get_pacific_time
-    from utils import parse_json, shift_tasks_after_delete
-    from routes import areas, objectives, tasks, undo
-
-app = Flask(__name__)
-
-app.config['CORS_HEADERS'] = 'Content-Type'
-CORS(
-    app,
-    resources={r"/api/*": {
-        "origins": [
-            "http://localhost:5173",
-            "https://bigpicture-frontend-ancient-night-2172.fly.dev",
-            "https://foo.boulos.ca",
-        ],
-        "methods": ["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
-        "allow_headers": ["Content-Type"],
-        "supports_credentials": True,
-        "expose_headers": ["Access-Control-Allow-Origin"],
-    }},
-    supports_credentials=True,
+    from database import (
+        DB_PATH, TENANT_DIR, TENANT_HEADER, get_db, get_writer, get_router, writer_run, current_shard,
+        select_tenant, close_db, pool_stats, init_db, prepare_db, connect, get_pacific_time,
+    )
+    from history import log_action_for_undo, UndoBuffer, HistoryPruner, history_stats, prune_history
+    from ordering import make_ordering
+    from cache import ResponseCache, serve_cached, store_response
+    from events import ChangeFeed, prune_changes
+    from readmodel import ReadModel, READ_MODEL
+    from sync import prune_tombstones
+    from metrics import METRICS, Registry, start_timer, record_response, record_exception
+    from tracing import QUERY_TRACE, QueryTracer, finish_request
+    from backup import BackupScheduler
+    from archive import Archiver
+    from progress import PROGRESS_CHECK_INTERVAL, check_progress
+    from analytics import AnalyticsCache
+    from utils import (
+        parse_json, parse_list_args, query_page, completion_filters, list_response,
+        shift_tasks_after_delete, insert_row,
+    )
+    from routes import (
+        areas, objectives, tasks, tree, undo, batch, events, changes, search, metrics, transfer, backup, archive,
+        stats, analytics, tenants,
+    )
+
+CORS_ORIGINS = [
+    "http://localhost:5173",
+    "https://bigpicture-frontend-ancient-night-2172.fly.dev",
+    "https://foo.boulos.ca",
+]
+
+BLUEPRINTS = (
+    areas, objectives, tasks, tree, batch, undo, events, changes, search, metrics, transfer, backup, archive,
+    stats, analytics, tenants,
 )
 
-with app.app_context():
-    init_db()
+
+def current_change_feed():
+    """The change feed of the request's database: the tenant's own, if any."""
+    shard = current_shard()
+    if shard is None:
+        return current_app.change_feed
+    return shard.attach('change_feed', lambda: ChangeFeed(shard.connect, run=shard.writer.run))
+
+
+def current_read_model():
+    """The read model of the request's database, or ``None`` when disabled."""
+    model = current_app.read_model
+    shard = current_shard()
+    if shard is None or model is None:
+        return model
+    return shard.attach('read_model', lambda: ReadModel(model.max_bytes))
+
+
+def current_analytics():
+    """The analytics bucket cache of the request's database."""
+    shard = current_shard()
+    if shard is None:
+        return current_app.analytics
+    return shard.attach('analytics', lambda: AnalyticsCache(current_app.analytics.offset // 60))
+
+
+def start_background_jobs():
+    """Start per-process background threads once the worker serves requests."""
+    current_app.history_pruner.start()
+    current_app.backups.start()
+    current_app.archiver.start()
+    current_app.progress_checker.start()
+
+
+def record_boot(response):
+    """Note how long this process took from boot to its first response."""
+    app = current_app._get_current_object()
+    if app.boot_seconds is None:
+        app.boot_seconds = time.perf_counter() - BOOT_STARTED
+        logging.info(f"First response {app.boot_seconds * 1000:.0f}ms after boot")
+    return response
+
+
+def test():
+    """Simple health check used by tests."""
+    return jsonify({"status": "ok", "message": "API is working"})
+
+
+def pool_status():
+    """Report connection pool, response cache and read model usage so they can be sized."""
+    app = current_app
+    stats = {**pool_stats(), 'response_cache': app.response_cache.stats(), 'boot_seconds': app.boot_seconds}
+    if app.read_model is not None:
+        stats['read_model'] = app.read_model.stats()
+    return jsonify(stats)
+
+
+def create_app(config=None):
+    """Build the Flask application.
+
+    Parameters
+    ----------
+    config : dict | None
+        Settings applied to ``app.config``.  With ``DATABASE_SETUP`` (the
+        default) the schema of ``DATABASE_URL`` is first brought up to date
+        by :func:`database.prepare_db`, which returns at once when another
+        process already did so.
+    """
+    app = Flask(__name__)
+    app.config['CORS_HEADERS'] = 'Content-Type'
+    app.config['DATABASE_SETUP'] = True
+    app.config.update(config or {})
+    CORS(
+        app,
+        resources={r"/api/*": {
+            "origins": CORS_ORIGINS,
+            "methods": ["GET", "POST", "PUT", "DELETE", "PATCH", "OPTIONS"],
+            "allow_headers": ["Content-Type", "If-None-Match", "Authorization", "X-Admin-Token", TENANT_HEADER],
+            "supports_credentials": True,
+            "expose_headers": ["Access-Control-Allow-Origin", "X-Next-Cursor", "ETag"],
+        }},
+        supports_credentials=True,
+    )
+    if app.config['DATABASE_SETUP']:
+        prepare_db()
+
     # expose helpers for blueprints and tests
     app.get_db = get_db
     app.log_action_for_undo = log_action_for_undo
+    app.history_stats = history_stats
+    app.undo_buffer = UndoBuffer
     app.get_pacific_time = get_pacific_time
     app.parse_json = parse_json
+    app.parse_list_args = parse_list_args
+    app.query_page = query_page
+    app.completion_filters = completion_filters
+    app.list_response = list_response
     app.shift_tasks_after_delete = shift_tasks_after_delete
+    app.insert_row = insert_row
+    # sibling ordering strategy (ORDERING_MODE); rank rebalancing goes
+    # through the writer queue of the request's database
+    app.ordering = make_ordering(run=get_writer().run, route=writer_run if TENANT_DIR else None)
+    app.response_cache = ResponseCache()
+    # keeps undo_log/redo_log within UNDO_MAX_GROUPS / UNDO_MAX_AGE_DAYS,
+    # tombstones within TOMBSTONE_MAX_ROWS and change_log within
+    # CHANGE_LOG_MAX_ROWS, in every tenant, streams or not
+    app.history_pruner = HistoryPruner(
+        get_router().run_all if TENANT_DIR else get_writer().run,
+        jobs=(prune_history, prune_tombstones, prune_changes),
+    )
+    # tails change_log for /api/events subscribers in this worker
+    app.change_feed = ChangeFeed(connect, run=get_writer().run)
+    app.current_change_feed = current_change_feed
+    # in-memory copy of the board for the list endpoints (READ_MODEL)
+    app.read_model = ReadModel() if READ_MODEL else None
+    app.current_read_model = current_read_model
+    # per-process request and SQLite counters served by /metrics
+    app.metrics = Registry()
+    # statement totals and slow-query log, when QUERY_TRACE is set
+    app.query_tracer = QueryTracer()
+    # snapshots into BACKUP_DIR every BACKUP_INTERVAL seconds, or of every
+    # tenant into BACKUP_DIR/<tenant>
+    app.backups = BackupScheduler(DB_PATH, registry=app.metrics, run=get_writer().run, tenant_dir=TENANT_DIR)
+    app.admin_token = backup.ADMIN_TOKEN
+    # moves rows completed ARCHIVE_AFTER_DAYS ago out of the hot tables,
+    # in every tenant
+    app.archiver = Archiver(get_router().run_all if TENANT_DIR else get_writer().run, app.ordering)
+    # repairs drifted progress rollups every PROGRESS_CHECK_INTERVAL seconds
+    app.progress_checker = HistoryPruner(
+        get_router().run_all if TENANT_DIR else get_writer().run,
+        interval=PROGRESS_CHECK_INTERVAL, jobs=(check_progress,), name='progress-checker',
+    )
+    # closed /api/analytics buckets, computed once per worker
+    app.analytics = AnalyticsCache()
+    app.current_analytics = current_analytics
+    # set by the first response (/api/pool, /metrics)
+    app.boot_seconds = None
 
-@app.route('/api/test', methods=['GET'])
-def test():
-    """Simple health check used by tests."""
-    return jsonify({"status": "ok", "message": "API is working"})
+    if METRICS:
+        # registered first so the timer covers every other hook
+        app.before_request(start_timer)
+        app.after_request(record_response)
+        app.teardown_request(record_exception)
+    if QUERY_TRACE:
+        app.after_request(finish_request)
+    app.before_request(start_background_jobs)
+    app.after_request(record_boot)
+    # hand pooled connections back at the end of every request
+    app.teardown_appcontext(close_db)
+    # route each request to its tenant's database (TENANT_DIR); registered
+    # ahead of the response cache, which reads the database
+    app.before_request(select_tenant)
+    # answer unchanged list reads from the ETag / response cache
+    app.before_request(serve_cached)
+    app.after_request(store_response)
+
+    app.add_url_rule('/api/test', view_func=test, methods=['GET'])
+    app.add_url_rule('/api/pool', view_func=pool_status, methods=['GET'])
+    # Register API blueprints
+    for module in BLUEPRINTS:
+        app.register_blueprint(module.bp)
+    return app
+
+
+def __getattr__(name):
+    # ``app`` is built on first access, by gunicorn (``app:app``) or a test
+    if name == 'app':
+        globals()['app'] = create_app()
+        return globals()['app']
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-# Register API blueprints
-app.register_blueprint(areas.bp)
-app.register_blueprint(objectives.bp)
-app.register_blueprint(tasks.bp)
-app.register_blueprint(undo.bp)
 
 if __name__ == '__main__':
-    init_db()
     port = int(os.environ.get('PORT', 8080))
-    app.run(host='0.0.0.0', port=port)
+    create_app().run(host='0.0.0.0', port=port)
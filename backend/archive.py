@@ -0,0 +1,277 @@
+"""Archival of long-completed objectives and tasks.
+
+Completed rows never leave ``objectives`` and ``tasks`` on their own, so
+every list query, sibling shift and cascade keeps paying for them.  With
+``ARCHIVE_AFTER_DAYS`` set, :class:`Archiver` moves those completed longer
+ago than that into ``archived_objectives`` and ``archived_tasks``
+(migration 10), ``ARCHIVE_BATCH_ROWS`` at a time, each batch in its own
+write transaction so ordinary writes interleave with a large first pass.
+
+- A task is archived on its own once it is complete.
+- An objective is archived once it is complete and so are all its tasks;
+  they move with it.
+
+Moved rows leave their sibling lists: in index mode the remaining siblings
+are renumbered once per batch, so later shifts only touch active rows.  To
+everything reading the hot tables (lists, the tree, search, ``/api/changes``
+and ``/api/events``) an archived row looks deleted.  Undo and redo groups
+involving an archived row, or re-inserting a child under one, are dropped:
+they could never be reverted.
+
+:func:`restore_row` brings a row back as the last child of its parent; an
+objective brings back its archived tasks.  ``/api/archive`` pages through
+the archive and restores from it.
+"""
+import os
+import time
+import logging
+import threading
+
+try:
+    from .analytics import EPOCH_COLUMNS
+    from .database import get_pacific_time
+    from .history import drop_groups
+    from .migrations import CHANGE_LOG_COLUMNS
+    from .ordering import parent_of
+    from .services import OperationError
+    from .utils import insert_row
+except ImportError:  # pragma: no cover - executed only when run as script
+    from analytics import EPOCH_COLUMNS
+    from database import get_pacific_time
+    from history import drop_groups
+    from migrations import CHANGE_LOG_COLUMNS
+    from ordering import parent_of
+    from services import OperationError
+    from utils import insert_row
+
+# completed rows older than this are archived; 0 disables the archiver
+ARCHIVE_AFTER_DAYS = float(os.environ.get('ARCHIVE_AFTER_DAYS', 0))
+ARCHIVE_INTERVAL = float(os.environ.get('ARCHIVE_INTERVAL', 3600))
+ARCHIVE_BATCH_ROWS = int(os.environ.get('ARCHIVE_BATCH_ROWS', 500))
+# page size of /api/archive when the client gives no limit
+ARCHIVE_PAGE_SIZE = 100
+
+ARCHIVE_TABLES = {'objectives': 'archived_objectives', 'tasks': 'archived_tasks'}
+
+# columns of a row that are its own rather than its place among siblings
+DATA_COLUMNS = {
+    table: tuple(c for c in CHANGE_LOG_COLUMNS[table] if c not in ('order_index', 'rank'))
+    for table in ARCHIVE_TABLES
+}
+# columns copied into the archive; the epochs are derived again on restore
+ARCHIVED_COLUMNS = {table: (*CHANGE_LOG_COLUMNS[table], *EPOCH_COLUMNS) for table in ARCHIVE_TABLES}
+# a task archived with its objective without a completion time of its own
+# is filed under the objective's
+TASK_COMPLETED = {
+    column: f'IFNULL({column}, (SELECT o.{column} FROM objectives o WHERE o.key = objective_key))'
+    for column in ('date_time_completed', 'completed_epoch')
+}
+
+
+def archive_cutoff(max_age_days=ARCHIVE_AFTER_DAYS):
+    """Completion time (Unix seconds) before which rows are archived."""
+    return int(time.time() - max_age_days * 86400)
+
+
+def _move(conn, table, where, params, archived_at):
+    """Move the rows of ``table`` matching ``where`` into its archive table."""
+    columns = ', '.join(ARCHIVED_COLUMNS[table])
+    values = ', '.join(
+        TASK_COMPLETED.get(c, c) if table == 'tasks' else c for c in ARCHIVED_COLUMNS[table]
+    )
+    conn.execute(
+        f'INSERT OR REPLACE INTO {ARCHIVE_TABLES[table]} ({columns}, archived_at) '
+        f'SELECT {values}, ? FROM {table} WHERE {where}',
+        [archived_at, *params],
+    )
+    return conn.execute(f'DELETE FROM {table} WHERE {where}', params).rowcount
+
+
+def archive_batch(conn, ordering, before, limit=ARCHIVE_BATCH_ROWS):
+    """Archive up to ``limit`` objectives and ``limit`` tasks completed before ``before``.
+
+    Runs in the caller's transaction.  Returns the number of rows moved,
+    tasks of archived objectives included.
+    """
+    archived_at = get_pacific_time()
+    batch = ordering.batch()
+    moved = 0
+    archived = {'objectives': set(), 'tasks': set()}
+    objectives = conn.execute(
+        "SELECT key, area_key, order_index, rank FROM objectives o "
+        "WHERE status = 'complete' AND completed_epoch < ? "
+        "AND NOT EXISTS (SELECT 1 FROM tasks WHERE objective_key = o.key AND status IS NOT 'complete') "
+        "ORDER BY completed_epoch LIMIT ?",
+        (before, limit),
+    ).fetchall()
+    if objectives:
+        keys = [row['key'] for row in objectives]
+        marks = ', '.join('?' * len(keys))
+        for row in objectives:
+            batch.remove(conn, 'objectives', parent_of('objectives', row), row['order_index'], row['key'])
+        archived['objectives'].update(keys)
+        archived['tasks'].update(r[0] for r in conn.execute(
+            f'SELECT key FROM tasks WHERE objective_key IN ({marks})', keys))
+        # the objective's whole task list goes with it: no siblings to shift
+        moved += _move(conn, 'tasks', f'objective_key IN ({marks})', keys, archived_at)
+        moved += _move(conn, 'objectives', f'key IN ({marks})', keys, archived_at)
+
+    tasks = conn.execute(
+        "SELECT key, area_key, objective_key, order_index, rank FROM tasks "
+        "WHERE status = 'complete' AND completed_epoch < ? ORDER BY completed_epoch LIMIT ?",
+        (before, limit),
+    ).fetchall()
+    if tasks:
+        keys = [row['key'] for row in tasks]
+        for row in tasks:
+            batch.remove(conn, 'tasks', parent_of('tasks', row), row['order_index'], row['key'])
+        archived['tasks'].update(keys)
+        moved += _move(conn, 'tasks', f"key IN ({', '.join('?' * len(keys))})", keys, archived_at)
+    # close the gaps the moved rows left among their siblings
+    batch.flush(conn)
+    if moved:
+        # undoing these would touch rows that are gone, or re-insert
+        # children under a parent that is, and fail the foreign key
+        drop_groups(conn, archived)
+    return moved
+
+
+def _check_parent(conn, table, row):
+    """Raise unless the parent of archived ``row`` is back in the hot tables."""
+    column, key = parent_of(table, row)
+    parent = 'areas' if column == 'area_key' else 'objectives'
+    if conn.execute(f'SELECT 1 FROM {parent} WHERE key = ?', (key,)).fetchone():
+        return
+    if parent == 'objectives' and conn.execute(
+        'SELECT 1 FROM archived_objectives WHERE key = ?', (key,)
+    ).fetchone():
+        raise OperationError(f"Objective {key} is archived; restore it instead", 409)
+    raise OperationError(f"{parent[:-1].capitalize()} {key} not found", 409)
+
+
+def _restore(conn, ordering, table, row):
+    placement = ordering.append(conn, table, parent_of(table, row), row['key'])
+    insert_row(conn, table, {**{c: row[c] for c in DATA_COLUMNS[table]}, **placement})
+
+
+def restore_row(conn, ordering, table, key):
+    """Move an archived row back as the last child of its parent.
+
+    Restoring an objective also restores the tasks archived under it, in
+    their old order.  Runs in the caller's transaction.
+
+    Returns
+    -------
+    dict
+        Number of rows restored per table.
+    """
+    archived = ARCHIVE_TABLES[table]
+    row = conn.execute(f'SELECT * FROM {archived} WHERE key = ?', (key,)).fetchone()
+    if row is None:
+        raise OperationError(f"{table[:-1].capitalize()} {key} is not archived", 404)
+    _check_parent(conn, table, row)
+    tasks = []
+    if table == 'objectives':
+        tasks = conn.execute(
+            'SELECT * FROM archived_tasks WHERE objective_key = ? ORDER BY order_index, key', (key,)
+        ).fetchall()
+    for table_name, restored in ((table, row), *(('tasks', task) for task in tasks)):
+        if conn.execute(f'SELECT 1 FROM {table_name} WHERE key = ?', (restored['key'],)).fetchone():
+            raise OperationError(f"{table_name[:-1].capitalize()} {restored['key']} already exists", 409)
+    # the archive rows go first, so the progress counts they take back are
+    # not taken from the rows the restored ones start afresh
+    conn.execute(f'DELETE FROM {archived} WHERE key = ?', (key,))
+    if table == 'objectives':
+        conn.execute('DELETE FROM archived_tasks WHERE objective_key = ?', (key,))
+    _restore(conn, ordering, table, row)
+    for task in tasks:
+        _restore(conn, ordering, 'tasks', task)
+    return {'objectives': int(table == 'objectives'), 'tasks': len(tasks) + int(table == 'tasks')}
+
+
+def archive_counts(conn):
+    """Rows in each archive table."""
+    return {
+        table: conn.execute(f'SELECT COUNT(*) FROM {archived}').fetchone()[0]
+        for table, archived in ARCHIVE_TABLES.items()
+    }
+
+
+class Archiver:
+    """Background thread archiving completed rows every ``interval`` seconds.
+
+    Parameters
+    ----------
+    run : callable
+        ``run(fn, *args)`` executes ``fn(conn, *args)`` in a write
+        transaction, e.g. ``WriterQueue.run``; each batch is one call.
+    ordering : IndexOrdering
+        Strategy whose sibling lists the archived rows leave.
+    max_age_days : float
+        Age of completion after which rows are archived; ``0`` disables
+        the thread.
+    interval : float
+        Seconds between passes.
+    batch_rows : int
+        Objectives and tasks moved per transaction.
+    """
+
+    def __init__(self, run, ordering, max_age_days=ARCHIVE_AFTER_DAYS, interval=ARCHIVE_INTERVAL,
+                 batch_rows=ARCHIVE_BATCH_ROWS):
+        self._run = run
+        self.ordering = ordering
+        self.max_age_days = max_age_days
+        self.interval = interval
+        self.batch_rows = batch_rows
+        self._lock = threading.Lock()
+        self._pid = None
+        self.passes = 0
+        self.batches = 0
+        self.moved = 0
+        self.last_pass = None
+
+    def start(self):
+        """Start the thread unless it already runs in this process."""
+        if not self.max_age_days or not self.interval or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # started lazily, and again in each forked worker
+                self._pid = os.getpid()
+                threading.Thread(target=self._loop, name='archiver', daemon=True).start()
+
+    def run_once(self):
+        """Archive everything due, one batch per transaction; return the rows moved."""
+        before = archive_cutoff(self.max_age_days)
+        total = 0
+        while True:
+            moved = self._run(archive_batch, self.ordering, before, self.batch_rows)
+            self.batches += 1
+            total += moved
+            if not moved:
+                break
+        self.passes += 1
+        self.moved += total
+        self.last_pass = get_pacific_time()
+        return total
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                moved = self.run_once()
+                if moved:
+                    logging.info(f"Archived {moved} completed rows")
+            except Exception as e:  # pragma: no cover - logged and retried next interval
+                logging.error(f"Error archiving completed rows: {e}")
+
+    def stats(self):
+        return {
+            'after_days': self.max_age_days,
+            'interval': self.interval,
+            'batch_rows': self.batch_rows,
+            'passes': self.passes,
+            'batches': self.batches,
+            'moved': self.moved,
+            'last_pass': self.last_pass,
+        }
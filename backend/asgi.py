@@ -0,0 +1,230 @@
+"""ASGI entry point serving the Flask application.
+
+Run under an ASGI server, e.g. ``SERVER_MODE=asgi gunicorn`` (see
+``gunicorn.conf.py``) or ``uvicorn asgi:application`` from ``backend/``.
+The routes stay synchronous: every request runs on a thread, so a slow one
+such as a large area delete ties up a thread, not the event loop.
+
+- Reads run on a bounded pool of ``ASGI_THREADS`` threads.
+- Mutating requests (``POST``/``PUT``/``PATCH``/``DELETE``) run on one
+  dedicated writer thread.  SQLite takes one writer at a time, so they
+  queue up in arrival order instead of occupying reader threads while
+  they wait for the write lock.  With ``TENANT_DIR`` each tenant already
+  has its own writer, so writes share the reader pool instead.
+- Streamed bodies (``/api/events``, ``/api/export``) are pulled chunk by
+  chunk on a separate pool of ``ASGI_STREAM_THREADS`` threads, so
+  long-lived streams never starve ordinary requests.  A stream whose client
+  disconnected is closed at its next chunk (or heartbeat).
+"""
+import os
+import sys
+import asyncio
+import logging
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from .app import app
+    from .database import TENANT_DIR, WRITE_METHODS
+except ImportError:  # pragma: no cover - executed only when run as script
+    from app import app
+    from database import TENANT_DIR, WRITE_METHODS
+
+CPUS = os.cpu_count() or 1
+ASGI_THREADS = int(os.environ.get('ASGI_THREADS', min(32, 4 * CPUS + 4)))
+ASGI_STREAM_THREADS = int(os.environ.get('ASGI_STREAM_THREADS', 64))
+# request bodies larger than this are spooled to a temporary file
+ASGI_SPOOL_BYTES = 1024 * 1024
+# streamed chunks read ahead of a slow client
+ASGI_STREAM_BUFFER = 8
+
+
+class WSGIBridge:
+    """ASGI application running a WSGI application on thread pools.
+
+    Parameters
+    ----------
+    wsgi_app : callable
+        The WSGI application.
+    threads : int
+        Reader pool size.
+    stream_threads : int
+        Threads pulling streamed response bodies.
+    writer : bool
+        Run mutating requests on one dedicated thread.
+    """
+
+    def __init__(self, wsgi_app, threads=ASGI_THREADS, stream_threads=ASGI_STREAM_THREADS, writer=True):
+        self.wsgi_app = wsgi_app
+        self.readers = ThreadPoolExecutor(threads, thread_name_prefix='asgi-reader')
+        self.writer = ThreadPoolExecutor(1, thread_name_prefix='asgi-writer') if writer else self.readers
+        self.streams = ThreadPoolExecutor(stream_threads, thread_name_prefix='asgi-stream')
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+        else:
+            raise ValueError(f"Unsupported ASGI scope type: {scope['type']}")
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.close()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    def close(self):
+        for executor in {self.readers, self.writer, self.streams}:
+            executor.shutdown(wait=False)
+
+    async def _http(self, scope, receive, send):
+        body = tempfile.SpooledTemporaryFile(max_size=ASGI_SPOOL_BYTES)
+        more = True
+        while more:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                body.close()
+                return
+            body.write(message.get('body', b''))
+            more = message.get('more_body', False)
+        length = body.tell()
+        body.seek(0)
+
+        loop = asyncio.get_running_loop()
+        executor = self.writer if scope['method'] in WRITE_METHODS else self.readers
+        try:
+            status, headers, chunks, streamed = await loop.run_in_executor(
+                executor, self._run, environ(scope, body, length)
+            )
+        finally:
+            body.close()
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        if not streamed:
+            await send({'type': 'http.response.body', 'body': chunks})
+            return
+
+        queue = asyncio.Queue()
+        credits = threading.Semaphore(ASGI_STREAM_BUFFER)
+        stop = threading.Event()
+        loop.run_in_executor(self.streams, _pump, chunks, loop, queue, credits, stop)
+        disconnected = asyncio.ensure_future(receive())
+        try:
+            while True:
+                get = asyncio.ensure_future(queue.get())
+                done, _ = await asyncio.wait({get, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if get not in done:
+                    get.cancel()
+                    return
+                chunk = get.result()
+                if chunk is None:
+                    break
+                credits.release()
+                if chunk:
+                    await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            stop.set()
+            disconnected.cancel()
+
+    def _run(self, environ):
+        """Call the WSGI application; buffer the body unless it streams."""
+        response = {}
+
+        def start_response(status, headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+
+        chunks = self.wsgi_app(environ, start_response)
+        # werkzeug sets Content-Length on every body it holds in memory
+        streamed = not any(k == b'content-length' for k, _ in response['headers'])
+        if streamed and response['status'] not in (204, 304):
+            return response['status'], response['headers'], chunks, True
+        try:
+            return response['status'], response['headers'], b''.join(chunks), False
+        finally:
+            _close(chunks)
+
+
+def _pump(chunks, loop, queue, credits, stop):
+    """Iterate a streamed body on one thread, handing chunks to the loop.
+
+    A body is always iterated and closed on the same thread: Flask's
+    ``stream_with_context`` keeps the request context in context variables,
+    which do not follow a generator from one thread to another.  At most
+    ``ASGI_STREAM_BUFFER`` chunks wait for a slow client.
+    """
+    try:
+        for chunk in chunks:
+            while not credits.acquire(timeout=1):
+                if stop.is_set():
+                    return
+            if stop.is_set():
+                # the client disconnected
+                return
+            loop.call_soon_threadsafe(queue.put_nowait, chunk)
+    except Exception as e:  # pragma: no cover - the response has started
+        logging.error(f"Error streaming response: {e}")
+    finally:
+        _close(chunks)
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, None)
+        except RuntimeError:  # pragma: no cover - the loop has shut down
+            pass
+
+
+def _close(chunks):
+    close = getattr(chunks, 'close', None)
+    if close is not None:
+        try:
+            close()
+        except Exception as e:  # pragma: no cover - logged, the response is over
+            logging.error(f"Error closing response body: {e}")
+
+
+def environ(scope, body, length):
+    """Build the WSGI environ for an ASGI ``http`` scope.
+
+    ``body`` holds the whole request body, ``length`` bytes, however the
+    client sent it.
+    """
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    env = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1] or 80),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'CONTENT_LENGTH': str(length),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', ()):
+        name = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if name == 'CONTENT_TYPE':
+            env[name] = value
+            continue
+        if name in ('CONTENT_LENGTH', 'TRANSFER_ENCODING'):
+            continue
+        key = f'HTTP_{name}'
+        env[key] = f'{env[key]},{value}' if key in env else value
+    return env
+
+
+application = WSGIBridge(app, writer=not TENANT_DIR)
@@ -0,0 +1,453 @@
+"""Online snapshots of the database with the SQLite backup API.
+
+:func:`snapshot` copies the live database with ``Connection.backup``,
+``BACKUP_STEP_PAGES`` pages at a time with a short sleep in between, so the
+copy never holds a lock for long.  When other connections keep writing,
+SQLite restarts the copy from scratch; after ``BACKUP_MAX_RESTARTS`` of
+those the remainder is taken in a single step, which under WAL only needs
+a read snapshot and still does not block writers.  Copies are written under
+a temporary name, switched to a rollback journal, checked with
+``PRAGMA quick_check`` and only then renamed into ``BACKUP_DIR``.
+
+With ``BACKUP_DIR`` set every worker runs a :class:`BackupScheduler`; a lock
+file makes sure only one of them takes each snapshot.  With ``TENANT_DIR``
+set it backs up every ``<tenant>.db`` there instead, each into a
+``BACKUP_DIR/<tenant>`` directory of its own.  Snapshots beyond
+``BACKUP_KEEP`` or older than ``BACKUP_MAX_AGE_DAYS`` are deleted, never
+the newest one.
+
+:func:`restore` copies a snapshot back over the live database, after saving
+the current state as a ``pre-restore`` snapshot.  The snapshot is first
+copied aside and migrated to the current schema; its tables then replace
+the live ones in a single write transaction on the database's writer, which
+also makes change versions continue above the ones handed out before and
+raises ``tombstone_floor``, so delta-sync clients are told to reload rather
+than miss rows.  A new ``instance_id`` invalidates every cached ETag.
+
+Usage from the ``backend`` directory::
+
+    python backup.py list
+    python backup.py create
+    python backup.py restore snapshot-20240101T000000Z.db
+    python backup.py --tenant acme list
+"""
+import os
+import sys
+import time
+import sqlite3
+import logging
+import argparse
+import threading
+from datetime import datetime, timezone
+
+try:
+    from .database import DB_PATH, TENANT_DIR, TENANT_ID, connect, init_db, tenant_names
+    from .sync import high_water
+except ImportError:  # pragma: no cover - executed only when run as script
+    from database import DB_PATH, TENANT_DIR, TENANT_ID, connect, init_db, tenant_names
+    from sync import high_water
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+BACKUP_DIR = os.environ.get('BACKUP_DIR') or None
+BACKUP_INTERVAL = float(os.environ.get('BACKUP_INTERVAL', 3600))
+BACKUP_KEEP = int(os.environ.get('BACKUP_KEEP', 24))
+BACKUP_MAX_AGE_DAYS = float(os.environ.get('BACKUP_MAX_AGE_DAYS', 7))
+BACKUP_STEP_PAGES = int(os.environ.get('BACKUP_STEP_PAGES', 256))
+BACKUP_STEP_SLEEP = float(os.environ.get('BACKUP_STEP_SLEEP', 0.005))
+BACKUP_MAX_RESTARTS = int(os.environ.get('BACKUP_MAX_RESTARTS', 5))
+
+PREFIX = 'snapshot-'
+SUFFIX = '.db'
+LOCK_FILE = '.lock'
+
+
+class _Restarted(Exception):
+    pass
+
+
+def _copy(source, target, pages, sleep, max_restarts):
+    """Back ``source`` up into ``target``; returns the number of restarts."""
+    restarts = 0
+    remaining = None
+
+    def progress(status, left, total):
+        nonlocal restarts, remaining
+        if remaining is not None and left >= remaining:
+            # another connection wrote to the source; SQLite started over
+            restarts += 1
+            if restarts > max_restarts:
+                raise _Restarted()
+        remaining = left
+
+    try:
+        source.backup(target, pages=pages, progress=progress, sleep=sleep)
+    except _Restarted:
+        logging.info(f"Backup restarted {restarts} times; copying the rest in one step")
+        source.backup(target)
+    return restarts
+
+
+def _timestamp():
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+def is_snapshot(name):
+    return name.startswith(PREFIX) and name.endswith(SUFFIX) and os.path.basename(name) == name
+
+
+def snapshot(path, directory, label=None, pages=BACKUP_STEP_PAGES, sleep=BACKUP_STEP_SLEEP,
+             max_restarts=BACKUP_MAX_RESTARTS):
+    """Copy the database at ``path`` into a new snapshot in ``directory``.
+
+    Returns
+    -------
+    dict
+        ``{"name", "size", "created", "seconds", "restarts"}``.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = f"{PREFIX}{_timestamp()}{'-' + label if label else ''}{SUFFIX}"
+    n = 1
+    while os.path.exists(os.path.join(directory, name)):
+        n += 1
+        name = f"{PREFIX}{_timestamp()}{'-' + label if label else ''}-{n}{SUFFIX}"
+    final = os.path.join(directory, name)
+    partial = os.path.join(directory, f'.{name}.partial')
+    start = time.perf_counter()
+    source = sqlite3.connect(path)
+    target = sqlite3.connect(partial)
+    try:
+        restarts = _copy(source, target, pages, sleep, max_restarts)
+        # a self-contained file, without -wal/-shm companions
+        target.execute('PRAGMA journal_mode = DELETE')
+        check = target.execute('PRAGMA quick_check').fetchone()[0]
+        if check != 'ok':
+            raise sqlite3.DatabaseError(f"snapshot failed quick_check: {check}")
+    except Exception:
+        target.close()
+        os.remove(partial)
+        raise
+    finally:
+        source.close()
+    target.close()
+    os.replace(partial, final)
+    return {**describe(directory, name), 'seconds': round(time.perf_counter() - start, 3), 'restarts': restarts}
+
+
+def describe(directory, name):
+    stat = os.stat(os.path.join(directory, name))
+    return {
+        'name': name,
+        'size': stat.st_size,
+        'created': datetime.fromtimestamp(stat.st_mtime, timezone.utc).isoformat(),
+    }
+
+
+def list_snapshots(directory):
+    """Snapshots in ``directory``, newest first."""
+    if not directory or not os.path.isdir(directory):
+        return []
+    names = [name for name in os.listdir(directory) if is_snapshot(name)]
+    names.sort(key=lambda name: os.stat(os.path.join(directory, name)).st_mtime, reverse=True)
+    return [describe(directory, name) for name in names]
+
+
+def prune_snapshots(directory, keep=BACKUP_KEEP, max_age_days=BACKUP_MAX_AGE_DAYS):
+    """Delete snapshots beyond ``keep`` or older than ``max_age_days``.
+
+    ``0`` disables either limit; the newest snapshot is always kept.
+    Returns the names removed.
+    """
+    snapshots = list_snapshots(directory)
+    cutoff = time.time() - max_age_days * 86400 if max_age_days else None
+    removed = []
+    for index, entry in enumerate(snapshots[1:], start=1):
+        path = os.path.join(directory, entry['name'])
+        if (keep and index >= keep) or (cutoff and os.stat(path).st_mtime < cutoff):
+            os.remove(path)
+            removed.append(entry['name'])
+    return removed
+
+
+def run_on(path):
+    """``run(fn, *args)`` calling ``fn(conn, *args)`` on a new connection to ``path``.
+
+    For callers without a writer queue, such as the command line.
+    """
+    def run(fn, *args):
+        conn = connect(path)
+        try:
+            with conn:
+                return fn(conn, *args)
+        finally:
+            conn.close()
+    return run
+
+
+def restore(name, directory, path, run=None):
+    """Copy snapshot ``name`` over the live database at ``path``.
+
+    The current contents are saved first; returns that snapshot's entry.
+    ``run`` is the writer of ``path`` (``WriterQueue.run``), so the copy
+    waits its turn like any write; by default a connection of its own.
+    """
+    if not is_snapshot(name) or not os.path.exists(os.path.join(directory, name)):
+        raise FileNotFoundError(f"No snapshot named {name}")
+    saved = snapshot(path, directory, label='pre-restore')
+    staged = os.path.join(directory, f'.{name}.restore')
+    source = sqlite3.connect(os.path.join(directory, name))
+    target = sqlite3.connect(staged)
+    try:
+        source.backup(target)
+    finally:
+        source.close()
+        target.close()
+    try:
+        # the snapshot may predate the current schema: migrate the copy, so
+        # the live database never has an older one
+        init_db(staged)
+        (run or run_on(path))(replace_contents, staged)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(staged + suffix):
+                os.remove(staged + suffix)
+    return saved
+
+
+def replace_contents(conn, source):
+    """Replace every table of ``conn``'s database with those of ``source``.
+
+    ``source`` must have the same schema.  The copy and
+    :func:`fence_versions` run in one ``BEGIN IMMEDIATE`` transaction,
+    committed here, so no other write lands between them.  Triggers are
+    dropped for the copy and created again; virtual tables (the search
+    index) are rebuilt from their content tables.
+    """
+    conn.execute('ATTACH DATABASE ? AS restored', (source,))
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            latest = high_water(conn)
+            conn.execute('PRAGMA defer_foreign_keys = ON')
+            triggers = conn.execute("SELECT name, sql FROM main.sqlite_master WHERE type = 'trigger'").fetchall()
+            for trigger, _ in triggers:
+                conn.execute(f'DROP TRIGGER main."{trigger}"')
+            tables = [row[0] for row in conn.execute(
+                "SELECT name FROM main.sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite%' "
+                "AND sql NOT LIKE 'CREATE VIRTUAL TABLE%' ORDER BY name"
+            )]
+            virtual = [row[0] for row in conn.execute(
+                "SELECT name FROM main.sqlite_master WHERE type = 'table' AND sql LIKE 'CREATE VIRTUAL TABLE%'"
+            )]
+            # shadow tables belong to their virtual table; the sequence goes
+            # last, over the values the inserted rows leave in it
+            tables = [t for t in tables if not any(t.startswith(f'{v}_') for v in virtual)] + ['sqlite_sequence']
+            for table in tables:
+                columns = ', '.join(
+                    f'"{row[1]}"' for row in conn.execute(f'PRAGMA main.table_info("{table}")')
+                )
+                conn.execute(f'DELETE FROM main."{table}"')
+                conn.execute(f'INSERT INTO main."{table}" ({columns}) SELECT {columns} FROM restored."{table}"')
+            for table in virtual:
+                conn.execute(f'INSERT INTO main."{table}" ("{table}") VALUES (?)', ('rebuild',))
+            for _, sql in triggers:
+                conn.execute(sql)
+            fence_versions(conn, latest)
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+    finally:
+        conn.execute('DETACH DATABASE restored')
+
+
+def fence_versions(conn, latest):
+    """Continue change versions above ``latest`` after a restore.
+
+    Versions handed out before the restore may now name different changes,
+    so clients synced past any of them must reload: the tombstone floor is
+    raised above them and the next version follows.
+    """
+    fence = max(latest, high_water(conn)) + 1
+    if not conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'change_log'", (fence,)).rowcount:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', ?)", (fence,))
+    conn.execute("UPDATE meta SET value = ? WHERE name = 'tombstone_floor'", (fence,))
+    conn.execute("UPDATE meta SET value = lower(hex(randomblob(6))) WHERE name = 'instance_id'")
+
+
+def backup_now(path, directory, registry=None, keep=BACKUP_KEEP, max_age_days=BACKUP_MAX_AGE_DAYS):
+    """Take a snapshot, prune old ones and record the outcome in ``registry``."""
+    start = time.perf_counter()
+    try:
+        entry = snapshot(path, directory)
+    except Exception:
+        if registry is not None:
+            registry.inc('bigpicture_backups_total', {'result': 'error'})
+        raise
+    if registry is not None:
+        registry.inc('bigpicture_backups_total', {'result': 'ok'})
+        registry.observe('bigpicture_backup_duration_seconds', {}, time.perf_counter() - start)
+    entry['pruned'] = prune_snapshots(directory, keep, max_age_days)
+    return entry
+
+
+def backup_gauges(directory, labels=None):
+    """``render`` gauges describing the snapshots in ``directory``."""
+    labels = labels or {}
+    snapshots = list_snapshots(directory)
+    gauges = [('bigpicture_backup_snapshots', 'Snapshots kept in BACKUP_DIR.', labels, len(snapshots))]
+    if snapshots:
+        newest = os.stat(os.path.join(directory, snapshots[0]['name']))
+        gauges += [
+            ('bigpicture_backup_last_size_bytes', 'Size of the newest snapshot.', labels, newest.st_size),
+            ('bigpicture_backup_last_timestamp_seconds', 'When the newest snapshot was taken.', labels,
+             newest.st_mtime),
+        ]
+    return gauges
+
+
+class BackupScheduler:
+    """Background thread snapshotting the database every ``interval`` seconds.
+
+    Each worker runs one; whichever takes the lock file first makes the
+    snapshots, and a database whose newest snapshot is younger than
+    ``interval`` is left alone.
+
+    Parameters
+    ----------
+    path : str
+        Database to copy.
+    directory : str | None
+        ``BACKUP_DIR``; ``None`` disables the scheduler.
+    interval : float
+        Seconds between snapshots; ``0`` disables the scheduler.
+    registry : metrics.Registry | None
+        Where to record durations and outcomes.
+    run : callable | None
+        Writer of ``path`` (``WriterQueue.run``) that restores go through;
+        by default a connection of their own.
+    tenant_dir : str | None
+        ``TENANT_DIR``.  When set, every ``<tenant>.db`` in it is backed up
+        into ``directory/<tenant>`` instead of ``path``.
+    """
+
+    def __init__(self, path, directory=BACKUP_DIR, interval=BACKUP_INTERVAL, registry=None, run=None,
+                 tenant_dir=None):
+        self.path = path
+        self.run = run or run_on(path)
+        self.directory = directory
+        self.tenant_dir = tenant_dir
+        self.interval = interval
+        self.registry = registry
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        """Start the thread unless it already runs in this process."""
+        if not self.directory or not self.interval or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # started lazily, and again in each forked worker
+                self._pid = os.getpid()
+                threading.Thread(target=self._loop, name='backup-scheduler', daemon=True).start()
+
+    def location(self, tenant=None):
+        """Database and snapshot directory of ``tenant``, or of ``path``.
+
+        Raises ``FileNotFoundError`` for a tenant without a database.
+        """
+        if tenant is None:
+            return self.path, self.directory
+        path = os.path.join(self.tenant_dir or '', f'{tenant}.db')
+        if not self.tenant_dir or not TENANT_ID.fullmatch(tenant) or not os.path.exists(path):
+            raise FileNotFoundError(f"No tenant named {tenant}")
+        return path, os.path.join(self.directory, tenant)
+
+    def targets(self):
+        """``(tenant, database, snapshot directory)`` of everything backed up."""
+        if not self.tenant_dir:
+            return [(None, self.path, self.directory)]
+        return [(tenant,) + self.location(tenant) for tenant in tenant_names(self.tenant_dir)]
+
+    def gauges(self):
+        """``render`` gauges of every snapshot directory, grouped by name."""
+        gauges = []
+        for tenant, _, directory in self.targets():
+            gauges += backup_gauges(directory, {'tenant': tenant} if tenant else None)
+        return sorted(gauges, key=lambda gauge: gauge[0])
+
+    def run_due(self):
+        """Snapshot each database no worker backed up within ``interval``.
+
+        Returns the new snapshots' entries.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        with open(os.path.join(self.directory, LOCK_FILE), 'w') as lock:
+            if fcntl is not None:
+                try:
+                    fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except OSError:
+                    return []
+            entries = []
+            for tenant, path, directory in self.targets():
+                snapshots = list_snapshots(directory)
+                newest = os.stat(os.path.join(directory, snapshots[0]['name'])).st_mtime if snapshots else 0
+                if time.time() - newest < self.interval:
+                    continue
+                try:
+                    entry = backup_now(path, directory, self.registry)
+                except Exception as e:
+                    # one tenant's failure must not hold back the others
+                    logging.error(f"Error backing up {path}: {e}")
+                    continue
+                logging.info(f"Backed up {path} to {entry['name']} ({entry['size']} bytes, {entry['seconds']}s)")
+                entries.append(entry)
+            return entries
+
+    def _loop(self):
+        while True:
+            time.sleep(min(self.interval, 60))
+            try:
+                self.run_due()
+            except Exception as e:  # pragma: no cover - logged and retried next interval
+                logging.error(f"Error backing up the database: {e}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='List, take and restore database snapshots.')
+    parser.add_argument('command', choices=('list', 'create', 'restore', 'prune'))
+    parser.add_argument('name', nargs='?', help='snapshot to restore')
+    parser.add_argument('--db', default=DB_PATH, help='database file (default DATABASE_URL)')
+    parser.add_argument('--dir', default=BACKUP_DIR, help='snapshot directory (default BACKUP_DIR)')
+    parser.add_argument('--tenant', help="a tenant's database in TENANT_DIR and its BACKUP_DIR/<tenant>")
+    args = parser.parse_args(argv)
+    if not args.dir:
+        parser.error('set BACKUP_DIR or pass --dir')
+    if args.tenant:
+        try:
+            args.db, args.dir = BackupScheduler(args.db, args.dir, tenant_dir=TENANT_DIR).location(args.tenant)
+        except FileNotFoundError as e:
+            parser.error(str(e))
+    if args.command == 'list':
+        for entry in list_snapshots(args.dir):
+            print(f"{entry['name']}  {entry['size']:>12}  {entry['created']}")
+    elif args.command == 'create':
+        entry = backup_now(args.db, args.dir)
+        print(f"{entry['name']}  {entry['size']} bytes  {entry['seconds']}s")
+    elif args.command == 'prune':
+        for name in prune_snapshots(args.dir):
+            print(f"removed {name}")
+    else:
+        if not args.name:
+            parser.error('restore needs a snapshot name')
+        saved = restore(args.name, args.dir, args.db)
+        print(f"restored {args.name}; the previous state is in {saved['name']}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""Conditional GETs and an in-memory cache for the list endpoints.
+
+Every write to ``areas``, ``objectives`` or ``tasks`` bumps
+``meta.data_version`` through triggers (see migration 4), including writes
+made by undo, by other workers and by background jobs.  Read endpoints
+listed in ``CACHEABLE_ENDPOINTS`` derive a strong ETag from that version:
+a matching ``If-None-Match`` is answered with ``304 Not Modified`` and other
+repeats are served from a bounded LRU of rendered responses, so polling a
+quiet board never touches the tables.
+"""
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from flask import current_app, g, request
+
+# ETags are always served; RESPONSE_CACHE only controls the in-memory copies
+RESPONSE_CACHE = os.environ.get('RESPONSE_CACHE', '1') not in ('0', 'false', 'no')
+RESPONSE_CACHE_MAX_BYTES = int(os.environ.get('RESPONSE_CACHE_MAX_BYTES', 32 * 1024 * 1024))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 1000))
+
+CACHEABLE_ENDPOINTS = {
+    'areas.handle_areas',
+    'objectives.handle_objectives',
+    'tasks.handle_tasks',
+    'tree.get_tree',
+    'changes.get_changes',
+    'search.search',
+    'stats.get_stats',
+    # archived rows only change when rows leave or re-enter the board
+    'archive.list_archive',
+}
+
+# response headers worth replaying from the cache
+CACHED_HEADERS = ('Content-Type', 'X-Next-Cursor')
+
+
+class ResponseCache:
+    """Thread-safe LRU of rendered responses capped by entries and bytes."""
+
+    def __init__(self, max_bytes=RESPONSE_CACHE_MAX_BYTES, max_entries=RESPONSE_CACHE_MAX_ENTRIES):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()  # key -> (body, headers)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, body, headers):
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old[0])
+            self._entries[key] = (body, headers)
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes or len(self._entries) > self.max_entries:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'not_modified': self.not_modified,
+                'evictions': self.evictions,
+            }
+
+
+def data_version(conn):
+    """Return ``(instance_id, data_version)`` for the database."""
+    rows = dict(conn.execute(
+        "SELECT name, value FROM meta WHERE name IN ('instance_id', 'data_version')"
+    ).fetchall())
+    return rows['instance_id'], rows['data_version']
+
+
+def serve_cached():
+    """``before_request`` hook answering repeat reads without the route."""
+    if request.method != 'GET' or request.endpoint not in CACHEABLE_ENDPOINTS:
+        return None
+    try:
+        instance, version = data_version(current_app.get_db())
+    except Exception as e:  # pragma: no cover - e.g. database not migrated yet
+        logging.debug(f"Response cache disabled for request: {e}")
+        return None
+    path = request.full_path
+    digest = hashlib.blake2b(path.encode(), digest_size=6).hexdigest()
+    etag = f'{instance}.{version}.{digest}'
+    g.cache_key = (instance, version, path)
+    g.etag = etag
+
+    cache = current_app.response_cache
+    if etag in request.if_none_match:
+        cache.not_modified += 1
+        response = current_app.response_class(status=304)
+        response.set_etag(etag)
+        g.cache_hit = True
+        return response
+    entry = cache.get(g.cache_key) if RESPONSE_CACHE else None
+    if entry is None:
+        return None
+    body, headers = entry
+    response = current_app.response_class(body, headers=headers)
+    response.set_etag(etag)
+    g.cache_hit = True
+    return response
+
+
+def store_response(response):
+    """``after_request`` hook tagging and caching freshly rendered reads."""
+    key = g.get('cache_key')
+    if key is None or g.get('cache_hit') or response.status_code != 200 or response.is_streamed:
+        return response
+    response.set_etag(g.etag)
+    if not RESPONSE_CACHE:
+        return response
+    headers = [(name, response.headers[name]) for name in CACHED_HEADERS if name in response.headers]
+    current_app.response_cache.put(key, response.get_data(), headers)
+    return response
@@ -1,13 +1,91 @@
 import os
+import re
+import hmac
+import hashlib
 import sqlite3
-import json
 import logging
+import time
+import threading
+from collections import OrderedDict
 from datetime import datetime
 import pytz
+from flask import g, has_app_context, has_request_context, jsonify, request
+
+try:
+    from .pool import ConnectionPool, WriterQueue
+    from .migrations import LATEST_VERSION, migrate, schema_version
+    from .ordering import ORDERING_MODE, sync_mode
+    from .search import ensure_search_index
+    from .metrics import METRICS, InstrumentedConnection, RequestStats, unwrap
+    from .tracing import QUERY_TRACE
+except ImportError:  # pragma: no cover - executed only when run as script
+    from pool import ConnectionPool, WriterQueue
+    from migrations import LATEST_VERSION, migrate, schema_version
+    from ordering import ORDERING_MODE, sync_mode
+    from search import ensure_search_index
+    from metrics import METRICS, InstrumentedConnection, RequestStats, unwrap
+    from tracing import QUERY_TRACE
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
 
 # Determine where the SQLite database should live. This mirrors the old logic in app.py
 DB_PATH = os.environ.get('DATABASE_URL', 'tasks.db')
 
+# Connection pool sizing. Each worker process keeps its own pool.
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 5))
+POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+POOL_MAX_AGE = float(os.environ.get('DB_POOL_MAX_AGE', 300))
+
+# Storage profile: a named set of pragmas, each of which can be overridden
+# individually.  ``wal`` lets readers proceed while a write is in progress.
+STORAGE_PROFILES = {
+    'wal': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': 5000,
+        'mmap_size': 256 * 1024 * 1024,
+        'cache_size': -16000,
+    },
+    'legacy': {
+        'journal_mode': 'DELETE',
+        'synchronous': 'FULL',
+        'busy_timeout': 5000,
+        'mmap_size': 0,
+        'cache_size': -2000,
+    },
+}
+STORAGE_PROFILE = dict(STORAGE_PROFILES[os.environ.get('SQLITE_PROFILE', 'wal')])
+for _name in STORAGE_PROFILE:
+    _override = os.environ.get(f'SQLITE_{_name.upper()}')
+    if _override:
+        STORAGE_PROFILE[_name] = _override
+
+# Route every mutating request through a single writer connection.
+WRITER_QUEUE = os.environ.get('SQLITE_WRITER_QUEUE', '1') not in ('0', 'false', 'no')
+WRITER_TIMEOUT = float(os.environ.get('SQLITE_WRITER_TIMEOUT', 30))
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+# Per-tenant sharding: with TENANT_DIR set, each tenant gets its own
+# database file there, picked per request by select_tenant().
+TENANT_DIR = os.environ.get('TENANT_DIR') or None
+TENANT_HEADER = os.environ.get('TENANT_HEADER', 'X-Tenant')
+# with a secret, tenants come only from signed bearer tokens (tenant_token)
+TENANT_SECRET = os.environ.get('TENANT_SECRET') or None
+TENANT_MAX_OPEN = int(os.environ.get('TENANT_MAX_OPEN', 64))
+TENANT_IDLE_TIMEOUT = float(os.environ.get('TENANT_IDLE_TIMEOUT', 300))
+TENANT_POOL_SIZE = int(os.environ.get('TENANT_POOL_SIZE', 2))
+TENANT_ID = re.compile(r'[A-Za-z0-9][A-Za-z0-9_-]{0,63}')
+# endpoints and blueprints served from the main database, without a tenant
+TENANT_FREE = ('test', 'pool_status', 'metrics', 'tenants')
+
+_pool = None
+_writer = None
+_router = None
+_pool_lock = threading.Lock()
+
 
 def get_pacific_time():
     """Return the current time in America/Los_Angeles timezone."""
@@ -15,87 +93,471 @@ def get_pacific_time():
     return datetime.now(pacific).isoformat()
 
 
-def init_db():
-    """Initialise the database and create tables if required."""
-    logging.info(f"Initializing database at {DB_PATH}...")
+def init_db(path=None):
+    """Initialise the database, applying any pending schema migrations."""
+    path = path or DB_PATH
+    logging.info(f"Initializing database at {path}...")
     try:
-        dir_name = os.path.dirname(DB_PATH)
+        dir_name = os.path.dirname(path)
         if dir_name:
             os.makedirs(dir_name, exist_ok=True)
-        with sqlite3.connect(DB_PATH) as conn:
-            c = conn.cursor()
-
-            c.execute('''
-                CREATE TABLE IF NOT EXISTS areas (
-                    key TEXT PRIMARY KEY,
-                    text TEXT NOT NULL,
-                    date_time_created TEXT NOT NULL,
-                    order_index INTEGER NOT NULL DEFAULT 0
-                )
-            ''')
-
-            c.execute('''
-                CREATE TABLE IF NOT EXISTS objectives (
-                    key TEXT PRIMARY KEY,
-                    area_key TEXT NOT NULL,
-                    text TEXT NOT NULL,
-                    date_time_created TEXT NOT NULL,
-                    date_time_completed TEXT,
-                    status TEXT DEFAULT 'open' CHECK(status IN ('open', 'complete', 'secondary')),
-                    order_index INTEGER NOT NULL DEFAULT 0,
-                    FOREIGN KEY (area_key) REFERENCES areas (key) ON DELETE CASCADE
-                )
-            ''')
-
-            c.execute('''
-                CREATE TABLE IF NOT EXISTS tasks (
-                    key TEXT PRIMARY KEY,
-                    area_key TEXT,
-                    objective_key TEXT,
-                    text TEXT NOT NULL,
-                    date_time_created TEXT NOT NULL,
-                    date_time_completed TEXT,
-                    status TEXT DEFAULT 'open' CHECK(status IN ('open', 'complete', 'secondary')),
-                    order_index INTEGER NOT NULL DEFAULT 0,
-                    FOREIGN KEY (area_key) REFERENCES areas (key) ON DELETE CASCADE,
-                    FOREIGN KEY (objective_key) REFERENCES objectives (key) ON DELETE CASCADE,
-                    CHECK ((area_key IS NOT NULL AND objective_key IS NULL) OR
-                           (area_key IS NULL AND objective_key IS NOT NULL))
-                )
-            ''')
-
-            c.execute('''
-                CREATE TABLE IF NOT EXISTS undo_log (
-                    id INTEGER PRIMARY KEY AUTOINCREMENT,
-                    action_type TEXT NOT NULL,
-                    table_name TEXT NOT NULL,
-                    record_key TEXT NOT NULL,
-                    old_data TEXT NOT NULL,
-                    timestamp TEXT NOT NULL
-                )
-            ''')
-
-            logging.info("Database initialized successfully")
+        conn = sqlite3.connect(path)
+        try:
+            # journal_mode is persistent, so it only needs setting once
+            mode = conn.execute(f"PRAGMA journal_mode = {STORAGE_PROFILE['journal_mode']}").fetchone()[0]
+            logging.info(f"Database journal mode: {mode}")
+            applied = migrate(conn)
+            sync_mode(conn, ORDERING_MODE)
+            ensure_search_index(conn)
+        finally:
+            conn.close()
+        if applied:
+            logging.info(f"Database migrated to schema version {applied[-1]}")
+        logging.info("Database initialized successfully")
     except sqlite3.Error as e:
         logging.error(f"Error initializing database: {e}")
         raise
 
 
-def get_db():
-    """Return a connection to the configured database."""
-    logging.info(f"Attempting to connect to DB at: {DB_PATH}")
-    conn = sqlite3.connect(DB_PATH)
+def schema_current(path=None):
+    """Whether the database at ``path`` needs none of :func:`init_db`'s setup.
+
+    True once it is fully migrated and uses the configured ordering mode
+    and journal mode.  Cheap: reads the header and one ``meta`` row.
+    """
+    path = path or DB_PATH
+    if not os.path.exists(path):
+        return False
+    conn = sqlite3.connect(path)
+    try:
+        if schema_version(conn) != LATEST_VERSION:
+            return False
+        mode = conn.execute("SELECT value FROM meta WHERE name = 'ordering_mode'").fetchone()
+        journal = conn.execute('PRAGMA journal_mode').fetchone()[0]
+        # no recorded mode means 'index', as in sync_mode
+        return ((mode[0] if mode else 'index') == ORDERING_MODE
+                and journal.lower() == STORAGE_PROFILE['journal_mode'].lower())
+    finally:
+        conn.close()
+
+
+def prepare_db(path=None):
+    """Run :func:`init_db` unless the schema is already current.
+
+    Processes booting together (gunicorn workers, or machines sharing a
+    volume) take turns on a lock file next to the database: the first one
+    sets it up, the others find it current and skip straight on.  Returns
+    whether setup ran.
+    """
+    path = path or DB_PATH
+    if schema_current(path):
+        return False
+    dir_name = os.path.dirname(path)
+    if dir_name:
+        os.makedirs(dir_name, exist_ok=True)
+    with open(f'{path}.lock', 'w') as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        if schema_current(path):
+            return False
+        init_db(path)
+    return True
+
+
+def connect(path=None):
+    """Open a new connection configured the way the routes expect."""
+    conn = sqlite3.connect(path or DB_PATH, check_same_thread=False)
     conn.row_factory = sqlite3.Row
     # enable foreign key constraints for cascading deletes
     conn.execute('PRAGMA foreign_keys = ON')
+    for name in ('synchronous', 'busy_timeout', 'mmap_size', 'cache_size'):
+        conn.execute(f'PRAGMA {name} = {STORAGE_PROFILE[name]}')
     return conn
 
 
-def log_action_for_undo(conn, action_type, table_name, record_key, old_data):
-    """Persist an action so that it can be undone later."""
-    json_data = json.dumps(old_data)
-    conn.execute(
-        'INSERT INTO undo_log (action_type, table_name, record_key, old_data, timestamp) VALUES (?, ?, ?, ?, ?)',
-        (action_type, table_name, record_key, json_data, get_pacific_time())
+def get_pool():
+    """Return this process's connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(connect, size=POOL_SIZE, timeout=POOL_TIMEOUT, max_age=POOL_MAX_AGE)
+    return _pool
+
+
+def get_writer():
+    """Return this process's writer queue, creating it on first use."""
+    global _writer
+    if _writer is None:
+        with _pool_lock:
+            if _writer is None:
+                _writer = WriterQueue(connect, timeout=WRITER_TIMEOUT)
+    return _writer
+
+
+class TenantError(Exception):
+    """Raised for a missing, malformed or forged tenant."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+class Shard:
+    """One tenant's database file with its own reader pool and writer.
+
+    Shards never share a connection or a write lock, so writes of different
+    tenants do not wait for each other.
+    """
+
+    def __init__(self, tenant, path, pool_size=TENANT_POOL_SIZE):
+        self.tenant = tenant
+        self.path = path
+        self.pool = ConnectionPool(self.connect, size=pool_size, timeout=POOL_TIMEOUT, max_age=POOL_MAX_AGE)
+        self.writer = WriterQueue(self.connect, timeout=WRITER_TIMEOUT)
+        self.active = 0
+        self.last_used = time.monotonic()
+        self.ready = False
+        self._lock = threading.Lock()
+        self._resources = {}
+
+    def connect(self):
+        return connect(self.path)
+
+    def prepare(self):
+        """Create or migrate the tenant's schema once per process."""
+        if self.ready:
+            return
+        with self._lock:
+            if not self.ready:
+                prepare_db(self.path)
+                self.ready = True
+
+    def attach(self, name, factory):
+        """Return the shard's ``name`` object, created by ``factory()`` once.
+
+        Objects with a ``close`` method are closed with the shard.
+        """
+        with self._lock:
+            if name not in self._resources:
+                self._resources[name] = factory()
+            return self._resources[name]
+
+    @property
+    def busy(self):
+        return self.active > 0 or any(getattr(r, 'in_use', False) for r in self._resources.values())
+
+    def close(self):
+        """Close the idle connections; checked-out ones close on release."""
+        self.pool.close_all()
+        self.writer.close()
+        for resource in self._resources.values():
+            if hasattr(resource, 'close'):
+                resource.close()
+        self._resources = {}
+
+
+def tenant_names(directory):
+    """Names of the tenants with a ``<tenant>.db`` file in ``directory``."""
+    if not os.path.isdir(directory):
+        return []
+    return sorted(
+        name[:-len('.db')] for name in os.listdir(directory)
+        if name.endswith('.db') and TENANT_ID.fullmatch(name[:-len('.db')])
     )
-    conn.commit()
+
+
+class TenantRouter:
+    """LRU of open tenant shards, bounded in count and idle time.
+
+    Parameters
+    ----------
+    directory : str
+        Where the ``<tenant>.db`` files live.
+    max_open : int
+        Shards kept open; the least recently used idle one is closed to
+        make room for another.
+    idle_timeout : float
+        Shards unused for this many seconds are closed.  ``0`` keeps them
+        open until evicted.
+    """
+
+    def __init__(self, directory, max_open=TENANT_MAX_OPEN, idle_timeout=TENANT_IDLE_TIMEOUT,
+                 pool_size=TENANT_POOL_SIZE):
+        self.directory = directory
+        self.max_open = max_open
+        self.idle_timeout = idle_timeout
+        self.pool_size = pool_size
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._shards = OrderedDict()   # tenant -> Shard, most recently used last
+        self._swept = time.monotonic()
+        self._opened = 0
+        self._evicted = 0
+        self._expired = 0
+
+    def path(self, tenant):
+        return os.path.join(self.directory, f'{tenant}.db')
+
+    def acquire(self, tenant):
+        """Return ``tenant``'s shard, ready for use until :meth:`release`."""
+        now = time.monotonic()
+        with self._lock:
+            if self._pid != os.getpid():
+                # forked worker: the parent's connections are not ours
+                self._reset()
+            shard = self._shards.get(tenant)
+            if shard is None:
+                shard = self._shards[tenant] = Shard(tenant, self.path(tenant), self.pool_size)
+                self._opened += 1
+            else:
+                self._shards.move_to_end(tenant)
+            shard.active += 1
+            shard.last_used = now
+            closing = self._evict(now)
+        for old in closing:
+            old.close()
+        try:
+            # outside the router lock: a slow migration holds up one tenant
+            shard.prepare()
+        except Exception:
+            self.release(shard)
+            raise
+        return shard
+
+    def release(self, shard):
+        with self._lock:
+            shard.active -= 1
+            shard.last_used = time.monotonic()
+
+    def _evict(self, now):
+        closing = []
+        if self.idle_timeout and now - self._swept > self.idle_timeout / 4:
+            self._swept = now
+            for tenant, shard in list(self._shards.items()):
+                if not shard.busy and now - shard.last_used > self.idle_timeout:
+                    closing.append(self._shards.pop(tenant))
+                    self._expired += 1
+        while len(self._shards) > self.max_open:
+            idle = next((t for t, s in self._shards.items() if not s.busy), None)
+            if idle is None:
+                # every shard is in use; they close once released and idle
+                break
+            closing.append(self._shards.pop(idle))
+            self._evicted += 1
+        return closing
+
+    def tenants(self):
+        """Names of the tenants with a database file in ``directory``."""
+        return tenant_names(self.directory)
+
+    def run_all(self, fn, *args):
+        """Run ``fn(conn, *args)`` on every tenant's writer, one at a time.
+
+        Tenants that are not open are opened for the call and closed again
+        afterwards, so idle ones are pruned and archived too.  Returns the
+        sum of the results, for the background jobs.
+        """
+        total = 0
+        for tenant in self.tenants():
+            with self._lock:
+                was_open = tenant in self._shards
+            try:
+                shard = self.acquire(tenant)
+            except Exception as e:  # pragma: no cover - logged, the others still run
+                logging.error(f"Error opening tenant {tenant} for {fn.__name__}: {e}")
+                continue
+            try:
+                total += shard.writer.run(fn, *args) or 0
+            except Exception as e:  # pragma: no cover - logged, the others still run
+                logging.error(f"Error in {fn.__name__} for tenant {tenant}: {e}")
+            finally:
+                self.release(shard)
+                if not was_open:
+                    self._close_idle(tenant)
+        return total
+
+    def _close_idle(self, tenant):
+        with self._lock:
+            shard = self._shards.get(tenant)
+            if shard is None or shard.busy:
+                return
+            del self._shards[tenant]
+        shard.close()
+
+    def close_all(self):
+        with self._lock:
+            shards = list(self._shards.values())
+            self._shards.clear()
+        for shard in shards:
+            shard.close()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'open': len(self._shards),
+                'active': sum(1 for s in self._shards.values() if s.active),
+                'max_open': self.max_open,
+                'opened': self._opened,
+                'evicted': self._evicted,
+                'expired': self._expired,
+            }
+
+
+def get_router():
+    """Return this process's tenant router (``TENANT_DIR`` only)."""
+    global _router
+    if _router is None:
+        with _pool_lock:
+            if _router is None:
+                _router = TenantRouter(TENANT_DIR)
+    return _router
+
+
+def tenant_token(tenant, secret=None):
+    """Return the bearer token naming ``tenant``, signed with ``TENANT_SECRET``."""
+    secret = secret or TENANT_SECRET
+    signature = hmac.new(secret.encode(), tenant.encode(), hashlib.sha256).hexdigest()
+    return f'{tenant}.{signature}'
+
+
+def resolve_tenant():
+    """Return the request's tenant, or ``None`` when it names none.
+
+    With ``TENANT_SECRET`` set the tenant comes from an ``Authorization:
+    Bearer`` token made by :func:`tenant_token`; otherwise from the
+    ``TENANT_HEADER`` header, set by a trusted proxy, and must already
+    have been created with :func:`provision_tenant`.  Raises
+    :class:`TenantError` for a forged token, an unusable name or an
+    unknown tenant.
+    """
+    if TENANT_SECRET:
+        supplied = request.headers.get('Authorization', '')
+        if not supplied.startswith('Bearer '):
+            return None
+        supplied = supplied[len('Bearer '):]
+        tenant = supplied.rpartition('.')[0]
+        if not tenant or not hmac.compare_digest(tenant_token(tenant).encode(), supplied.encode()):
+            raise TenantError("Invalid tenant token", 401)
+    else:
+        tenant = request.headers.get(TENANT_HEADER)
+        if not tenant:
+            return None
+    if not TENANT_ID.fullmatch(tenant):
+        raise TenantError("Tenant names are 1-64 letters, digits, '-' or '_'")
+    if not TENANT_SECRET and not os.path.exists(get_router().path(tenant)):
+        # an unsigned header must not create a database per distinct value
+        raise TenantError(f"Unknown tenant {tenant}", 404)
+    return tenant
+
+
+def provision_tenant(tenant):
+    """Create and migrate ``tenant``'s database; returns whether it is new."""
+    if not TENANT_DIR:
+        raise TenantError("Tenants are disabled; set TENANT_DIR", 404)
+    if not isinstance(tenant, str) or not TENANT_ID.fullmatch(tenant):
+        raise TenantError("Tenant names are 1-64 letters, digits, '-' or '_'")
+    router = get_router()
+    created = not os.path.exists(router.path(tenant))
+    router.release(router.acquire(tenant))
+    return created
+
+
+def select_tenant():
+    """``before_request`` hook routing the request to its tenant's database."""
+    if not TENANT_DIR or request.method == 'OPTIONS':
+        return None
+    if request.endpoint in TENANT_FREE or request.blueprint in TENANT_FREE:
+        return None
+    try:
+        tenant = resolve_tenant()
+    except TenantError as e:
+        return jsonify({"error": str(e)}), e.status
+    if tenant is None:
+        if TENANT_SECRET:
+            return jsonify({"error": "A tenant token is required"}), 401
+        return jsonify({"error": f"The {TENANT_HEADER} header is required"}), 400
+    g.tenant = tenant
+    return None
+
+
+def current_shard():
+    """The request's tenant shard, or ``None`` for the main database."""
+    if not has_request_context() or g.get('tenant') is None:
+        return None
+    if 'shard' not in g:
+        g.shard = get_router().acquire(g.tenant)
+    return g.shard
+
+
+def get_db():
+    """Return a connection to the configured database.
+
+    Inside an application context the connection is checked out once and
+    reused for the rest of the request; :func:`close_db` hands it back when
+    the context is torn down.  Mutating requests wait their turn for the
+    writer connection (see ``SQLITE_WRITER_QUEUE``), everything else reads
+    through the pool.  Requests routed to a tenant (``TENANT_DIR``) use
+    that tenant's pool and writer instead.  Outside of a context a fresh,
+    unpooled connection is returned.
+    """
+    if not has_app_context():
+        return connect()
+    if 'db' not in g:
+        start = time.perf_counter()
+        shard = current_shard()
+        if shard is not None:
+            pool, writer = shard.pool, shard.writer
+        else:
+            pool, writer = get_pool(), get_writer()
+        if WRITER_QUEUE and has_request_context() and request.method in WRITE_METHODS:
+            conn = writer.acquire()
+            g.db_is_writer = True
+        else:
+            conn = pool.acquire()
+        if METRICS or QUERY_TRACE:
+            # times the request's SQLite work for /metrics and the query tracer
+            conn = InstrumentedConnection(
+                conn, RequestStats(connect=time.perf_counter() - start), [] if QUERY_TRACE else None
+            )
+        g.db = conn
+    return g.db
+
+
+def close_db(exc=None):
+    """Return the request's connection to the pool (teardown hook)."""
+    conn = g.pop('db', None)
+    shard = g.pop('shard', None)
+    if conn is not None:
+        conn = unwrap(conn)
+        pool, writer = (shard.pool, shard.writer) if shard is not None else (get_pool(), get_writer())
+        if g.pop('db_is_writer', False):
+            writer.release(conn, discard=exc is not None)
+        else:
+            pool.release(conn, discard=exc is not None)
+    if shard is not None:
+        get_router().release(shard)
+
+
+def writer_run():
+    """Return ``run`` of the writer behind the current request.
+
+    Lets background work scheduled by a request (rank rebalancing) write to
+    that request's tenant.
+    """
+    shard = current_shard()
+    return shard.writer.run if shard is not None else get_writer().run
+
+
+def pool_stats():
+    """Usage counters for the reader pool and, once used, the writer."""
+    stats = get_pool().stats()
+    if _writer is not None:
+        stats['writer'] = _writer.stats()
+    if _router is not None:
+        stats['tenants'] = _router.stats()
+    return stats
+
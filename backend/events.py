@@ -0,0 +1,256 @@
+"""Change feed behind ``GET /api/events``.
+
+Triggers (migration 7) append a record to ``change_log`` for every row
+written to ``areas``, ``objectives`` or ``tasks``, inside the writing
+transaction, so a record becomes visible exactly when its change commits,
+whichever route, worker or background job made it.  Each worker runs one
+:class:`ChangeFeed` thread that tails the table and fans new records out to
+its subscribers; ``PRAGMA data_version`` tells it when another connection
+has committed, so an idle feed costs one pragma per poll.
+
+Subscribers hold a bounded buffer.  One that falls behind is not allowed to
+grow without limit: its buffer is dropped and it catches up from
+``change_log`` itself.  Clients resume with ``?since=<version>`` or the
+standard ``Last-Event-ID`` header; when the versions they ask for have been
+pruned they get a ``reset`` event and must reload.
+"""
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+
+EVENTS_POLL_INTERVAL = float(os.environ.get('EVENTS_POLL_INTERVAL', 0.5))
+EVENTS_HEARTBEAT = float(os.environ.get('EVENTS_HEARTBEAT', 15))
+EVENTS_BUFFER = int(os.environ.get('EVENTS_BUFFER', 1000))
+CHANGE_LOG_MAX_ROWS = int(os.environ.get('CHANGE_LOG_MAX_ROWS', 100000))
+
+# records read per query
+READ_CHUNK = 500
+
+
+def read_changes(conn, since, limit=READ_CHUNK):
+    """Return up to ``limit`` change records with a version above ``since``."""
+    rows = conn.execute(
+        'SELECT version, entity, key, op, fields FROM change_log WHERE version > ? ORDER BY version LIMIT ?',
+        (since, limit),
+    ).fetchall()
+    return [
+        {
+            'version': version,
+            'entity': entity,
+            'key': key,
+            'op': op,
+            'fields': json.loads(fields) if fields else {},
+        }
+        for version, entity, key, op, fields in rows
+    ]
+
+
+def version_range(conn):
+    """Return ``(oldest, latest)`` versions still in ``change_log``."""
+    oldest, latest = conn.execute('SELECT MIN(version), MAX(version) FROM change_log').fetchone()
+    latest = latest or conn.execute(
+        "SELECT IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'change_log'), 0)"
+    ).fetchone()[0]
+    return (oldest or latest + 1), latest
+
+
+def prune_changes(conn, keep=CHANGE_LOG_MAX_ROWS):
+    """Delete all but the newest ``keep`` change records."""
+    return conn.execute(
+        'DELETE FROM change_log WHERE version <= (SELECT MAX(version) FROM change_log) - ?', (keep,)
+    ).rowcount
+
+
+def format_event(event, data, event_id=None):
+    """Render one Server-Sent Event."""
+    lines = [f'id: {event_id}'] if event_id is not None else []
+    lines += [f'event: {event}', f'data: {json.dumps(data, separators=(",", ":"))}']
+    return '\n'.join(lines) + '\n\n'
+
+
+class Subscriber:
+    """A bounded buffer of records waiting to be streamed to one client."""
+
+    def __init__(self, size):
+        self.size = size
+        self.records = deque()
+        self.overflowed = False
+        self.cond = threading.Condition()
+
+    def push(self, records):
+        with self.cond:
+            if not self.overflowed:
+                self.records.extend(records)
+                if len(self.records) > self.size:
+                    # stop buffering; the stream re-reads from change_log
+                    self.records.clear()
+                    self.overflowed = True
+            self.cond.notify()
+
+    def take(self, timeout):
+        """Wait up to ``timeout`` for records.
+
+        Returns ``(records, overflowed)`` and resets the buffer.
+        """
+        with self.cond:
+            if not self.records and not self.overflowed:
+                self.cond.wait(timeout)
+            records, overflowed = list(self.records), self.overflowed
+            self.records.clear()
+            self.overflowed = False
+            return records, overflowed
+
+
+class ChangeFeed:
+    """Per-process tailer of ``change_log`` fanning records out to subscribers.
+
+    Parameters
+    ----------
+    connect : callable
+        Opens a connection to the database to tail.
+    run : callable | None
+        ``run(fn, *args)`` executes ``fn(conn, *args)`` in a write
+        transaction; used to keep ``change_log`` within
+        ``CHANGE_LOG_MAX_ROWS``.
+    interval : float
+        Seconds between polls.  ``0`` starts no thread; call :meth:`poll`
+        instead.
+    """
+
+    def __init__(self, connect, run=None, interval=EVENTS_POLL_INTERVAL,
+                 buffer_size=EVENTS_BUFFER, heartbeat=EVENTS_HEARTBEAT):
+        self._connect = connect
+        self._run = run
+        self.interval = interval
+        self.buffer_size = buffer_size
+        self.heartbeat = heartbeat
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._conn = None
+        self._pid = None
+        self._thread_pid = None
+        self._data_version = None
+        self._closed = False
+        self.last_version = None
+
+    def _connection(self):
+        if self._conn is None or self._pid != os.getpid():
+            self._conn = self._connect()
+            self._pid = os.getpid()
+            self.last_version = version_range(self._conn)[1]
+            self._data_version = None
+        return self._conn
+
+    def read(self, since, limit=READ_CHUNK):
+        """Read records after ``since`` on the feed's own connection."""
+        with self._lock:
+            return read_changes(self._connection(), since, limit)
+
+    def versions(self):
+        with self._lock:
+            return version_range(self._connection())
+
+    def subscribe(self):
+        subscriber = Subscriber(self.buffer_size)
+        with self._lock:
+            self._connection()
+            self._subscribers.add(subscriber)
+            if self.interval and self._thread_pid != os.getpid():
+                # started lazily, and again in each forked worker
+                self._thread_pid = os.getpid()
+                threading.Thread(target=self._loop, name='change-feed', daemon=True).start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def in_use(self):
+        return bool(self._subscribers)
+
+    def close(self):
+        """Stop the polling thread and close the feed's connection."""
+        with self._lock:
+            self._closed = True
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    def poll(self):
+        """Hand records committed since the last poll to every subscriber.
+
+        Returns the number of records read.
+        """
+        with self._lock:
+            conn = self._connection()
+            data_version = conn.execute('PRAGMA data_version').fetchone()[0]
+            if data_version == self._data_version:
+                return 0
+            self._data_version = data_version
+            records = []
+            while True:
+                chunk = read_changes(conn, self.last_version)
+                records.extend(chunk)
+                if len(chunk) < READ_CHUNK:
+                    break
+                self.last_version = chunk[-1]['version']
+            if records:
+                self.last_version = records[-1]['version']
+            subscribers = list(self._subscribers)
+            oldest = version_range(conn)[0]
+        if records:
+            for subscriber in subscribers:
+                subscriber.push(records)
+        # the history pruner bounds the table too; this keeps busy feeds
+        # from waiting for its next run
+        if self._run and self.last_version - oldest >= CHANGE_LOG_MAX_ROWS * 1.1:
+            self._run(prune_changes)
+        return len(records)
+
+    def _loop(self):
+        while not self._closed:
+            time.sleep(self.interval)
+            if self._closed:
+                break
+            try:
+                self.poll()
+            except Exception as e:  # pragma: no cover - logged and retried next poll
+                logging.error(f"Error tailing change log: {e}")
+                with self._lock:
+                    self._conn = None
+
+    def stream(self, since=None):
+        """Yield Server-Sent Events from ``since`` (or from now) onwards."""
+        subscriber = self.subscribe()
+        try:
+            caught_up = since is None
+            if since is None:
+                since = self.versions()[1]
+            while True:
+                if not caught_up:
+                    # backlog, or a subscriber that overflowed: read the table
+                    oldest, latest = self.versions()
+                    if since < oldest - 1:
+                        since = latest
+                        yield format_event('reset', {'version': latest}, latest)
+                    records = self.read(since)
+                    caught_up = len(records) < READ_CHUNK
+                else:
+                    records, overflowed = subscriber.take(self.heartbeat)
+                    if overflowed:
+                        caught_up = False
+                        continue
+                    if not records:
+                        yield ': heartbeat\n\n'
+                        continue
+                for record in records:
+                    # the buffer may repeat what the backlog already sent
+                    if record['version'] > since:
+                        since = record['version']
+                        yield format_event('change', record, since)
+        finally:
+            self.unsubscribe(subscriber)
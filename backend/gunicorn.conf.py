@@ -0,0 +1,43 @@
+"""gunicorn settings, sized from the machine's CPU count.
+
+gunicorn reads this file from its working directory, so the image starts
+with a plain ``gunicorn``.  ``SERVER_MODE`` picks the serving model:
+
+- ``wsgi`` (default): ``app:app`` on threaded ``gthread`` workers.
+- ``asgi``: ``asgi:application`` on uvicorn workers; see ``asgi.py`` for
+  how requests are spread over its threads.
+
+SQLite admits one writer at a time, so more processes add read capacity
+but not write capacity: the worker count follows the CPUs, up to
+``WEB_CONCURRENCY_MAX``, and threads cover requests waiting on I/O.
+``WEB_CONCURRENCY`` and ``GUNICORN_THREADS`` override the derived values.
+"""
+import os
+import multiprocessing
+
+SERVER_MODE = os.environ.get('SERVER_MODE', 'wsgi')
+CPUS = multiprocessing.cpu_count()
+WEB_CONCURRENCY_MAX = int(os.environ.get('WEB_CONCURRENCY_MAX', 4))
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8080)}"
+workers = int(os.environ.get('WEB_CONCURRENCY', max(1, min(CPUS, WEB_CONCURRENCY_MAX))))
+if SERVER_MODE == 'asgi':
+    wsgi_app = 'asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+    # asgi.py sizes its own thread pools (ASGI_THREADS, ASGI_STREAM_THREADS)
+elif SERVER_MODE == 'wsgi':
+    wsgi_app = 'app:app'
+    worker_class = 'gthread'
+    # 16 on one CPU; every open /api/events stream holds a thread
+    threads = int(os.environ.get('GUNICORN_THREADS', 8 * CPUS + 8))
+else:
+    raise ValueError(f"Unknown SERVER_MODE: {SERVER_MODE}")
+
+# build the app, and set up the schema, once in the master before forking;
+# connections, pools and background threads are all opened per process
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') not in ('0', 'false', 'no')
+
+# long exports and imports are legitimate; streams send heartbeats
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+graceful_timeout = 30
+keepalive = 5
@@ -0,0 +1,263 @@
+"""Undo/redo history storage.
+
+Changes are recorded in ``undo_log`` as ``(action_type, table_name,
+record_key, old_data)`` entries:
+
+``DELETE``
+    ``old_data`` is the deleted row; reverting re-inserts it.
+``UPDATE``
+    ``old_data`` holds the key and the previous value of each changed
+    column (plus the old parent and position when the row moved);
+    reverting writes them back.
+``INSERT``
+    ``old_data`` is just the key; reverting deletes the row.  Only redo
+    entries use it.
+
+Entries written for one user action share a ``group_id`` and are undone
+together.  Undoing a group pushes its inverse onto ``redo_log`` and any new
+action clears that stack.  ``old_data`` is compact JSON, zlib-compressed
+when ``UNDO_COMPRESS`` is set and the payload is large enough to benefit.
+Both tables are bounded by :func:`prune_history`, which
+:class:`HistoryPruner` runs in the background; :func:`drop_groups` removes
+groups that can no longer be reverted.
+"""
+import os
+import json
+import zlib
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+import pytz
+
+try:
+    from .database import get_pacific_time
+except ImportError:  # pragma: no cover - executed only when run as script
+    from database import get_pacific_time
+
+UNDO_MAX_GROUPS = int(os.environ.get('UNDO_MAX_GROUPS', 500))
+UNDO_MAX_AGE_DAYS = float(os.environ.get('UNDO_MAX_AGE_DAYS', 30))
+UNDO_PRUNE_INTERVAL = float(os.environ.get('UNDO_PRUNE_INTERVAL', 300))
+UNDO_COMPRESS = os.environ.get('UNDO_COMPRESS', '0') not in ('0', 'false', 'no')
+UNDO_COMPRESS_MIN_BYTES = int(os.environ.get('UNDO_COMPRESS_MIN_BYTES', 256))
+
+HISTORY_TABLES = ('undo_log', 'redo_log')
+# tables the parent columns of ``old_data`` point into
+PARENT_TABLES = {'area_key': 'areas', 'objective_key': 'objectives'}
+
+
+def encode_data(data, compress=UNDO_COMPRESS):
+    """Serialise ``old_data`` as compact JSON, compressed if worthwhile."""
+    text = json.dumps(data, separators=(',', ':'))
+    if compress and len(text) >= UNDO_COMPRESS_MIN_BYTES:
+        return zlib.compress(text.encode())
+    return text
+
+
+def decode_data(value):
+    """Inverse of :func:`encode_data`; also reads uncompressed legacy rows."""
+    if isinstance(value, bytes):
+        value = zlib.decompress(value).decode()
+    return json.loads(value)
+
+
+def write_history(conn, actions, table='undo_log'):
+    """Append ``actions`` to ``table`` as one group, without committing.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection whose open transaction receives the entries.
+    actions : list[tuple]
+        ``(action_type, table_name, record_key, old_data)`` in the order the
+        changes were made.
+    table : str
+        ``'undo_log'`` or ``'redo_log'``.
+
+    Returns
+    -------
+    int | None
+        The ``group_id`` written, or ``None`` when there was nothing to log.
+    """
+    if not actions:
+        return None
+    # above every existing id, so no older group can share it
+    group_id = conn.execute(f'SELECT IFNULL(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+    timestamp = get_pacific_time()
+    conn.executemany(
+        f'INSERT INTO {table} (action_type, table_name, record_key, old_data, timestamp, group_id) '
+        'VALUES (?, ?, ?, ?, ?, ?)',
+        [(action_type, table_name, record_key, encode_data(old_data), timestamp, group_id)
+         for action_type, table_name, record_key, old_data in actions],
+    )
+    return group_id
+
+
+def pop_group(conn, table='undo_log'):
+    """Remove the newest group from ``table`` and return its entries.
+
+    Entries come newest first, the order in which they must be reverted.
+    """
+    last = conn.execute(f'SELECT group_id FROM {table} ORDER BY id DESC LIMIT 1').fetchone()
+    if last is None:
+        return []
+    rows = conn.execute(
+        f'SELECT action_type, table_name, record_key, old_data FROM {table} '
+        'WHERE group_id = ? ORDER BY id DESC',
+        (last[0],),
+    ).fetchall()
+    conn.execute(f'DELETE FROM {table} WHERE group_id = ?', (last[0],))
+    return [(action_type, table_name, key, decode_data(data)) for action_type, table_name, key, data in rows]
+
+
+class UndoBuffer:
+    """Collects a request's undo entries to write them as one group.
+
+    An instance is a drop-in for ``log_action_for_undo``; call :meth:`write`
+    before committing so the entries land in the same transaction as the
+    changes they describe.
+    """
+
+    def __init__(self):
+        self.actions = []
+
+    def __call__(self, conn, action_type, table_name, record_key, old_data):
+        self.actions.append((action_type, table_name, record_key, old_data))
+
+    def write(self, conn):
+        if not self.actions:
+            return None
+        # a new action invalidates whatever could have been redone
+        conn.execute('DELETE FROM redo_log')
+        group_id = write_history(conn, self.actions)
+        self.actions = []
+        return group_id
+
+
+def log_action_for_undo(conn, action_type, table_name, record_key, old_data):
+    """Record a single action as its own undo group, without committing."""
+    undo = UndoBuffer()
+    undo(conn, action_type, table_name, record_key, old_data)
+    return undo.write(conn)
+
+
+def prune_history(conn, max_groups=UNDO_MAX_GROUPS, max_age_days=UNDO_MAX_AGE_DAYS):
+    """Drop groups beyond the newest ``max_groups`` or older than ``max_age_days``.
+
+    Either limit may be ``0`` to disable it.  Returns the number of entries
+    removed.
+    """
+    removed = 0
+    for table in HISTORY_TABLES:
+        cutoffs = []
+        if max_groups:
+            row = conn.execute(
+                f'SELECT DISTINCT group_id FROM {table} ORDER BY group_id DESC LIMIT 1 OFFSET ?',
+                (max_groups,),
+            ).fetchone()
+            if row:
+                cutoffs.append(row[0])
+        if max_age_days:
+            oldest = datetime.now(pytz.timezone('America/Los_Angeles')) - timedelta(days=max_age_days)
+            row = conn.execute(
+                f'SELECT MAX(group_id) FROM {table} WHERE timestamp < ?', (oldest.isoformat(),)
+            ).fetchone()
+            if row[0] is not None:
+                cutoffs.append(row[0])
+        if cutoffs:
+            removed += conn.execute(f'DELETE FROM {table} WHERE group_id <= ?', (max(cutoffs),)).rowcount
+    return removed
+
+
+def drop_groups(conn, keys):
+    """Drop the undo and redo groups that involve rows in ``keys``.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection whose open transaction removes the groups.
+    keys : dict[str, collections.abc.Set]
+        Table name to the keys of rows the history can no longer revert
+        against (e.g. archived ones).  A group is dropped whole when any
+        entry is recorded against one of them or names one as its parent.
+
+    Returns
+    -------
+    int
+        The number of entries removed.
+    """
+    removed = 0
+    for table in HISTORY_TABLES:
+        groups = set()
+        for group_id, table_name, record_key, data in conn.execute(
+            f'SELECT group_id, table_name, record_key, old_data FROM {table}'
+        ).fetchall():
+            if group_id in groups:
+                continue
+            if record_key in keys.get(table_name, ()):
+                groups.add(group_id)
+                continue
+            old_data = decode_data(data)
+            if any(old_data.get(column) in keys.get(parent, ()) for column, parent in PARENT_TABLES.items()):
+                groups.add(group_id)
+        if groups:
+            removed += conn.executemany(
+                f'DELETE FROM {table} WHERE group_id = ?', [(group_id,) for group_id in groups]
+            ).rowcount
+    return removed
+
+
+def history_stats(conn):
+    """Entry and group counts of the undo and redo stacks."""
+    stats = {}
+    for table in HISTORY_TABLES:
+        entries, groups = conn.execute(f'SELECT COUNT(*), COUNT(DISTINCT group_id) FROM {table}').fetchone()
+        stats[table] = {'entries': entries, 'groups': groups}
+    return stats
+
+
+class HistoryPruner:
+    """Background thread running pruning jobs every ``interval`` seconds.
+
+    Parameters
+    ----------
+    run : callable
+        ``run(fn, *args)`` executes ``fn(conn, *args)`` in a write
+        transaction, e.g. ``WriterQueue.run``.
+    interval : float
+        Seconds between runs; ``0`` disables the pruner.
+    jobs : tuple[callable]
+        ``job(conn)`` functions returning the number of rows removed;
+        :func:`prune_history` by default.
+    name : str
+        Name of the thread.
+    """
+
+    def __init__(self, run, interval=UNDO_PRUNE_INTERVAL, jobs=(prune_history,), name='history-pruner'):
+        self._run = run
+        self.interval = interval
+        self.jobs = jobs
+        self.name = name
+        self._lock = threading.Lock()
+        self._pid = None
+
+    def start(self):
+        """Start the thread unless it already runs in this process."""
+        if not self.interval or self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid != os.getpid():
+                # started lazily, and again in each forked worker
+                self._pid = os.getpid()
+                threading.Thread(target=self._loop, name=self.name, daemon=True).start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            for job in self.jobs:
+                try:
+                    removed = self._run(job)
+                    if removed:
+                        logging.info(f"{job.__name__} removed {removed} rows")
+                except Exception as e:  # pragma: no cover - logged and retried next interval
+                    logging.error(f"Error in {job.__name__}: {e}")
@@ -0,0 +1,394 @@
+"""Request and SQLite metrics in the Prometheus text format.
+
+Each worker process counts into its own :class:`Registry`: request hooks in
+``app.py`` record per-route counts, latencies, errors and response sizes,
+and :class:`InstrumentedConnection`, which ``get_db`` hands out in place of
+the pooled connection, times what the request spends in SQLite.
+
+With several gunicorn workers a scrape reaches only one of them, so when
+``METRICS_DIR`` is set every worker also writes its samples to
+``METRICS_DIR/metrics-<pid>.json`` (at most every
+``METRICS_FLUSH_INTERVAL`` seconds, and whenever it serves a scrape) and
+``/metrics`` sums the files of all workers.  Files of workers that exited
+are kept so counters never go backwards; empty the directory when the
+server is (re)started.
+"""
+import os
+import json
+import time
+import bisect
+import logging
+import tempfile
+import threading
+from flask import current_app, g, request
+
+METRICS = os.environ.get('METRICS', '1') not in ('0', 'false', 'no')
+METRICS_DIR = os.environ.get('METRICS_DIR') or None
+METRICS_FLUSH_INTERVAL = float(os.environ.get('METRICS_FLUSH_INTERVAL', 5))
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SQLITE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+BACKUP_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
+
+# name -> (type, help, histogram buckets)
+DEFINITIONS = {
+    'bigpicture_http_requests_total': (
+        'counter', 'HTTP requests by route, method and status.', None),
+    'bigpicture_http_request_errors_total': (
+        'counter', 'Requests answered with a 5xx status or an unhandled exception.', None),
+    'bigpicture_http_request_duration_seconds': (
+        'histogram', 'Time from the first request hook to the response.', LATENCY_BUCKETS),
+    'bigpicture_http_response_bytes_total': (
+        'counter', 'Response body bytes, excluding streamed responses.', None),
+    'bigpicture_sqlite_seconds_total': (
+        'counter', 'Time spent in SQLite by phase (connect, query, commit).', None),
+    'bigpicture_sqlite_request_seconds': (
+        'histogram', 'SQLite time per request, all phases.', SQLITE_BUCKETS),
+    'bigpicture_sqlite_rows_total': (
+        'counter', 'Rows returned by queries.', None),
+    'bigpicture_sqlite_statements_total': (
+        'counter', 'Statements executed.', None),
+    'bigpicture_backups_total': (
+        'counter', 'Snapshots attempted, by result.', None),
+    'bigpicture_backup_duration_seconds': (
+        'histogram', 'Time taken by a snapshot, including its check.', BACKUP_BUCKETS),
+}
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Registry:
+    """Thread-safe counters and histograms of one process.
+
+    Samples are keyed by ``(name, labels)`` where ``labels`` is a sorted
+    tuple of pairs.  A histogram sample is ``[count per bucket..., count
+    above the last bucket, sum]`` (not cumulative).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._samples = {}
+        self._flushed_at = 0.0
+
+    def _check_fork(self):
+        # a forked worker starts counting from zero in its own file
+        if self._pid != os.getpid():
+            self._reset()
+
+    def inc(self, name, labels, value=1):
+        key = (name, _labels(labels))
+        with self._lock:
+            self._check_fork()
+            self._samples[key] = self._samples.get(key, 0) + value
+
+    def observe(self, name, labels, value):
+        buckets = DEFINITIONS[name][2]
+        key = (name, _labels(labels))
+        with self._lock:
+            self._check_fork()
+            sample = self._samples.get(key)
+            if sample is None:
+                sample = self._samples[key] = [0] * (len(buckets) + 1) + [0.0]
+            sample[bisect.bisect_left(buckets, value)] += 1
+            sample[-1] += value
+
+    def samples(self):
+        """Return a copy of this process's samples."""
+        with self._lock:
+            self._check_fork()
+            return {key: list(value) if isinstance(value, list) else value
+                    for key, value in self._samples.items()}
+
+    # --- multi-process aggregation ---------------------------------------
+
+    def flush(self, directory, force=False):
+        """Write this process's samples to ``directory`` if due."""
+        now = time.monotonic()
+        if not force and now - self._flushed_at < METRICS_FLUSH_INTERVAL:
+            return
+        self._flushed_at = now
+        payload = json.dumps([[name, labels, value] for (name, labels), value in self.samples().items()])
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix='.metrics-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(payload)
+            # atomic, so readers never see a half-written file
+            os.replace(tmp, os.path.join(directory, f'metrics-{os.getpid()}.json'))
+        except OSError:
+            os.unlink(tmp)
+            raise
+
+    def collect(self, directory=None):
+        """Samples summed over every worker (just this one without ``directory``)."""
+        if directory is None:
+            return self.samples()
+        self.flush(directory, force=True)
+        merged = {}
+        for name in os.listdir(directory):
+            if not (name.startswith('metrics-') and name.endswith('.json')):
+                continue
+            try:
+                with open(os.path.join(directory, name)) as f:
+                    entries = json.load(f)
+            except (OSError, ValueError) as e:  # pragma: no cover - e.g. removed while listing
+                logging.warning(f"Skipping metrics file {name}: {e}")
+                continue
+            for metric, labels, value in entries:
+                key = (metric, tuple(tuple(pair) for pair in labels))
+                if key not in merged:
+                    merged[key] = value
+                elif isinstance(value, list):
+                    merged[key] = [a + b for a, b in zip(merged[key], value)]
+                else:
+                    merged[key] += value
+        return merged
+
+
+def render(samples, gauges=()):
+    """Render samples, plus ``(name, help, labels, value)`` gauges, as text."""
+    by_name = {}
+    for (name, labels), value in samples.items():
+        by_name.setdefault(name, []).append((labels, value))
+    lines = []
+    for name, (kind, help_text, buckets) in DEFINITIONS.items():
+        lines += [f'# HELP {name} {help_text}', f'# TYPE {name} {kind}']
+        for labels, value in sorted(by_name.get(name, ())):
+            if kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip((*buckets, '+Inf'), value[:-1]):
+                    cumulative += count
+                    le = bound if bound == '+Inf' else _number(bound)
+                    lines.append(f'{name}_bucket{_format_labels(labels, [("le", le)])} {cumulative}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_number(value[-1])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {cumulative}')
+            else:
+                lines.append(f'{name}{_format_labels(labels)} {_number(value)}')
+    seen = set()
+    for name, help_text, labels, value in gauges:
+        if name not in seen:
+            seen.add(name)
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge']
+        lines.append(f'{name}{_format_labels(_labels(labels))} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestStats:
+    """SQLite usage accumulated by one request's connection."""
+
+    __slots__ = ('connect', 'query', 'commit', 'rows', 'statements')
+
+    def __init__(self, connect=0.0):
+        self.connect = connect
+        self.query = 0.0
+        self.commit = 0.0
+        self.rows = 0
+        self.statements = 0
+
+
+class StatementTrace:
+    """One statement run through a traced connection (see ``tracing.py``)."""
+
+    __slots__ = ('sql', 'params', 'many', 'duration', 'rows')
+
+    def __init__(self, sql, params, many=False):
+        self.sql = sql
+        self.params = params
+        self.many = many
+        self.duration = 0.0
+        self.rows = 0
+
+
+class InstrumentedCursor:
+    """Cursor proxy timing fetches and counting the rows they return."""
+
+    __slots__ = ('_cursor', '_stats', '_trace')
+
+    def __init__(self, cursor, stats, trace=None):
+        self._cursor = cursor
+        self._stats = stats
+        self._trace = trace
+
+    def _fetched(self, start, rows):
+        elapsed = time.perf_counter() - start
+        self._stats.query += elapsed
+        self._stats.rows += rows
+        if self._trace is not None:
+            self._trace.duration += elapsed
+            self._trace.rows += rows
+
+    def fetchone(self):
+        start = time.perf_counter()
+        row = self._cursor.fetchone()
+        self._fetched(start, row is not None)
+        return row
+
+    def fetchall(self):
+        start = time.perf_counter()
+        rows = self._cursor.fetchall()
+        self._fetched(start, len(rows))
+        return rows
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        rows = self._cursor.fetchmany(size) if size is not None else self._cursor.fetchmany()
+        self._fetched(start, len(rows))
+        return rows
+
+    def __iter__(self):
+        while True:
+            row = self.fetchone()
+            if row is None:
+                return
+            yield row
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class InstrumentedConnection:
+    """Thin proxy over a ``sqlite3.Connection`` recording :class:`RequestStats`.
+
+    Everything not timed here is delegated, so callers use it like the
+    connection itself; :attr:`connection` is the wrapped one.  When
+    ``traces`` is a list, a :class:`StatementTrace` is appended to it for
+    every statement.
+    """
+
+    __slots__ = ('connection', 'stats', 'traces')
+
+    def __init__(self, connection, stats, traces=None):
+        self.connection = connection
+        self.stats = stats
+        self.traces = traces
+
+    def _run(self, method, sql, params, many=False):
+        trace = None
+        if self.traces is not None:
+            trace = StatementTrace(sql, params, many)
+            self.traces.append(trace)
+        start = time.perf_counter()
+        try:
+            cursor = method(sql, params)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.stats.query += elapsed
+            self.stats.statements += 1
+            if trace is not None:
+                trace.duration += elapsed
+        return InstrumentedCursor(cursor, self.stats, trace)
+
+    def execute(self, sql, params=()):
+        return self._run(self.connection.execute, sql, params)
+
+    def executemany(self, sql, params):
+        if self.traces is not None:
+            params = list(params)
+        return self._run(self.connection.executemany, sql, params, many=True)
+
+    def executescript(self, script):
+        start = time.perf_counter()
+        try:
+            return self.connection.executescript(script)
+        finally:
+            self.stats.query += time.perf_counter() - start
+            self.stats.statements += 1
+
+    def commit(self):
+        start = time.perf_counter()
+        try:
+            self.connection.commit()
+        finally:
+            self.stats.commit += time.perf_counter() - start
+
+    def rollback(self):
+        start = time.perf_counter()
+        try:
+            self.connection.rollback()
+        finally:
+            self.stats.commit += time.perf_counter() - start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        # the connection's own context manager commits or rolls back
+        start = time.perf_counter()
+        try:
+            return self.connection.__exit__(exc_type, exc, tb)
+        finally:
+            self.stats.commit += time.perf_counter() - start
+
+    def __getattr__(self, name):
+        return getattr(self.connection, name)
+
+
+def unwrap(conn):
+    """Return the ``sqlite3.Connection`` behind ``conn``."""
+    return conn.connection if isinstance(conn, InstrumentedConnection) else conn
+
+
+# --- request hooks ---------------------------------------------------------
+
+def start_timer():
+    """``before_request`` hook; register it before any other."""
+    g.metrics_start = time.perf_counter()
+
+
+def _record(response_status, response=None):
+    start = g.pop('metrics_start', None)
+    if start is None:
+        return
+    registry = current_app.metrics
+    labels = {
+        'blueprint': request.blueprint or '',
+        'route': request.url_rule.rule if request.url_rule else 'unmatched',
+        'method': request.method,
+    }
+    registry.inc('bigpicture_http_requests_total', {**labels, 'status': str(response_status)})
+    if response_status >= 500:
+        registry.inc('bigpicture_http_request_errors_total', labels)
+    registry.observe('bigpicture_http_request_duration_seconds', labels, time.perf_counter() - start)
+    if response is not None and not response.is_streamed:
+        registry.inc('bigpicture_http_response_bytes_total', labels, response.calculate_content_length() or 0)
+    stats = getattr(g.get('db'), 'stats', None)
+    if isinstance(stats, RequestStats):
+        for phase in ('connect', 'query', 'commit'):
+            registry.inc('bigpicture_sqlite_seconds_total', {**labels, 'phase': phase}, getattr(stats, phase))
+        registry.observe('bigpicture_sqlite_request_seconds', labels, stats.connect + stats.query + stats.commit)
+        registry.inc('bigpicture_sqlite_rows_total', labels, stats.rows)
+        registry.inc('bigpicture_sqlite_statements_total', labels, stats.statements)
+    if METRICS_DIR:
+        try:
+            registry.flush(METRICS_DIR)
+        except OSError as e:  # pragma: no cover - e.g. directory missing
+            logging.warning(f"Could not write metrics to {METRICS_DIR}: {e}")
+
+
+def record_response(response):
+    """``after_request`` hook recording the finished request."""
+    _record(response.status_code, response)
+    return response
+
+
+def record_exception(exc=None):
+    """``teardown_request`` hook for requests that ended in an exception."""
+    if exc is not None:
+        _record(500)
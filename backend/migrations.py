@@ -0,0 +1,448 @@
+"""Versioned schema migrations.
+
+Each migration is a ``(version, description, steps)`` tuple where ``steps``
+are SQL statements or callables taking the connection.  The version of the
+last applied migration is recorded in SQLite's ``user_version`` header, so
+:func:`migrate` only runs what an existing database is missing and is safe to
+call on every start.
+"""
+import logging
+
+try:
+    from .ordering import backfill_ranks
+    from .search import search_triggers, rebuild_search_index
+    from .progress import progress_triggers, check_progress
+    from .analytics import (
+        ANALYTICS_ENTITIES, EPOCH_COLUMNS, epoch_triggers, backfill_epochs, lifecycle_triggers, backfill_lifecycle,
+    )
+except ImportError:  # pragma: no cover - executed only when run as script
+    from ordering import backfill_ranks
+    from search import search_triggers, rebuild_search_index
+    from progress import progress_triggers, check_progress
+    from analytics import (
+        ANALYTICS_ENTITIES, EPOCH_COLUMNS, epoch_triggers, backfill_epochs, lifecycle_triggers, backfill_lifecycle,
+    )
+
+
+def add_column(table, name, definition):
+    """Migration step adding a column unless it already exists."""
+    def step(conn):
+        columns = {r[1] for r in conn.execute(f'PRAGMA table_info({table})')}
+        if name not in columns:
+            conn.execute(f'ALTER TABLE {table} ADD COLUMN {name} {definition}')
+    return step
+
+
+# columns of each table as of migration 7
+CHANGE_LOG_COLUMNS = {
+    'areas': ('key', 'text', 'date_time_created', 'order_index', 'rank'),
+    'objectives': ('key', 'area_key', 'text', 'date_time_created', 'date_time_completed',
+                   'status', 'order_index', 'rank'),
+    'tasks': ('key', 'area_key', 'objective_key', 'text', 'date_time_created',
+              'date_time_completed', 'status', 'order_index', 'rank'),
+}
+
+
+def _event(op, table, update_of):
+    if op == 'UPDATE' and update_of:
+        return f"UPDATE OF {', '.join(CHANGE_LOG_COLUMNS[table])}"
+    return op
+
+
+def change_log_triggers(stamp=False):
+    """Triggers appending a ``change_log`` record for every row change.
+
+    Inserts record the whole row, updates only the columns that changed
+    (and nothing when none did), deletes just the key.  With ``stamp`` the
+    record's version is also written to the row's ``version`` column, or to
+    ``tombstones`` for a delete.
+    """
+    triggers = []
+    for table, columns in CHANGE_LOG_COLUMNS.items():
+        whole_row = ', '.join(f"'{c}', NEW.{c}" for c in columns)
+        changed = ' UNION ALL '.join(
+            f"SELECT '{c}' AS name, NEW.{c} AS value WHERE NEW.{c} IS NOT OLD.{c}" for c in columns
+        )
+        any_changed = ' OR '.join(f'NEW.{c} IS NOT OLD.{c}' for c in columns)
+        stamp_row = stamp_delete = ''
+        if stamp:
+            stamp_row = f'UPDATE {table} SET version = last_insert_rowid() WHERE key = NEW.key;'
+            stamp_delete = (f"INSERT OR REPLACE INTO tombstones (entity, key, version) "
+                            f"VALUES ('{table}', OLD.key, last_insert_rowid());")
+        revive = f"DELETE FROM tombstones WHERE entity = '{table}' AND key = NEW.key;" if stamp else ''
+        triggers += [
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_insert_change AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO change_log (entity, key, op, fields)
+                VALUES ('{table}', NEW.key, 'insert', json_object({whole_row}));
+                {stamp_row}
+                {revive}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_update_change AFTER {_event('UPDATE', table, stamp)} ON {table}
+            WHEN {any_changed}
+            BEGIN
+                INSERT INTO change_log (entity, key, op, fields)
+                VALUES ('{table}', NEW.key, 'update',
+                        (SELECT json_group_object(name, value) FROM ({changed})));
+                {stamp_row}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_delete_change AFTER DELETE ON {table}
+            BEGIN
+                INSERT INTO change_log (entity, key, op) VALUES ('{table}', OLD.key, 'delete');
+                {stamp_delete}
+            END
+            ''',
+        ]
+    return triggers
+
+
+def bump_version_triggers(update_of=False):
+    """Triggers bumping ``meta.data_version`` on every row change.
+
+    With ``update_of`` the update triggers only fire for the columns in
+    :data:`CHANGE_LOG_COLUMNS`, so stamping a row's ``version`` does not
+    count as a change.
+    """
+    return [
+        f'''
+        CREATE TRIGGER IF NOT EXISTS {table}_{op.lower()}_version AFTER {_event(op, table, update_of)} ON {table}
+        BEGIN
+            UPDATE meta SET value = value + 1 WHERE name = 'data_version';
+        END
+        '''
+        for table in ('areas', 'objectives', 'tasks')
+        for op in ('INSERT', 'UPDATE', 'DELETE')
+    ]
+
+
+def drop_triggers(*suffixes):
+    """Statements dropping the per-table triggers named ``{table}_{suffix}``."""
+    return [
+        f'DROP TRIGGER IF EXISTS {table}_{suffix}'
+        for table in CHANGE_LOG_COLUMNS
+        for suffix in suffixes
+    ]
+
+
+def backfill_row_versions(conn):
+    """Give existing rows distinct versions below any future change.
+
+    The versions are taken from ``change_log``'s sequence, so they order
+    with the versions the triggers hand out from now on.
+    """
+    row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'change_log'").fetchone()
+    version = row[0] if row else 0
+    for table in CHANGE_LOG_COLUMNS:
+        rowids = [r[0] for r in conn.execute(f'SELECT rowid FROM {table} WHERE version = 0 ORDER BY rowid')]
+        conn.executemany(
+            f'UPDATE {table} SET version = ? WHERE rowid = ?',
+            [(version + i, rowid) for i, rowid in enumerate(rowids, 1)],
+        )
+        version += len(rowids)
+    if row:
+        conn.execute("UPDATE sqlite_sequence SET seq = ? WHERE name = 'change_log'", (version,))
+    else:
+        conn.execute("INSERT INTO sqlite_sequence (name, seq) VALUES ('change_log', ?)", (version,))
+
+
+MIGRATIONS = [
+    (1, 'initial schema', [
+        '''
+        CREATE TABLE IF NOT EXISTS areas (
+            key TEXT PRIMARY KEY,
+            text TEXT NOT NULL,
+            date_time_created TEXT NOT NULL,
+            order_index INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS objectives (
+            key TEXT PRIMARY KEY,
+            area_key TEXT NOT NULL,
+            text TEXT NOT NULL,
+            date_time_created TEXT NOT NULL,
+            date_time_completed TEXT,
+            status TEXT DEFAULT 'open' CHECK(status IN ('open', 'complete', 'secondary')),
+            order_index INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (area_key) REFERENCES areas (key) ON DELETE CASCADE
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS tasks (
+            key TEXT PRIMARY KEY,
+            area_key TEXT,
+            objective_key TEXT,
+            text TEXT NOT NULL,
+            date_time_created TEXT NOT NULL,
+            date_time_completed TEXT,
+            status TEXT DEFAULT 'open' CHECK(status IN ('open', 'complete', 'secondary')),
+            order_index INTEGER NOT NULL DEFAULT 0,
+            FOREIGN KEY (area_key) REFERENCES areas (key) ON DELETE CASCADE,
+            FOREIGN KEY (objective_key) REFERENCES objectives (key) ON DELETE CASCADE,
+            CHECK ((area_key IS NOT NULL AND objective_key IS NULL) OR
+                   (area_key IS NULL AND objective_key IS NOT NULL))
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS undo_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            action_type TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            record_key TEXT NOT NULL,
+            old_data TEXT NOT NULL,
+            timestamp TEXT NOT NULL
+        )
+        ''',
+    ]),
+    # Sibling lookups (MAX(order_index), order shifts) and the foreign key
+    # cascades all filter on the parent column, then on order_index.
+    (2, 'parent/order indexes', [
+        'CREATE INDEX IF NOT EXISTS idx_areas_order ON areas (order_index)',
+        'CREATE INDEX IF NOT EXISTS idx_objectives_area_order ON objectives (area_key, order_index)',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_area_order ON tasks (area_key, order_index)',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_objective_order ON tasks (objective_key, order_index)',
+    ]),
+    # Lexicographic rank keys for ORDERING_MODE=rank, derived from the
+    # current order_index.  ``meta`` records which column is authoritative.
+    (3, 'rank ordering keys', [
+        add_column('areas', 'rank', 'TEXT'),
+        add_column('objectives', 'rank', 'TEXT'),
+        add_column('tasks', 'rank', 'TEXT'),
+        'CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value)',
+        "INSERT OR IGNORE INTO meta (name, value) VALUES ('ordering_mode', 'index')",
+        backfill_ranks,
+        'CREATE INDEX IF NOT EXISTS idx_areas_rank ON areas (rank, key)',
+        'CREATE INDEX IF NOT EXISTS idx_objectives_area_rank ON objectives (area_key, rank, key)',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_area_rank ON tasks (area_key, rank, key)',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_objective_rank ON tasks (objective_key, rank, key)',
+    ]),
+    # A change counter for ETags and caches.  instance_id tells databases
+    # apart when several share a process-wide cache.
+    (4, 'data version counter', [
+        "INSERT OR IGNORE INTO meta (name, value) VALUES ('data_version', 0)",
+        "INSERT OR IGNORE INTO meta (name, value) VALUES ('instance_id', lower(hex(randomblob(6))))",
+        *bump_version_triggers(),
+    ]),
+    # Entries sharing a group_id (e.g. one /api/batch call) are undone together.
+    (5, 'undo groups', [
+        add_column('undo_log', 'group_id', 'INTEGER'),
+        'CREATE INDEX IF NOT EXISTS idx_undo_log_group ON undo_log (group_id)',
+    ]),
+    # Every undo entry belongs to a group; undone groups move to redo_log.
+    (6, 'redo stack', [
+        'UPDATE undo_log SET group_id = id WHERE group_id IS NULL',
+        '''
+        CREATE TABLE IF NOT EXISTS redo_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            action_type TEXT NOT NULL,
+            table_name TEXT NOT NULL,
+            record_key TEXT NOT NULL,
+            old_data TEXT NOT NULL,
+            timestamp TEXT NOT NULL,
+            group_id INTEGER NOT NULL
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_redo_log_group ON redo_log (group_id)',
+    ]),
+    # Committed row changes in order, tailed by the /api/events feed.
+    (7, 'change log', [
+        '''
+        CREATE TABLE IF NOT EXISTS change_log (
+            version INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            key TEXT NOT NULL,
+            op TEXT NOT NULL,
+            fields TEXT
+        )
+        ''',
+        *change_log_triggers(),
+    ]),
+    # Per-row versions and tombstones for /api/changes delta sync.  The
+    # triggers are recreated to stamp them; their update variants now only
+    # fire for data columns, so the stamp itself is not a change.
+    (8, 'row versions and tombstones', [
+        add_column('areas', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+        add_column('objectives', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+        add_column('tasks', 'version', 'INTEGER NOT NULL DEFAULT 0'),
+        '''
+        CREATE TABLE IF NOT EXISTS tombstones (
+            entity TEXT NOT NULL,
+            key TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            PRIMARY KEY (entity, key)
+        )
+        ''',
+        *drop_triggers('insert_change', 'update_change', 'delete_change', 'update_version'),
+        *change_log_triggers(stamp=True),
+        *bump_version_triggers(update_of=True),
+        backfill_row_versions,
+        'CREATE INDEX IF NOT EXISTS idx_areas_version ON areas (version)',
+        'CREATE INDEX IF NOT EXISTS idx_objectives_version ON objectives (version)',
+        'CREATE INDEX IF NOT EXISTS idx_tasks_version ON tasks (version)',
+        'CREATE INDEX IF NOT EXISTS idx_tombstones_version ON tombstones (version)',
+        "INSERT OR IGNORE INTO meta (name, value) VALUES ('tombstone_floor', 0)",
+    ]),
+    # Full-text search: search_docs is the external content of the FTS5
+    # index, one row per area, objective and task.
+    (9, 'full-text search', [
+        '''
+        CREATE TABLE IF NOT EXISTS search_docs (
+            id INTEGER PRIMARY KEY,
+            entity TEXT NOT NULL,
+            key TEXT NOT NULL,
+            text TEXT,
+            status TEXT,
+            UNIQUE (entity, key)
+        )
+        ''',
+        '''
+        CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+            text, content='search_docs', content_rowid='id',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        ''',
+        *search_triggers(),
+        rebuild_search_index,
+    ]),
+    # Completed objectives and tasks moved out of the hot tables (see
+    # archive.py).  No foreign keys: an archived row outlives a deleted
+    # area, and comes back if the area is restored by undo.
+    (10, 'archive tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS archived_objectives (
+            key TEXT PRIMARY KEY,
+            area_key TEXT NOT NULL,
+            text TEXT NOT NULL,
+            date_time_created TEXT NOT NULL,
+            date_time_completed TEXT NOT NULL,
+            status TEXT,
+            order_index INTEGER NOT NULL DEFAULT 0,
+            rank TEXT,
+            archived_at TEXT NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS archived_tasks (
+            key TEXT PRIMARY KEY,
+            area_key TEXT,
+            objective_key TEXT,
+            text TEXT NOT NULL,
+            date_time_created TEXT NOT NULL,
+            date_time_completed TEXT NOT NULL,
+            status TEXT,
+            order_index INTEGER NOT NULL DEFAULT 0,
+            rank TEXT,
+            archived_at TEXT NOT NULL
+        )
+        ''',
+        # pages of /api/archive, whole or per parent, by completion time
+        'CREATE INDEX IF NOT EXISTS idx_archived_objectives_completed '
+        'ON archived_objectives (date_time_completed, key)',
+        'CREATE INDEX IF NOT EXISTS idx_archived_objectives_area '
+        'ON archived_objectives (area_key, date_time_completed, key)',
+        'CREATE INDEX IF NOT EXISTS idx_archived_tasks_completed ON archived_tasks (date_time_completed, key)',
+        'CREATE INDEX IF NOT EXISTS idx_archived_tasks_area ON archived_tasks (area_key, date_time_completed, key)',
+        'CREATE INDEX IF NOT EXISTS idx_archived_tasks_objective '
+        'ON archived_tasks (objective_key, date_time_completed, key)',
+        # candidates for archiving, without scanning the open rows
+        *(f"CREATE INDEX IF NOT EXISTS idx_{table}_completed "
+          f"ON {table} (date_time_completed) WHERE status = 'complete'" for table in ('objectives', 'tasks')),
+    ]),
+    # Task counts per status for every objective and area (see progress.py).
+    (11, 'progress rollups', [
+        '''
+        CREATE TABLE IF NOT EXISTS progress (
+            entity TEXT NOT NULL,
+            key TEXT NOT NULL,
+            open INTEGER NOT NULL DEFAULT 0,
+            complete INTEGER NOT NULL DEFAULT 0,
+            secondary INTEGER NOT NULL DEFAULT 0,
+            archived INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (entity, key)
+        )
+        ''',
+        *progress_triggers(),
+        check_progress,
+    ]),
+    # Numeric times and the lifecycle event log behind /api/analytics (see
+    # analytics.py).  Archiving selects on completed_epoch from now on.
+    (12, 'epoch columns and lifecycle events', [
+        *(add_column(table, column, 'INTEGER')
+          for table in (*ANALYTICS_ENTITIES, 'archived_objectives', 'archived_tasks') for column in EPOCH_COLUMNS),
+        backfill_epochs,
+        *epoch_triggers(),
+        *(f"CREATE INDEX IF NOT EXISTS idx_{table}_completed_epoch "
+          f"ON {table} (completed_epoch) WHERE status = 'complete'" for table in ANALYTICS_ENTITIES),
+        *(f'DROP INDEX IF EXISTS idx_{table}_completed' for table in ANALYTICS_ENTITIES),
+        '''
+        CREATE TABLE IF NOT EXISTS lifecycle_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            entity TEXT NOT NULL,
+            key TEXT NOT NULL,
+            area_key TEXT,
+            type TEXT NOT NULL,
+            status TEXT,
+            at INTEGER NOT NULL,
+            created INTEGER NOT NULL
+        )
+        ''',
+        # a row's history, and a covering index for the bucket queries
+        'CREATE INDEX IF NOT EXISTS idx_lifecycle_events_key ON lifecycle_events (entity, key)',
+        'CREATE INDEX IF NOT EXISTS idx_lifecycle_events_at '
+        'ON lifecycle_events (entity, at, area_key, type, status, created)',
+        backfill_lifecycle,
+        *lifecycle_triggers(),
+    ]),
+    # Task pages seek (parent, order_index, key) without sorting the ties.
+    (13, 'task page indexes', [
+        *(step for column in ('area', 'objective') for step in (
+            f'DROP INDEX IF EXISTS idx_tasks_{column}_order',
+            f'CREATE INDEX IF NOT EXISTS idx_tasks_{column}_order ON tasks ({column}_key, order_index, key)',
+        )),
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def schema_version(conn):
+    """Return the schema version recorded in the database."""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Apply every migration newer than the database's recorded version.
+
+    Each migration runs in its own transaction together with the version
+    bump, so an interrupted upgrade resumes where it stopped.
+
+    Returns
+    -------
+    list[int]
+        Versions that were applied.
+    """
+    current = schema_version(conn)
+    applied = []
+    for version, description, steps in MIGRATIONS:
+        if version <= current:
+            continue
+        logging.info(f"Applying schema migration {version}: {description}")
+        try:
+            conn.execute('BEGIN')
+            for step in steps:
+                if callable(step):
+                    step(conn)
+                else:
+                    conn.execute(step)
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+    return applied
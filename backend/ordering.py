@@ -0,0 +1,510 @@
+"""Sibling ordering for areas, objectives and tasks.
+
+Two interchangeable strategies decide where rows sit among their siblings:
+
+``index`` (default)
+    The historical scheme: a dense integer ``order_index`` per parent.
+    Inserting or moving a row shifts every sibling in between.
+
+``rank``
+    Each row carries a ``rank`` string; siblings sort lexicographically by
+    it.  A new rank can always be generated between two neighbours, so an
+    insert or move writes only the row itself.  Ranks grow slowly as rows
+    are squeezed into the same gap, and a background job rewrites a parent's
+    ranks evenly once one gets longer than ``RANK_MAX_LENGTH``.
+
+Both strategies report dense integer positions as ``order_index`` so API
+clients see no difference.  Select ``columns(table, alias)`` in queries and
+convert rows with ``as_dict`` to get them.
+
+A *parent* is a ``(column, key)`` tuple, e.g. ``('objective_key', 'o1')``;
+areas have no parent and use ``NO_PARENT``.
+"""
+import os
+import logging
+import threading
+
+ORDERING_MODE = os.environ.get('ORDERING_MODE', 'index')
+RANK_MAX_LENGTH = int(os.environ.get('RANK_MAX_LENGTH', 32))
+
+NO_PARENT = (None, None)
+
+# columns that partition each table into sibling lists
+PARENT_COLUMNS = {
+    'areas': (),
+    'objectives': ('area_key',),
+    'tasks': ('area_key', 'objective_key'),
+}
+
+DIGITS = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+BASE = len(DIGITS)
+
+
+def parent_of(table, row):
+    """Return the ``(column, key)`` parent of ``row`` in ``table``."""
+    if table == 'areas':
+        return NO_PARENT
+    if row['area_key']:
+        return ('area_key', row['area_key'])
+    return ('objective_key', row['objective_key'])
+
+
+def _where(parent):
+    col, key = parent
+    if col is None:
+        return '1', []
+    return f'{col} = ?', [key]
+
+
+# --- rank keys -----------------------------------------------------------
+#
+# Ranks are base-62 fractions written without the leading "0." and without
+# trailing zeros; under that rule plain string comparison matches numeric
+# order, which is also what SQLite's BINARY collation does.
+
+def _before(hi):
+    d = DIGITS.index(hi[0])
+    if d > 1:
+        return DIGITS[d - 1]
+    if d == 1:
+        return DIGITS[0] + DIGITS[-1]
+    return DIGITS[0] + _before(hi[1:])
+
+
+def rank_between(lo=None, hi=None):
+    """Return a rank sorting strictly between ``lo`` and ``hi``.
+
+    Either bound may be ``None`` for an open end.  Appending and prepending
+    step the nearest digit so repeated appends grow keys by one character
+    per ~60 rows rather than one per halving.
+    """
+    if lo is None and hi is None:
+        return DIGITS[BASE // 2]
+    if hi is None:
+        for i, ch in enumerate(lo):
+            d = DIGITS.index(ch)
+            if d < BASE - 1:
+                return lo[:i] + DIGITS[d + 1]
+        return lo + DIGITS[1]
+    if lo is None:
+        return _before(hi)
+    if lo >= hi:
+        raise ValueError(f"rank {lo!r} is not below {hi!r}")
+    digits = []
+    i = 0
+    while True:
+        a = DIGITS.index(lo[i]) if i < len(lo) else 0
+        b = DIGITS.index(hi[i]) if hi is not None and i < len(hi) else BASE
+        if b - a > 1:
+            digits.append(DIGITS[(a + b) // 2])
+            return ''.join(digits)
+        digits.append(DIGITS[a])
+        if b > a:
+            # past this digit anything longer than lo stays below hi
+            hi = None
+        i += 1
+
+
+def spread_ranks(n):
+    """Return ``n`` increasing ranks evenly spaced over the key space."""
+    width = 1
+    while BASE ** width <= 2 * (n + 1):
+        width += 1
+    step = BASE ** width // (n + 1)
+    ranks = []
+    for i in range(1, n + 1):
+        value = i * step
+        digits = []
+        for _ in range(width):
+            value, d = divmod(value, BASE)
+            digits.append(DIGITS[d])
+        ranks.append(''.join(reversed(digits)).rstrip(DIGITS[0]))
+    return ranks
+
+
+# --- renumbering ---------------------------------------------------------
+
+def renumber(conn, table, parent, by='rank'):
+    """Rewrite ``rank`` and ``order_index`` of one parent's children.
+
+    Children keep the order given by ``by`` (``'rank'`` or ``'order_index'``)
+    and get dense indices plus evenly spaced ranks.
+    """
+    where, params = _where(parent)
+    keys = [r[0] for r in conn.execute(
+        f'SELECT key FROM {table} WHERE {where} ORDER BY {by}, key', params
+    )]
+    # rows already in place are left alone, so they are not reported as changed
+    conn.executemany(
+        f'UPDATE {table} SET rank = ?, order_index = ? WHERE key = ? AND (rank, order_index) IS NOT (?, ?)',
+        [(rank, i, key, rank, i) for i, (rank, key) in enumerate(zip(spread_ranks(len(keys)), keys))],
+    )
+    return len(keys)
+
+
+def renumber_all(conn, by='rank'):
+    """Renumber every sibling list in the database (see :func:`renumber`)."""
+    for table, columns in PARENT_COLUMNS.items():
+        if not columns:
+            renumber(conn, table, NO_PARENT, by)
+            continue
+        cols = ', '.join(columns)
+        for row in conn.execute(f'SELECT DISTINCT {cols} FROM {table}').fetchall():
+            renumber(conn, table, parent_of(table, dict(zip(columns, row))), by)
+
+
+def sync_mode(conn, mode):
+    """Make the stored ordering columns consistent with ``mode``.
+
+    Only the active strategy's column is kept up to date.  When the
+    configured mode differs from the one recorded in ``meta`` both columns
+    are rebuilt from the previously active one before the new mode is used.
+    """
+    row = conn.execute("SELECT value FROM meta WHERE name = 'ordering_mode'").fetchone()
+    stored = row[0] if row else 'index'
+    if stored == mode:
+        return False
+    logging.info(f"Switching ordering mode from {stored} to {mode}; renumbering siblings")
+    with conn:
+        renumber_all(conn, by='rank' if stored == 'rank' else 'order_index')
+        conn.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES ('ordering_mode', ?)", (mode,)
+        )
+    return True
+
+
+def backfill_ranks(conn):
+    """Migration step: derive ranks from the existing ``order_index``."""
+    renumber_all(conn, by='order_index')
+
+
+# --- strategies ----------------------------------------------------------
+
+class IndexOrdering:
+    """Dense integer ``order_index`` maintained by shifting siblings."""
+
+    mode = 'index'
+
+    def columns(self, table, alias):
+        """Select list adding the dense position as ``position_``."""
+        return f'{alias}.*, {alias}.order_index AS position_'
+
+    def as_dict(self, row):
+        """Convert a row selected with :meth:`columns` for the API.
+
+        Columns whose name ends in an underscore are query helpers (such as
+        ``position_``) and are dropped.
+        """
+        data = dict(row)
+        data['order_index'] = data['position_']
+        data.pop('rank', None)
+        for name in [name for name in data if name.endswith('_')]:
+            del data[name]
+        return data
+
+    def position(self, conn, table, row):
+        return row['order_index']
+
+    def fetch(self, conn, table, key):
+        """Return one row as a dict with its dense position, or ``None``."""
+        row = conn.execute(f'SELECT * FROM {table} WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            return None
+        data = dict(row)
+        data['order_index'] = self.position(conn, table, row)
+        data.pop('rank', None)
+        return data
+
+    def rows(self, conn, table, where='1', params=()):
+        """Return the rows of ``table`` matching ``where`` as API dicts.
+
+        Positions are counted within each row's parent, so ``where`` may
+        select several sibling lists at once.
+        """
+        rows = conn.execute(
+            f"SELECT {self.columns(table, 'c')} FROM {table} c WHERE {where} ORDER BY position_", params
+        ).fetchall()
+        return [self.as_dict(row) for row in rows]
+
+    def children(self, conn, table, parent):
+        """Return ``parent``'s children in ``table`` as API dicts, in order."""
+        where, params = _where(parent)
+        return self.rows(conn, table, where, params)
+
+    def batch(self):
+        """Strategy to use for a batch of writes; ``flush`` it before commit."""
+        return IndexBatch()
+
+    def flush(self, conn):
+        """Write placements deferred by a batch (none outside one)."""
+        return 0
+
+    def append(self, conn, table, parent, key=None):
+        """Placement values for a new last child of ``parent``.
+
+        ``key`` names the row being placed; only batches need it.
+        """
+        where, params = _where(parent)
+        max_order = conn.execute(
+            f'SELECT MAX(order_index) FROM {table} WHERE {where}', params
+        ).fetchone()[0]
+        return {'order_index': (max_order if max_order is not None else -1) + 1}
+
+    def insert_at(self, conn, table, parent, index, key=None):
+        """Open a gap at ``index`` and return placement values for it."""
+        where, params = _where(parent)
+        conn.execute(
+            f'UPDATE {table} SET order_index = order_index + 1 WHERE {where} AND order_index >= ?',
+            params + [index],
+        )
+        return {'order_index': index}
+
+    def remove(self, conn, table, parent, index, key=None):
+        """Close the gap left by removing the child at ``index``."""
+        where, params = _where(parent)
+        conn.execute(
+            f'UPDATE {table} SET order_index = order_index - 1 WHERE {where} AND order_index > ?',
+            params + [index],
+        )
+
+    def move(self, conn, table, key, old_parent, old_index, new_parent, new_index):
+        """Make room for ``key`` at ``new_index`` under ``new_parent``.
+
+        Returns the placement values to write to the moved row.
+        """
+        if old_parent != new_parent:
+            self.remove(conn, table, old_parent, old_index)
+            return self.insert_at(conn, table, new_parent, new_index)
+        if new_index == old_index:
+            return {}
+        where, params = _where(new_parent)
+        if new_index > old_index:
+            conn.execute(
+                f'UPDATE {table} SET order_index = order_index - 1 '
+                f'WHERE {where} AND order_index > ? AND order_index <= ?',
+                params + [old_index, new_index],
+            )
+        else:
+            conn.execute(
+                f'UPDATE {table} SET order_index = order_index + 1 '
+                f'WHERE {where} AND order_index >= ? AND order_index < ?',
+                params + [new_index, old_index],
+            )
+        return {'order_index': new_index}
+
+
+class RankOrdering(IndexOrdering):
+    """Lexicographic ``rank`` keys; inserts and moves write a single row.
+
+    Parameters
+    ----------
+    max_length : int
+        Rank length above which the parent is queued for rebalancing.
+    on_long_rank : callable | None
+        Called with ``(table, parent)`` when a long rank is handed out.
+    """
+
+    mode = 'rank'
+
+    def __init__(self, max_length=RANK_MAX_LENGTH, on_long_rank=None):
+        self.max_length = max_length
+        self.on_long_rank = on_long_rank
+
+    def columns(self, table, alias):
+        partition = ', '.join(f'{alias}.{c}' for c in PARENT_COLUMNS[table])
+        window = f'PARTITION BY {partition} ' if partition else ''
+        return (f'{alias}.*, ROW_NUMBER() OVER ({window}'
+                f'ORDER BY {alias}.rank, {alias}.key) - 1 AS position_')
+
+    def position(self, conn, table, row):
+        where, params = _where(parent_of(table, row))
+        return conn.execute(
+            f'SELECT COUNT(*) FROM {table} WHERE {where} AND (rank < ? OR (rank = ? AND key < ?))',
+            params + [row['rank'], row['rank'], row['key']],
+        ).fetchone()[0]
+
+    def _placement(self, table, parent, rank):
+        if len(rank) > self.max_length and self.on_long_rank:
+            self.on_long_rank(table, parent)
+        return {'rank': rank}
+
+    def batch(self):
+        # moves already write only the moved row
+        return self
+
+    def append(self, conn, table, parent, key=None):
+        where, params = _where(parent)
+        last = conn.execute(f'SELECT MAX(rank) FROM {table} WHERE {where}', params).fetchone()[0]
+        return self._placement(table, parent, rank_between(last, None))
+
+    def _rank_at(self, conn, table, parent, index, exclude=None):
+        where, params = _where(parent)
+        if exclude is not None:
+            where += ' AND key != ?'
+            params = params + [exclude]
+        if index <= 0:
+            first = conn.execute(
+                f'SELECT rank FROM {table} WHERE {where} ORDER BY rank, key LIMIT 1', params
+            ).fetchone()
+            return rank_between(None, first[0] if first else None)
+        rows = conn.execute(
+            f'SELECT rank FROM {table} WHERE {where} ORDER BY rank, key LIMIT 2 OFFSET ?',
+            params + [index - 1],
+        ).fetchall()
+        if not rows:
+            last = conn.execute(f'SELECT MAX(rank) FROM {table} WHERE {where}', params).fetchone()[0]
+            return rank_between(last, None)
+        lo = rows[0][0]
+        hi = rows[1][0] if len(rows) > 1 else None
+        return rank_between(lo, hi)
+
+    def insert_at(self, conn, table, parent, index, key=None, exclude=None):
+        try:
+            rank = self._rank_at(conn, table, parent, index, exclude)
+        except ValueError:
+            # duplicate neighbours (e.g. rows written by another mode); spread
+            # the parent's ranks out and try again
+            renumber(conn, table, parent)
+            rank = self._rank_at(conn, table, parent, index, exclude)
+        return self._placement(table, parent, rank)
+
+    def remove(self, conn, table, parent, index, key=None):
+        # gaps between ranks are harmless
+        pass
+
+    def move(self, conn, table, key, old_parent, old_index, new_parent, new_index):
+        if old_parent == new_parent and old_index == new_index:
+            return {}
+        return self.insert_at(conn, table, new_parent, new_index, exclude=key)
+
+
+class IndexBatch(IndexOrdering):
+    """Index ordering for a batch of writes that shifts siblings once.
+
+    Each sibling list the batch touches is read once and edited in memory;
+    positions reported while the batch runs come from those lists.
+    :meth:`flush` then writes ``order_index`` for every row whose position
+    ended up different from what is stored, one ``executemany`` per table.
+    Callers must pass ``key`` to ``append``, ``insert_at`` and ``remove``.
+    """
+
+    def __init__(self):
+        self._siblings = {}  # (table, parent) -> keys in order
+        self._stored = {}    # (table, key) -> order_index in the database
+
+    def batch(self):
+        return self
+
+    def _list(self, conn, table, parent):
+        siblings = self._siblings.get((table, parent))
+        if siblings is None:
+            where, params = _where(parent)
+            rows = conn.execute(
+                f'SELECT key, order_index FROM {table} WHERE {where} ORDER BY order_index, key', params
+            ).fetchall()
+            siblings = [key for key, _ in rows]
+            self._stored.update(((table, key), index) for key, index in rows)
+            self._siblings[(table, parent)] = siblings
+        return siblings
+
+    def _place(self, table, key, index):
+        self._stored[(table, key)] = index
+        return {'order_index': index}
+
+    def position(self, conn, table, row):
+        siblings = self._siblings.get((table, parent_of(table, row)))
+        if siblings is not None and row['key'] in siblings:
+            return siblings.index(row['key'])
+        return row['order_index']
+
+    def rows(self, conn, table, where='1', params=()):
+        rows = super().rows(conn, table, where, params)
+        for row in rows:
+            row['order_index'] = self.position(conn, table, row)
+        return sorted(rows, key=lambda row: row['order_index'])
+
+    def append(self, conn, table, parent, key=None):
+        siblings = self._list(conn, table, parent)
+        siblings.append(key)
+        return self._place(table, key, len(siblings) - 1)
+
+    def insert_at(self, conn, table, parent, index, key=None):
+        siblings = self._list(conn, table, parent)
+        siblings.insert(max(index, 0), key)
+        return self._place(table, key, index)
+
+    def remove(self, conn, table, parent, index, key=None):
+        siblings = self._list(conn, table, parent)
+        if key in siblings:
+            siblings.remove(key)
+
+    def move(self, conn, table, key, old_parent, old_index, new_parent, new_index):
+        if old_parent == new_parent and old_index == new_index:
+            return {}
+        self.remove(conn, table, old_parent, old_index, key)
+        return self.insert_at(conn, table, new_parent, new_index, key)
+
+    def flush(self, conn):
+        updates = {}
+        for (table, _), siblings in self._siblings.items():
+            for index, key in enumerate(siblings):
+                if self._stored.get((table, key)) != index:
+                    updates.setdefault(table, []).append((index, key))
+                    self._stored[(table, key)] = index
+        for table, rows in updates.items():
+            conn.executemany(f'UPDATE {table} SET order_index = ? WHERE key = ?', rows)
+        return sum(len(rows) for rows in updates.values())
+
+
+class Rebalancer:
+    """Background thread that renumbers parents whose ranks got too long.
+
+    Parameters
+    ----------
+    run : callable
+        ``run(fn, *args)`` executes ``fn(conn, *args)`` in a write
+        transaction, e.g. ``WriterQueue.run``.
+    route : callable | None
+        Returns the ``run`` for the database of the current request, so a
+        parent is renumbered in the tenant it was scheduled from.
+    """
+
+    def __init__(self, run, route=None):
+        self._run = run
+        self._route = route
+        self._pending = set()
+        self._cond = threading.Condition()
+        self._pid = None
+
+    def schedule(self, table, parent):
+        """Queue ``parent``'s children in ``table`` for renumbering."""
+        run = self._route() if self._route else self._run
+        with self._cond:
+            self._pending.add((run, table, parent))
+            if self._pid != os.getpid():
+                # started lazily, and again in each forked worker
+                self._pid = os.getpid()
+                threading.Thread(target=self._loop, name='rank-rebalancer', daemon=True).start()
+            self._cond.notify()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                run, table, parent = self._pending.pop()
+            try:
+                count = run(renumber, table, parent)
+                logging.info(f"Rebalanced {count} {table} ranks under {parent}")
+            except Exception as e:  # pragma: no cover - logged and retried on next long rank
+                logging.error(f"Error rebalancing {table} ranks under {parent}: {e}")
+
+
+def make_ordering(mode=ORDERING_MODE, run=None, route=None):
+    """Return the strategy for ``mode``; ``run`` drives background rebalancing."""
+    if mode == 'index':
+        return IndexOrdering()
+    if mode == 'rank':
+        rebalancer = Rebalancer(run, route) if run else None
+        return RankOrdering(on_long_rank=rebalancer.schedule if rebalancer else None)
+    raise ValueError(f"Unknown ORDERING_MODE: {mode}")
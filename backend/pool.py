@@ -0,0 +1,286 @@
+"""Connection management for the SQLite backend.
+
+Opening a connection and applying the pragmas the application relies on is a
+noticeable share of the cost of a request.  ``ConnectionPool`` keeps a
+bounded number of configured connections around per process and hands them
+out to request threads one at a time, while ``WriterQueue`` funnels all
+mutations through a single connection.
+"""
+import os
+import time
+import logging
+import sqlite3
+import threading
+from collections import deque
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection becomes available in time."""
+
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of pre-configured connections.
+
+    Parameters
+    ----------
+    connect : callable
+        Zero-argument factory returning a configured ``sqlite3.Connection``.
+    size : int
+        Maximum number of connections (idle plus checked out).
+    timeout : float
+        Seconds to wait for a free connection before raising
+        :class:`PoolTimeout`.
+    max_age : float
+        Connections older than this many seconds are closed when returned
+        rather than reused.  ``0`` disables recycling by age.
+    """
+
+    def __init__(self, connect, size=5, timeout=10.0, max_age=300.0):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.max_age = max_age
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._idle = []       # (conn, created_at), most recently used last
+        self._in_use = {}     # id(conn) -> created_at
+        self._opening = 0     # slots reserved by threads opening a connection
+        self._created = 0
+        self._recycled = 0
+        self._acquired = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def _check_fork(self):
+        # Connections must never be shared with a forked child (gunicorn
+        # workers fork from the master); start over with an empty pool.
+        if self._pid != os.getpid():
+            self._reset()
+
+    def _expired(self, created_at):
+        return self.max_age and time.monotonic() - created_at > self.max_age
+
+    def acquire(self):
+        """Check out a connection, opening one if the pool is not full."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        with self._cond:
+            self._check_fork()
+            while True:
+                while self._idle:
+                    conn, created_at = self._idle.pop()
+                    if self._expired(created_at):
+                        self._close(conn)
+                        self._recycled += 1
+                        continue
+                    self._checked_out(conn, created_at, start)
+                    return conn
+                if len(self._in_use) + self._opening < self.size:
+                    self._opening += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._timeouts += 1
+                    raise PoolTimeout(f"No database connection available after {self.timeout}s")
+                self._cond.wait(remaining)
+
+        # Open the new connection without holding the lock.
+        try:
+            conn = self._connect()
+        except Exception:
+            with self._cond:
+                self._opening -= 1
+                self._cond.notify()
+            raise
+        logging.debug("Opened new pooled database connection")
+        with self._cond:
+            self._opening -= 1
+            self._created += 1
+            self._checked_out(conn, time.monotonic(), start)
+        return conn
+
+    def _checked_out(self, conn, created_at, start):
+        waited = time.monotonic() - start
+        self._in_use[id(conn)] = created_at
+        self._acquired += 1
+        self._wait_total += waited
+        self._wait_max = max(self._wait_max, waited)
+
+    def release(self, conn, discard=False):
+        """Return ``conn`` to the pool.
+
+        Any transaction left open is rolled back.  The connection is closed
+        instead of reused when ``discard`` is true, when the rollback fails or
+        when it has exceeded ``max_age``.
+        """
+        if not discard and conn.in_transaction:
+            try:
+                conn.rollback()
+            except sqlite3.Error as e:
+                logging.warning(f"Discarding pooled connection after failed rollback: {e}")
+                discard = True
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            created_at = self._in_use.pop(id(conn), None)
+            if created_at is None:
+                # Not ours (e.g. checked out before a fork); just close it.
+                discard = True
+            elif not discard and self._expired(created_at):
+                discard = True
+            if discard:
+                self._recycled += 1
+            else:
+                self._idle.append((conn, created_at))
+            self._cond.notify()
+        if discard:
+            self._close(conn)
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except sqlite3.Error:  # pragma: no cover - best effort
+            pass
+
+    def close_all(self):
+        """Close every idle connection.  Checked-out ones close on release."""
+        with self._cond:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            self._close(conn)
+
+    def stats(self):
+        """Return a snapshot of pool usage for sizing and monitoring."""
+        with self._cond:
+            self._check_fork()
+            acquired = self._acquired
+            return {
+                'size': self.size,
+                'in_use': len(self._in_use),
+                'idle': len(self._idle),
+                'created': self._created,
+                'recycled': self._recycled,
+                'acquired': acquired,
+                'timeouts': self._timeouts,
+                'wait_avg_ms': round(self._wait_total / acquired * 1000, 3) if acquired else 0.0,
+                'wait_max_ms': round(self._wait_max * 1000, 3),
+            }
+
+
+class WriterQueue:
+    """Serialise writes through one dedicated connection.
+
+    SQLite allows a single writer at a time.  Rather than letting request
+    threads race for the write lock (and fail with ``database is locked``),
+    writers take turns on one connection in the order they arrived while
+    readers keep using the :class:`ConnectionPool`.
+
+    Parameters
+    ----------
+    connect : callable
+        Zero-argument factory returning a configured ``sqlite3.Connection``.
+    timeout : float
+        Seconds to wait for a turn before raising :class:`PoolTimeout`.
+    """
+
+    def __init__(self, connect, timeout=30.0):
+        self._connect = connect
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._conn = None
+        self._busy = False
+        self._queue = deque()
+        self._writes = 0
+        self._timeouts = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    def acquire(self):
+        """Wait for this caller's turn and return the writer connection."""
+        start = time.monotonic()
+        deadline = start + self.timeout
+        ticket = object()
+        with self._cond:
+            if self._pid != os.getpid():
+                self._reset()
+            self._queue.append(ticket)
+            while self._busy or self._queue[0] is not ticket:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._queue.remove(ticket)
+                    self._timeouts += 1
+                    self._cond.notify_all()
+                    raise PoolTimeout(f"Timed out after {self.timeout}s waiting for the writer connection")
+                self._cond.wait(remaining)
+            self._queue.popleft()
+            self._busy = True
+            waited = time.monotonic() - start
+            self._writes += 1
+            self._wait_total += waited
+            self._wait_max = max(self._wait_max, waited)
+        if self._conn is None:
+            try:
+                self._conn = self._connect()
+            except Exception:
+                self.release(None)
+                raise
+        return self._conn
+
+    def release(self, conn, discard=False):
+        """Finish the current turn, rolling back anything left uncommitted."""
+        if conn is not None:
+            if not discard and conn.in_transaction:
+                try:
+                    conn.rollback()
+                except sqlite3.Error as e:
+                    logging.warning(f"Discarding writer connection after failed rollback: {e}")
+                    discard = True
+            if discard:
+                ConnectionPool._close(conn)
+        with self._cond:
+            if discard:
+                self._conn = None
+            self._busy = False
+            self._cond.notify_all()
+
+    def run(self, fn, *args, **kwargs):
+        """Call ``fn(conn, *args, **kwargs)`` in its own write transaction."""
+        conn = self.acquire()
+        failed = True
+        try:
+            with conn:
+                result = fn(conn, *args, **kwargs)
+            failed = False
+            return result
+        finally:
+            self.release(conn, discard=failed)
+
+    def close(self):
+        """Close the writer connection unless a turn is in progress."""
+        with self._cond:
+            if self._busy or self._conn is None:
+                return
+            conn, self._conn = self._conn, None
+        ConnectionPool._close(conn)
+
+    def stats(self):
+        """Return a snapshot of writer usage."""
+        with self._cond:
+            writes = self._writes
+            return {
+                'busy': self._busy,
+                'queued': len(self._queue),
+                'writes': writes,
+                'timeouts': self._timeouts,
+                'wait_avg_ms': round(self._wait_total / writes * 1000, 3) if writes else 0.0,
+                'wait_max_ms': round(self._wait_max * 1000, 3),
+            }
@@ -0,0 +1,198 @@
+"""Materialized task counts per objective and area.
+
+``progress`` holds one row per parent that has tasks: the number of its
+direct tasks in each status, plus those moved to ``archived_tasks``, which
+count as done.  Triggers (migration 11) keep it in step inside the writing
+transaction, whatever the writer: routes, ``/api/batch``, undo, imports,
+cascades and the archiver.  Task updates only fire them for
+``status``, ``area_key`` and ``objective_key``.
+
+An area's own row only covers the tasks filed directly under it, so moving
+an objective to another area touches no counts; :func:`read_progress` adds
+each objective's row to its area's, reading one row per area and objective.
+
+:func:`check_progress` recomputes the table from the task tables and
+repairs any row that drifted, e.g. the archived counts of an area brought
+back by undo; a background job runs it every ``PROGRESS_CHECK_INTERVAL``
+seconds.
+"""
+import os
+import logging
+
+PROGRESS_CHECK_INTERVAL = float(os.environ.get('PROGRESS_CHECK_INTERVAL', 3600))
+
+STATUSES = ('open', 'complete', 'secondary')
+COUNTS = (*STATUSES, 'archived')
+
+# the progress row of a task: the objective it belongs to, else its area
+ENTITY = "CASE WHEN {row}.objective_key IS NOT NULL THEN 'objectives' ELSE 'areas' END"
+KEY = 'IFNULL({row}.objective_key, {row}.area_key)'
+
+
+def _counts(row, sign, archived=False):
+    """Column deltas for adding (``sign`` 1) or removing (-1) ``row``."""
+    if archived:
+        return {'open': '0', 'complete': '0', 'secondary': '0', 'archived': str(sign)}
+    # a missing status reads as open, as the column default
+    status = f"IFNULL({row}.status, 'open')"
+    return {
+        **{name: f"{sign} * ({status} = '{name}')" for name in STATUSES},
+        'archived': '0',
+    }
+
+
+def _add(row, archived=False):
+    counts = _counts(row, 1, archived)
+    return f'''
+        INSERT INTO progress (entity, key, {', '.join(COUNTS)})
+        VALUES ({ENTITY.format(row=row)}, {KEY.format(row=row)}, {', '.join(counts[c] for c in COUNTS)})
+        ON CONFLICT (entity, key) DO UPDATE SET
+            {', '.join(f'{c} = {c} + excluded.{c}' for c in COUNTS)};
+    '''
+
+
+def _remove(row, archived=False):
+    # a plain update: the parent's row may already be gone with the parent
+    counts = _counts(row, -1, archived)
+    return f'''
+        UPDATE progress SET {', '.join(f'{c} = {c} + {counts[c]}' for c in COUNTS)}
+        WHERE entity = {ENTITY.format(row=row)} AND key = {KEY.format(row=row)};
+    '''
+
+
+def progress_triggers():
+    """Triggers maintaining ``progress`` from ``tasks`` and ``archived_tasks``."""
+    triggers = []
+    for table, archived in (('tasks', False), ('archived_tasks', True)):
+        triggers += [
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_insert_progress AFTER INSERT ON {table}
+            BEGIN
+                {_add('NEW', archived)}
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_delete_progress AFTER DELETE ON {table}
+            BEGIN
+                {_remove('OLD', archived)}
+            END
+            ''',
+        ]
+    triggers.append(f'''
+        CREATE TRIGGER IF NOT EXISTS tasks_update_progress AFTER UPDATE OF status, area_key, objective_key ON tasks
+        WHEN NEW.status IS NOT OLD.status OR NEW.area_key IS NOT OLD.area_key
+            OR NEW.objective_key IS NOT OLD.objective_key
+        BEGIN
+            {_remove('OLD')}
+            {_add('NEW')}
+        END
+    ''')
+    # a deleted parent's row goes with it (its tasks cascade)
+    for table in ('areas', 'objectives'):
+        triggers.append(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_delete_progress AFTER DELETE ON {table}
+            BEGIN
+                DELETE FROM progress WHERE entity = '{table}' AND key = OLD.key;
+            END
+        ''')
+    return triggers
+
+
+def expected_progress(conn):
+    """Recompute every row of ``progress`` from the task tables.
+
+    Only parents still on the board get a row.
+    """
+    expected = {}
+    for table, archived in (('tasks', False), ('archived_tasks', True)):
+        status = "'archived'" if archived else "IFNULL(t.status, 'open')"
+        for entity, parent in (('areas', 'area_key'), ('objectives', 'objective_key')):
+            rows = conn.execute(
+                f'SELECT t.{parent}, {status}, COUNT(*) FROM {table} t '
+                f'JOIN {entity} p ON p.key = t.{parent} GROUP BY 1, 2'
+            )
+            for key, name, count in rows:
+                counts = expected.setdefault((entity, key), dict.fromkeys(COUNTS, 0))
+                if name in counts:
+                    counts[name] += count
+    return expected
+
+
+def check_progress(conn):
+    """Repair ``progress`` rows that disagree with the task tables.
+
+    Returns the number of rows rewritten or removed.
+    """
+    expected = expected_progress(conn)
+    stored = {
+        (row[0], row[1]): dict(zip(COUNTS, row[2:]))
+        for row in conn.execute(f"SELECT entity, key, {', '.join(COUNTS)} FROM progress")
+    }
+    fixes = [(entity, key, *(counts[c] for c in COUNTS))
+             for (entity, key), counts in expected.items() if stored.get((entity, key)) != counts]
+    # rows counted down to zero are left alone
+    stale = [key for key, counts in stored.items() if key not in expected and any(counts.values())]
+    conn.executemany(
+        f"INSERT OR REPLACE INTO progress (entity, key, {', '.join(COUNTS)}) "
+        f"VALUES (?, ?, {', '.join('?' * len(COUNTS))})",
+        fixes,
+    )
+    conn.executemany('DELETE FROM progress WHERE entity = ? AND key = ?', stale)
+    if fixes or stale:
+        logging.warning(f"Repaired {len(fixes) + len(stale)} progress rows")
+    return len(fixes) + len(stale)
+
+
+def summarize(counts):
+    """API form of a set of counts, with the total and the share done."""
+    total = sum(counts[c] for c in COUNTS)
+    done = counts['complete'] + counts['archived']
+    return {
+        **counts,
+        'total': total,
+        'percent_complete': round(100 * done / total, 1) if total else None,
+    }
+
+
+def read_progress(conn, area_key=None):
+    """Counts of every area and objective (or those of ``area_key``).
+
+    Returns
+    -------
+    dict
+        ``{"areas": {key: counts}, "objectives": {key: counts}}`` where
+        ``counts`` holds ``open``, ``complete``, ``secondary``,
+        ``archived``, ``total`` and ``percent_complete`` (``None`` without
+        tasks).  An area's counts include the tasks of its objectives.
+    """
+    where, params = ('WHERE key = ?', [area_key]) if area_key else ('', [])
+    areas = {row[0]: dict.fromkeys(COUNTS, 0) for row in conn.execute(f'SELECT key FROM areas {where}', params)}
+    where = 'WHERE area_key = ?' if area_key else ''
+    objectives = {
+        key: (area, dict.fromkeys(COUNTS, 0))
+        for key, area in conn.execute(f'SELECT key, area_key FROM objectives {where}', params)
+    }
+    if area_key:
+        rows = conn.execute(
+            f"SELECT entity, key, {', '.join(COUNTS)} FROM progress WHERE entity = 'areas' AND key = ? "
+            f"UNION ALL SELECT entity, key, {', '.join(COUNTS)} FROM progress "
+            "WHERE entity = 'objectives' AND key IN (SELECT key FROM objectives WHERE area_key = ?)",
+            [area_key, area_key],
+        )
+    else:
+        rows = conn.execute(f"SELECT entity, key, {', '.join(COUNTS)} FROM progress")
+    for entity, key, *values in rows:
+        if entity == 'areas' and key in areas:
+            targets = [areas[key]]
+        elif entity == 'objectives' and key in objectives:
+            area, counts = objectives[key]
+            targets = [counts] + ([areas[area]] if area in areas else [])
+        else:
+            continue
+        for counts in targets:
+            for name, value in zip(COUNTS, values):
+                counts[name] += value
+    return {
+        'areas': {key: summarize(counts) for key, counts in areas.items()},
+        'objectives': {key: summarize(counts) for key, (_, counts) in objectives.items()},
+    }
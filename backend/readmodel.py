@@ -0,0 +1,303 @@
+"""In-process read model serving the list endpoints from memory.
+
+With ``READ_MODEL`` set each worker keeps a copy of every area, objective
+and task and answers ``GET /api/areas``, ``/api/objectives`` and
+``/api/tasks`` (filters and pages included) without running their queries.
+``PRAGMA data_version`` only tells one connection about commits made by
+others, so requests compare the ``meta.data_version`` change counter the
+response cache already uses: a single-row read on the request's pooled
+connection notices writes made by any worker or background job.  When it
+moved, only the rows whose ``version`` is newer than the copy, and the
+tombstones of deleted ones, are read, with the same delta query as
+``/api/changes``.
+
+The copy is capped at ``READ_MODEL_MAX_BYTES`` (estimated from the Python
+objects held).  A board that outgrows it is dropped from memory and served
+by SQL again.  After ``READ_MODEL_RETRY`` seconds, doubling up to an hour
+while it keeps failing, a changed board whose row count times the average
+row size seen fits again is loaded afresh.  ``/api/pool`` and ``/metrics``
+report the size.
+"""
+import os
+import sys
+import time
+import logging
+import threading
+
+try:
+    from .cache import data_version
+    from .ordering import PARENT_COLUMNS
+    from .sync import SYNC_TABLES, read_delta
+    from .utils import encode_cursor
+except ImportError:  # pragma: no cover - executed only when run as script
+    from cache import data_version
+    from ordering import PARENT_COLUMNS
+    from sync import SYNC_TABLES, read_delta
+    from utils import encode_cursor
+
+READ_MODEL = os.environ.get('READ_MODEL', '0') not in ('0', 'false', 'no')
+READ_MODEL_MAX_BYTES = int(os.environ.get('READ_MODEL_MAX_BYTES', 64 * 1024 * 1024))
+# seconds before an overflowed copy is tried again; doubles up to RETRY_MAX
+READ_MODEL_RETRY = float(os.environ.get('READ_MODEL_RETRY', 60))
+RETRY_MAX = 3600
+
+# rows read per delta query
+READ_CHUNK = 5000
+
+# keyset sort of each list endpoint, as in its route
+SORTS = {
+    'areas': ('position_', 'key'),
+    'objectives': ('area_key', 'position_', 'key'),
+    'tasks': ('area_key', 'objective_key', 'order_', 'key'),
+}
+FILTERS = {
+    'areas': (),
+    'objectives': ('area_key',),
+    'tasks': ('area_key', 'objective_key'),
+}
+
+
+def sql_order(value):
+    """Sort key comparing like SQLite: NULL, then numbers, then text."""
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)):
+        return (1, value)
+    return (2, value)
+
+
+def row_size(row):
+    """Rough bytes held by a row dict and its values."""
+    return sys.getsizeof(row) + sum(sys.getsizeof(v) for v in row.values())
+
+
+class ReadModel:
+    """One worker's in-memory copy of the board.
+
+    Parameters
+    ----------
+    max_bytes : int
+        Estimated size above which the copy is dropped and the endpoints
+        fall back to SQL.
+    retry : float
+        Seconds after an overflow before the copy is tried again.
+    clock : callable
+        Monotonic time source, for the retry backoff.
+    """
+
+    def __init__(self, max_bytes=READ_MODEL_MAX_BYTES, retry=READ_MODEL_RETRY, clock=time.monotonic):
+        self.max_bytes = max_bytes
+        self.retry = retry
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._rows = {table: {} for table in SYNC_TABLES}  # table -> key -> row
+        self._views = {}     # (table, mode, paginated) -> sorted API dicts
+        self._seen = None    # (instance_id, data_version) the copy reflects
+        self._version = 0    # newest row version applied
+        self._bytes = 0
+        self.overflowed = False
+        self._backoff = retry
+        self._retry_at = 0
+        self._row_bytes = 0   # average row size when the copy overflowed
+        self.overflows = 0
+        self.full_loads = 0
+        self.refreshes = 0
+        self.rows_loaded = 0
+        self.rows_deleted = 0
+        self.hits = 0
+
+    def _clear(self):
+        for rows in self._rows.values():
+            rows.clear()
+        self._views.clear()
+        self._version = 0
+        self._bytes = 0
+
+    def _apply(self, delta):
+        changed = set()
+        for table in SYNC_TABLES:
+            rows = self._rows[table]
+            for row in delta[table]:
+                old = rows.get(row['key'])
+                if old is not None:
+                    self._bytes -= row_size(old)
+                rows[row['key']] = row
+                self._bytes += row_size(row)
+                changed.add(table)
+            self.rows_loaded += len(delta[table])
+        for entry in delta['deleted']:
+            old = self._rows[entry['entity']].pop(entry['key'], None)
+            if old is not None:
+                self._bytes -= row_size(old)
+                self.rows_deleted += 1
+                changed.add(entry['entity'])
+        return changed
+
+    def _overflow(self, seen):
+        logging.warning(
+            f"Read model exceeds READ_MODEL_MAX_BYTES ({self.max_bytes}); "
+            f"serving lists from SQL for {self._backoff:.0f}s"
+        )
+        rows = sum(len(rows) for rows in self._rows.values())
+        self._row_bytes = self._bytes / rows if rows else 0
+        self._clear()
+        self._seen = seen
+        self.overflowed = True
+        self.overflows += 1
+        self._retry_at = self.clock() + self._backoff
+        self._backoff = min(self._backoff * 2, max(RETRY_MAX, self.retry))
+
+    def _fits(self, conn):
+        """Whether the board has changed and looks small enough to load."""
+        seen = data_version(conn)
+        if seen != self._seen:
+            self._seen = seen
+            rows = conn.execute(
+                f"SELECT {' + '.join(f'(SELECT COUNT(*) FROM {table})' for table in SYNC_TABLES)}"
+            ).fetchone()[0]
+            if rows * self._row_bytes <= self.max_bytes:
+                return True
+        self._retry_at = self.clock() + self._backoff
+        self._backoff = min(self._backoff * 2, max(RETRY_MAX, self.retry))
+        return False
+
+    def refresh(self, conn):
+        """Bring the copy up to date; return ``False`` if it is disabled."""
+        if self.overflowed:
+            if not self.retry or self.clock() < self._retry_at or not self._fits(conn):
+                return False
+            self.overflowed = False
+            self._seen = None
+        seen = data_version(conn)
+        if seen == self._seen:
+            return True
+        began = not conn.in_transaction
+        if began:
+            # the counter and the deltas from one snapshot
+            conn.execute('BEGIN')
+        try:
+            seen = data_version(conn)
+            if self._seen is None or seen[0] != self._seen[0]:
+                # first load, or another database (restored, or replaced)
+                self._clear()
+                self.full_loads += 1
+            else:
+                self.refreshes += 1
+            changed = set()
+            while True:
+                delta = read_delta(conn, self._version, READ_CHUNK)
+                if delta['reset']:
+                    # deletes older than the pruned tombstones are unknown
+                    self._clear()
+                    self.full_loads += 1
+                changed |= self._apply(delta)
+                self._version = delta['version']
+                if self._bytes > self.max_bytes:
+                    self._overflow(seen)
+                    return False
+                if not delta['more']:
+                    break
+        finally:
+            if began:
+                conn.rollback()
+        if 'objectives' in changed:
+            # tasks carry their objective's status
+            changed.add('tasks')
+        for key in [key for key in self._views if key[0] in changed]:
+            del self._views[key]
+        self._seen = seen
+        # the copy fits: a later overflow starts the backoff over
+        self._backoff = self.retry
+        return True
+
+    def _positions(self, table, mode):
+        """Each row's index among its siblings, as the ordering reports it."""
+        rows = self._rows[table].values()
+        if mode == 'index':
+            return {row['key']: row['order_index'] for row in rows}
+        parents = {}
+        for row in rows:
+            parents.setdefault(tuple(row[c] for c in PARENT_COLUMNS[table]), []).append(row)
+        positions = {}
+        for siblings in parents.values():
+            siblings.sort(key=lambda r: (sql_order(r['rank']), r['key']))
+            positions.update((row['key'], i) for i, row in enumerate(siblings))
+        return positions
+
+    def _view(self, table, mode, paginated):
+        """The table's API dicts with their sort keys, in the route's order."""
+        key = (table, mode, paginated)
+        view = self._views.get(key)
+        if view is not None:
+            return view
+        positions = self._positions(table, mode)
+        objectives = self._rows['objectives']
+        sort = SORTS[table]
+        view = []
+        for row in self._rows[table].values():
+            item = dict(row)
+            item.pop('rank', None)
+            item['order_index'] = positions[row['key']]
+            helpers = {'position_': item['order_index']}
+            if table == 'tasks':
+                parent = objectives.get(row['objective_key'])
+                item['parent_status'] = parent['status'] if parent else None
+                # pages follow the ordering's own column, as in SQL
+                helpers['order_'] = row['rank'] if mode == 'rank' else row['order_index']
+            values = tuple(helpers[c] if c in helpers else item[c] for c in sort)
+            order = values if paginated else (item['order_index'],) + values
+            view.append((tuple(sql_order(v) for v in order), values, item))
+        view.sort(key=lambda entry: entry[0])
+        self._views[key] = view
+        return view
+
+    def page(self, conn, table, args, ordering):
+        """Answer a list request like its route, or ``None`` to use SQL.
+
+        ``args`` come from ``parse_list_args``; the result is ``(items,
+        next_cursor)``.
+        """
+        with self._lock:
+            if not self.refresh(conn):
+                return None
+            cursor, limit = args.get('cursor'), args.get('limit')
+            view = self._view(table, ordering.mode, cursor is not None or limit is not None)
+            self.hits += 1
+        start = None if cursor is None else tuple(sql_order(v) for v in cursor)
+        parents = [(c, args[c]) for c in FILTERS[table] if c in args]
+        statuses = args.get('status')
+        after, before = args.get('completed_after'), args.get('completed_before')
+        items, values = [], None
+        for order, row_values, item in view:
+            if start is not None and order <= start:
+                continue
+            if any(item[c] != v for c, v in parents):
+                continue
+            if statuses is not None and item.get('status') not in statuses:
+                continue
+            completed = item.get('date_time_completed')
+            if after is not None and (completed is None or completed < after):
+                continue
+            if before is not None and (completed is None or completed >= before):
+                continue
+            if limit is not None and len(items) == limit:
+                return items, encode_cursor(values)
+            items.append(item)
+            values = row_values
+        return items, None
+
+    def stats(self):
+        with self._lock:
+            return {
+                'rows': {table: len(rows) for table, rows in self._rows.items()},
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'version': self._version,
+                'overflowed': self.overflowed,
+                'overflows': self.overflows,
+                'full_loads': self.full_loads,
+                'refreshes': self.refreshes,
+                'rows_loaded': self.rows_loaded,
+                'rows_deleted': self.rows_deleted,
+                'hits': self.hits,
+            }
@@ -0,0 +1,71 @@
+"""Completion analytics route."""
+import logging
+from datetime import date, timedelta
+from flask import Blueprint, jsonify, request, current_app
+
+try:
+    from ..analytics import (
+        ANALYTICS_ENTITIES, ANALYTICS_MAX_BUCKETS, DEFAULT_BUCKETS, UNITS, bucket_of, build_report, local_day,
+    )
+except ImportError:  # pragma: no cover - executed only when run as script
+    from analytics import (
+        ANALYTICS_ENTITIES, ANALYTICS_MAX_BUCKETS, DEFAULT_BUCKETS, UNITS, bucket_of, build_report, local_day,
+    )
+
+bp = Blueprint('analytics', __name__)
+
+
+def _bad(message):
+    return jsonify({"error": message}), 400
+
+
+@bp.route('/api/analytics', methods=['GET'])
+def get_analytics():
+    """Created, completed and open counts per day or week, per area.
+
+    Accepts ``entity`` (``tasks`` or ``objectives``, default ``tasks``),
+    ``unit`` (``day`` or ``week``), ``since`` and ``until`` (local dates,
+    ``YYYY-MM-DD``; by default the last 30 days or 12 weeks up to today)
+    and ``area_key``.  Each bucket reports the lifecycle events in it, the
+    cycle time (creation to completion) of its completions and the rows
+    ``open`` at its end, in total and per area.
+
+    Not in the response cache: the current bucket changes with the clock,
+    not only with the data.
+    """
+    app_module = current_app
+    try:
+        entity = request.args.get('entity', 'tasks')
+        unit = request.args.get('unit', 'day')
+        if entity not in ANALYTICS_ENTITIES:
+            return _bad(f"Unknown entity: {entity}")
+        if unit not in UNITS:
+            return _bad(f"unit must be one of: {', '.join(UNITS)}")
+        analytics = app_module.current_analytics()
+        try:
+            until = date.fromisoformat(request.args['until']) if 'until' in request.args else (
+                date(1970, 1, 1) + timedelta(days=analytics.today()))
+            last = bucket_of(unit, local_day(until))
+            first = (bucket_of(unit, local_day(date.fromisoformat(request.args['since'])))
+                     if 'since' in request.args else last - DEFAULT_BUCKETS[unit] + 1)
+        except ValueError:
+            return _bad("since and until must be dates (YYYY-MM-DD)")
+        if first > last:
+            return _bad("since is after until")
+        if last - first >= ANALYTICS_MAX_BUCKETS:
+            return _bad(f"At most {ANALYTICS_MAX_BUCKETS} buckets per request")
+
+        area_key = request.args.get('area_key')
+        with app_module.get_db() as conn:
+            if area_key and not conn.execute('SELECT 1 FROM areas WHERE key = ?', (area_key,)).fetchone():
+                return jsonify({"error": f"Area {area_key} not found"}), 404
+            series = analytics.series(conn, entity, unit)
+        return jsonify({
+            'entity': entity,
+            'unit': unit,
+            'utc_offset_minutes': analytics.offset // 60,
+            **build_report(series, unit, first, last, area_key),
+        })
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error getting analytics: {e}")
+        return jsonify({"error": str(e)}), 500
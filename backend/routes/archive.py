@@ -0,0 +1,101 @@
+"""Archive API routes."""
+import logging
+from flask import Blueprint, jsonify, current_app
+
+try:
+    from ..archive import ARCHIVE_PAGE_SIZE, ARCHIVE_TABLES, archive_counts, restore_row
+    from ..services import OperationError
+except ImportError:  # pragma: no cover - executed only when run as script
+    from archive import ARCHIVE_PAGE_SIZE, ARCHIVE_TABLES, archive_counts, restore_row
+    from services import OperationError
+
+bp = Blueprint('archive', __name__)
+
+# oldest completion first
+ARCHIVE_SORT = ('date_time_completed', 'key')
+ARCHIVE_FILTERS = {
+    'objectives': ('area_key', 'completed_after', 'completed_before'),
+    'tasks': ('area_key', 'objective_key', 'completed_after', 'completed_before'),
+}
+
+
+def _unknown(entity):
+    return jsonify({"error": f"Unknown archive: {entity}"}), 404
+
+
+@bp.route('/api/archive', methods=['GET'])
+def archive_status():
+    """Archived row counts and the archiver's settings and progress."""
+    app_module = current_app
+    try:
+        with app_module.get_db() as conn:
+            counts = archive_counts(conn)
+        return jsonify({**counts, 'archiver': app_module.archiver.stats()})
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error getting archive status: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/archive/<entity>', methods=['GET'])
+def list_archive(entity):
+    """Page through archived ``objectives`` or ``tasks``.
+
+    Accepts ``area_key`` (and ``objective_key`` for tasks),
+    ``completed_after``/``completed_before``, ``limit`` (default
+    ``ARCHIVE_PAGE_SIZE``) and ``cursor``.  Items carry ``archived_at``
+    instead of a position.
+    """
+    app_module = current_app
+    if entity not in ARCHIVE_TABLES:
+        return _unknown(entity)
+    try:
+        args, error = app_module.parse_list_args(filters=ARCHIVE_FILTERS[entity], sort=ARCHIVE_SORT)
+        if error:
+            return error
+        where, params = [], []
+        for column in ('area_key', 'objective_key'):
+            if column in args:
+                where.append(f'{column} = ?')
+                params.append(args[column])
+        completion_where, completion_params = app_module.completion_filters(args)
+        with app_module.get_db() as conn:
+            rows, next_cursor = app_module.query_page(
+                conn,
+                f'SELECT * FROM {ARCHIVE_TABLES[entity]}',
+                [],
+                sort=ARCHIVE_SORT,
+                where=where + completion_where, where_params=params + completion_params,
+                cursor=args.get('cursor'), limit=args.get('limit', ARCHIVE_PAGE_SIZE),
+            )
+        items = []
+        for row in rows:
+            item = dict(row)
+            for name in ('order_index', 'rank'):
+                del item[name]
+            items.append(item)
+        return app_module.list_response(items, next_cursor)
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error listing archived {entity}: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/archive/<entity>/<key>/restore', methods=['POST'])
+def restore_archived(entity, key):
+    """Move an archived objective (with its tasks) or task back to the board.
+
+    The row becomes the last child of its parent, which must not itself be
+    archived or deleted.
+    """
+    app_module = current_app
+    if entity not in ARCHIVE_TABLES:
+        return _unknown(entity)
+    try:
+        with app_module.get_db() as conn:
+            restored = restore_row(conn, app_module.ordering, entity, key)
+            conn.commit()
+        return jsonify({'status': 'success', 'restored': restored})
+    except OperationError as e:
+        return jsonify({"error": e.message}), e.status
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error restoring archived {entity[:-1]} {key}: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -2,17 +2,46 @@
 import logging
 from flask import Blueprint, jsonify, request, current_app
 
+try:
+    from ..services import OperationError, create_area, update_area, delete_area
+except ImportError:  # pragma: no cover - executed only when run as script
+    from services import OperationError, create_area, update_area, delete_area
+
 bp = Blueprint('areas', __name__)
 
+AREA_SORT = ('position_', 'key')
+
 @bp.route('/api/areas', methods=['GET', 'POST'])
 def handle_areas():
-    """List or create areas."""
+    """List or create areas.
+
+    ``GET`` accepts ``limit`` and ``cursor`` for keyset pagination.
+    """
     app_module = current_app
     if request.method == 'GET':
         try:
+            args, error = app_module.parse_list_args(sort=AREA_SORT)
+            if error:
+                return error
+            ordering = app_module.ordering
             with app_module.get_db() as conn:
-                areas = conn.execute('SELECT * FROM areas').fetchall()
-                return jsonify([dict(area) for area in areas])
+                model = app_module.current_read_model()
+                page = model.page(conn, 'areas', args, ordering) if model else None
+                if page is not None:
+                    return app_module.list_response(*page)
+                if 'cursor' not in args and 'limit' not in args:
+                    areas = conn.execute(
+                        f"SELECT {ordering.columns('areas', 'a')} FROM areas a ORDER BY position_"
+                    ).fetchall()
+                    return jsonify([ordering.as_dict(area) for area in areas])
+                areas, next_cursor = app_module.query_page(
+                    conn,
+                    f"SELECT {ordering.columns('areas', 'a')} FROM areas a",
+                    [],
+                    sort=AREA_SORT,
+                    cursor=args.get('cursor'), limit=args.get('limit'),
+                )
+                return app_module.list_response([ordering.as_dict(area) for area in areas], next_cursor)
         except Exception as e:  # pragma: no cover - exercise in tests
             logging.error(f"Error getting areas: {e}")
             return jsonify({"error": str(e)}), 500
@@ -24,14 +53,11 @@ def handle_areas():
                 return error
 
             with app_module.get_db() as conn:
-                max_order = conn.execute('SELECT MAX(order_index) FROM areas').fetchone()[0]
-                next_order = (max_order if max_order is not None else -1) + 1
-                conn.execute(
-                    'INSERT INTO areas (key, text, date_time_created, order_index) VALUES (?, ?, ?, ?)',
-                    (data['key'], data['text'], app_module.get_pacific_time(), next_order)
-                )
+                undo = app_module.undo_buffer()
+                result = create_area(conn, app_module.ordering, data, undo)
+                undo.write(conn)
                 conn.commit()
-                return jsonify({'status': 'success'})
+                return jsonify(result)
         except Exception as e:  # pragma: no cover - exercise in tests
             logging.error(f"Error creating area: {e}")
             return jsonify({"error": str(e)}), 500
@@ -45,37 +71,13 @@ def handle_area(key):
         try:
             data = request.json
             with app_module.get_db() as conn:
-                current = conn.execute('SELECT * FROM areas WHERE key = ?', (key,)).fetchone()
-                if current:
-                    app_module.log_action_for_undo(conn, 'UPDATE', 'areas', key, dict(current))
-
-                updates = []
-                values = []
-                if 'text' in data:
-                    updates.append('text = ?')
-                    values.append(data['text'])
-                if 'order_index' in data:
-                    current_area = conn.execute('SELECT order_index FROM areas WHERE key = ?', (key,)).fetchone()
-                    new_index = data['order_index']
-                    if current_area and current_area['order_index'] != new_index:
-                        if new_index > current_area['order_index']:
-                            conn.execute(
-                                'UPDATE areas SET order_index = order_index - 1 WHERE order_index > ? AND order_index <= ?',
-                                (current_area['order_index'], new_index)
-                            )
-                        else:
-                            conn.execute(
-                                'UPDATE areas SET order_index = order_index + 1 WHERE order_index >= ? AND order_index < ?',
-                                (new_index, current_area['order_index'])
-                            )
-                        updates.append('order_index = ?')
-                        values.append(new_index)
-                if updates:
-                    values.append(key)
-                    query = f'UPDATE areas SET {", ".join(updates)} WHERE key = ?'
-                    conn.execute(query, values)
-                    conn.commit()
-                return jsonify({'status': 'success'})
+                undo = app_module.undo_buffer()
+                result = update_area(conn, app_module.ordering, key, data, undo)
+                undo.write(conn)
+                conn.commit()
+                return jsonify(result)
+        except OperationError as e:
+            return jsonify({"error": e.message}), e.status
         except Exception as e:  # pragma: no cover - exercise in tests
             logging.error(f"Error updating area: {e}")
             return jsonify({"error": str(e)}), 500
@@ -83,21 +85,11 @@ def handle_area(key):
     elif request.method == 'DELETE':
         try:
             with app_module.get_db() as conn:
-                area = conn.execute('SELECT * FROM areas WHERE key = ?', (key,)).fetchone()
-                objectives = conn.execute('SELECT * FROM objectives WHERE area_key = ?', (key,)).fetchall()
-                for obj in objectives:
-                    tasks = conn.execute('SELECT * FROM tasks WHERE objective_key = ?', (obj['key'],)).fetchall()
-                    for task in tasks:
-                        app_module.log_action_for_undo(conn, 'DELETE', 'tasks', task['key'], dict(task))
-                    app_module.log_action_for_undo(conn, 'DELETE', 'objectives', obj['key'], dict(obj))
-                area_tasks = conn.execute('SELECT * FROM tasks WHERE area_key = ?', (key,)).fetchall()
-                for task in area_tasks:
-                    app_module.log_action_for_undo(conn, 'DELETE', 'tasks', task['key'], dict(task))
-                if area:
-                    app_module.log_action_for_undo(conn, 'DELETE', 'areas', key, dict(area))
-                conn.execute('DELETE FROM areas WHERE key = ?', (key,))
+                undo = app_module.undo_buffer()
+                result = delete_area(conn, app_module.ordering, key, undo)
+                undo.write(conn)
                 conn.commit()
-                return jsonify({'status': 'success'})
+                return jsonify(result)
         except Exception as e:  # pragma: no cover - exercise in tests
             logging.error(f"Error deleting area: {e}")
             return jsonify({"error": str(e)}), 500
@@ -0,0 +1,105 @@
+"""Snapshot administration routes."""
+import os
+import hmac
+import logging
+from flask import Blueprint, jsonify, request, current_app
+
+try:
+    from ..backup import backup_now, list_snapshots, restore
+    from ..database import current_shard
+except ImportError:  # pragma: no cover - executed only when run as script
+    from backup import backup_now, list_snapshots, restore
+    from database import current_shard
+
+bp = Blueprint('backup', __name__)
+
+# bearer token for the admin routes; without one they are disabled
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN') or None
+
+
+def check_token():
+    """Return an error response unless the request carries ``ADMIN_TOKEN``.
+
+    It comes as ``Authorization: Bearer <token>``, or as ``X-Admin-Token``
+    when ``Authorization`` carries a tenant token.
+    """
+    token = current_app.admin_token
+    if not token:
+        return jsonify({"error": "Admin routes are disabled; set ADMIN_TOKEN"}), 403
+    supplied = request.headers.get('X-Admin-Token')
+    supplied = request.headers.get('Authorization', '') if supplied is None else f'Bearer {supplied}'
+    if not hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode()):
+        return jsonify({"error": "Unauthorized"}), 401
+    return None
+
+
+def check_admin():
+    """Like :func:`check_token`, and also require backups to be enabled."""
+    error = check_token()
+    if error:
+        return error
+    if not current_app.backups.directory:
+        return jsonify({"error": "Backups are disabled; set BACKUP_DIR"}), 404
+    return None
+
+
+def backup_target(backups):
+    """Database, snapshot directory and writer of the request's tenant.
+
+    Without tenants that is the scheduler's own database.
+    """
+    shard = current_shard()
+    if shard is None:
+        return backups.path, backups.directory, backups.run
+    return shard.path, os.path.join(backups.directory, shard.tenant), shard.writer.run
+
+
+@bp.route('/api/backups', methods=['GET', 'POST'])
+def handle_backups():
+    """List the snapshots, newest first, or take one now (``POST``).
+
+    With ``TENANT_DIR`` set they are those of the request's tenant.
+    """
+    app_module = current_app
+    try:
+        error = check_admin()
+        if error:
+            return error
+        backups = app_module.backups
+        path, directory, _ = backup_target(backups)
+        if request.method == 'POST':
+            entry = backup_now(path, directory, app_module.metrics)
+            return jsonify(entry), 201
+        return jsonify({
+            'directory': directory,
+            'interval': backups.interval,
+            'snapshots': list_snapshots(directory),
+        })
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error handling backups: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/backups/<name>/restore', methods=['POST'])
+def restore_backup(name):
+    """Replace the database, or the request's tenant's, with snapshot ``name``.
+
+    The current contents are snapshotted first and named in the response.
+    Clients should reload afterwards; delta sync reports ``reset``.
+    """
+    app_module = current_app
+    try:
+        error = check_admin()
+        if error:
+            return error
+        path, directory, run = backup_target(app_module.backups)
+        try:
+            saved = restore(name, directory, path, run)
+        except FileNotFoundError as e:
+            return jsonify({"error": str(e)}), 404
+        app_module.response_cache.clear()
+        logging.warning(f"Restored {path} from {name}; previous state saved as {saved['name']}")
+        return jsonify({'status': 'success', 'restored': name, 'saved': saved['name']})
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error restoring backup: {e}")
+        return jsonify({"error": str(e)}), 500
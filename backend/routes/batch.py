@@ -0,0 +1,111 @@
+"""Batched mutation route."""
+import os
+import sqlite3
+import logging
+from flask import Blueprint, jsonify, current_app
+
+try:
+    from ..services import OPERATIONS, OperationError
+    from ..utils import STATUSES
+except ImportError:  # pragma: no cover - executed only when run as script
+    from services import OPERATIONS, OperationError
+    from utils import STATUSES
+
+bp = Blueprint('batch', __name__)
+
+BATCH_MAX_OPS = int(os.environ.get('BATCH_MAX_OPS', 500))
+
+# fields a create needs, as for the single-item POST routes
+REQUIRED_FIELDS = {
+    'areas': ('key', 'text'),
+    'objectives': ('key', 'area_key', 'text'),
+    'tasks': ('key', 'text'),
+}
+
+
+def validate_operation(op):
+    """Normalise one batch entry.
+
+    Returns ``(op, error)`` where ``op`` is ``(name, table, key, data)``.
+    """
+    if not isinstance(op, dict):
+        return None, "Operation must be an object"
+    name, table = op.get('op'), op.get('entity')
+    if (name, table) not in OPERATIONS:
+        return None, f"Unknown operation {name!r} on {table!r}"
+    data = op.get('data', {})
+    if not isinstance(data, dict):
+        return None, "data must be an object"
+    key = op.get('key', data.get('key'))
+    if not isinstance(key, str) or not key:
+        return None, "key is required"
+    if name == 'create':
+        data = {**data, 'key': key}
+        missing = [field for field in REQUIRED_FIELDS[table] if not data.get(field)]
+        if missing:
+            return None, f"Missing fields: {', '.join(missing)}"
+        if table == 'tasks' and bool(data.get('area_key')) == bool(data.get('objective_key')):
+            return None, "Exactly one of area_key or objective_key must be specified"
+    elif name == 'update' and not data:
+        return None, "No updates provided"
+    if 'status' in data and data['status'] not in STATUSES:
+        return None, f"Invalid status {data['status']!r}"
+    return (name, table, key, data), None
+
+
+@bp.route('/api/batch', methods=['POST'])
+def apply_batch():
+    """Apply a list of operations in one transaction and one undo group.
+
+    The body is ``{"operations": [...]}`` where each entry looks like
+    ``{"op": "create" | "update" | "delete", "entity": "areas" |
+    "objectives" | "tasks", "key": ..., "data": {...}}``.  Every entry is
+    validated before anything is written.  Operations then run in order and
+    see each other's effects; the first one that fails rolls the whole batch
+    back.  The response lists each operation's result, which is the body
+    the matching single-item route would have returned.
+    """
+    app_module = current_app
+    try:
+        data, error = app_module.parse_json(['operations'])
+        if error:
+            return error
+        operations = data['operations']
+        if not isinstance(operations, list):
+            return jsonify({"error": "operations must be a list"}), 400
+        if len(operations) > BATCH_MAX_OPS:
+            return jsonify({"error": f"At most {BATCH_MAX_OPS} operations per batch"}), 400
+        parsed, errors = [], []
+        for index, op in enumerate(operations):
+            op, error = validate_operation(op)
+            if error:
+                errors.append({"index": index, "error": error})
+            parsed.append(op)
+        if errors:
+            return jsonify({"error": "Invalid operations", "errors": errors}), 400
+
+        undo = app_module.undo_buffer()
+        with app_module.get_db() as conn:
+            # index-mode sibling shifts are applied once, at flush
+            ordering = app_module.ordering.batch()
+            results = []
+            for index, (name, table, key, fields) in enumerate(parsed):
+                func = OPERATIONS[(name, table)]
+                try:
+                    if name == 'create':
+                        results.append(func(conn, ordering, fields, undo))
+                    elif name == 'update':
+                        results.append(func(conn, ordering, key, fields, undo))
+                    else:
+                        results.append(func(conn, ordering, key, undo))
+                except (OperationError, sqlite3.IntegrityError) as e:
+                    conn.rollback()
+                    status = e.status if isinstance(e, OperationError) else 400
+                    return jsonify({"error": str(e), "index": index}), status
+            ordering.flush(conn)
+            undo.write(conn)
+            conn.commit()
+            return jsonify({"results": results})
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error applying batch: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,38 @@
+"""Delta sync route."""
+import logging
+from flask import Blueprint, jsonify, request, current_app
+
+try:
+    from ..sync import SYNC_MAX_ROWS, read_delta
+except ImportError:  # pragma: no cover - executed only when run as script
+    from sync import SYNC_MAX_ROWS, read_delta
+
+bp = Blueprint('changes', __name__)
+
+
+@bp.route('/api/changes', methods=['GET'])
+def get_changes():
+    """Return rows and deletions newer than ``since``.
+
+    Rows carry every column, including ``version``, ``order_index`` and
+    ``rank``; deletions are ``{"entity", "key", "version"}`` entries in
+    ``deleted``.  Pass the returned ``version`` as the next ``since`` and
+    call again while ``more`` is true.
+    """
+    app_module = current_app
+    try:
+        try:
+            since = int(request.args.get('since', 0))
+            limit = int(request.args.get('limit', SYNC_MAX_ROWS))
+        except ValueError:
+            return jsonify({"error": "since and limit must be integers"}), 400
+        if since < 0 or not 0 < limit <= SYNC_MAX_ROWS:
+            return jsonify({"error": f"since must be >= 0 and limit between 1 and {SYNC_MAX_ROWS}"}), 400
+        with app_module.get_db() as conn:
+            # one snapshot for the high-water mark and every table
+            conn.execute('BEGIN')
+            delta = read_delta(conn, since, limit)
+        return jsonify(delta)
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error reading changes: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,31 @@
+"""Change feed route."""
+import logging
+from flask import Blueprint, Response, jsonify, request, current_app
+
+bp = Blueprint('events', __name__)
+
+
+@bp.route('/api/events', methods=['GET'])
+def stream_events():
+    """Stream committed changes as Server-Sent Events.
+
+    ``since`` (or a reconnecting browser's ``Last-Event-ID``) resumes after
+    that version; without it only new changes are sent.
+    """
+    app_module = current_app
+    try:
+        since = request.args.get('since', request.headers.get('Last-Event-ID'))
+        if since is not None:
+            try:
+                since = int(since)
+            except ValueError:
+                return jsonify({"error": "since must be an integer version"}), 400
+        # the stream holds no request state, so no pooled connection is tied up
+        return Response(
+            app_module.current_change_feed().stream(since),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+        )
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error opening event stream: {e}")
+        return jsonify({"error": str(e)}), 500
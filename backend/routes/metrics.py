@@ -0,0 +1,59 @@
+"""Metrics and query statistics routes."""
+import logging
+from flask import Blueprint, Response, jsonify, request, current_app
+
+try:
+    from ..metrics import METRICS_DIR, render
+    from ..tracing import QUERY_TRACE
+except ImportError:  # pragma: no cover - executed only when run as script
+    from metrics import METRICS_DIR, render
+    from tracing import QUERY_TRACE
+
+bp = Blueprint('metrics', __name__)
+
+
+@bp.route('/metrics', methods=['GET'])
+def metrics():
+    """Request and SQLite metrics of every worker, plus history, read model and backup sizes."""
+    app_module = current_app
+    try:
+        with app_module.get_db() as conn:
+            history = app_module.history_stats(conn)
+        gauges = []
+        for table, stats in history.items():
+            gauges.append(('bigpicture_history_entries', 'Entries in the undo and redo logs.',
+                           {'table': table}, stats['entries']))
+        for table, stats in history.items():
+            gauges.append(('bigpicture_history_groups', 'Undoable or redoable actions.',
+                           {'table': table}, stats['groups']))
+        if app_module.boot_seconds is not None:
+            gauges.append(('bigpicture_boot_seconds', "Seconds from this worker's boot to its first response.",
+                           {}, app_module.boot_seconds))
+        if app_module.read_model is not None:
+            model = app_module.read_model.stats()
+            gauges.append(('bigpicture_read_model_bytes', 'Estimated memory held by the read model.',
+                           {}, model['bytes']))
+            for table, rows in model['rows'].items():
+                gauges.append(('bigpicture_read_model_rows', 'Rows held by the read model.', {'table': table}, rows))
+        if app_module.backups.directory:
+            gauges += app_module.backups.gauges()
+        body = render(app_module.metrics.collect(METRICS_DIR), gauges)
+        return Response(body, mimetype='text/plain; version=0.0.4')
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error rendering metrics: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/queries', methods=['GET'])
+def queries():
+    """Statements of this worker by total time (``QUERY_TRACE`` only).
+
+    ``limit`` caps the number of statements listed (default 50).
+    """
+    app_module = current_app
+    try:
+        limit = request.args.get('limit', 50, type=int)
+        return jsonify({"enabled": QUERY_TRACE, "statements": app_module.query_tracer.stats(limit)})
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error listing queries: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -2,17 +2,49 @@
 import logging
 from flask import Blueprint, jsonify, request, current_app
 
+try:
+    from ..services import OperationError, create_objective, update_objective, delete_objective
+except ImportError:  # pragma: no cover - executed only when run as script
+    from services import OperationError, create_objective, update_objective, delete_objective
+
 bp = Blueprint('objectives', __name__)
 
+OBJECTIVE_FILTERS = ('area_key', 'status', 'completed_after', 'completed_before')
+OBJECTIVE_SORT = ('area_key', 'position_', 'key')
+
 @bp.route('/api/objectives', methods=['GET', 'POST'])
 def handle_objectives():
-    """List or create objectives."""
+    """List or create objectives.
+
+    ``GET`` accepts the filters in ``OBJECTIVE_FILTERS`` plus ``limit`` and
+    ``cursor`` for keyset pagination over (area_key, order_index, key).
+    """
     app_module = current_app
     if request.method == 'GET':
         try:
+            args, error = app_module.parse_list_args(OBJECTIVE_FILTERS, OBJECTIVE_SORT)
+            if error:
+                return error
+            ordering = app_module.ordering
+            parent_where, parent_params = '', []
+            if 'area_key' in args:
+                parent_where, parent_params = 'WHERE o.area_key = ?', [args['area_key']]
+            where, where_params = app_module.completion_filters(args)
             with app_module.get_db() as conn:
-                objectives = conn.execute('SELECT * FROM objectives ORDER BY order_index').fetchall()
-                return jsonify([dict(objective) for objective in objectives])
+                model = app_module.current_read_model()
+                page = model.page(conn, 'objectives', args, ordering) if model else None
+                if page is not None:
+                    return app_module.list_response(*page)
+                objectives, next_cursor = app_module.query_page(
+                    conn,
+                    f"SELECT {ordering.columns('objectives', 'o')} FROM objectives o {parent_where}",
+                    parent_params,
+                    sort=OBJECTIVE_SORT,
+                    default_sort=('position_',),
+                    where=where, where_params=where_params,
+                    cursor=args.get('cursor'), limit=args.get('limit'),
+                )
+                return app_module.list_response([ordering.as_dict(o) for o in objectives], next_cursor)
         except Exception as e:  # pragma: no cover - exercise in tests
             logging.error(f"Error getting objectives: {e}")
             return jsonify({"error": str(e)}), 500
@@ -24,17 +56,11 @@ def handle_objectives():
                 return error
 
             with app_module.get_db() as conn:
-                max_order = conn.execute(
-                    'SELECT MAX(order_index) FROM objectives WHERE area_key = ?',
-                    (data['area_key'],)
-                ).fetchone()[0]
-                next_order = (max_order if max_order is not None else -1) + 1
-                conn.execute(
-                    'INSERT INTO objectives (key, area_key, text, date_time_created, status, order_index) VALUES (?, ?, ?, ?, ?, ?)',
-                    (data['key'], data['area_key'], data['text'], app_module.get_pacific_time(), 'open', next_order)
-                )
+                undo = app_module.undo_buffer()
+                result = create_objective(conn, app_module.ordering, data, undo)
+                undo.write(conn)
                 conn.commit()
-                return jsonify({'status': 'success'})
+                return jsonify(result)
         except Exception as e:  # pragma: no cover - exercise in tests
             logging.error(f"Error creating objective: {e}")
             return jsonify({"error": str(e)}), 500
@@ -48,63 +74,13 @@ def handle_objective(key):
         try:
             data = request.json
             with app_module.get_db() as conn:
-                current = conn.execute('SELECT * FROM objectives WHERE key = ?', (key,)).fetchone()
-                if current:
-                    app_module.log_action_for_undo(conn, 'UPDATE', 'objectives', key, dict(current))
-
-                updates = []
-                values = []
-                if 'text' in data:
-                    updates.append('text = ?')
-                    values.append(data['text'])
-
-                if 'order_index' in data or 'area_key' in data:
-                    current_area = current['area_key']
-                    new_area = data.get('area_key', current_area)
-                    new_index = data.get('order_index', current['order_index'])
-                    if new_area != current_area:
-                        conn.execute(
-                            'UPDATE objectives SET order_index = order_index - 1 WHERE area_key = ? AND order_index > ?',
-                            (current_area, current['order_index'])
-                        )
-                        conn.execute(
-                            'UPDATE objectives SET order_index = order_index + 1 WHERE area_key = ? AND order_index >= ?',
-                            (new_area, new_index)
-                        )
-                        updates.extend(['area_key = ?', 'order_index = ?'])
-                        values.extend([new_area, new_index])
-                    elif new_index != current['order_index']:
-                        if new_index > current['order_index']:
-                            conn.execute(
-                                'UPDATE objectives SET order_index = order_index - 1 WHERE area_key = ? AND order_index > ? AND order_index <= ?',
-                                (current_area, current['order_index'], new_index)
-                            )
-                        else:
-                            conn.execute(
-                                'UPDATE objectives SET order_index = order_index + 1 WHERE area_key = ? AND order_index >= ? AND order_index < ?',
-                                (current_area, new_index, current['order_index'])
-                            )
-                        updates.append('order_index = ?')
-                        values.append(new_index)
-
-                if 'status' in data:
-                    updates.append('status = ?')
-                    values.append(data['status'])
-                    if data['status'] == 'complete':
-                        updates.append('date_time_completed = ?')
-                        values.append(app_module.get_pacific_time())
-                    else:
-                        updates.append('date_time_completed = ?')
-                        values.append(None)
-
-                if updates:
-                    values.append(key)
-                    query = f'UPDATE objectives SET {", ".join(updates)} WHERE key = ?'
-                    conn.execute(query, values)
-                    conn.commit()
-                    updated = conn.execute('SELECT * FROM objectives WHERE key = ?', (key,)).fetchone()
-                    return jsonify(dict(updated))
-                return jsonify({"error": "No updates provided"}), 400
+                undo = app_module.undo_buffer()
+                result = update_objective(conn, app_module.ordering, key, data, undo)
+                undo.write(conn)
+                conn.commit()
+                return jsonify(result)
+        except OperationError as e:
+            return jsonify({"error": e.message}), e.status
         except Exception as e:  # pragma: no cover - exercise in tests
             logging.error(f"Error patching objective: {e}")
             return jsonify({"error": str(e)}), 500
@@ -112,15 +88,11 @@ def handle_objective(key):
     elif request.method == 'DELETE':
         try:
             with app_module.get_db() as conn:
-                objective = conn.execute('SELECT * FROM objectives WHERE key = ?', (key,)).fetchone()
-                if objective:
-                    tasks = conn.execute('SELECT * FROM tasks WHERE objective_key = ?', (key,)).fetchall()
-                    for task in tasks:
-                        app_module.log_action_for_undo(conn, 'DELETE', 'tasks', task['key'], dict(task))
-                    app_module.log_action_for_undo(conn, 'DELETE', 'objectives', key, dict(objective))
-                conn.execute('DELETE FROM objectives WHERE key = ?', (key,))
+                undo = app_module.undo_buffer()
+                result = delete_objective(conn, app_module.ordering, key, undo)
+                undo.write(conn)
                 conn.commit()
-                return jsonify({'status': 'success'})
+                return jsonify(result)
         except Exception as e:  # pragma: no cover - exercise in tests
             logging.error(f"Error deleting objective: {e}")
             return jsonify({"error": str(e)}), 500
@@ -0,0 +1,48 @@
+"""Full-text search route."""
+import logging
+from flask import Blueprint, jsonify, request, current_app
+
+try:
+    from ..search import SEARCH_SORT, SEARCH_TABLES, as_result, match_expression, search_sql
+except ImportError:  # pragma: no cover - executed only when run as script
+    from search import SEARCH_SORT, SEARCH_TABLES, as_result, match_expression, search_sql
+
+bp = Blueprint('search', __name__)
+
+
+@bp.route('/api/search', methods=['GET'])
+def search():
+    """Search area, objective and task text.
+
+    ``q`` is free text; every word matches as a prefix and results are
+    ranked by bm25, best first.  ``entity`` (comma separated) and ``status``
+    narrow the results, and ``limit``/``cursor`` page through them as for
+    the list endpoints.  Each result carries a ``snippet`` of the text,
+    HTML-escaped, with the matches wrapped in ``<mark>``.
+    """
+    app_module = current_app
+    try:
+        match = match_expression(request.args.get('q', ''))
+        if match is None:
+            return jsonify({"error": "q must contain a search term"}), 400
+        entities = [e for e in request.args.get('entity', '').split(',') if e]
+        unknown = [e for e in entities if e not in SEARCH_TABLES]
+        if unknown:
+            return jsonify({"error": f"Unknown entity: {unknown}"}), 400
+        args, error = app_module.parse_list_args(('status',), SEARCH_SORT)
+        if error:
+            return error
+        where, where_params = app_module.completion_filters(args)
+        with app_module.get_db() as conn:
+            rows, next_cursor = app_module.query_page(
+                conn,
+                search_sql(entities),
+                [match, *entities],
+                sort=SEARCH_SORT,
+                where=where, where_params=where_params,
+                cursor=args.get('cursor'), limit=args.get('limit'),
+            )
+            return app_module.list_response([as_result(row) for row in rows], next_cursor)
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error searching: {e}")
+        return jsonify({"error": str(e)}), 500
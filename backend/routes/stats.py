@@ -0,0 +1,31 @@
+"""Progress rollup route."""
+import logging
+from flask import Blueprint, jsonify, request, current_app
+
+try:
+    from ..progress import read_progress
+except ImportError:  # pragma: no cover - executed only when run as script
+    from progress import read_progress
+
+bp = Blueprint('stats', __name__)
+
+
+@bp.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Task counts and completion of every area and objective.
+
+    ``area_key`` limits the result to one area and its objectives.  The
+    counts come from the ``progress`` table, one row per area and
+    objective, without reading any task.
+    """
+    app_module = current_app
+    try:
+        area_key = request.args.get('area_key')
+        with app_module.get_db() as conn:
+            stats = read_progress(conn, area_key)
+        if area_key and not stats['areas']:
+            return jsonify({"error": f"Area {area_key} not found"}), 404
+        return jsonify(stats)
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error getting stats: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -2,22 +2,139 @@
 import logging
 from flask import Blueprint, jsonify, request, current_app
 
+try:
+    from ..ordering import parent_of
+    from ..services import OperationError, create_task, update_task, delete_task
+    from ..utils import encode_cursor
+except ImportError:  # pragma: no cover - executed only when run as script
+    from ordering import parent_of
+    from services import OperationError, create_task, update_task, delete_task
+    from utils import encode_cursor
+
 bp = Blueprint('tasks', __name__)
 
+TASK_FILTERS = ('area_key', 'objective_key', 'status', 'completed_after', 'completed_before')
+# keyset order of pages: the tasks of objectives (no area_key) by objective,
+# then those of areas by area, each list in sibling order.  ``order_`` is
+# the ordering's own column, so every page is a seek on a parent index.
+TASK_SORT = ('area_key', 'objective_key', 'order_', 'key')
+# the parent column of each run of that order, in sequence
+TASK_PARENTS = ('objective_key', 'area_key')
+
+
+def _page_positions(conn, ordering, rows):
+    """Set ``position_`` on a page of task dicts in keyset order.
+
+    In rank mode only the first row of each parent counts its siblings;
+    the next ones add the siblings between them and the previous row.
+    """
+    previous = None
+    for row in rows:
+        parent = parent_of('tasks', row)
+        if ordering.mode == 'rank' and previous is not None and parent_of('tasks', previous) == parent:
+            row['position_'] = previous['position_'] + conn.execute(
+                f'SELECT COUNT(*) FROM tasks WHERE {parent[0]} = ? '
+                'AND (rank, key) > (?, ?) AND (rank, key) <= (?, ?)',
+                (parent[1], previous['rank'], previous['key'], row['rank'], row['key']),
+            ).fetchone()[0]
+        else:
+            row['position_'] = ordering.position(conn, 'tasks', row)
+        previous = row
+
+
+def page_tasks(conn, ordering, args, where, where_params):
+    """One keyset page of tasks, as ``(rows, next_cursor)``.
+
+    Runs one index seek per parent column the page reaches instead of
+    ordering every task.
+    """
+    app_module = current_app
+    cursor, limit = args.get('cursor'), args.get('limit')
+    order = 'rank' if ordering.mode == 'rank' else 'order_index'
+    rows = []
+    for column in TASK_PARENTS:
+        if cursor is not None and column == 'objective_key' and cursor[0] is not None:
+            # the cursor is past the objectives' tasks
+            continue
+        conditions, params = [f't.{column} IS NOT NULL'], []
+        for name in ('area_key', 'objective_key'):
+            if name in args:
+                conditions.append(f't.{name} = ?')
+                params.append(args[name])
+        page_where = list(where)
+        page_params = list(where_params)
+        if cursor is not None and (column == 'area_key') == (cursor[0] is not None):
+            page_where.append(f'({column}, order_, key) > (?, ?, ?)')
+            page_params += [cursor[TASK_SORT.index(column)], cursor[2], cursor[3]]
+        found, _ = app_module.query_page(
+            conn,
+            f'''
+            SELECT t.*, o.status AS parent_status, t.{order} AS order_
+            FROM tasks t
+            LEFT JOIN objectives o ON t.objective_key = o.key
+            WHERE {' AND '.join(conditions)}
+            ''',
+            params,
+            sort=(column, 'order_', 'key'),
+            where=page_where, where_params=page_params,
+            limit=limit + 1 - len(rows) if limit is not None else None,
+        )
+        rows += [dict(row) for row in found]
+        if limit is not None and len(rows) > limit:
+            break
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][column] for column in TASK_SORT)
+    _page_positions(conn, ordering, rows)
+    return rows, next_cursor
+
+
 @bp.route('/api/tasks', methods=['GET', 'POST'])
 def handle_tasks():
-    """List or create tasks."""
+    """List or create tasks.
+
+    ``GET`` accepts the filters in ``TASK_FILTERS`` plus ``limit`` and
+    ``cursor`` for keyset pagination in ``TASK_SORT`` order.
+    """
     app_module = current_app
     if request.method == 'GET':
         try:
+            args, error = app_module.parse_list_args(TASK_FILTERS, TASK_SORT)
+            if error:
+                return error
+            ordering = app_module.ordering
+            # parent filters go inside the query so sibling positions are
+            # computed over whole parents; the rest filter its result
+            parent_where, parent_params = [], []
+            for column in ('area_key', 'objective_key'):
+                if column in args:
+                    parent_where.append(f't.{column} = ?')
+                    parent_params.append(args[column])
+            where, where_params = app_module.completion_filters(args)
             with app_module.get_db() as conn:
-                tasks = conn.execute('''
-                    SELECT t.*, o.status as parent_status
-                    FROM tasks t
-                    LEFT JOIN objectives o ON t.objective_key = o.key
-                    ORDER BY t.order_index
-                ''').fetchall()
-                return jsonify([dict(task) for task in tasks])
+                model = app_module.current_read_model()
+                page = model.page(conn, 'tasks', args, ordering) if model else None
+                if page is not None:
+                    return app_module.list_response(*page)
+                if 'cursor' in args or 'limit' in args:
+                    tasks, next_cursor = page_tasks(conn, ordering, args, where, where_params)
+                else:
+                    # the whole list, or one parent's: read as it is
+                    tasks, next_cursor = app_module.query_page(
+                        conn,
+                        f'''
+                        SELECT {ordering.columns('tasks', 't')}, o.status as parent_status
+                        FROM tasks t
+                        LEFT JOIN objectives o ON t.objective_key = o.key
+                        {'WHERE ' + ' AND '.join(parent_where) if parent_where else ''}
+                        ''',
+                        parent_params,
+                        sort=('position_', 'key'),
+                        default_sort=('position_',),
+                        where=where, where_params=where_params,
+                    )
+                return app_module.list_response([ordering.as_dict(task) for task in tasks], next_cursor)
         except Exception as e:  # pragma: no cover - exercise in tests
             logging.error(f"Error getting tasks: {e}")
             return jsonify({"error": str(e)}), 500
@@ -28,36 +145,13 @@ def handle_tasks():
             if error:
                 return error
             with app_module.get_db() as conn:
-                area_key = data.get('area_key') or None
-                objective_key = data.get('objective_key') or None
-                if (area_key is None) == (objective_key is None):
-                    return jsonify({"error": "Exactly one of area_key or objective_key must be specified"}), 400
-                parent_key = area_key or objective_key
-                parent_type = 'area_key' if area_key else 'objective_key'
-                max_order = conn.execute(
-                    f'SELECT MAX(order_index) FROM tasks WHERE {parent_type} = ?',
-                    (parent_key,)
-                ).fetchone()[0]
-                next_order = (max_order if max_order is not None else -1) + 1
-                conn.execute(
-                    '''INSERT INTO tasks (
-                        key, area_key, objective_key, text,
-                        date_time_created, status, date_time_completed, order_index
-                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?)''',
-                    (
-                        data['key'],
-                        area_key,
-                        objective_key,
-                        data['text'],
-                        app_module.get_pacific_time(),
-                        'open',
-                        None,
-                        next_order,
-                    )
-                )
-                result = conn.execute('SELECT * FROM tasks WHERE key = ?', (data['key'],)).fetchone()
+                undo = app_module.undo_buffer()
+                result = create_task(conn, app_module.ordering, data, undo)
+                undo.write(conn)
                 conn.commit()
-                return jsonify(dict(result))
+                return jsonify(result)
+        except OperationError as e:
+            return jsonify({"error": e.message}), e.status
         except Exception as e:  # pragma: no cover - exercise in tests
             logging.error(f"Error creating task: {e}")
             return jsonify({"error": str(e)}), 500
@@ -70,18 +164,13 @@ def handle_task(key):
     if request.method == 'DELETE':
         try:
             with app_module.get_db() as conn:
-                task = conn.execute('SELECT * FROM tasks WHERE key = ?', (key,)).fetchone()
-                if not task:
-                    return jsonify({"error": "Task not found"}), 404
-                app_module.log_action_for_undo(conn, 'DELETE', 'tasks', key, dict(task))
-                task_dict = dict(task)
-                parent_key = task_dict['area_key'] if task_dict['area_key'] else task_dict['objective_key']
-                parent_type = 'area_key' if task_dict['area_key'] else 'objective_key'
-                # Shift remaining tasks to fill the gap left by the deletion
-                app_module.shift_tasks_after_delete(conn, parent_type, parent_key, task_dict['order_index'])
-                conn.execute('DELETE FROM tasks WHERE key = ?', (key,))
+                undo = app_module.undo_buffer()
+                result = delete_task(conn, app_module.ordering, key, undo)
+                undo.write(conn)
                 conn.commit()
-                return jsonify({'status': 'success'})
+                return jsonify(result)
+        except OperationError as e:
+            return jsonify({"error": e.message}), e.status
         except Exception as e:  # pragma: no cover - exercise in tests
             logging.error(f"Error deleting task: {e}")
             return jsonify({"error": str(e)}), 500
@@ -90,115 +179,13 @@ def handle_task(key):
         try:
             data = request.json
             with app_module.get_db() as conn:
-                current = conn.execute('SELECT * FROM tasks WHERE key = ?', (key,)).fetchone()
-                if not current:
-                    return jsonify({"error": f"Task {key} not found"}), 404
-                current_dict = dict(current)
-                app_module.log_action_for_undo(conn, 'UPDATE', 'tasks', key, current_dict)
-
-                updates = []  # column assignments for the UPDATE statement
-                values = []   # values corresponding to the assignments
-                if 'text' in data:
-                    updates.append('text = ?')
-                    values.append(data['text'])
-                if 'status' in data:
-                    updates.append('status = ?')
-                    values.append(data['status'])
-                    if data['status'] == 'complete':
-                        updates.append('date_time_completed = ?')
-                        values.append(app_module.get_pacific_time())
-                    else:
-                        updates.append('date_time_completed = ?')
-                        values.append(None)
-
-                # Determine new parent and ordering for the task
-                new_area_key = data.get('area_key')
-                new_objective_key = data.get('objective_key')
-                new_order = data.get('order_index', current_dict['order_index'])
-
-                if new_area_key is None and new_objective_key is None:
-                    new_area_key = current_dict['area_key']
-                    new_objective_key = current_dict['objective_key']
-                else:
-                    new_area_key = None if not new_area_key or new_area_key in ('', 'null') else new_area_key
-                    new_objective_key = None if not new_objective_key or new_objective_key in ('', 'null') else new_objective_key
-                    if new_area_key and new_objective_key:
-                        return jsonify({"error": "Task cannot have both area and objective parent"}), 400
-                    if not new_area_key and not new_objective_key:
-                        return jsonify({"error": "Task must have either area or objective parent"}), 400
-
-                if new_area_key:
-                    area = conn.execute('SELECT key FROM areas WHERE key = ?', (new_area_key,)).fetchone()
-                    if not area:
-                        return jsonify({"error": f"Area {new_area_key} not found"}), 400
-                if new_objective_key:
-                    objective = conn.execute('SELECT key FROM objectives WHERE key = ?', (new_objective_key,)).fetchone()
-                    if not objective:
-                        return jsonify({"error": f"Objective {new_objective_key} not found"}), 400
-
-                current_parent = current_dict['area_key'] if current_dict['area_key'] else current_dict['objective_key']
-                new_parent = new_area_key if new_area_key else new_objective_key
-                changing_parent = current_parent != new_parent
-
-                if changing_parent:
-                    if current_dict['area_key']:
-                        conn.execute(
-                            'UPDATE tasks SET order_index = order_index - 1 WHERE area_key = ? AND order_index > ?',
-                            (current_dict['area_key'], current_dict['order_index'])
-                        )
-                    else:
-                        conn.execute(
-                            'UPDATE tasks SET order_index = order_index - 1 WHERE objective_key = ? AND order_index > ?',
-                            (current_dict['objective_key'], current_dict['order_index'])
-                        )
-                    if new_area_key:
-                        conn.execute(
-                            'UPDATE tasks SET order_index = order_index + 1 WHERE area_key = ? AND order_index >= ?',
-                            (new_area_key, new_order)
-                        )
-                    else:
-                        conn.execute(
-                            'UPDATE tasks SET order_index = order_index + 1 WHERE objective_key = ? AND order_index >= ?',
-                            (new_objective_key, new_order)
-                        )
-                else:
-                    current_order = current_dict['order_index']
-                    if new_order > current_order:
-                        if new_area_key:
-                            conn.execute(
-                                'UPDATE tasks SET order_index = order_index - 1 WHERE area_key = ? AND order_index > ? AND order_index <= ?',
-                                (new_area_key, current_order, new_order)
-                            )
-                        else:
-                            conn.execute(
-                                'UPDATE tasks SET order_index = order_index - 1 WHERE objective_key = ? AND order_index > ? AND order_index <= ?',
-                                (new_objective_key, current_order, new_order)
-                            )
-                    else:
-                        if new_area_key:
-                            conn.execute(
-                                'UPDATE tasks SET order_index = order_index + 1 WHERE area_key = ? AND order_index >= ? AND order_index < ?',
-                                (new_area_key, new_order, current_order)
-                            )
-                        else:
-                            conn.execute(
-                                'UPDATE tasks SET order_index = order_index + 1 WHERE objective_key = ? AND order_index >= ? AND order_index < ?',
-                                (new_objective_key, new_order, current_order)
-                            )
-                updated_task = {
-                    **current_dict,
-                    'area_key': new_area_key,
-                    'objective_key': new_objective_key,
-                    'order_index': new_order,
-                }
-
-                updates.extend(['area_key = ?', 'objective_key = ?', 'order_index = ?'])
-                values.extend([new_area_key, new_objective_key, new_order])
-                values.append(key)
-                query = f'UPDATE tasks SET {", ".join(updates)} WHERE key = ?'
-                conn.execute(query, values)
+                undo = app_module.undo_buffer()
+                result = update_task(conn, app_module.ordering, key, data, undo)
+                undo.write(conn)
                 conn.commit()
-                return jsonify(updated_task)
+                return jsonify(result)
+        except OperationError as e:
+            return jsonify({"error": e.message}), e.status
         except Exception as e:  # pragma: no cover - exercise in tests
             logging.error(f"Error updating task: {e}")
             return jsonify({"error": str(e)}), 500
@@ -0,0 +1,40 @@
+"""Tenant provisioning routes."""
+import logging
+from flask import Blueprint, jsonify, request, current_app
+
+try:
+    from ..database import TenantError, get_router, provision_tenant
+    from .backup import check_token
+except ImportError:  # pragma: no cover - executed only when run as script
+    from database import TenantError, get_router, provision_tenant
+    from routes.backup import check_token
+
+bp = Blueprint('tenants', __name__)
+
+
+@bp.route('/api/tenants', methods=['GET', 'POST'])
+def handle_tenants():
+    """List the tenants, or create one (``POST {"tenant": name}``).
+
+    Admin only (``ADMIN_TOKEN``).  Without ``TENANT_SECRET`` requests can
+    only name tenants created here; a new one answers ``201``, an existing
+    one ``200``.
+    """
+    app_module = current_app
+    try:
+        error = check_token()
+        if error:
+            return error
+        if request.method == 'GET':
+            return jsonify({'tenants': get_router().tenants()})
+        data, error = app_module.parse_json(['tenant'])
+        if error:
+            return error
+        try:
+            created = provision_tenant(data['tenant'])
+        except TenantError as e:
+            return jsonify({"error": str(e)}), e.status
+        return jsonify({'tenant': data['tenant'], 'created': created}), 201 if created else 200
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error handling tenants: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,101 @@
+"""Whole-board export and import routes."""
+import zlib
+import sqlite3
+import logging
+from flask import Blueprint, Response, jsonify, request, current_app, stream_with_context
+
+try:
+    from ..transfer import Importer, export_lines, gzip_chunks, read_lines, spool
+    from ..sync import high_water
+except ImportError:  # pragma: no cover - executed only when run as script
+    from transfer import Importer, export_lines, gzip_chunks, read_lines, spool
+    from sync import high_water
+
+bp = Blueprint('transfer', __name__)
+
+IMPORT_MODES = ('upsert', 'replace')
+
+
+def _flag(name):
+    return request.args.get(name, '0') not in ('0', 'false', 'no')
+
+
+@bp.route('/api/export', methods=['GET'])
+def export_board():
+    """Stream every area, objective and task as NDJSON.
+
+    ``gzip=1`` compresses the stream, as a ``.ndjson.gz`` download.  The
+    rows come from a single snapshot, however long the download takes.
+    """
+    app_module = current_app
+    try:
+        compress = _flag('gzip')
+
+        def generate():
+            conn = app_module.get_db()
+            conn.execute('BEGIN')
+            try:
+                yield from export_lines(conn)
+            except Exception as e:  # pragma: no cover - the response has started
+                logging.error(f"Error exporting board: {e}")
+                raise
+            finally:
+                conn.rollback()
+
+        lines = generate()
+        if compress:
+            body, mimetype, filename = gzip_chunks(lines), 'application/gzip', 'bigpicture.ndjson.gz'
+        else:
+            body, mimetype, filename = lines, 'application/x-ndjson', 'bigpicture.ndjson'
+        # keeps the request's connection checked out until the stream ends
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename={filename}', 'Cache-Control': 'no-store'},
+        )
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error exporting board: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/import', methods=['POST'])
+def import_board():
+    """Load an NDJSON export (plain or gzip) in one transaction.
+
+    ``mode=upsert`` (the default) inserts new keys and overwrites existing
+    ones; ``mode=replace`` empties the board and the undo history first.
+    With ``dry_run=1`` everything is written and checked, then rolled back.
+    Any invalid line or dangling reference fails the import with a 400
+    listing the problems; nothing is written.  The upload is received in
+    full before the write transaction begins.
+    """
+    app_module = current_app
+    try:
+        mode = request.args.get('mode', 'upsert')
+        if mode not in IMPORT_MODES:
+            return jsonify({"error": f"mode must be one of {', '.join(IMPORT_MODES)}"}), 400
+        dry_run = _flag('dry_run')
+        with spool(request.stream) as body:
+            conn = app_module.get_db()
+            conn.execute('BEGIN IMMEDIATE')
+            importer = Importer(conn, replace=mode == 'replace')
+            try:
+                importer.start()
+                for number, line in read_lines(body):
+                    if not importer.add(number, line):
+                        break
+                summary = importer.finish()
+            except (zlib.error, sqlite3.IntegrityError) as e:
+                conn.rollback()
+                return jsonify({"error": f"Import failed: {e}"}), 400
+        if summary['errors']:
+            conn.rollback()
+            return jsonify({"error": "Invalid import", **summary}), 400
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+        return jsonify({**summary, 'mode': mode, 'dry_run': dry_run, 'version': high_water(conn)})
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error importing board: {e}")
+        return jsonify({"error": str(e)}), 500
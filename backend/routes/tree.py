@@ -0,0 +1,92 @@
+"""Nested board snapshot route."""
+import logging
+from flask import Blueprint, jsonify, request, current_app
+
+try:
+    from ..progress import read_progress
+except ImportError:  # pragma: no cover - executed only when run as script
+    from progress import read_progress
+
+bp = Blueprint('tree', __name__)
+
+
+def build_tree(conn, ordering, area_key=None):
+    """Return areas with their objectives and tasks nested inside.
+
+    One query per table fetches everything in sibling order, all in one
+    read transaction, then a single pass files each row under its parent.
+    ``area_key`` limits the snapshot to one area.  Areas and objectives
+    carry their ``progress`` counts (see :func:`progress.read_progress`).
+    """
+    params = [area_key] if area_key else []
+    began = not conn.in_transaction
+    if began:
+        # every table and the progress counts from one snapshot, so no
+        # row's parent can be missing from it
+        conn.execute('BEGIN')
+    try:
+        return _build_tree(conn, ordering, area_key, params)
+    finally:
+        if began:
+            conn.rollback()
+
+
+def _build_tree(conn, ordering, area_key, params):
+    # areas are wrapped so rank-mode positions are computed over every area
+    areas = conn.execute(
+        f"SELECT * FROM (SELECT {ordering.columns('areas', 'a')} FROM areas a) "
+        f"{'WHERE key = ?' if area_key else ''} ORDER BY position_",
+        params,
+    ).fetchall()
+    objectives = conn.execute(
+        f"SELECT {ordering.columns('objectives', 'o')} FROM objectives o "
+        f"{'WHERE o.area_key = ?' if area_key else ''} ORDER BY position_",
+        params,
+    ).fetchall()
+    tasks = conn.execute(
+        f'''
+        SELECT {ordering.columns('tasks', 't')}, o.status as parent_status
+        FROM tasks t
+        LEFT JOIN objectives o ON t.objective_key = o.key
+        {'WHERE t.area_key = ? OR t.objective_key IN (SELECT key FROM objectives WHERE area_key = ?)' if area_key else ''}
+        ORDER BY position_
+        ''',
+        params * 2,
+    ).fetchall()
+
+    progress = read_progress(conn, area_key)
+
+    tree = []
+    area_nodes = {}
+    objective_nodes = {}
+    for row in areas:
+        node = {**ordering.as_dict(row), 'progress': progress['areas'][row['key']], 'objectives': [], 'tasks': []}
+        area_nodes[node['key']] = node
+        tree.append(node)
+    for row in objectives:
+        node = {**ordering.as_dict(row), 'progress': progress['objectives'][row['key']], 'tasks': []}
+        objective_nodes[node['key']] = node
+        area_nodes[node['area_key']]['objectives'].append(node)
+    for row in tasks:
+        task = ordering.as_dict(row)
+        if task['objective_key']:
+            objective_nodes[task['objective_key']]['tasks'].append(task)
+        else:
+            area_nodes[task['area_key']]['tasks'].append(task)
+    return tree
+
+
+@bp.route('/api/tree', methods=['GET'])
+def get_tree():
+    """Return the whole board (or one ``area_key``) as nested JSON."""
+    app_module = current_app
+    try:
+        area_key = request.args.get('area_key')
+        with app_module.get_db() as conn:
+            tree = build_tree(conn, app_module.ordering, area_key)
+            if area_key and not tree:
+                return jsonify({"error": f"Area {area_key} not found"}), 404
+            return jsonify(tree)
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error getting tree: {e}")
+        return jsonify({"error": str(e)}), 500
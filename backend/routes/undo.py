@@ -1,102 +1,141 @@
-"""Undo API route."""
-import json
+"""Undo and redo API routes."""
 import logging
 from flask import Blueprint, jsonify, current_app
 
+try:
+    from ..ordering import PARENT_COLUMNS, parent_of
+    from ..history import pop_group, write_history
+except ImportError:  # pragma: no cover - executed only when run as script
+    from ordering import PARENT_COLUMNS, parent_of
+    from history import pop_group, write_history
+
 bp = Blueprint('undo', __name__)
 
+# columns re-inserted when a deletion is undone (ordering is placed separately)
+RESTORED_COLUMNS = {
+    'areas': ('key', 'text', 'date_time_created'),
+    'objectives': ('key', 'area_key', 'text', 'date_time_created', 'date_time_completed', 'status'),
+    'tasks': ('key', 'area_key', 'objective_key', 'text', 'date_time_created', 'date_time_completed', 'status'),
+}
+# columns an update entry may write back
+REVERTED_COLUMNS = {
+    'areas': ('text',),
+    'objectives': ('text', 'area_key', 'status', 'date_time_completed'),
+    'tasks': ('text', 'area_key', 'objective_key', 'status', 'date_time_completed'),
+}
+
+# child rows that keep a blanked area/objective alive when an edit is undone
+CHILDREN = {
+    'areas': ('objectives', 'area_key'),
+    'objectives': ('tasks', 'objective_key'),
+}
+
+
+def _drop(app_module, conn, table, current):
+    app_module.ordering.remove(conn, table, parent_of(table, current), current['order_index'])
+    conn.execute(f'DELETE FROM {table} WHERE key = ?', (current['key'],))
+    return [('DELETE', table, current['key'], current)]
+
+
+def revert(app_module, conn, action_type, table, old_data):
+    """Revert one history entry.
+
+    Returns the entries that would redo it again.
+    """
+    ordering = app_module.ordering
+    key = old_data['key']
+    if 'text' in old_data:
+        old_data['text'] = old_data['text'].strip()
+    if action_type == 'DELETE':
+        parent = parent_of(table, old_data)
+        placement = ordering.insert_at(conn, table, parent, old_data['order_index'])
+        restored = {column: old_data[column] for column in RESTORED_COLUMNS[table]}
+        app_module.insert_row(conn, table, {**restored, **placement})
+        return [('INSERT', table, key, {'key': key})]
+
+    current = ordering.fetch(conn, table, key)
+    if current is None:
+        return []
+    if action_type == 'INSERT':
+        return _drop(app_module, conn, table, current)
+
+    if old_data.get('text') == '':
+        # an edit of a blank record: drop the record rather than restore it,
+        # unless it has children
+        child = CHILDREN.get(table)
+        if not child or not conn.execute(
+            f'SELECT 1 FROM {child[0]} WHERE {child[1]} = ? LIMIT 1', (key,)
+        ).fetchone():
+            return _drop(app_module, conn, table, current)
+
+    restored = {column: old_data[column] for column in REVERTED_COLUMNS[table] if column in old_data}
+    redo = {column: current[column] for column in restored}
+    if 'order_index' in old_data:
+        # move the row back to where it was, shifting siblings as needed
+        restored.update(ordering.move(
+            conn, table, key,
+            parent_of(table, current), current['order_index'],
+            parent_of(table, old_data), old_data['order_index'],
+        ))
+        redo.update({column: current[column] for column in ('order_index', *PARENT_COLUMNS[table])})
+    if restored:
+        assignments = ', '.join(f'{column} = ?' for column in restored)
+        conn.execute(f'UPDATE {table} SET {assignments} WHERE key = ?', [*restored.values(), key])
+    return [('UPDATE', table, key, {'key': key, **redo})]
+
+
+def replay(app_module, conn, source, target):
+    """Revert the newest group in ``source`` and push its inverse onto ``target``.
+
+    Returns ``False`` when ``source`` is empty.
+    """
+    entries = pop_group(conn, source)
+    if not entries:
+        return False
+    inverse = []
+    for action_type, table, _, old_data in entries:
+        inverse.extend(revert(app_module, conn, action_type, table, old_data))
+    write_history(conn, inverse, target)
+    return True
+
+
 @bp.route('/api/undo', methods=['POST'])
 def undo_last_action():
-    """Undo the most recent logged action."""
+    """Undo the most recent action, i.e. every change in its group."""
     app_module = current_app
     try:
         with app_module.get_db() as conn:
-            last_action = conn.execute(
-                'SELECT * FROM undo_log ORDER BY id DESC LIMIT 1'
-            ).fetchone()
-            if not last_action:
+            if not replay(app_module, conn, 'undo_log', 'redo_log'):
                 return jsonify({"error": "No actions to undo"}), 404
-            action_data = dict(last_action)
-            old_data = json.loads(action_data['old_data'])
-            if 'text' in old_data:
-                old_data['text'] = old_data['text'].strip()
-            if action_data['action_type'] == 'DELETE':
-                if action_data['table_name'] == 'areas':
-                    conn.execute(
-                        'UPDATE areas SET order_index = order_index + 1 WHERE order_index >= ?',
-                        (old_data['order_index'],)
-                    )
-                    conn.execute(
-                        'INSERT INTO areas (key, text, order_index, date_time_created) VALUES (?, ?, ?, ?)',
-                        (old_data['key'], old_data['text'], old_data['order_index'], old_data['date_time_created'])
-                    )
-                elif action_data['table_name'] == 'objectives':
-                    conn.execute(
-                        'UPDATE objectives SET order_index = order_index + 1 WHERE area_key = ? AND order_index >= ?',
-                        (old_data['area_key'], old_data['order_index'])
-                    )
-                    conn.execute(
-                        'INSERT INTO objectives (key, area_key, text, order_index, date_time_created, date_time_completed, status) VALUES (?, ?, ?, ?, ?, ?, ?)',
-                        (
-                            old_data['key'], old_data['area_key'], old_data['text'],
-                            old_data['order_index'], old_data['date_time_created'],
-                            old_data['date_time_completed'], old_data['status']
-                        )
-                    )
-                elif action_data['table_name'] == 'tasks':
-                    parent_col = 'area_key' if old_data['area_key'] else 'objective_key'
-                    parent_key = old_data['area_key'] or old_data['objective_key']
-                    conn.execute(
-                        f'UPDATE tasks SET order_index = order_index + 1 WHERE {parent_col} = ? AND order_index >= ?',
-                        (parent_key, old_data['order_index'])
-                    )
-                    conn.execute(
-                        'INSERT INTO tasks (key, area_key, objective_key, text, order_index, date_time_created, date_time_completed, status) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
-                        (
-                            old_data['key'], old_data['area_key'], old_data['objective_key'],
-                            old_data['text'], old_data['order_index'], old_data['date_time_created'],
-                            old_data['date_time_completed'], old_data['status']
-                        )
-                    )
-            elif action_data['action_type'] == 'UPDATE':
-                if action_data['table_name'] == 'areas':
-                    conn.execute(
-                        'UPDATE areas SET text = ?, order_index = ? WHERE key = ?',
-                        (old_data['text'], old_data['order_index'], old_data['key'])
-                    )
-                    if old_data['text'] == '':
-                        related = conn.execute('SELECT 1 FROM objectives WHERE area_key = ? LIMIT 1', (old_data['key'],)).fetchone()
-                        if not related:
-                            conn.execute('DELETE FROM areas WHERE key = ?', (old_data['key'],))
-                elif action_data['table_name'] == 'objectives':
-                    conn.execute(
-                        'UPDATE objectives SET text = ?, area_key = ?, order_index = ?, status = ?, date_time_completed = ? WHERE key = ?',
-                        (
-                            old_data['text'], old_data['area_key'], old_data['order_index'],
-                            old_data['status'], old_data['date_time_completed'], old_data['key']
-                        )
-                    )
-                    if old_data['text'] == '':
-                        related = conn.execute('SELECT 1 FROM tasks WHERE objective_key = ? LIMIT 1', (old_data['key'],)).fetchone()
-                        if not related:
-                            conn.execute('DELETE FROM objectives WHERE key = ?', (old_data['key'],))
-                elif action_data['table_name'] == 'tasks':
-                    conn.execute(
-                        'UPDATE tasks SET text = ?, area_key = ?, objective_key = ?, order_index = ?, status = ?, date_time_completed = ? WHERE key = ?',
-                        (
-                            old_data['text'], old_data['area_key'], old_data['objective_key'],
-                            old_data['order_index'], old_data['status'], old_data['date_time_completed'],
-                            old_data['key']
-                        )
-                    )
-                    if old_data['text'] == '':
-                        parent_col = 'area_key' if old_data['area_key'] else 'objective_key'
-                        parent_key = old_data['area_key'] or old_data['objective_key']
-                        app_module.shift_tasks_after_delete(conn, parent_col, parent_key, old_data['order_index'])
-                        conn.execute('DELETE FROM tasks WHERE key = ?', (old_data['key'],))
-            conn.execute('DELETE FROM undo_log WHERE id = ?', (action_data['id'],))
             conn.commit()
             return jsonify({'status': 'success'})
     except Exception as e:  # pragma: no cover - exercise in tests
         logging.error(f"Error during undo: {e}")
         return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/redo', methods=['POST'])
+def redo_last_action():
+    """Redo the most recently undone action."""
+    app_module = current_app
+    try:
+        with app_module.get_db() as conn:
+            if not replay(app_module, conn, 'redo_log', 'undo_log'):
+                return jsonify({"error": "No actions to redo"}), 404
+            conn.commit()
+            return jsonify({'status': 'success'})
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error during redo: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@bp.route('/api/history', methods=['GET'])
+def history():
+    """Sizes of the undo and redo stacks."""
+    app_module = current_app
+    try:
+        with app_module.get_db() as conn:
+            return jsonify(app_module.history_stats(conn))
+    except Exception as e:  # pragma: no cover - exercise in tests
+        logging.error(f"Error getting history: {e}")
+        return jsonify({"error": str(e)}), 500
@@ -0,0 +1,137 @@
+"""Full-text search over area, objective and task text.
+
+``search_docs`` holds one row per searchable record (its entity, key, text
+and status) and is the external content of the FTS5 table
+``search_index``.  Triggers (migration 9) keep both in step with the
+source tables inside the writing transaction; :func:`ensure_search_index`
+rebuilds them when an existing database is found out of step.
+"""
+import re
+import html
+import logging
+
+# entity -> status column, or None for tables without one
+SEARCH_TABLES = {
+    'areas': None,
+    'objectives': 'status',
+    'tasks': 'status',
+}
+
+# snippet() delimiters, replaced after the text has been HTML-escaped
+MARK_START, MARK_END = '\x02', '\x03'
+SNIPPET_TOKENS = 12
+
+SEARCH_SORT = ('score_', 'id_')
+
+
+def search_triggers():
+    """Triggers mirroring source rows into ``search_docs`` and ``search_index``."""
+    triggers = []
+    for table, status in SEARCH_TABLES.items():
+        doc = f"entity = '{table}' AND key = OLD.key"
+        unindex = (f"INSERT INTO search_index (search_index, rowid, text) "
+                   f"SELECT 'delete', id, text FROM search_docs WHERE {doc};")
+        triggers += [
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_insert_search AFTER INSERT ON {table}
+            BEGIN
+                INSERT INTO search_docs (entity, key, text, status)
+                VALUES ('{table}', NEW.key, NEW.text, {f'NEW.{status}' if status else 'NULL'});
+                INSERT INTO search_index (rowid, text) VALUES (last_insert_rowid(), NEW.text);
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_update_search AFTER UPDATE OF key, text ON {table}
+            WHEN NEW.text IS NOT OLD.text OR NEW.key IS NOT OLD.key
+            BEGIN
+                {unindex}
+                UPDATE search_docs SET key = NEW.key, text = NEW.text WHERE {doc};
+                INSERT INTO search_index (rowid, text)
+                SELECT id, text FROM search_docs WHERE entity = '{table}' AND key = NEW.key;
+            END
+            ''',
+            f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_delete_search AFTER DELETE ON {table}
+            BEGIN
+                {unindex}
+                DELETE FROM search_docs WHERE {doc};
+            END
+            ''',
+        ]
+        if status:
+            # the status only filters results, so the index is left alone
+            triggers.append(f'''
+            CREATE TRIGGER IF NOT EXISTS {table}_status_search AFTER UPDATE OF {status} ON {table}
+            WHEN NEW.{status} IS NOT OLD.{status}
+            BEGIN
+                UPDATE search_docs SET status = NEW.{status} WHERE entity = '{table}' AND key = NEW.key;
+            END
+            ''')
+    return triggers
+
+
+def rebuild_search_index(conn):
+    """Repopulate ``search_docs`` from the source tables and reindex."""
+    conn.execute('DELETE FROM search_docs')
+    for table, status in SEARCH_TABLES.items():
+        conn.execute(
+            f"INSERT INTO search_docs (entity, key, text, status) "
+            f"SELECT '{table}', key, text, {status or 'NULL'} FROM {table}"
+        )
+    conn.execute("INSERT INTO search_index (search_index) VALUES ('rebuild')")
+
+
+def ensure_search_index(conn):
+    """Rebuild the index if its document count disagrees with the tables.
+
+    Returns whether a rebuild was needed.
+    """
+    expected = sum(conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0] for table in SEARCH_TABLES)
+    if conn.execute('SELECT COUNT(*) FROM search_docs').fetchone()[0] == expected:
+        return False
+    logging.info("Search index out of date; rebuilding")
+    with conn:
+        rebuild_search_index(conn)
+    return True
+
+
+def match_expression(query):
+    """Turn free text into an FTS5 query matching every word as a prefix.
+
+    Returns ``None`` when ``query`` contains no words.  Operators and
+    quotes in the input are not interpreted, so any text is safe to pass.
+    """
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return ' '.join(f'"{word}"*' for word in words)
+
+
+def search_sql(entities=None):
+    """``SELECT`` of matching documents for :func:`utils.query_page`.
+
+    Parameters are the match expression followed by ``entities``.
+    """
+    where = ''
+    if entities:
+        where = f"AND d.entity IN ({', '.join('?' * len(entities))})"
+    return f'''
+        SELECT d.entity, d.key, d.status,
+               snippet(search_index, 0, '{MARK_START}', '{MARK_END}', '…', {SNIPPET_TOKENS}) AS snippet_,
+               bm25(search_index) AS score_, d.id AS id_
+        FROM search_index
+        JOIN search_docs d ON d.id = search_index.rowid
+        WHERE search_index MATCH ? {where}
+    '''
+
+
+def as_result(row):
+    """API form of a row selected with :func:`search_sql`."""
+    snippet = html.escape(row['snippet_']).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return {
+        'entity': row['entity'],
+        'key': row['key'],
+        'status': row['status'],
+        'snippet': snippet,
+        'score': row['score_'],
+    }
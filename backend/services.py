@@ -0,0 +1,261 @@
+"""Create, update and delete operations shared by the routes and ``/api/batch``.
+
+Each function works on an open connection and never commits, so callers
+decide the transaction: the single-item routes commit after one call, the
+batch route after all of them.  ``ordering`` is the strategy to place rows
+with (possibly a batch, see :meth:`IndexOrdering.batch`) and ``log`` records
+undo entries with the signature of ``log_action_for_undo``.
+
+Failures the client can fix raise :class:`OperationError`; the value
+returned is the JSON body of a successful response.
+"""
+from flask import current_app
+
+try:
+    from .ordering import NO_PARENT, PARENT_COLUMNS, parent_of
+    from .utils import insert_row
+except ImportError:  # pragma: no cover - executed only when run as script
+    from ordering import NO_PARENT, PARENT_COLUMNS, parent_of
+    from utils import insert_row
+
+
+class OperationError(Exception):
+    """A rejected operation, reported to the client with ``status``."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def _completion(status):
+    """Column changes setting ``status`` and the matching completion time."""
+    completed = current_app.get_pacific_time() if status == 'complete' else None
+    return {'status': status, 'date_time_completed': completed}
+
+
+def _update(conn, table, key, current, changes, placement, log):
+    """Write ``changes`` and ``placement`` to a row and log what changed.
+
+    Only columns whose value differs are kept for undo, plus the old parent
+    and position when the row moved.  Nothing is logged for a no-op.
+    """
+    changes = {**changes, **placement}
+    if not changes:
+        return
+    old = {column: current[column] for column, value in changes.items()
+           if column in current and current[column] != value}
+    if placement:
+        old.update({column: current[column] for column in ('order_index', *PARENT_COLUMNS[table])})
+    if old:
+        log(conn, 'UPDATE', table, key, {'key': key, **old})
+    assignments = ', '.join(f'{column} = ?' for column in changes)
+    conn.execute(f'UPDATE {table} SET {assignments} WHERE key = ?', [*changes.values(), key])
+
+
+def _log_deletes(conn, log, table, rows):
+    """Log the deletion of ``rows``, last sibling first.
+
+    Undo replays entries newest first, so children logged before their
+    parent are restored after it, and siblings come back in ascending
+    order without leaving gaps.
+    """
+    for row in sorted(rows, key=lambda row: row['order_index'], reverse=True):
+        log(conn, 'DELETE', table, row['key'], row)
+
+
+# --- areas ---------------------------------------------------------------
+
+def create_area(conn, ordering, data, log):
+    placement = ordering.append(conn, 'areas', NO_PARENT, data['key'])
+    insert_row(conn, 'areas', {
+        'key': data['key'],
+        'text': data['text'],
+        'date_time_created': current_app.get_pacific_time(),
+        **placement,
+    })
+    return {'status': 'success'}
+
+
+def update_area(conn, ordering, key, data, log):
+    current = ordering.fetch(conn, 'areas', key)
+    if not current:
+        return {'status': 'success'}
+    changes, placement = {}, {}
+    if 'text' in data:
+        changes['text'] = data['text']
+    if 'order_index' in data and current['order_index'] != data['order_index']:
+        placement = ordering.move(
+            conn, 'areas', key, NO_PARENT, current['order_index'], NO_PARENT, data['order_index']
+        )
+    _update(conn, 'areas', key, current, changes, placement, log)
+    return {'status': 'success'}
+
+
+def delete_area(conn, ordering, key, log):
+    area = ordering.fetch(conn, 'areas', key)
+    objectives = ordering.rows(conn, 'objectives', 'area_key = ?', [key])
+    tasks = ordering.rows(
+        conn, 'tasks',
+        'area_key = ? OR objective_key IN (SELECT key FROM objectives WHERE area_key = ?)', [key, key],
+    )
+    _log_deletes(conn, log, 'tasks', [task for task in tasks if task['objective_key']])
+    _log_deletes(conn, log, 'objectives', objectives)
+    _log_deletes(conn, log, 'tasks', [task for task in tasks if task['area_key']])
+    if area:
+        log(conn, 'DELETE', 'areas', key, area)
+    conn.execute('DELETE FROM areas WHERE key = ?', (key,))
+    return {'status': 'success'}
+
+
+# --- objectives ----------------------------------------------------------
+
+def create_objective(conn, ordering, data, log):
+    placement = ordering.append(conn, 'objectives', ('area_key', data['area_key']), data['key'])
+    insert_row(conn, 'objectives', {
+        'key': data['key'],
+        'area_key': data['area_key'],
+        'text': data['text'],
+        'date_time_created': current_app.get_pacific_time(),
+        'status': 'open',
+        **placement,
+    })
+    return {'status': 'success'}
+
+
+def update_objective(conn, ordering, key, data, log):
+    current = ordering.fetch(conn, 'objectives', key)
+    if not current:
+        raise OperationError(f"Objective {key} not found", 404)
+
+    changes, placement = {}, {}
+    if 'text' in data:
+        changes['text'] = data['text']
+
+    if 'order_index' in data or 'area_key' in data:
+        current_area = current['area_key']
+        new_area = data.get('area_key', current_area)
+        new_index = data.get('order_index', current['order_index'])
+        if new_area != current_area or new_index != current['order_index']:
+            placement = ordering.move(
+                conn, 'objectives', key,
+                ('area_key', current_area), current['order_index'],
+                ('area_key', new_area), new_index,
+            )
+            if new_area != current_area:
+                changes['area_key'] = new_area
+
+    if 'status' in data:
+        changes.update(_completion(data['status']))
+
+    if not changes and not placement:
+        raise OperationError("No updates provided")
+    _update(conn, 'objectives', key, current, changes, placement, log)
+    return ordering.fetch(conn, 'objectives', key)
+
+
+def delete_objective(conn, ordering, key, log):
+    objective = ordering.fetch(conn, 'objectives', key)
+    if objective:
+        _log_deletes(conn, log, 'tasks', ordering.children(conn, 'tasks', ('objective_key', key)))
+        log(conn, 'DELETE', 'objectives', key, objective)
+    conn.execute('DELETE FROM objectives WHERE key = ?', (key,))
+    return {'status': 'success'}
+
+
+# --- tasks ---------------------------------------------------------------
+
+def create_task(conn, ordering, data, log):
+    area_key = data.get('area_key') or None
+    objective_key = data.get('objective_key') or None
+    if (area_key is None) == (objective_key is None):
+        raise OperationError("Exactly one of area_key or objective_key must be specified")
+    parent = ('area_key', area_key) if area_key else ('objective_key', objective_key)
+    placement = ordering.append(conn, 'tasks', parent, data['key'])
+    insert_row(conn, 'tasks', {
+        'key': data['key'],
+        'area_key': area_key,
+        'objective_key': objective_key,
+        'text': data['text'],
+        'date_time_created': current_app.get_pacific_time(),
+        'status': 'open',
+        'date_time_completed': None,
+        **placement,
+    })
+    return ordering.fetch(conn, 'tasks', data['key'])
+
+
+def update_task(conn, ordering, key, data, log):
+    current = ordering.fetch(conn, 'tasks', key)
+    if not current:
+        raise OperationError(f"Task {key} not found", 404)
+
+    changes = {}
+    if 'text' in data:
+        changes['text'] = data['text']
+    if 'status' in data:
+        changes.update(_completion(data['status']))
+
+    # Determine new parent and ordering for the task
+    new_area_key = data.get('area_key')
+    new_objective_key = data.get('objective_key')
+    new_order = data.get('order_index', current['order_index'])
+
+    if new_area_key is None and new_objective_key is None:
+        new_area_key = current['area_key']
+        new_objective_key = current['objective_key']
+    else:
+        new_area_key = None if not new_area_key or new_area_key in ('', 'null') else new_area_key
+        new_objective_key = None if not new_objective_key or new_objective_key in ('', 'null') else new_objective_key
+        if new_area_key and new_objective_key:
+            raise OperationError("Task cannot have both area and objective parent")
+        if not new_area_key and not new_objective_key:
+            raise OperationError("Task must have either area or objective parent")
+
+    if new_area_key:
+        if not conn.execute('SELECT key FROM areas WHERE key = ?', (new_area_key,)).fetchone():
+            raise OperationError(f"Area {new_area_key} not found")
+    if new_objective_key:
+        if not conn.execute('SELECT key FROM objectives WHERE key = ?', (new_objective_key,)).fetchone():
+            raise OperationError(f"Objective {new_objective_key} not found")
+
+    new_parent = ('area_key', new_area_key) if new_area_key else ('objective_key', new_objective_key)
+    placement = ordering.move(
+        conn, 'tasks', key,
+        parent_of('tasks', current), current['order_index'],
+        new_parent, new_order,
+    )
+
+    changes.update(area_key=new_area_key, objective_key=new_objective_key)
+    _update(conn, 'tasks', key, current, changes, placement, log)
+    return {
+        **current,
+        'area_key': new_area_key,
+        'objective_key': new_objective_key,
+        'order_index': new_order,
+    }
+
+
+def delete_task(conn, ordering, key, log):
+    task = ordering.fetch(conn, 'tasks', key)
+    if not task:
+        raise OperationError("Task not found", 404)
+    log(conn, 'DELETE', 'tasks', key, task)
+    # Shift remaining tasks to fill the gap left by the deletion
+    ordering.remove(conn, 'tasks', parent_of('tasks', task), task['order_index'], key)
+    conn.execute('DELETE FROM tasks WHERE key = ?', (key,))
+    return {'status': 'success'}
+
+
+# (op, table) -> function; creates take ``data``, the others ``key`` first
+OPERATIONS = {
+    ('create', 'areas'): create_area,
+    ('update', 'areas'): update_area,
+    ('delete', 'areas'): delete_area,
+    ('create', 'objectives'): create_objective,
+    ('update', 'objectives'): update_objective,
+    ('delete', 'objectives'): delete_objective,
+    ('create', 'tasks'): create_task,
+    ('update', 'tasks'): update_task,
+    ('delete', 'tasks'): delete_task,
+}
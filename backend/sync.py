@@ -0,0 +1,87 @@
+"""Delta reads behind ``GET /api/changes``.
+
+Migration 8 stamps every row of ``areas``, ``objectives`` and ``tasks`` with
+the ``change_log`` version of its last change and records deleted keys in
+``tombstones`` at the version of the delete.  Versions only grow and no two
+rows or tombstones share one, so "everything after version N" is a range
+scan of the ``version`` indexes and costs the size of the delta, not of the
+board.
+
+Tombstones beyond ``TOMBSTONE_MAX_ROWS`` are pruned; ``meta.tombstone_floor``
+remembers the newest pruned version, below which a delta can no longer
+report every delete and the client must resync from scratch.
+"""
+import os
+
+TOMBSTONE_MAX_ROWS = int(os.environ.get('TOMBSTONE_MAX_ROWS', 100000))
+SYNC_MAX_ROWS = int(os.environ.get('SYNC_MAX_ROWS', 5000))
+
+SYNC_TABLES = ('areas', 'objectives', 'tasks')
+
+
+def high_water(conn):
+    """Return the newest version handed out so far."""
+    return conn.execute(
+        "SELECT IFNULL((SELECT seq FROM sqlite_sequence WHERE name = 'change_log'), 0)"
+    ).fetchone()[0]
+
+
+def tombstone_floor(conn):
+    row = conn.execute("SELECT value FROM meta WHERE name = 'tombstone_floor'").fetchone()
+    return row[0] if row else 0
+
+
+def read_delta(conn, since=0, limit=SYNC_MAX_ROWS):
+    """Return the rows and tombstones written after version ``since``.
+
+    At most ``limit`` entries are returned, oldest first.  Call inside a
+    read transaction so the tables are read from one snapshot.
+
+    Returns
+    -------
+    dict
+        ``{"version", "more", "reset", "areas", "objectives", "tasks",
+        "deleted"}``.  ``version`` is the ``since`` for the next call and
+        ``more`` tells whether that call has anything left to return.
+        ``reset`` is set when ``since`` predates the pruned tombstones;
+        the delta then holds every row, and the client should drop what it
+        has before applying it.
+    """
+    reset = 0 < since < tombstone_floor(conn)
+    if reset:
+        since = 0
+    latest = high_water(conn)
+    sources = [f'SELECT version FROM {table} WHERE version > ?' for table in (*SYNC_TABLES, 'tombstones')]
+    # the limit-th oldest version bounds this page
+    row = conn.execute(
+        f"SELECT version FROM ({' UNION ALL '.join(sources)}) ORDER BY version LIMIT 1 OFFSET ?",
+        [since] * len(sources) + [limit],
+    ).fetchone()
+    more = row is not None
+    until = row[0] - 1 if more else latest
+
+    delta = {'version': until, 'more': more, 'reset': reset}
+    for table in SYNC_TABLES:
+        delta[table] = [
+            dict(r) for r in conn.execute(
+                f'SELECT * FROM {table} WHERE version > ? AND version <= ? ORDER BY version', (since, until)
+            )
+        ]
+    delta['deleted'] = [] if reset else [
+        dict(r) for r in conn.execute(
+            'SELECT entity, key, version FROM tombstones WHERE version > ? AND version <= ? ORDER BY version',
+            (since, until),
+        )
+    ]
+    return delta
+
+
+def prune_tombstones(conn, keep=TOMBSTONE_MAX_ROWS):
+    """Delete all but the newest ``keep`` tombstones, raising the floor."""
+    row = conn.execute(
+        'SELECT version FROM tombstones ORDER BY version DESC LIMIT 1 OFFSET ?', (keep,)
+    ).fetchone()
+    if row is None:
+        return 0
+    conn.execute("UPDATE meta SET value = MAX(value, ?) WHERE name = 'tombstone_floor'", (row[0],))
+    return conn.execute('DELETE FROM tombstones WHERE version <= ?', (row[0],)).rowcount
@@ -0,0 +1,153 @@
+"""Opt-in SQL tracing, slow-query log and query-plan auditing.
+
+With ``QUERY_TRACE`` set, the connection ``get_db`` hands out records a
+:class:`~metrics.StatementTrace` per statement: its text, the shape of its
+bound parameters, the time spent executing and fetching it and the rows it
+returned.  When the request finishes :class:`QueryTracer` folds the traces
+into per-statement totals (``GET /api/queries``) and logs every statement
+that took longer than ``QUERY_SLOW_MS``, together with its
+``EXPLAIN QUERY PLAN``.
+
+The same plans drive the audit in ``tests/test_query_plans.py``, which
+fails when a route scans ``tasks`` or ``objectives`` in full.
+"""
+import os
+import re
+import logging
+import threading
+from flask import current_app, g, request
+
+QUERY_TRACE = os.environ.get('QUERY_TRACE', '0') not in ('0', 'false', 'no')
+QUERY_SLOW_MS = float(os.environ.get('QUERY_SLOW_MS', 100))
+QUERY_TRACE_MAX_STATEMENTS = int(os.environ.get('QUERY_TRACE_MAX_STATEMENTS', 500))
+
+# tables that must be reached through an index
+AUDITED_TABLES = ('tasks', 'objectives')
+
+
+def param_shape(params, many=False):
+    """Describe bound parameters by type, e.g. ``(str, int)`` or ``3 x (str)``."""
+    if many:
+        params = list(params)
+        return f'{len(params)} x {param_shape(params[0]) if params else "()"}'
+    if isinstance(params, dict):
+        return '{' + ', '.join(f'{k}: {type(v).__name__}' for k, v in params.items()) + '}'
+    return '(' + ', '.join(type(v).__name__ for v in params) + ')'
+
+
+def explain(conn, sql, params=(), many=False):
+    """Return the ``EXPLAIN QUERY PLAN`` details of a statement.
+
+    Statements that cannot be explained (``PRAGMA``, ``BEGIN``...) give
+    an empty list.
+    """
+    if many:
+        params = params[0] if params else ()
+    try:
+        return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+    except Exception:
+        return []
+
+
+def _aliases(sql, tables):
+    """Names ``tables`` go by in ``sql``: themselves and any alias."""
+    names = {}
+    for table in tables:
+        names[table] = table
+        pattern = rf'\b(?:FROM|JOIN|UPDATE|INTO)\s+{table}\s+(?:AS\s+)?(\w+)'
+        for alias in re.findall(pattern, sql, re.IGNORECASE):
+            if alias.upper() not in ('WHERE', 'SET', 'ON', 'JOIN', 'LEFT', 'INNER', 'ORDER', 'GROUP',
+                                     'LIMIT', 'VALUES', 'SELECT', 'USING', 'AS', 'DEFAULT'):
+                names[alias] = table
+    return names
+
+
+def full_scans(sql, plan, tables=AUDITED_TABLES):
+    """Plan lines that visit every row of one of ``tables``.
+
+    A ``SCAN`` reads the whole table, even when it walks an index to get
+    the rows in order; only a ``SEARCH`` narrows the rows visited.
+    """
+    names = _aliases(sql, tables)
+    scans = []
+    for detail in plan:
+        match = re.match(r'SCAN (?:TABLE )?(\w+)', detail)
+        if match and match.group(1) in names:
+            scans.append(detail)
+    return scans
+
+
+class QueryTracer:
+    """Aggregates statement traces and logs the slow ones.
+
+    Parameters
+    ----------
+    slow_ms : float
+        Statements taking at least this long are logged with their plan.
+    max_statements : int
+        Distinct statement texts kept in :meth:`stats`; later ones are
+        still logged when slow but not totalled.
+    audit : bool
+        Explain every distinct statement once and collect the full scans of
+        ``AUDITED_TABLES`` in :attr:`violations`.
+    """
+
+    def __init__(self, slow_ms=QUERY_SLOW_MS, max_statements=QUERY_TRACE_MAX_STATEMENTS, audit=False):
+        self.slow_ms = slow_ms
+        self.max_statements = max_statements
+        self.audit = audit
+        self.violations = []  # (endpoint, sql, plan line)
+        self._explained = set()
+        self._totals = {}     # sql -> [count, seconds, max seconds, rows, param shape]
+        self._lock = threading.Lock()
+
+    def finish(self, conn, traces, endpoint=None):
+        """Account for a request's ``traces``; ``conn`` is used for plans."""
+        for trace in traces:
+            with self._lock:
+                totals = self._totals.get(trace.sql)
+                if totals is None and len(self._totals) < self.max_statements:
+                    totals = self._totals[trace.sql] = [0, 0.0, 0.0, 0, None]
+                if totals is not None:
+                    totals[0] += 1
+                    totals[1] += trace.duration
+                    totals[2] = max(totals[2], trace.duration)
+                    totals[3] += trace.rows
+                    totals[4] = param_shape(trace.params, trace.many)
+            if trace.duration * 1000 >= self.slow_ms:
+                plan = explain(conn, trace.sql, trace.params, trace.many)
+                logging.warning(
+                    f"Slow query ({trace.duration * 1000:.1f} ms, {trace.rows} rows) in {endpoint}: "
+                    f"{' '.join(trace.sql.split())} {param_shape(trace.params, trace.many)}"
+                    + ''.join(f"\n    {line}" for line in plan)
+                )
+            if self.audit and (endpoint, trace.sql) not in self._explained:
+                self._explained.add((endpoint, trace.sql))
+                plan = explain(conn, trace.sql, trace.params, trace.many)
+                self.violations += [(endpoint, trace.sql, line) for line in full_scans(trace.sql, plan)]
+
+    def stats(self, limit=50):
+        """The ``limit`` statements with the most total time."""
+        with self._lock:
+            items = sorted(self._totals.items(), key=lambda item: item[1][1], reverse=True)[:limit]
+        return [
+            {
+                'sql': ' '.join(sql.split()),
+                'params': shape,
+                'calls': count,
+                'total_ms': round(total * 1000, 3),
+                'max_ms': round(longest * 1000, 3),
+                'rows': rows,
+            }
+            for sql, (count, total, longest, rows, shape) in items
+        ]
+
+
+def finish_request(response):
+    """``after_request`` hook handing the request's traces to the tracer."""
+    conn = g.get('db')
+    traces = getattr(conn, 'traces', None)
+    if traces:
+        current_app.query_tracer.finish(conn.connection, traces, request.endpoint)
+        conn.traces = []
+    return response
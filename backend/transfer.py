@@ -0,0 +1,316 @@
+"""Whole-board export and import as NDJSON.
+
+An export is one JSON object per line: a header
+``{"format": 1, "schema": ..., "version": ..., "ordering_mode": ...}``
+followed by every area, objective and task, parents first, as
+``{"entity": "tasks", "key": ..., ...}`` with all columns but ``version``.
+Rows are read through a cursor ``EXPORT_CHUNK`` at a time and encoded as
+they go, so memory stays flat whatever the size of the board.
+
+:class:`Importer` takes such lines in any order and writes them in
+``executemany`` chunks of ``IMPORT_CHUNK`` rows inside the caller's
+transaction.  Foreign keys are checked once, at the end, so a task may come
+before its objective.  Sibling positions are renumbered for the parents
+that need it: those that got rows without a position, all touched parents
+when merging into existing data (including the old parents of rows that
+moved), and every parent when the file was written under the other
+ordering mode.
+"""
+import os
+import json
+import zlib
+import shutil
+import tempfile
+
+try:
+    from .ordering import PARENT_COLUMNS, parent_of, renumber
+    from .sync import SYNC_TABLES, high_water
+    from .utils import STATUSES
+except ImportError:  # pragma: no cover - executed only when run as script
+    from ordering import PARENT_COLUMNS, parent_of, renumber
+    from sync import SYNC_TABLES, high_water
+    from utils import STATUSES
+
+EXPORT_CHUNK = int(os.environ.get('EXPORT_CHUNK', 1000))
+IMPORT_CHUNK = int(os.environ.get('IMPORT_CHUNK', 1000))
+IMPORT_MAX_ERRORS = int(os.environ.get('IMPORT_MAX_ERRORS', 50))
+# uploads larger than this are spooled to a temporary file, not memory
+IMPORT_SPOOL_BYTES = int(os.environ.get('IMPORT_SPOOL_BYTES', 8 << 20))
+
+EXPORT_FORMAT = 1
+
+# columns an import may set, and those it must
+COLUMNS = {
+    'areas': ('key', 'text', 'date_time_created', 'order_index', 'rank'),
+    'objectives': ('key', 'area_key', 'text', 'date_time_created', 'date_time_completed', 'status',
+                   'order_index', 'rank'),
+    'tasks': ('key', 'area_key', 'objective_key', 'text', 'date_time_created', 'date_time_completed',
+              'status', 'order_index', 'rank'),
+}
+REQUIRED = {
+    'areas': ('key', 'text', 'date_time_created'),
+    'objectives': ('key', 'area_key', 'text', 'date_time_created'),
+    'tasks': ('key', 'text', 'date_time_created'),
+}
+
+# placeholder positions sorting after every real one until renumbered
+_LAST_INDEX = 1 << 40
+_LAST_RANK = '~'
+
+READ_SIZE = 64 * 1024
+
+
+def ordering_mode(conn):
+    row = conn.execute("SELECT value FROM meta WHERE name = 'ordering_mode'").fetchone()
+    return row[0] if row else 'index'
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), ensure_ascii=False) + '\n'
+
+
+def export_lines(conn, chunk=EXPORT_CHUNK):
+    """Yield the export of the board as NDJSON lines.
+
+    Call inside a read transaction so every table comes from one snapshot.
+    """
+    yield _dumps({
+        'format': EXPORT_FORMAT,
+        'schema': conn.execute('PRAGMA user_version').fetchone()[0],
+        'version': high_water(conn),
+        'ordering_mode': ordering_mode(conn),
+    })
+    for table in SYNC_TABLES:
+        columns = COLUMNS[table]
+        cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY key")
+        while True:
+            rows = cursor.fetchmany(chunk)
+            if not rows:
+                break
+            yield ''.join(_dumps({'entity': table, **dict(zip(columns, row))}) for row in rows)
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress an iterable of strings into a gzip stream."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode())
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def spool(stream, max_size=IMPORT_SPOOL_BYTES, size=READ_SIZE):
+    """Read all of ``stream`` into a file object positioned at its start.
+
+    The import reads its upload through this before it takes the write
+    lock, so a slow client never holds up other writers.  Bodies up to
+    ``max_size`` bytes stay in memory, larger ones go to a temporary file;
+    close the result when done.
+    """
+    body = tempfile.SpooledTemporaryFile(max_size=max_size)
+    try:
+        shutil.copyfileobj(stream, body, size)
+    except BaseException:
+        body.close()
+        raise
+    body.seek(0)
+    return body
+
+
+def read_lines(stream, size=READ_SIZE):
+    """Yield ``(number, line)`` from a binary NDJSON stream, gzip or not.
+
+    The stream is read ``size`` bytes at a time; gzip input is recognised
+    by its magic number and decompressed as it arrives.
+    """
+    decompressor = None
+    pending = b''
+    number = 0
+    first = True
+    while True:
+        data = stream.read(size)
+        if first and data:
+            first = False
+            if data[:2] == b'\x1f\x8b':
+                decompressor = zlib.decompressobj(31)
+        if decompressor is not None:
+            data = decompressor.decompress(data) if data else decompressor.flush()
+        if not data:
+            break
+        pending += data
+        lines = pending.split(b'\n')
+        pending = lines.pop()
+        for line in lines:
+            number += 1
+            yield number, line
+    if pending:
+        yield number + 1, pending
+
+
+def validate(record):
+    """Check one parsed line; returns ``(table, values, error)``.
+
+    Header lines give ``(None, record, None)``.
+    """
+    if not isinstance(record, dict):
+        return None, None, "line must be a JSON object"
+    table = record.get('entity')
+    if table is None and 'format' in record:
+        if record['format'] != EXPORT_FORMAT:
+            return None, None, f"unsupported format {record['format']!r}"
+        return None, record, None
+    if table not in COLUMNS:
+        return None, None, f"unknown entity {table!r}"
+    unknown = set(record) - set(COLUMNS[table]) - {'entity', 'version'}
+    if unknown:
+        return None, None, f"unknown fields: {', '.join(sorted(unknown))}"
+    missing = [field for field in REQUIRED[table] if not record.get(field)]
+    if missing:
+        return None, None, f"missing fields: {', '.join(missing)}"
+    if not isinstance(record['key'], str):
+        return None, None, "key must be a string"
+    if table == 'tasks' and bool(record.get('area_key')) == bool(record.get('objective_key')):
+        return None, None, "exactly one of area_key or objective_key must be set"
+    if table != 'areas' and record.get('status', 'open') not in STATUSES:
+        return None, None, f"invalid status {record['status']!r}"
+    if record.get('order_index') is not None and not isinstance(record['order_index'], int):
+        return None, None, "order_index must be an integer"
+    values = {column: record.get(column) for column in COLUMNS[table]}
+    if table != 'areas':
+        values['status'] = values['status'] or 'open'
+    return table, values, None
+
+
+class Importer:
+    """Writes validated lines to the database in ``executemany`` chunks.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Connection with an open write transaction; the caller commits or,
+        for a dry run, rolls back.
+    replace : bool
+        Delete every area, objective and task (and the undo history, which
+        refers to them) before importing, instead of merging by key.
+    chunk : int
+        Rows per ``executemany``.
+    """
+
+    def __init__(self, conn, replace=False, chunk=IMPORT_CHUNK, max_errors=IMPORT_MAX_ERRORS):
+        self.conn = conn
+        self.replace = replace
+        self.chunk = chunk
+        self.max_errors = max_errors
+        self.mode = ordering_mode(conn)
+        self.file_mode = None
+        self.buffers = {table: [] for table in COLUMNS}
+        self.counts = {table: 0 for table in COLUMNS}
+        self.deleted = {table: 0 for table in COLUMNS}
+        self.errors = []
+        # parents whose children must be renumbered, or that were touched
+        self.unplaced = {table: set() for table in COLUMNS}
+        self.touched = {table: set() for table in COLUMNS}
+        self._statements = {
+            table: (
+                f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))}) "
+                f"ON CONFLICT(key) DO UPDATE SET "
+                + ', '.join(f'{column} = excluded.{column}' for column in columns[1:])
+                # unchanged rows keep their version, so sync clients skip them
+                + f" WHERE ({', '.join(columns[1:])}) IS NOT "
+                f"({', '.join(f'excluded.{column}' for column in columns[1:])})"
+            )
+            for table, columns in COLUMNS.items()
+        }
+
+    def start(self):
+        # checked once in finish(), so rows may arrive before their parents
+        self.conn.execute('PRAGMA defer_foreign_keys = ON')
+        if self.replace:
+            for table in reversed(SYNC_TABLES):
+                self.deleted[table] = self.conn.execute(f'DELETE FROM {table}').rowcount
+            self.conn.execute('DELETE FROM undo_log')
+            self.conn.execute('DELETE FROM redo_log')
+
+    def add(self, number, line):
+        """Parse and buffer line ``number``; returns False once errors pile up."""
+        if not line.strip():
+            return True
+        try:
+            record = json.loads(line)
+        except ValueError as e:
+            return self._error(number, f"invalid JSON: {e}")
+        table, values, error = validate(record)
+        if error:
+            return self._error(number, error)
+        if table is None:
+            self.file_mode = values.get('ordering_mode')
+            return True
+        if self.errors:
+            # nothing more is written once the import is known to fail
+            return True
+        parent = parent_of(table, values)
+        column = 'rank' if (self.file_mode or self.mode) == 'rank' else 'order_index'
+        if values[column] is None:
+            self.unplaced[table].add(parent)
+        if values['order_index'] is None:
+            values['order_index'] = _LAST_INDEX + number
+        if values['rank'] is None:
+            values['rank'] = f'{_LAST_RANK}{number:012d}'
+        self.touched[table].add(parent)
+        buffer = self.buffers[table]
+        buffer.append(tuple(values[column] for column in COLUMNS[table]))
+        if len(buffer) >= self.chunk:
+            self._flush(table)
+        return True
+
+    def _error(self, number, message):
+        self.errors.append({'line': number, 'error': message})
+        return len(self.errors) < self.max_errors
+
+    def _flush(self, table):
+        buffer = self.buffers[table]
+        if buffer:
+            if not self.replace and PARENT_COLUMNS[table]:
+                # a row moving to another parent leaves a gap in its old one
+                keys = [row[0] for row in buffer]
+                columns = PARENT_COLUMNS[table]
+                for row in self.conn.execute(
+                    f"SELECT {', '.join(columns)} FROM {table} WHERE key IN ({', '.join('?' * len(keys))})", keys
+                ):
+                    self.touched[table].add(parent_of(table, dict(zip(columns, row))))
+            self.conn.executemany(self._statements[table], buffer)
+            self.counts[table] += len(buffer)
+            buffer.clear()
+
+    def finish(self):
+        """Write what is buffered, fix positions and check references.
+
+        Returns the summary of the import; ``errors`` is non-empty when it
+        must be rolled back.
+        """
+        if self.errors:
+            return self.summary()
+        for table in SYNC_TABLES:
+            self._flush(table)
+        by = 'rank' if (self.file_mode or self.mode) == 'rank' else 'order_index'
+        for table in SYNC_TABLES:
+            if not self.replace or (self.file_mode and self.file_mode != self.mode):
+                parents = self.touched[table]
+            else:
+                parents = self.unplaced[table]
+            for parent in parents:
+                renumber(self.conn, table, parent, by)
+        for table, rowid, parent, _fk in self.conn.execute('PRAGMA foreign_key_check').fetchall():
+            key = self.conn.execute(f'SELECT key FROM {table} WHERE rowid = ?', (rowid,)).fetchone()[0]
+            self.errors.append({'entity': table, 'key': key, 'error': f"unknown parent in {parent}"})
+            if len(self.errors) >= self.max_errors:
+                break
+        return self.summary()
+
+    def summary(self):
+        return {
+            'imported': self.counts,
+            'deleted': self.deleted if self.replace else None,
+            'errors': self.errors,
+        }
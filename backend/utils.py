@@ -1,7 +1,12 @@
 """Utility helpers used across the Flask application."""
+import json
+import base64
 
 from flask import request, jsonify
 
+STATUSES = ('open', 'complete', 'secondary')
+MAX_PAGE_SIZE = 1000
+
 
 def parse_json(required_fields=None):
     """Parse JSON from the request.
@@ -51,3 +56,162 @@ def shift_tasks_after_delete(conn, parent_col, parent_key, start_order):
         f"WHERE {parent_col} = ? AND order_index > ?",
         (parent_key, start_order),
     )
+
+
+def insert_row(conn, table, values):
+    """Insert a row given as a ``{column: value}`` mapping.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Database connection.
+    table : str
+        Table to insert into.
+    values : dict
+        Column values for the new row.
+    """
+    columns = ', '.join(values)
+    placeholders = ', '.join('?' * len(values))
+    conn.execute(
+        f'INSERT INTO {table} ({columns}) VALUES ({placeholders})',
+        list(values.values()),
+    )
+
+
+def encode_cursor(values):
+    """Encode the sort key of the last row of a page as an opaque cursor."""
+    return base64.urlsafe_b64encode(json.dumps(list(values)).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Inverse of :func:`encode_cursor`; raises ``ValueError`` if malformed."""
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}")
+    # only scalars SQLite can bind
+    if not isinstance(values, list) or not all(v is None or isinstance(v, (int, float, str)) for v in values):
+        raise ValueError("Invalid cursor")
+    return values
+
+
+def parse_list_args(filters=(), sort=()):
+    """Parse the filter and paging query parameters of a list endpoint.
+
+    Parameters
+    ----------
+    filters : iterable[str]
+        Filters the endpoint supports, out of ``area_key``,
+        ``objective_key``, ``status`` (comma separated), ``completed_after``
+        and ``completed_before``.  ``limit`` and ``cursor`` are always
+        accepted.
+    sort : tuple[str]
+        The endpoint's keyset sort columns, used to validate ``cursor``.
+
+    Returns
+    -------
+    tuple
+        ``(args, error)`` as for :func:`parse_json`.  ``args`` only contains
+        the parameters that were given.
+    """
+    args = {}
+    for name in filters:
+        value = request.args.get(name)
+        if value is None or value == '':
+            continue
+        if name == 'status':
+            value = value.split(',')
+            unknown = [v for v in value if v not in STATUSES]
+            if unknown:
+                return None, (jsonify({"error": f"Unknown status: {unknown}"}), 400)
+        args[name] = value
+    if 'limit' in request.args:
+        try:
+            limit = int(request.args['limit'])
+        except ValueError:
+            limit = 0
+        if not 0 < limit <= MAX_PAGE_SIZE:
+            return None, (jsonify({"error": f"limit must be between 1 and {MAX_PAGE_SIZE}"}), 400)
+        args['limit'] = limit
+    if request.args.get('cursor'):
+        try:
+            args['cursor'] = decode_cursor(request.args['cursor'])
+        except ValueError as e:
+            return None, (jsonify({"error": str(e)}), 400)
+        if len(args['cursor']) != len(sort):
+            return None, (jsonify({"error": "Invalid cursor"}), 400)
+    return args, None
+
+
+def query_page(conn, sql, params, sort, where=(), where_params=(), cursor=None, limit=None, default_sort=None):
+    """Run a list query with optional filtering and keyset pagination.
+
+    Parameters
+    ----------
+    conn : sqlite3.Connection
+        Database connection.
+    sql : str
+        ``SELECT`` producing every candidate row, without ``ORDER BY``.
+    params : list
+        Parameters for ``sql``.
+    sort : tuple[str]
+        Result columns forming a unique sort key; pages are cut on it.
+    where, where_params : list
+        Extra conditions on the result columns of ``sql``.  They are applied
+        outside ``sql`` so that window functions in it still see every row.
+    cursor : list | None
+        Sort key of the last row of the previous page.
+    limit : int | None
+        Page size.  Without ``limit`` and ``cursor`` every row is returned,
+        ordered by ``default_sort`` (or ``sort``).
+    default_sort : tuple[str] | None
+        Order used when the caller does not paginate.
+
+    Returns
+    -------
+    tuple
+        ``(rows, next_cursor)``; ``next_cursor`` is ``None`` on the last page.
+    """
+    where = list(where)
+    values = list(params) + list(where_params)
+    paginated = cursor is not None or limit is not None
+    if cursor is not None:
+        where.append(f"({', '.join(sort)}) > ({', '.join('?' * len(sort))})")
+        values.extend(cursor)
+    query = f'SELECT * FROM ({sql}) page'
+    if where:
+        query += ' WHERE ' + ' AND '.join(where)
+    order = sort if paginated or not default_sort else default_sort
+    query += f" ORDER BY {', '.join(order)}"
+    if limit is not None:
+        query += ' LIMIT ?'
+        values.append(limit + 1)
+    rows = conn.execute(query, values).fetchall()
+    next_cursor = None
+    if limit is not None and len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1][column] for column in sort)
+    return rows, next_cursor
+
+
+def completion_filters(args):
+    """SQL conditions for the ``status``/``completed_*`` list filters."""
+    where, params = [], []
+    if 'status' in args:
+        where.append(f"status IN ({', '.join('?' * len(args['status']))})")
+        params.extend(args['status'])
+    if 'completed_after' in args:
+        where.append('date_time_completed >= ?')
+        params.append(args['completed_after'])
+    if 'completed_before' in args:
+        where.append('date_time_completed < ?')
+        params.append(args['completed_before'])
+    return where, params
+
+
+def list_response(items, next_cursor):
+    """JSON list response, with ``X-Next-Cursor`` when more pages follow."""
+    response = jsonify(items)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
+    return response
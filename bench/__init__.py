@@ -0,0 +1,8 @@
+"""Benchmarks for the backend.
+
+``bench.generate`` builds large deterministic boards, ``bench.micro`` times
+every endpoint in-process through the Flask test client, ``bench.load``
+drives a running (or spawned) gunicorn server from several processes,
+``bench.boot`` times a fresh process from start to its first response, and
+``bench.compare`` checks one saved result file against another.
+"""
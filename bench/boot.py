@@ -0,0 +1,102 @@
+"""Boot-to-first-response time of fresh backend processes.
+
+Each run starts a new interpreter that imports the backend, builds the app
+with ``create_app`` and answers one ``GET /api/test`` through the test
+client, the way a gunicorn worker starts on a cold machine.  Two cases are
+timed: ``fresh`` boots against an empty database, so the schema is set up,
+and ``current`` boots against a generated board whose schema is already up
+to date, which is what every worker after the first sees.  ``process`` times
+are measured from the parent, interpreter start included; ``app`` times are
+the app's own ``boot_seconds``, from importing the backend to the response.
+
+Usage::
+
+    python -m bench.boot --runs 20 --out boot.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+try:
+    from .generate import generate
+    from .results import summarize, save, print_table
+except ImportError:  # pragma: no cover - executed only when run as script
+    from generate import generate
+    from results import summarize, save, print_table
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CHILD = '''
+import json
+from backend.app import create_app
+app = create_app()
+status = app.test_client().get('/api/test').status_code
+print(json.dumps({'status': status, 'boot_seconds': app.boot_seconds}))
+'''
+
+
+def boot(path):
+    """Start one process on the database at ``path``; returns ``(seconds, app_seconds)``."""
+    env = dict(os.environ, DATABASE_URL=path, PYTHONPATH=ROOT)
+    start = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, '-c', CHILD], env=env, cwd=ROOT, capture_output=True, text=True, check=True
+    ).stdout
+    elapsed = time.perf_counter() - start
+    result = json.loads(out.strip().splitlines()[-1])
+    if result['status'] != 200:
+        raise RuntimeError(f"boot answered {result['status']}")
+    return elapsed, result['boot_seconds']
+
+
+def run(board, workdir, runs=10):
+    """Time ``runs`` boots of each case; returns summaries."""
+    samples = {'fresh': ([], []), 'current': ([], [])}
+    for i in range(runs):
+        fresh = os.path.join(workdir, f'fresh-{i}.db')
+        for case, path in (('fresh', fresh), ('current', board)):
+            process, app = boot(path)
+            samples[case][0].append(process)
+            samples[case][1].append(app)
+    results = {}
+    for case, (process, app) in samples.items():
+        results[f'{case} process'] = summarize(process)
+        results[f'{case} app'] = summarize(app)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', help='existing board to copy instead of generating one')
+    parser.add_argument('--areas', type=int, default=10)
+    parser.add_argument('--objectives', type=int, default=10)
+    parser.add_argument('--tasks', type=int, default=20)
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--out', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    board = os.path.join(workdir, 'board.db')
+    try:
+        if args.db:
+            shutil.copyfile(args.db, board)
+            params = {'db': args.db}
+        else:
+            params = generate(board, args.areas, args.objectives, args.tasks)
+        params['runs'] = args.runs
+        results = run(board, workdir, args.runs)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print_table(results)
+    if args.out:
+        save(args.out, 'boot', results, params)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,80 @@
+"""Compare two benchmark result files and fail on regressions.
+
+Every benchmark present in both files is compared on ``--metric``.  A
+benchmark regresses when the current value is more than
+``--max-regression`` (a fraction) above the baseline *and* at least
+``--min-ms`` above it in absolute terms, so sub-millisecond noise on fast
+endpoints does not fail the gate.  For ``throughput_rps`` a drop is the
+regression.  The exit status is 1 when anything regressed, so the command
+can gate a local CI run::
+
+    python -m bench.micro --out current.json
+    python -m bench.compare baseline.json current.json --max-regression 0.15
+"""
+import sys
+import argparse
+
+try:
+    from .results import load
+except ImportError:  # pragma: no cover - executed only when run as script
+    from results import load
+
+
+def compare(baseline, current, metric='p95_ms', max_regression=0.10, min_ms=0.5):
+    """Return ``(rows, regressions)`` for two loaded result documents.
+
+    Each row is ``(name, before, after, change)`` with ``change`` the
+    relative difference, or ``None`` when the benchmark is missing from one
+    side.
+    """
+    before, after = baseline['results'], current['results']
+    higher_is_better = metric == 'throughput_rps'
+    rows, regressions = [], []
+    for name in list(before) + [name for name in after if name not in before]:
+        old = before.get(name, {}).get(metric)
+        new = after.get(name, {}).get(metric)
+        if old is None or new is None:
+            rows.append((name, old, new, None))
+            continue
+        change = (new - old) / old if old else 0.0
+        rows.append((name, old, new, change))
+        worse = old - new if higher_is_better else new - old
+        if old and worse / old > max_regression and (higher_is_better or worse >= min_ms):
+            regressions.append(name)
+    return rows, regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('baseline')
+    parser.add_argument('current')
+    parser.add_argument('--metric', default='p95_ms',
+                        help='summary field to compare, e.g. p50_ms, p99_ms or throughput_rps')
+    parser.add_argument('--max-regression', type=float, default=0.10,
+                        help='allowed relative slowdown (default 0.10)')
+    parser.add_argument('--min-ms', type=float, default=0.5,
+                        help='ignore slowdowns smaller than this many milliseconds')
+    args = parser.parse_args(argv)
+
+    baseline, current = load(args.baseline), load(args.current)
+    if baseline.get('kind') != current.get('kind'):
+        print(f"warning: comparing a {baseline.get('kind')} run with a {current.get('kind')} run")
+    if baseline.get('params') != current.get('params'):
+        print('warning: the runs used different parameters')
+    print(f"{baseline.get('commit')} -> {current.get('commit')} ({args.metric})")
+    rows, regressions = compare(baseline, current, args.metric, args.max_regression, args.min_ms)
+    width = max((len(name) for name, *_ in rows), default=10)
+    for name, old, new, change in rows:
+        if change is None:
+            print(f"{name:<{width}}  {'missing from ' + ('baseline' if old is None else 'current')}")
+            continue
+        flag = '  REGRESSION' if name in regressions else ''
+        print(f'{name:<{width}}  {old:>10.3f}  {new:>10.3f}  {change:>+8.1%}{flag}')
+    if regressions:
+        print(f'{len(regressions)} benchmark(s) regressed by more than {args.max_regression:.0%}')
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
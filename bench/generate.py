@@ -0,0 +1,162 @@
+"""Deterministic synthetic boards for benchmarks.
+
+``generate`` builds a fully migrated database holding ``areas`` areas, each
+with ``objectives`` objectives of ``tasks`` tasks, plus a share of tasks
+filed directly under areas.  About 40% of tasks are complete (with
+completion times spread over the preceding half year), 10% secondary and
+the rest open.  ``undo_groups`` groups of edits and deletions fill the undo
+log the way real use does.  The same arguments always produce the same
+rows, so results from two commits are comparable.
+
+Usage::
+
+    python -m bench.generate board.db --areas 20 --objectives 25 --tasks 40
+"""
+import os
+import random
+import argparse
+from datetime import datetime, timedelta
+
+EPOCH = datetime(2024, 1, 1, 9, 0, 0)
+WORDS = (
+    'plan review draft ship fix call write update prepare schedule research design test '
+    'budget report launch migrate clean refactor meeting invoice garden trip book dentist '
+    'renew order backup benchmark roadmap hiring onboarding feedback retro release'
+).split()
+
+
+def _text(rng, words=(3, 8)):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(*words))).capitalize()
+
+
+def _time(offset):
+    return (EPOCH + timedelta(seconds=offset)).isoformat()
+
+
+def _status(rng, created):
+    roll = rng.random()
+    if roll < 0.4:
+        return 'complete', _time(created + rng.randint(3600, 180 * 86400))
+    if roll < 0.5:
+        return 'secondary', None
+    return 'open', None
+
+
+def generate(path, areas=10, objectives=10, tasks=20, area_tasks=5, undo_groups=2000, seed=0):
+    """Create the board at ``path`` (which must not exist yet).
+
+    Parameters
+    ----------
+    areas, objectives, tasks : int
+        Areas, objectives per area and tasks per objective.
+    area_tasks : int
+        Tasks filed directly under each area.
+    undo_groups : int
+        Undo groups to write; each holds one to three entries.
+    seed : int
+        Random seed; the output depends only on the arguments.
+
+    Returns
+    -------
+    dict
+        Row counts per table.
+    """
+    # imported here so callers can configure the backend through the
+    # environment before it is first loaded
+    import backend.database as database
+    from backend.history import encode_data
+    from backend.ordering import spread_ranks
+
+    if os.path.exists(path):
+        raise FileExistsError(path)
+    rng = random.Random(seed)
+    database.init_db(path)
+    ranks = spread_ranks(max(areas, objectives, tasks + area_tasks, 1))
+    clock = 0
+
+    area_rows, objective_rows, task_rows = [], [], []
+    for a in range(areas):
+        clock += rng.randint(60, 3600)
+        area_rows.append((f'area-{a}', _text(rng, (1, 3)), _time(clock), a, ranks[a]))
+        for o in range(objectives):
+            clock += rng.randint(60, 3600)
+            status, completed = _status(rng, clock)
+            objective_rows.append((f'obj-{a}-{o}', f'area-{a}', _text(rng), _time(clock), completed,
+                                   status, o, ranks[o]))
+            for t in range(tasks):
+                clock += rng.randint(10, 600)
+                status, completed = _status(rng, clock)
+                task_rows.append((f'task-{a}-{o}-{t}', None, f'obj-{a}-{o}', _text(rng), _time(clock),
+                                  completed, status, t, ranks[t]))
+        for t in range(area_tasks):
+            clock += rng.randint(10, 600)
+            status, completed = _status(rng, clock)
+            task_rows.append((f'task-{a}-{t}', f'area-{a}', None, _text(rng), _time(clock),
+                              completed, status, t, ranks[t]))
+
+    undo_rows = []
+    for group in range(1, undo_groups + 1):
+        clock += rng.randint(10, 600)
+        for _ in range(rng.randint(1, 3)):
+            key, area_key, objective_key, text, created, completed, status, index, _rank = rng.choice(task_rows)
+            if rng.random() < 0.7:
+                action, data = 'UPDATE', {'key': key, 'text': _text(rng)}
+            else:
+                # a deleted task, as the routes log it
+                action, data = 'DELETE', {
+                    'key': f'deleted-{group}', 'area_key': area_key, 'objective_key': objective_key,
+                    'text': text, 'date_time_created': created, 'date_time_completed': completed,
+                    'status': status, 'order_index': index,
+                }
+                key = data['key']
+            undo_rows.append((action, 'tasks', key, encode_data(data), _time(clock), group))
+
+    conn = database.connect(path)
+    try:
+        with conn:
+            conn.executemany(
+                'INSERT INTO areas (key, text, date_time_created, order_index, rank) VALUES (?, ?, ?, ?, ?)',
+                area_rows,
+            )
+            conn.executemany(
+                'INSERT INTO objectives (key, area_key, text, date_time_created, date_time_completed, status, '
+                'order_index, rank) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                objective_rows,
+            )
+            conn.executemany(
+                'INSERT INTO tasks (key, area_key, objective_key, text, date_time_created, date_time_completed, '
+                'status, order_index, rank) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                task_rows,
+            )
+            conn.executemany(
+                'INSERT INTO undo_log (action_type, table_name, record_key, old_data, timestamp, group_id) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                undo_rows,
+            )
+    finally:
+        conn.close()
+    return {
+        'areas': len(area_rows),
+        'objectives': len(objective_rows),
+        'tasks': len(task_rows),
+        'undo_log': len(undo_rows),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('path')
+    parser.add_argument('--areas', type=int, default=10)
+    parser.add_argument('--objectives', type=int, default=10, help='objectives per area')
+    parser.add_argument('--tasks', type=int, default=20, help='tasks per objective')
+    parser.add_argument('--area-tasks', type=int, default=5, help='tasks directly under each area')
+    parser.add_argument('--undo-groups', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+    counts = generate(args.path, args.areas, args.objectives, args.tasks, args.area_tasks,
+                      args.undo_groups, args.seed)
+    print(', '.join(f'{count} {table}' for table, count in counts.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+"""Multi-process HTTP load driver.
+
+Without ``--url`` a board is generated and served by gunicorn with the
+worker layout of the production image (``--workers`` processes of
+``--threads`` threads each); ``--server asgi`` serves ``asgi.py`` on
+uvicorn workers instead, with ``--threads`` reader threads.  With ``--url``
+an already running server is driven instead.  ``--clients`` processes each keep one HTTP connection open
+and send requests back to back, drawn from a weighted mix, for
+``--duration`` seconds after ``--warmup`` seconds whose requests are not
+counted.  Latencies are reported per request type and overall, with the
+throughput over the measured window.
+
+Usage::
+
+    python -m bench.load --clients 8 --duration 20 --mix mixed --out load.json
+
+    # WSGI against ASGI serving, on the same board
+    python -m bench.load --server wsgi --out wsgi.json
+    python -m bench.load --server asgi --out asgi.json
+    python -m bench.compare wsgi.json asgi.json --metric throughput_rps
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import argparse
+import tempfile
+import subprocess
+import http.client
+import multiprocessing
+from urllib.parse import urlsplit
+
+try:
+    from .generate import generate
+    from .results import summarize, save, print_table
+except ImportError:  # pragma: no cover - executed only when run as script
+    from generate import generate
+    from results import summarize, save, print_table
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend')
+
+
+def requests_for(keys):
+    """``{mix: [(weight, name, method, url(rng, n), body(rng, n))]}``.
+
+    ``n`` counts the requests a client has sent, so created keys are unique
+    per client when combined with its id.
+    """
+    tasks, objectives, areas = keys['tasks'], keys['objectives'], keys['areas']
+    reads = [
+        (30, 'GET /api/tree', 'GET', lambda rng, n: '/api/tree', None),
+        (15, 'GET /api/tree?area_key', 'GET', lambda rng, n: f'/api/tree?area_key={rng.choice(areas)}', None),
+        (15, 'GET /api/tasks?objective_key', 'GET',
+         lambda rng, n: f'/api/tasks?objective_key={rng.choice(objectives)}', None),
+        (10, 'GET /api/tasks?limit=100', 'GET', lambda rng, n: '/api/tasks?limit=100', None),
+        (10, 'GET /api/changes', 'GET', lambda rng, n: '/api/changes?since=0&limit=100', None),
+        (10, 'GET /api/search', 'GET', lambda rng, n: f"/api/search?q={rng.choice(('plan', 'fix', 'rev'))}", None),
+        (5, 'GET /api/areas', 'GET', lambda rng, n: '/api/areas', None),
+        (5, 'GET /api/history', 'GET', lambda rng, n: '/api/history', None),
+    ]
+    writes = [
+        (10, 'PATCH /api/tasks/<key> text', 'PATCH', lambda rng, n: f'/api/tasks/{rng.choice(tasks)}',
+         lambda rng, n: {'text': f'Load edit {n}'}),
+        (8, 'PATCH /api/tasks/<key> status', 'PATCH', lambda rng, n: f'/api/tasks/{rng.choice(tasks)}',
+         lambda rng, n: {'status': rng.choice(('open', 'complete'))}),
+        (5, 'PATCH /api/tasks/<key> move', 'PATCH', lambda rng, n: f'/api/tasks/{rng.choice(tasks)}',
+         lambda rng, n: {'order_index': rng.randint(0, 5)}),
+        (5, 'POST /api/tasks', 'POST', lambda rng, n: '/api/tasks',
+         lambda rng, n: {'key': f'load-{n}', 'text': 'Load task', 'objective_key': rng.choice(objectives)}),
+        (2, 'POST /api/undo', 'POST', lambda rng, n: '/api/undo', None),
+    ]
+    return {'read': reads, 'mixed': reads + writes}
+
+
+def _get(url, path):
+    """``(status, body)`` of one GET on a fresh connection."""
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    try:
+        conn.request('GET', path)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+    finally:
+        conn.close()
+
+
+def fetch_keys(url):
+    """Sample keys from a running server."""
+    def get(path):
+        return json.loads(_get(url, path)[1])
+    return {
+        'areas': [a['key'] for a in get('/api/areas')],
+        'objectives': [o['key'] for o in get('/api/objectives')],
+        'tasks': [t['key'] for t in get('/api/tasks?limit=500') if t.get('objective_key')],
+    }
+
+
+def client(args):
+    """Body of one client process; returns ``{name: (latencies, errors)}``."""
+    url, keys, mix, client_id, seed, warmup, duration = args
+    rng = random.Random(seed * 1000 + client_id)
+    choices = requests_for(keys)[mix]
+    weights = [choice[0] for choice in choices]
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+    headers = {'Content-Type': 'application/json'}
+    results = {}
+    start = time.perf_counter()
+    measure_from, stop = start + warmup, start + warmup + duration
+    n = 0
+    while True:
+        _weight, name, method, path, body = rng.choices(choices, weights)[0]
+        n += 1
+        payload = json.dumps(body(rng, f'{client_id}-{n}')) if body else None
+        sent = time.perf_counter()
+        if sent >= stop:
+            break
+        try:
+            conn.request(method, path(rng, n), body=payload, headers=headers)
+            resp = conn.getresponse()
+            resp.read()
+            failed = resp.status >= 500
+        except (OSError, http.client.HTTPException):
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            failed = True
+        if sent >= measure_from:
+            latencies, errors = results.setdefault(name, ([], [0]))
+            latencies.append(time.perf_counter() - sent)
+            errors[0] += failed
+    conn.close()
+    return {name: (latencies, errors[0]) for name, (latencies, errors) in results.items()}
+
+
+def drive(url, keys, mix='mixed', clients=4, duration=10.0, warmup=2.0, seed=0):
+    """Run ``clients`` processes against ``url`` and summarise their latencies."""
+    jobs = [(url, keys, mix, i, seed, warmup, duration) for i in range(clients)]
+    with multiprocessing.Pool(clients) as pool:
+        outcomes = pool.map(client, jobs)
+    merged = {}
+    for outcome in outcomes:
+        for name, (latencies, errors) in outcome.items():
+            entry = merged.setdefault(name, ([], [0]))
+            entry[0].extend(latencies)
+            entry[1][0] += errors
+    results = {'all': summarize([x for latencies, _ in merged.values() for x in latencies], elapsed=duration,
+                                errors=sum(errors[0] for _, errors in merged.values()))}
+    for name in sorted(merged):
+        latencies, errors = merged[name]
+        results[name] = summarize(latencies, elapsed=duration, errors=errors[0])
+    return results
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_until_up(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if _get(url, '/api/test')[0] == 200:
+                return
+        except OSError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'server at {url} did not come up within {timeout}s')
+
+
+def serve(path, workers, threads, server='wsgi'):
+    """Start gunicorn on the board at ``path``; returns ``(process, url)``."""
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=path, SERVER_MODE=server)
+    if server == 'asgi':
+        env['ASGI_THREADS'] = str(threads)
+        layout = ['--worker-class', 'uvicorn.workers.UvicornWorker', 'asgi:application']
+    else:
+        layout = ['--worker-class', 'gthread', '--threads', str(threads), 'app:app']
+    process = subprocess.Popen(
+        ['gunicorn', '--chdir', BACKEND_DIR, '--bind', f'127.0.0.1:{port}', '--workers', str(workers),
+         '--log-level', 'warning', *layout],
+        env=env,
+    )
+    return process, f'http://127.0.0.1:{port}'
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--url', help='drive this server instead of starting gunicorn')
+    parser.add_argument('--db', help='existing board to copy instead of generating one')
+    parser.add_argument('--areas', type=int, default=10)
+    parser.add_argument('--objectives', type=int, default=10)
+    parser.add_argument('--tasks', type=int, default=20)
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=16, help='threads per gunicorn worker')
+    parser.add_argument('--server', choices=('wsgi', 'asgi'), default='wsgi', help='app.py or asgi.py')
+    parser.add_argument('--clients', type=int, default=4, help='client processes')
+    parser.add_argument('--mix', choices=('read', 'mixed'), default='mixed')
+    parser.add_argument('--duration', type=float, default=10.0, help='measured seconds')
+    parser.add_argument('--warmup', type=float, default=2.0, help='unmeasured seconds before that')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    params = {key: getattr(args, key) for key in ('clients', 'mix', 'duration', 'warmup', 'seed')}
+    process = workdir = None
+    try:
+        if args.url:
+            url = args.url.rstrip('/')
+            params['url'] = url
+        else:
+            workdir = tempfile.mkdtemp(prefix='bench-')
+            path = os.path.join(workdir, 'board.db')
+            if args.db:
+                shutil.copyfile(args.db, path)
+                params['db'] = args.db
+            else:
+                params.update(generate(path, args.areas, args.objectives, args.tasks))
+            params.update(workers=args.workers, threads=args.threads, server=args.server)
+            process, url = serve(path, args.workers, args.threads, args.server)
+        wait_until_up(url)
+        results = drive(url, fetch_keys(url), args.mix, args.clients, args.duration, args.warmup, args.seed)
+    finally:
+        if process:
+            process.terminate()
+            process.wait()
+        if workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+    print_table(results)
+    if args.out:
+        save(args.out, 'load', results, params)
+    return 0 if not results['all']['errors'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
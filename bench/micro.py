@@ -0,0 +1,166 @@
+"""In-process micro-benchmarks of every endpoint through the Flask test client.
+
+A board is generated (or an existing one copied) and each endpoint is
+called ``--iterations`` times after ``--warmup`` untimed calls.  Writes are
+arranged so the board stays the same size: created tasks are deleted
+again, edits alternate between two values, and every undone action is
+redone.  ``/api/events`` streams forever and is left to ``bench.load``.
+
+The response cache is off unless ``--cache`` is given, so reads measure the
+queries rather than cache hits.
+
+Usage::
+
+    python -m bench.micro --out micro.json --areas 20 --objectives 20 --tasks 30
+"""
+import os
+import sys
+import time
+import shutil
+import sqlite3
+import argparse
+import tempfile
+
+try:
+    from .generate import generate
+    from .results import summarize, save, print_table
+except ImportError:  # pragma: no cover - executed only when run as script
+    from generate import generate
+    from results import summarize, save, print_table
+
+
+def sample_keys(path):
+    """Keys of a busy area, objective and task of the board at ``path``."""
+    conn = sqlite3.connect(path)
+    try:
+        objective, area = conn.execute(
+            'SELECT o.key, o.area_key FROM objectives o JOIN tasks t ON t.objective_key = o.key '
+            'GROUP BY o.key ORDER BY COUNT(*) DESC, o.key LIMIT 1'
+        ).fetchone()
+        tasks = [r[0] for r in conn.execute(
+            'SELECT key FROM tasks WHERE objective_key = ? ORDER BY order_index', (objective,)
+        )]
+        other = conn.execute(
+            'SELECT key FROM objectives WHERE key != ? ORDER BY key LIMIT 1', (objective,)
+        ).fetchone()[0]
+    finally:
+        conn.close()
+    return {'area': area, 'objective': objective, 'other_objective': other, 'tasks': tasks}
+
+
+def benchmarks(keys):
+    """``(name, method, url(i), json(i))`` in the order they run."""
+    area, objective, tasks = keys['area'], keys['objective'], keys['tasks']
+    task = tasks[0]
+    mover = tasks[len(tasks) // 2]
+    last = len(tasks) - 1
+    return [
+        ('GET /api/test', 'GET', lambda i: '/api/test', None),
+        ('GET /api/areas', 'GET', lambda i: '/api/areas', None),
+        ('GET /api/objectives', 'GET', lambda i: '/api/objectives', None),
+        ('GET /api/objectives?area_key', 'GET', lambda i: f'/api/objectives?area_key={area}', None),
+        ('GET /api/tasks', 'GET', lambda i: '/api/tasks', None),
+        ('GET /api/tasks?limit=100', 'GET', lambda i: '/api/tasks?limit=100', None),
+        ('GET /api/tasks?objective_key', 'GET', lambda i: f'/api/tasks?objective_key={objective}', None),
+        ('GET /api/tasks?area_key', 'GET', lambda i: f'/api/tasks?area_key={area}', None),
+        ('GET /api/tasks?status=complete', 'GET', lambda i: '/api/tasks?status=complete&limit=100', None),
+        ('GET /api/tree', 'GET', lambda i: '/api/tree', None),
+        ('GET /api/tree?area_key', 'GET', lambda i: f'/api/tree?area_key={area}', None),
+        ('GET /api/search', 'GET', lambda i: '/api/search?q=plan&limit=20', None),
+        ('GET /api/changes', 'GET', lambda i: '/api/changes?since=0&limit=100', None),
+        ('GET /api/history', 'GET', lambda i: '/api/history', None),
+        ('GET /api/pool', 'GET', lambda i: '/api/pool', None),
+        ('GET /metrics', 'GET', lambda i: '/metrics', None),
+        ('POST /api/tasks', 'POST', lambda i: '/api/tasks',
+         lambda i: {'key': f'bench-{i}', 'text': 'Benchmark task', 'objective_key': objective}),
+        ('DELETE /api/tasks/<key>', 'DELETE', lambda i: f'/api/tasks/bench-{i}', None),
+        ('POST /api/areas', 'POST', lambda i: '/api/areas', lambda i: {'key': f'bench-area-{i}', 'text': 'Bench'}),
+        ('DELETE /api/areas/<key>', 'DELETE', lambda i: f'/api/areas/bench-area-{i}', None),
+        ('PATCH /api/tasks/<key> text', 'PATCH', lambda i: f'/api/tasks/{task}',
+         lambda i: {'text': f'Edited {i % 2}'}),
+        ('PATCH /api/tasks/<key> status', 'PATCH', lambda i: f'/api/tasks/{task}',
+         lambda i: {'status': ('complete', 'open')[i % 2]}),
+        ('PATCH /api/tasks/<key> move', 'PATCH', lambda i: f'/api/tasks/{mover}',
+         lambda i: {'order_index': (0, last)[i % 2]}),
+        ('PATCH /api/tasks/<key> reparent', 'PATCH', lambda i: f'/api/tasks/{mover}',
+         lambda i: {'objective_key': (keys['other_objective'], objective)[i % 2], 'order_index': 0}),
+        ('PATCH /api/objectives/<key>', 'PATCH', lambda i: f'/api/objectives/{objective}',
+         lambda i: {'text': f'Objective {i % 2}'}),
+        ('PATCH /api/areas/<key>', 'PATCH', lambda i: f'/api/areas/{area}', lambda i: {'text': f'Area {i % 2}'}),
+        ('POST /api/batch', 'POST', lambda i: '/api/batch', lambda i: {'operations': [
+            {'op': 'update', 'entity': 'tasks', 'key': key, 'data': {'text': f'Batch {i % 2}'}}
+            for key in tasks[:10]
+        ]}),
+        ('POST /api/undo', 'POST', lambda i: '/api/undo', None),
+        ('POST /api/redo', 'POST', lambda i: '/api/redo', None),
+    ]
+
+
+def run(path, iterations=200, warmup=20, only=None):
+    """Time each benchmark against the board at ``path``; returns summaries.
+
+    ``DATABASE_URL`` must already point at ``path`` when the backend is
+    first imported.
+    """
+    from backend.app import app
+
+    client = app.test_client()
+    results = {}
+    for name, method, url, body in benchmarks(sample_keys(path)):
+        if only and only not in name:
+            continue
+        latencies, errors = [], 0
+        # writes use distinct indexes for warmup and timed calls
+        for i in range(warmup + iterations):
+            start = time.perf_counter()
+            resp = client.open(url(i), method=method, json=body(i) if body else None)
+            resp.get_data()
+            elapsed = time.perf_counter() - start
+            if resp.status_code >= 400:
+                errors += 1
+            if i >= warmup:
+                latencies.append(elapsed)
+        results[name] = summarize(latencies, errors=errors)
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n\n')[0])
+    parser.add_argument('--db', help='existing board to copy instead of generating one')
+    parser.add_argument('--areas', type=int, default=10)
+    parser.add_argument('--objectives', type=int, default=10)
+    parser.add_argument('--tasks', type=int, default=20)
+    parser.add_argument('--undo-groups', type=int, default=2000)
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--only', help='run benchmarks whose name contains this text')
+    parser.add_argument('--cache', action='store_true', help='leave the response cache on')
+    parser.add_argument('--out', help='write results to this JSON file')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp(prefix='bench-')
+    path = os.path.join(workdir, 'board.db')
+    # the backend reads its configuration when first imported
+    os.environ['DATABASE_URL'] = path
+    if not args.cache:
+        os.environ['RESPONSE_CACHE'] = '0'
+    # background pruning would race the timed requests
+    os.environ.setdefault('UNDO_PRUNE_INTERVAL', '0')
+    try:
+        if args.db:
+            shutil.copyfile(args.db, path)
+            params = {'db': args.db}
+        else:
+            params = generate(path, args.areas, args.objectives, args.tasks, undo_groups=args.undo_groups)
+        params.update(iterations=args.iterations, warmup=args.warmup, cache=args.cache)
+        results = run(path, args.iterations, args.warmup, args.only)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    print_table(results)
+    if args.out:
+        save(args.out, 'micro', results, params)
+    return 0 if not any(r['errors'] for r in results.values()) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
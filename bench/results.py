@@ -0,0 +1,77 @@
+"""Latency summaries and the JSON result files shared by the benchmarks."""
+import json
+import math
+import time
+import sqlite3
+import platform
+import subprocess
+
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    index = max(0, math.ceil(fraction * len(sorted_values)) - 1)
+    return sorted_values[index]
+
+
+def summarize(latencies, elapsed=None, errors=0):
+    """Summarise latencies (seconds) in milliseconds.
+
+    ``elapsed`` is the wall time the samples were taken over, for the
+    throughput; without it the samples are assumed to run back to back.
+    """
+    values = sorted(latencies)
+    total = sum(values)
+    elapsed = elapsed or total
+    return {
+        'n': len(values),
+        'errors': errors,
+        'mean_ms': round(total / len(values) * 1000, 3) if values else 0.0,
+        'p50_ms': round(percentile(values, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(values, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(values, 0.99) * 1000, 3),
+        'max_ms': round(values[-1] * 1000, 3) if values else 0.0,
+        'throughput_rps': round(len(values) / elapsed, 1) if elapsed else 0.0,
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def save(path, kind, results, params):
+    """Write ``results`` ({name: summary}) with enough context to compare runs."""
+    document = {
+        'kind': kind,
+        'commit': _commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'machine': platform.machine(),
+        'params': params,
+        'results': results,
+    }
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
+        f.write('\n')
+    return document
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def print_table(results):
+    """Print one line per benchmark."""
+    width = max((len(name) for name in results), default=10)
+    print(f"{'benchmark':<{width}}  {'n':>6}  {'p50 ms':>9}  {'p95 ms':>9}  {'p99 ms':>9}  {'req/s':>9}  errors")
+    for name, summary in results.items():
+        print(f"{name:<{width}}  {summary['n']:>6}  {summary['p50_ms']:>9.3f}  {summary['p95_ms']:>9.3f}  "
+              f"{summary['p99_ms']:>9.3f}  {summary['throughput_rps']:>9.1f}  {summary['errors']}")
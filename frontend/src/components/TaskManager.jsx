@@ -52,6 +52,9 @@ const TaskManager = () => {
         if ((e.metaKey || e.ctrlKey) && e.key === 'z') {
           e.preventDefault();
           handleUndo();
+        } else if ((e.metaKey || e.ctrlKey) && (e.key === 'Z' || e.key === 'y')) {
+          e.preventDefault();
+          handleRedo();
         }
       };
 
@@ -72,11 +75,20 @@ const TaskManager = () => {
         setError(null);
         console.log('Starting data refresh...');
         
-        const [areasData, objectivesData, tasksData] = await Promise.all([
-          apiWrapper.get('/api/areas'),
-          apiWrapper.get('/api/objectives'),
-          apiWrapper.get('/api/tasks')
-        ]);
+        // one request for the nested board, flattened into the lists the
+        // components work with
+        const tree = await apiWrapper.get('/api/tree');
+        const areasData = [];
+        const objectivesData = [];
+        const tasksData = [];
+        for (const { objectives: areaObjectives, tasks: areaTasks, ...area } of tree) {
+          areasData.push(area);
+          tasksData.push(...areaTasks);
+          for (const { tasks: objectiveTasks, ...objective } of areaObjectives) {
+            objectivesData.push(objective);
+            tasksData.push(...objectiveTasks);
+          }
+        }
         
         console.log('Received data:', {
           areas: areasData,
@@ -114,6 +126,15 @@ const TaskManager = () => {
         console.error('Failed to undo:', error);
       }
     };
+
+    const handleRedo = async () => {
+      try {
+        await apiWrapper.post('/api/redo');
+        await refreshAll();
+      } catch (error) {
+        console.error('Failed to redo:', error);
+      }
+    };
   
     const handleKeyPress = (event) => {
       if (event.key === 'Enter') {
@@ -12,7 +12,9 @@ export const config = {
         areas: '/api/areas',
         objectives: '/api/objectives',
         tasks: '/api/tasks',
-        undo: '/api/undo'
+        tree: '/api/tree',
+        undo: '/api/undo',
+        redo: '/api/redo'
     }
 };
     
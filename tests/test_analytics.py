@@ -0,0 +1,183 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import backend.app as app
+import backend.database as database
+from backend.analytics import AnalyticsCache, build_report, bucket_of
+from backend.archive import Archiver
+
+# built without schema setup, which would create tasks.db in the working
+# directory; every test points get_db at a database of its own
+app.app = app.create_app({'DATABASE_SETUP': False})
+
+# a Monday, 00:00 Pacific standard time
+MONDAY = 1704096000
+DAY = 86400
+
+
+def iso(epoch):
+    """``get_pacific_time()``-style string of ``epoch`` at UTC-8."""
+    from datetime import datetime, timedelta, timezone
+    return datetime.fromtimestamp(epoch, timezone(timedelta(hours=-8))).isoformat()
+
+
+class LifecycleTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'tasks.db')
+        database.init_db(self.path)
+        self.conn = database.connect(self.path)
+        self.addCleanup(self.conn.close)
+        with self.conn:
+            self.conn.executemany(
+                "INSERT INTO areas (key, text, date_time_created) VALUES (?, 'Area', 'now')", [('a1',), ('a2',)]
+            )
+            self.conn.execute(
+                "INSERT INTO objectives (key, area_key, text, date_time_created) VALUES ('o1', 'a1', 'O', ?)",
+                (iso(MONDAY),),
+            )
+            # created Monday 09:00 and 10:00, one completed on Wednesday
+            self.conn.executemany(
+                'INSERT INTO tasks (key, area_key, objective_key, text, date_time_created, status, '
+                "date_time_completed) VALUES (?, ?, ?, 'T', ?, ?, ?)",
+                [('t1', None, 'o1', iso(MONDAY + 9 * 3600), 'open', None),
+                 ('t2', 'a1', None, iso(MONDAY + 10 * 3600), 'complete', iso(MONDAY + 2 * DAY + 10 * 3600))],
+            )
+
+    def events(self, key):
+        return [tuple(r) for r in self.conn.execute(
+            "SELECT type, area_key, status FROM lifecycle_events WHERE key = ? ORDER BY id", (key,))]
+
+    def test_epoch_columns_follow_the_strings(self):
+        self.assertEqual(self.conn.execute(
+            "SELECT created_epoch, completed_epoch FROM tasks WHERE key = 't2'").fetchone()[:],
+            (MONDAY + 10 * 3600, MONDAY + 2 * DAY + 10 * 3600))
+        with self.conn:
+            self.conn.execute("UPDATE tasks SET date_time_completed = ? WHERE key = 't2'", (iso(MONDAY),))
+        self.assertEqual(self.conn.execute(
+            "SELECT completed_epoch FROM tasks WHERE key = 't2'").fetchone()[0], MONDAY)
+
+    def test_events(self):
+        self.assertEqual(self.events('t2'), [('created', 'a1', 'complete'), ('completed', 'a1', 'complete')])
+        with self.conn:
+            self.conn.execute("UPDATE tasks SET status = 'complete' WHERE key = 't1'")
+            self.conn.execute("UPDATE tasks SET status = 'secondary' WHERE key = 't1'")
+            # the task follows its objective to a2
+            self.conn.execute("UPDATE objectives SET area_key = 'a2' WHERE key = 'o1'")
+            self.conn.execute("DELETE FROM objectives WHERE key = 'o1'")
+        self.assertEqual(self.events('t1'), [
+            ('created', 'a1', 'open'), ('completed', 'a1', 'complete'), ('reopened', 'a1', 'secondary'),
+            ('moved_out', 'a1', 'secondary'), ('moved_in', 'a2', 'secondary'), ('deleted', 'a2', 'secondary'),
+        ])
+        # brought back, as undo does: restored once, not created again
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO objectives (key, area_key, text, date_time_created) VALUES ('o1', 'a2', 'O', ?)",
+                (iso(MONDAY),),
+            )
+            self.conn.execute(
+                "INSERT INTO tasks (key, objective_key, text, date_time_created, status) "
+                "VALUES ('t1', 'o1', 'T', ?, 'secondary')", (iso(MONDAY + 9 * 3600),)
+            )
+        self.assertEqual(self.events('t1')[-1], ('restored', 'a2', 'secondary'))
+        self.assertEqual(len(self.events('t1')), 7)
+
+        # archiving is not a deletion, and restoring it is no event
+        def run(fn, *args):
+            with self.conn:
+                return fn(self.conn, *args)
+        Archiver(run, app.app.ordering, max_age_days=1).run_once()
+        self.assertEqual(self.conn.execute(
+            "SELECT completed_epoch FROM archived_tasks WHERE key = 't2'").fetchone()[0], MONDAY + 2 * DAY + 10 * 3600)
+        self.assertEqual(len(self.events('t2')), 2)
+
+    def test_closed_buckets_are_cached(self):
+        cache = AnalyticsCache(utc_offset=-480)
+        now = MONDAY + 9 * DAY
+        series = cache.series(self.conn, 'tasks', 'day', now=now)
+        self.assertEqual(cache.stats()['buckets_computed'], 9)
+        first = bucket_of('day', cache.today(MONDAY))
+        report = build_report(series, 'day', first, first + 2)
+        self.assertEqual([b['start'] for b in report['buckets']], ['2024-01-01', '2024-01-02', '2024-01-03'])
+        self.assertEqual([(b['created'], b['completed'], b['open']) for b in report['buckets']],
+                         [(2, 0, 2), (0, 0, 2), (0, 1, 1)])
+        self.assertEqual(report['buckets'][2]['cycle_time'], {'count': 1, 'mean_hours': 48.0, 'max_hours': 48.0})
+        self.assertEqual(report['buckets'][0]['areas']['a1']['created'], 2)
+
+        # later calls only read the current bucket
+        queries = cache.stats()['queries']
+        cache.series(self.conn, 'tasks', 'day', now=now)
+        self.assertEqual(cache.stats()['queries'], queries + 1)
+        self.assertEqual(cache.stats()['buckets_computed'], 9)
+
+        # a write into a closed bucket recomputes from that bucket on
+        with self.conn:
+            self.conn.execute(
+                "INSERT INTO tasks (key, area_key, text, date_time_created) VALUES ('late', 'a2', 'T', ?)",
+                (iso(MONDAY + DAY + 3600),),
+            )
+        series = cache.series(self.conn, 'tasks', 'day', now=now)
+        self.assertEqual(cache.stats()['buckets_computed'], 17)
+        report = build_report(series, 'day', first, first + 2, area_key='a2')
+        self.assertEqual([b['open'] for b in report['buckets']], [0, 1, 1])
+
+        weeks = build_report(cache.series(self.conn, 'tasks', 'week', now=now), 'week',
+                             bucket_of('week', cache.today(MONDAY)), bucket_of('week', cache.today(now)))
+        self.assertEqual([(b['start'], b['created'], b['open']) for b in weeks['buckets']],
+                         [('2024-01-01', 3, 2), ('2024-01-08', 0, 2)])
+
+
+class AnalyticsAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'tasks.db')
+        database.init_db(self.path)
+        self.addCleanup(setattr, app.app, 'get_db', app.app.get_db)
+        self.addCleanup(setattr, app.app, 'analytics', app.app.analytics)
+        app.app.get_db = lambda: database.connect(self.path)
+        app.app.analytics = AnalyticsCache()
+        self.client = app.app.test_client()
+
+    def test_backlog_matches_stats(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area 1"})
+        c.post('/api/areas', json={"key": "a2", "text": "Area 2"})
+        c.post('/api/objectives', json={"key": "o1", "area_key": "a1", "text": "Obj1"})
+        for i in range(4):
+            c.post('/api/tasks', json={"key": f"t{i}", "text": "T", "objective_key": "o1"})
+        c.post('/api/tasks', json={"key": "x1", "text": "X", "area_key": "a1"})
+        c.patch('/api/tasks/t0', json={"status": "complete"})
+        c.patch('/api/tasks/t1', json={"status": "secondary"})
+        c.put('/api/tasks/t2', json={"area_key": "a2"})
+        c.patch('/api/objectives/o1', json={"area_key": "a2"})
+        c.delete('/api/tasks/t3')
+        c.delete('/api/tasks/t0')
+        c.post('/api/undo')
+
+        resp = c.get('/api/analytics')
+        self.assertEqual(resp.status_code, 200)
+        body = resp.get_json()
+        self.assertEqual((body['unit'], len(body['buckets'])), ('day', 30))
+        today = body['buckets'][-1]
+        self.assertEqual((today['created'], today['completed'], today['deleted'], today['restored']), (5, 1, 2, 1))
+        stats = c.get('/api/stats').get_json()['areas']
+        for area in ('a1', 'a2'):
+            self.assertEqual(today['areas'][area]['open'], stats[area]['open'] + stats[area]['secondary'])
+        self.assertEqual(today['open'], 3)
+
+        week = c.get('/api/analytics?unit=week&area_key=a1').get_json()
+        self.assertEqual(list(week['buckets'][-1]['areas']), ['a1'])
+        self.assertEqual(c.get('/api/analytics?entity=objectives').get_json()['buckets'][-1]['created'], 1)
+        self.assertEqual(c.get('/api/analytics?since=2024-01-01&until=2024-01-07').get_json()['buckets'][0]['open'], 0)
+        for query in ('unit=month', 'entity=areas', 'since=yesterday', 'since=2024-02-01&until=2024-01-01',
+                      'since=2000-01-01&until=2024-01-01'):
+            self.assertEqual(c.get(f'/api/analytics?{query}').status_code, 400, query)
+        self.assertEqual(c.get('/api/analytics?area_key=missing').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
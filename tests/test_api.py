@@ -1,10 +1,33 @@
+import io
 import os
+import shutil
 import sqlite3
 import tempfile
 import unittest
 import json
 
 import backend.app as app
+import backend.cache as cache
+from backend.backup import BackupScheduler
+from backend.events import ChangeFeed
+from backend.metrics import Registry
+from backend.ordering import RankOrdering
+from backend.readmodel import ReadModel
+from backend.sync import prune_tombstones
+from backend.utils import encode_cursor
+
+# built without schema setup, which would create tasks.db in the working
+# directory; every test points get_db at a database of its own
+app.app = app.create_app({'DATABASE_SETUP': False})
+
+
+def without_versions(nodes):
+    """Drop row versions from a tree, which restoring a row renews."""
+    return [
+        {k: without_versions(v) if isinstance(v, list) else v for k, v in node.items() if k != 'version'}
+        for node in nodes
+    ]
+
 
 class APITestCase(unittest.TestCase):
     def setUp(self):
@@ -60,6 +83,8 @@ class APITestCase(unittest.TestCase):
         ''')
         conn.commit()
         conn.close()
+        # bring the hand-made schema up to date as an existing deployment would be
+        app.init_db(self.db_path)
 
         def get_test_db():
             conn = sqlite3.connect(self.db_path)
@@ -87,6 +112,23 @@ class APITestCase(unittest.TestCase):
         self.assertEqual(resp.status_code, 200)
         self.assertEqual(resp.get_json(), {"status": "ok", "message": "API is working"})
 
+    def test_pool_stats_endpoint(self):
+        resp = self.client.get('/api/pool')
+        self.assertEqual(resp.status_code, 200)
+        self.assertTrue({'in_use', 'idle', 'wait_avg_ms'} <= set(resp.get_json()))
+
+    def test_create_app_records_boot_time(self):
+        fresh = app.create_app({'DATABASE_SETUP': False})
+        self.assertIsNot(fresh, app.app)
+        fresh.get_db = app.app.get_db
+        client = fresh.test_client()
+        self.assertIsNone(fresh.boot_seconds)
+        self.assertEqual(client.get('/api/test').status_code, 200)
+        boot = fresh.boot_seconds
+        self.assertGreater(boot, 0)
+        # only the first response counts
+        self.assertEqual(client.get('/api/pool').get_json()['boot_seconds'], boot)
+
     def test_create_and_get_area(self):
         resp = self.client.post('/api/areas', json={"key": "area1", "text": "Area 1"})
         self.assertEqual(resp.status_code, 200)
@@ -281,10 +323,8 @@ class APITestCase(unittest.TestCase):
         self.assertEqual([o['key'] for o in c.get('/api/objectives').get_json()], ['o2'])
         self.assertEqual([t for t in c.get('/api/tasks').get_json() if t['objective_key'] == 'o1'], [])
 
-        # undo objective deletion (needs 3 undos: two tasks then objective)
-        c.post('/api/undo')
-        c.post('/api/undo')
-        c.post('/api/undo')
+        # one undo restores the objective together with its tasks
+        self.assertEqual(c.post('/api/undo').status_code, 200)
         self.assertEqual(sorted(o['key'] for o in c.get('/api/objectives').get_json()), ['o1', 'o2'])
         tasks = sorted([t for t in c.get('/api/tasks').get_json() if t['objective_key'] == 'o1'], key=lambda x: x['order_index'])
         self.assertEqual([t['key'] for t in tasks], ['t1', 't2'])
@@ -295,15 +335,644 @@ class APITestCase(unittest.TestCase):
         self.assertEqual(c.get('/api/objectives').get_json(), [])
         self.assertEqual(c.get('/api/tasks').get_json(), [])
 
-        # undo area deletion (area + 2 objectives + 2 tasks = 5 undos)
-        for _ in range(5):
-            c.post('/api/undo')
+        # undo area deletion (area, 2 objectives and 2 tasks in one group)
+        self.assertEqual(c.post('/api/undo').status_code, 200)
 
         self.assertEqual([a['key'] for a in c.get('/api/areas').get_json()], ['area1'])
         self.assertEqual(sorted(o['key'] for o in c.get('/api/objectives').get_json()), ['o1', 'o2'])
         all_tasks = sorted(c.get('/api/tasks').get_json(), key=lambda x: (x['objective_key'], x['order_index']))
         self.assertEqual([t['key'] for t in all_tasks], ['t1', 't2'])
 
+    def test_task_filters_and_pagination(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area"})
+        c.post('/api/objectives', json={"key": "o1", "area_key": "a1", "text": "Obj1"})
+        c.post('/api/objectives', json={"key": "o2", "area_key": "a1", "text": "Obj2"})
+        for parent, keys in (('o1', ['t1', 't2', 't3']), ('o2', ['s1', 's2'])):
+            for k in keys:
+                c.post('/api/tasks', json={"key": k, "text": k, "objective_key": parent})
+        c.post('/api/tasks', json={"key": "x1", "text": "x1", "area_key": "a1"})
+        c.patch('/api/tasks/t2', json={"status": "complete"})
+
+        resp = c.get('/api/tasks?objective_key=o1&status=open')
+        self.assertEqual([(t['key'], t['order_index']) for t in resp.get_json()], [('t1', 0), ('t3', 2)])
+
+        pages, positions, cursor = [], {}, None
+        while True:
+            url = '/api/tasks?limit=2' + (f'&cursor={cursor}' if cursor else '')
+            resp = c.get(url)
+            self.assertEqual(resp.status_code, 200)
+            pages.append([t['key'] for t in resp.get_json()])
+            positions.update((t['key'], t['order_index']) for t in resp.get_json())
+            cursor = resp.headers.get('X-Next-Cursor')
+            if not cursor:
+                break
+        self.assertEqual(pages, [['t1', 't2'], ['t3', 's1'], ['s2', 'x1']])
+        self.assertEqual(positions, {t['key']: t['order_index'] for t in c.get('/api/tasks').get_json()})
+        resp = c.get('/api/tasks?status=open&limit=1&cursor=' + c.get('/api/tasks?status=open&limit=1')
+                     .headers['X-Next-Cursor'])
+        self.assertEqual([(t['key'], t['order_index']) for t in resp.get_json()], [('t3', 2)])
+
+        resp = c.get('/api/objectives?area_key=a1&limit=1')
+        self.assertEqual([o['key'] for o in resp.get_json()], ['o1'])
+        resp = c.get('/api/objectives?area_key=a1&limit=1&cursor=' + resp.headers['X-Next-Cursor'])
+        self.assertEqual([o['key'] for o in resp.get_json()], ['o2'])
+        self.assertNotIn('X-Next-Cursor', resp.headers)
+
+        self.assertEqual(c.get('/api/tasks?status=done').status_code, 400)
+        self.assertEqual(c.get('/api/tasks?limit=0').status_code, 400)
+        self.assertEqual(c.get('/api/areas?cursor=bogus').status_code, 400)
+        # well-formed JSON, but not values a query can bind
+        nested = encode_cursor([{"x": 1}, None, 0, "k"])
+        self.assertEqual(c.get(f'/api/tasks?limit=2&cursor={nested}').status_code, 400)
+        self.assertEqual(c.get(f'/api/areas?cursor={encode_cursor([["a1"], "a1"])}').status_code, 400)
+
+    def test_tree_matches_list_endpoints(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area 1"})
+        c.post('/api/areas', json={"key": "a2", "text": "Area 2"})
+        c.post('/api/objectives', json={"key": "o1", "area_key": "a1", "text": "Obj1"})
+        c.post('/api/objectives', json={"key": "o2", "area_key": "a1", "text": "Obj2"})
+        c.post('/api/tasks', json={"key": "t1", "text": "T1", "objective_key": "o1"})
+        c.post('/api/tasks', json={"key": "t2", "text": "T2", "objective_key": "o1"})
+        c.post('/api/tasks', json={"key": "x1", "text": "X1", "area_key": "a2"})
+        c.patch('/api/areas/a2', json={"order_index": 0})
+        c.patch('/api/tasks/t2', json={"order_index": 0})
+
+        tree = c.get('/api/tree').get_json()
+        self.assertEqual([a['key'] for a in tree], ['a2', 'a1'])
+        self.assertEqual([t['key'] for t in tree[0]['tasks']], ['x1'])
+        self.assertEqual([o['key'] for o in tree[1]['objectives']], ['o1', 'o2'])
+        self.assertEqual([t['key'] for t in tree[1]['objectives'][0]['tasks']], ['t2', 't1'])
+
+        # same rows as the flat endpoints
+        tasks = {t['key']: t for t in c.get('/api/tasks').get_json()}
+        self.assertEqual(tree[1]['objectives'][0]['tasks'][0], tasks['t2'])
+        objectives = {o['key']: o for o in c.get('/api/objectives').get_json()}
+        self.assertEqual(
+            {k: v for k, v in tree[1]['objectives'][1].items() if k not in ('tasks', 'progress')}, objectives['o2']
+        )
+        self.assertEqual(tree[1]['progress']['total'], 2)
+        self.assertEqual(tree[1]['objectives'][0]['progress']['open'], 2)
+
+        scoped = c.get('/api/tree?area_key=a1').get_json()
+        self.assertEqual(scoped, [tree[1]])
+        self.assertEqual(c.get('/api/tree?area_key=missing').status_code, 404)
+
+    def test_tree_is_one_snapshot(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area 1"})
+        get_db = app.app.get_db
+        db_path = self.db_path
+        written = []
+
+        class WriteAfterFirstRead:
+            """Connection committing a new subtree from elsewhere after the tree's first query."""
+
+            def __init__(self):
+                self.conn = get_db()
+
+            def __getattr__(self, name):
+                return getattr(self.conn, name)
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc):
+                self.conn.close()
+
+            def execute(self, sql, *args):
+                result = self.conn.execute(sql, *args)
+                if 'FROM areas a' in sql and not written:
+                    written.append(sql)
+                    other = sqlite3.connect(db_path)
+                    with other:
+                        other.execute("INSERT INTO areas (key, text, date_time_created) VALUES ('a9', 'A', 'now')")
+                        other.execute("INSERT INTO objectives (key, area_key, text, date_time_created) "
+                                      "VALUES ('o9', 'a9', 'O', 'now')")
+                        other.execute("INSERT INTO tasks (key, objective_key, text, date_time_created) "
+                                      "VALUES ('t9', 'o9', 'T', 'now')")
+                    other.close()
+                return result
+
+        app.app.get_db = WriteAfterFirstRead
+        try:
+            resp = c.get('/api/tree')
+        finally:
+            app.app.get_db = get_db
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([a['key'] for a in resp.get_json()], ['a1'])
+        self.assertEqual({a['key'] for a in c.get('/api/tree').get_json()}, {'a1', 'a9'})
+
+    def test_stats_follow_every_change(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area 1"})
+        c.post('/api/areas', json={"key": "a2", "text": "Area 2"})
+        c.post('/api/objectives', json={"key": "o1", "area_key": "a1", "text": "Obj1"})
+        for i in range(4):
+            c.post('/api/tasks', json={"key": f"t{i}", "text": "T", "objective_key": "o1"})
+        c.post('/api/tasks', json={"key": "x1", "text": "X", "area_key": "a1"})
+        c.patch('/api/tasks/t0', json={"status": "complete"})
+        c.patch('/api/tasks/t1', json={"status": "secondary"})
+
+        stats = c.get('/api/stats').get_json()
+        self.assertEqual(stats['objectives']['o1'], {
+            'open': 2, 'complete': 1, 'secondary': 1, 'archived': 0, 'total': 4, 'percent_complete': 25.0,
+        })
+        self.assertEqual((stats['areas']['a1']['total'], stats['areas']['a1']['open']), (5, 3))
+        self.assertIsNone(stats['areas']['a2']['percent_complete'])
+
+        # reparenting a task and its objective, deleting and undoing
+        c.put('/api/tasks/t2', json={"area_key": "a2"})
+        c.patch('/api/objectives/o1', json={"area_key": "a2"})
+        self.assertEqual(c.get('/api/stats?area_key=a1').get_json()['areas']['a1']['total'], 1)
+        self.assertEqual(c.get('/api/stats').get_json()['areas']['a2']['total'], 4)
+        c.delete('/api/tasks/t0')
+        self.assertEqual(c.get('/api/stats').get_json()['objectives']['o1']['complete'], 0)
+        c.post('/api/undo')
+        stats = c.get('/api/stats').get_json()
+        self.assertEqual(stats['objectives']['o1'], {
+            'open': 1, 'complete': 1, 'secondary': 1, 'archived': 0, 'total': 3, 'percent_complete': 33.3,
+        })
+        self.assertEqual((stats['areas']['a1']['total'], stats['areas']['a2']['total']), (1, 4))
+        self.assertEqual(c.get('/api/stats?area_key=missing').status_code, 404)
+
+    def test_etag_revalidation_and_cache(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area 1"})
+        c.post('/api/tasks', json={"key": "t1", "text": "T1", "area_key": "a1"})
+
+        first = c.get('/api/tasks?area_key=a1')
+        etag = first.headers['ETag']
+        self.assertEqual(c.get('/api/tasks?area_key=a1', headers={'If-None-Match': etag}).status_code, 304)
+        # other query strings get their own tag
+        self.assertNotEqual(c.get('/api/tasks').headers['ETag'], etag)
+        hits = app.app.response_cache.stats()['hits']
+        again = c.get('/api/tasks?area_key=a1')
+        self.assertEqual(again.get_json(), first.get_json())
+        self.assertEqual(app.app.response_cache.stats()['hits'], hits + 1)
+
+        # writes, undo included, invalidate the tag
+        c.patch('/api/tasks/t1', json={"text": "changed"})
+        resp = c.get('/api/tasks?area_key=a1', headers={'If-None-Match': etag})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()[0]['text'], 'changed')
+        c.post('/api/undo')
+        resp = c.get('/api/tasks?area_key=a1', headers={'If-None-Match': resp.headers['ETag']})
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(resp.get_json()[0]['text'], 'T1')
+
+        # errors are not cached
+        self.assertNotIn('ETag', c.get('/api/tasks?status=done').headers)
+
+    def test_read_model_matches_sql(self):
+        c = self.client
+        self.addCleanup(setattr, cache, 'RESPONSE_CACHE', cache.RESPONSE_CACHE)
+        cache.RESPONSE_CACHE = False
+        self.addCleanup(setattr, app.app, 'read_model', app.app.read_model)
+        for a in ('a1', 'a2'):
+            c.post('/api/areas', json={"key": a, "text": a})
+            for o in ('o1', 'o2'):
+                c.post('/api/objectives', json={"key": f'{a}{o}', "area_key": a, "text": o})
+                for t in ('t1', 't2', 't3'):
+                    c.post('/api/tasks', json={"key": f'{a}{o}{t}', "text": t, "objective_key": f'{a}{o}'})
+            c.post('/api/tasks', json={"key": f'{a}x', "text": "x", "area_key": a})
+        urls = [
+            '/api/areas', '/api/areas?limit=1', '/api/objectives', '/api/objectives?area_key=a2&limit=1',
+            '/api/tasks', '/api/tasks?limit=3', '/api/tasks?objective_key=a1o2', '/api/tasks?status=complete',
+            '/api/tasks?area_key=a2', '/api/objectives?status=open&completed_after=2000',
+            '/api/tasks?status=open&limit=2',
+        ]
+
+        def responses():
+            seen = {}
+            for url in urls:
+                pages, cursor = [], None
+                while True:
+                    resp = c.get(url + ('&' if '?' in url else '?') + f'cursor={cursor}' if cursor else url)
+                    pages.append(resp.get_json())
+                    cursor = resp.headers.get('X-Next-Cursor')
+                    if not cursor:
+                        break
+                seen[url] = pages
+            return seen
+
+        def compare():
+            app.app.read_model = None
+            expected = responses()
+            app.app.read_model = model
+            got = responses()
+            for url in urls:
+                if 'limit' not in url:
+                    # unpaginated lists are ordered by position alone
+                    positions = [item['order_index'] for item in got[url][0]]
+                    self.assertEqual(positions, sorted(positions))
+                    for seen in (got, expected):
+                        seen[url][0].sort(key=lambda item: (item['order_index'], item['key']))
+            self.assertEqual(got, expected)
+
+        model = ReadModel()
+        compare()
+        self.assertEqual(model.stats()['full_loads'], 1)
+        self.assertEqual(model.stats()['rows']['tasks'], 14)
+
+        loaded = model.stats()['rows_loaded']
+        c.patch('/api/tasks/a1o1t3', json={"order_index": 0})
+        c.patch('/api/objectives/a2o1', json={"status": "complete"})
+        c.delete('/api/tasks/a1o2t2')
+        c.patch('/api/areas/a2', json={"order_index": 0})
+        compare()
+        stats = model.stats()
+        self.assertEqual(stats['full_loads'], 1)
+        self.assertEqual(stats['rows_deleted'], 1)
+        # only the rows those writes touched were read again
+        self.assertLess(stats['rows_loaded'] - loaded, 12)
+
+        # the area move, then the delete
+        c.post('/api/undo')
+        c.post('/api/undo')
+        compare()
+        self.assertEqual(model.stats()['rows']['tasks'], 14)
+        self.assertIn('read_model', c.get('/api/pool').get_json())
+
+    def test_area_delete_snapshot_and_undo(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area"})
+        for o in ('o1', 'o2'):
+            c.post('/api/objectives', json={"key": o, "area_key": "a1", "text": o})
+            for i in range(3):
+                c.post('/api/tasks', json={"key": f"{o}t{i}", "text": "T", "objective_key": o})
+        c.post('/api/tasks', json={"key": "x1", "text": "X", "area_key": "a1"})
+        c.post('/api/tasks', json={"key": "x2", "text": "X", "area_key": "a1"})
+        before = without_versions(c.get('/api/tree').get_json())
+
+        self.assertEqual(c.delete('/api/areas/a1').status_code, 200)
+        conn = sqlite3.connect(self.db_path)
+        logged = conn.execute("SELECT table_name, record_key FROM undo_log ORDER BY id").fetchall()
+        conn.close()
+        self.assertEqual(len(logged), 11)
+        # children are logged before their parents, so undo restores parents first
+        self.assertEqual(logged[-1], ('areas', 'a1'))
+        self.assertEqual([k for t, k in logged if t == 'objectives'], ['o2', 'o1'])
+
+        self.assertEqual(c.post('/api/undo').status_code, 200)
+        self.assertEqual(without_versions(c.get('/api/tree').get_json()), before)
+        self.assertEqual(c.post('/api/undo').status_code, 404)
+
+        # redo deletes the subtree again, and undo brings it back once more
+        self.assertEqual(c.post('/api/redo').status_code, 200)
+        self.assertEqual(c.get('/api/tree').get_json(), [])
+        self.assertEqual(c.get('/api/tasks').get_json(), [])
+        self.assertEqual(c.post('/api/undo').status_code, 200)
+        self.assertEqual(without_versions(c.get('/api/tree').get_json()), before)
+
+    def test_undo_redo_updates(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area"})
+        for k in ('t1', 't2', 't3'):
+            c.post('/api/tasks', json={"key": k, "text": k, "area_key": "a1"})
+        c.patch('/api/tasks/t1', json={"status": "complete"})
+        c.patch('/api/tasks/t3', json={"order_index": 0})
+
+        # updates store only the columns they changed
+        conn = sqlite3.connect(self.db_path)
+        logged = [json.loads(r[0]) for r in conn.execute('SELECT old_data FROM undo_log ORDER BY id')]
+        conn.close()
+        self.assertEqual(logged[0], {'key': 't1', 'status': 'open', 'date_time_completed': None})
+        self.assertEqual(set(logged[1]), {'key', 'order_index', 'area_key', 'objective_key'})
+
+        def state():
+            return [(t['key'], t['order_index'], t['status']) for t in c.get('/api/tasks').get_json()]
+
+        moved = state()
+        self.assertEqual(moved, [('t3', 0, 'open'), ('t1', 1, 'complete'), ('t2', 2, 'open')])
+        c.post('/api/undo')
+        c.post('/api/undo')
+        self.assertEqual(state(), [('t1', 0, 'open'), ('t2', 1, 'open'), ('t3', 2, 'open')])
+        self.assertEqual(c.get('/api/history').get_json()['redo_log']['groups'], 2)
+        c.post('/api/redo')
+        c.post('/api/redo')
+        self.assertEqual(state(), moved)
+        self.assertEqual(c.post('/api/redo').status_code, 404)
+
+        # a new edit clears the redo stack
+        c.post('/api/undo')
+        c.patch('/api/tasks/t2', json={"text": "edited"})
+        self.assertEqual(c.post('/api/redo').status_code, 404)
+
+    def test_batch_applies_operations_in_one_transaction(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area"})
+        c.post('/api/objectives', json={"key": "o1", "area_key": "a1", "text": "Obj"})
+        c.post('/api/tasks', json={"key": "t0", "text": "T0", "objective_key": "o1"})
+        ops = [
+            {"op": "create", "entity": "tasks", "key": f"t{i}", "data": {"text": f"T{i}", "objective_key": "o1"}}
+            for i in range(1, 5)
+        ] + [
+            {"op": "update", "entity": "tasks", "key": "t4", "data": {"order_index": 0}},
+            {"op": "update", "entity": "tasks", "key": "t2", "data": {"status": "complete"}},
+            {"op": "delete", "entity": "tasks", "key": "t3"},
+            {"op": "update", "entity": "tasks", "key": "t0", "data": {"area_key": "a1"}},
+            {"op": "update", "entity": "objectives", "key": "o1", "data": {"text": "Renamed"}},
+        ]
+        resp = c.post('/api/batch', json={"operations": ops})
+        self.assertEqual(resp.status_code, 200)
+        results = resp.get_json()['results']
+        self.assertEqual(len(results), len(ops))
+        self.assertEqual(results[3]['order_index'], 4)
+        self.assertEqual(results[-1]['text'], 'Renamed')
+
+        tasks = c.get('/api/tasks?objective_key=o1').get_json()
+        self.assertEqual([(t['key'], t['order_index']) for t in tasks], [('t4', 0), ('t1', 1), ('t2', 2)])
+        self.assertEqual(tasks[2]['status'], 'complete')
+        self.assertEqual([t['key'] for t in c.get('/api/tasks?area_key=a1').get_json()], ['t0'])
+
+        # one undo reverts every update and delete in the batch (creates are
+        # not undoable, as with the single-item routes)
+        self.assertEqual(c.post('/api/undo').status_code, 200)
+        tasks = c.get('/api/tasks?objective_key=o1').get_json()
+        self.assertEqual(
+            [(t['key'], t['order_index'], t['status']) for t in tasks],
+            [(f't{i}', i, 'open') for i in range(5)],
+        )
+        self.assertEqual(c.get('/api/objectives').get_json()[0]['text'], 'Obj')
+        self.assertEqual(c.post('/api/undo').status_code, 404)
+
+    def test_batch_is_validated_and_rolled_back(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area"})
+        resp = c.post('/api/batch', json={"operations": [
+            {"op": "create", "entity": "tasks", "key": "t1", "data": {"text": "T1", "area_key": "a1"}},
+            {"op": "create", "entity": "tasks", "key": "t2", "data": {"text": "T2"}},
+            {"op": "rename", "entity": "tasks", "key": "t1"},
+            {"op": "update", "entity": "tasks", "key": "t1", "data": {"status": "done"}},
+        ]})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual([e['index'] for e in resp.get_json()['errors']], [1, 2, 3])
+
+        # the first failing operation undoes the ones before it
+        resp = c.post('/api/batch', json={"operations": [
+            {"op": "create", "entity": "tasks", "key": "t1", "data": {"text": "T1", "area_key": "a1"}},
+            {"op": "delete", "entity": "tasks", "key": "missing"},
+        ]})
+        self.assertEqual(resp.status_code, 404)
+        self.assertEqual(resp.get_json()['index'], 1)
+        self.assertEqual(c.get('/api/tasks').get_json(), [])
+        resp = c.post('/api/batch', json={"operations": [
+            {"op": "create", "entity": "objectives", "key": "o1", "data": {"text": "O", "area_key": "nope"}},
+        ]})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(c.get('/api/objectives').get_json(), [])
+
+    def test_event_stream(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area"})
+        c.post('/api/tasks', json={"key": "t1", "text": "T1", "area_key": "a1"})
+        c.delete('/api/tasks/t1')
+        c.post('/api/undo')
+        original = app.app.change_feed
+        app.app.change_feed = ChangeFeed(app.app.get_db, interval=0, heartbeat=0.01)
+        try:
+            resp = c.get('/api/events?since=0')
+            self.assertEqual(resp.mimetype, 'text/event-stream')
+            chunks = iter(resp.response)
+            events = [json.loads(next(chunks).decode().split('data: ', 1)[1]) for _ in range(4)]
+            resp.close()
+        finally:
+            app.app.change_feed = original
+        self.assertEqual(
+            [(e['entity'], e['key'], e['op']) for e in events],
+            [('areas', 'a1', 'insert'), ('tasks', 't1', 'insert'), ('tasks', 't1', 'delete'), ('tasks', 't1', 'insert')],
+        )
+        self.assertEqual(events[1]['fields']['text'], 'T1')
+        self.assertEqual(c.get('/api/events?since=soon').status_code, 400)
+
+    def test_changes_since_version(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area"})
+        for k in ('t1', 't2', 't3'):
+            c.post('/api/tasks', json={"key": k, "text": k, "area_key": "a1"})
+        full = c.get('/api/changes').get_json()
+        self.assertFalse(full['more'])
+        self.assertEqual([t['key'] for t in full['tasks']], ['t1', 't2', 't3'])
+        since = full['version']
+
+        c.patch('/api/tasks/t3', json={"text": "edited"})
+        c.delete('/api/tasks/t1')
+        delta = c.get(f'/api/changes?since={since}').get_json()
+        # in index mode t2 and t3 also moved up when t1 was deleted
+        self.assertEqual((delta['tasks'][-1]['key'], delta['tasks'][-1]['text']), ('t3', 'edited'))
+        self.assertNotIn('t1', [t['key'] for t in delta['tasks']])
+        self.assertEqual(delta['areas'], [])
+        self.assertEqual([(d['entity'], d['key']) for d in delta['deleted']], [('tasks', 't1')])
+
+        # undoing the delete revives the row and drops its tombstone
+        c.post('/api/undo')
+        delta = c.get(f"/api/changes?since={delta['version']}").get_json()
+        self.assertIn('t1', [t['key'] for t in delta['tasks']])
+        self.assertEqual(c.get(f'/api/changes?since={since}').get_json()['deleted'], [])
+
+        # paging hands out the delta a few rows at a time
+        keys, version, more = [], 0, True
+        while more:
+            page = c.get(f'/api/changes?since={version}&limit=2').get_json()
+            self.assertLessEqual(len(page['areas']) + len(page['tasks']), 2)
+            keys += [row['key'] for row in page['areas'] + page['tasks']]
+            version, more = page['version'], page['more']
+        self.assertEqual(sorted(keys), ['a1', 't1', 't2', 't3'])
+        self.assertEqual(c.get('/api/changes?since=x').status_code, 400)
+
+        # once tombstones are pruned, older clients must start over
+        c.delete('/api/tasks/t2')
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(prune_tombstones(conn, keep=0), 1)
+        conn.commit()
+        conn.close()
+        delta = c.get(f'/api/changes?since={since}').get_json()
+        self.assertTrue(delta['reset'])
+        self.assertEqual(sorted(t['key'] for t in delta['tasks']), ['t1', 't3'])
+
+    def test_search(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Garden work"})
+        c.post('/api/objectives', json={"key": "o1", "area_key": "a1", "text": "Plant the garden"})
+        c.post('/api/tasks', json={"key": "t1", "text": "Buy gardening <tools>", "objective_key": "o1"})
+        c.post('/api/tasks', json={"key": "t2", "text": "Water the garden, garden beds too", "area_key": "a1"})
+        c.post('/api/tasks', json={"key": "t3", "text": "Unrelated", "area_key": "a1"})
+
+        results = c.get('/api/search?q=gard').get_json()
+        self.assertEqual(sorted(r['key'] for r in results), ['a1', 'o1', 't1', 't2'])
+        # best bm25 score (the lowest) first
+        self.assertEqual([r['score'] for r in results], sorted(r['score'] for r in results))
+        t1 = next(r for r in results if r['key'] == 't1')
+        self.assertEqual(t1['snippet'], 'Buy <mark>gardening</mark> &lt;tools&gt;')
+
+        c.patch('/api/tasks/t1', json={"status": "complete"})
+        results = c.get('/api/search?q=garden&status=complete').get_json()
+        self.assertEqual([r['key'] for r in results], ['t1'])
+        results = c.get('/api/search?q=garden&entity=areas,objectives').get_json()
+        self.assertEqual(sorted(r['key'] for r in results), ['a1', 'o1'])
+
+        # edits and deletes reach the index, undo restores it
+        c.patch('/api/tasks/t3', json={"text": "Garden hose"})
+        c.delete('/api/tasks/t2')
+        self.assertEqual(sorted(r['key'] for r in c.get('/api/search?q=garden').get_json()),
+                         ['a1', 'o1', 't1', 't3'])
+        c.post('/api/undo')
+        self.assertIn('t2', [r['key'] for r in c.get('/api/search?q=garden').get_json()])
+
+        resp = c.get('/api/search?q=garden&limit=2')
+        page2 = c.get(f"/api/search?q=garden&limit=2&cursor={resp.headers['X-Next-Cursor']}").get_json()
+        self.assertEqual(len({r['key'] for r in resp.get_json() + page2}), 4)
+
+        # operators are plain words; blank queries are rejected
+        self.assertEqual(c.get('/api/search?q="garden OR (').status_code, 200)
+        self.assertEqual(c.get('/api/search?q=%20').status_code, 400)
+        self.assertEqual(c.get('/api/search?q=x&entity=users').status_code, 400)
+
+    def test_metrics(self):
+        c = self.client
+        original = app.app.metrics
+        app.app.metrics = Registry()
+        self.addCleanup(setattr, app.app, 'metrics', original)
+        c.post('/api/areas', json={"key": "a1", "text": "Area"})
+        c.get('/api/tasks')
+        c.get('/api/tasks')
+        c.get('/api/tasks/t1')
+        text = c.get('/metrics').get_data(as_text=True)
+        self.assertIn(
+            'bigpicture_http_requests_total{blueprint="tasks",method="GET",route="/api/tasks",status="200"} 2', text
+        )
+        self.assertIn('route="unmatched",status="405"', text)
+        self.assertIn('bigpicture_http_request_duration_seconds_count{blueprint="areas",method="POST",'
+                      'route="/api/areas"} 1', text)
+        self.assertIn('bigpicture_history_entries{table="undo_log"} 0', text)
+
+    def test_export_import(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area"})
+        c.post('/api/objectives', json={"key": "o1", "area_key": "a1", "text": "Obj"})
+        c.post('/api/tasks', json={"key": "t1", "text": "T1", "objective_key": "o1"})
+        c.post('/api/tasks', json={"key": "t2", "text": "T2", "area_key": "a1"})
+        c.patch('/api/tasks/t1', json={"status": "complete"})
+        before = without_versions(c.get('/api/tree').get_json())
+
+        resp = c.get('/api/export')
+        self.assertEqual(resp.mimetype, 'application/x-ndjson')
+        lines = [json.loads(line) for line in resp.get_data(as_text=True).splitlines()]
+        self.assertEqual(lines[0]['format'], 1)
+        self.assertEqual([(r['entity'], r['key']) for r in lines[1:]],
+                         [('areas', 'a1'), ('objectives', 'o1'), ('tasks', 't1'), ('tasks', 't2')])
+        gz = c.get('/api/export?gzip=1').get_data()
+
+        # a dry run writes nothing; replace restores the exported board
+        c.post('/api/tasks', json={"key": "t3", "text": "T3", "area_key": "a1"})
+        c.patch('/api/areas/a1', json={"text": "Renamed"})
+        result = c.post('/api/import?mode=replace&dry_run=1', data=gz).get_json()
+        self.assertEqual(result['imported'], {'areas': 1, 'objectives': 1, 'tasks': 2})
+        self.assertEqual(result['deleted']['tasks'], 3)
+        self.assertIn('t3', [t['key'] for t in c.get('/api/tasks').get_json()])
+        self.assertEqual(c.post('/api/import?mode=replace', data=gz).status_code, 200)
+        self.assertEqual(without_versions(c.get('/api/tree').get_json()), before)
+        self.assertEqual(c.get('/api/history').get_json()['undo_log']['entries'], 0)
+
+        # upserts merge by key, in any order, and place rows without a position last
+        rows = [
+            {"entity": "tasks", "key": "t4", "text": "T4", "objective_key": "o2", "date_time_created": "x"},
+            {"entity": "objectives", "key": "o2", "area_key": "a1", "text": "New", "date_time_created": "x"},
+            {"entity": "tasks", "key": "t2", "text": "T2 again", "area_key": "a1", "date_time_created": "x",
+             "order_index": 0},
+        ]
+        body = '\n'.join(json.dumps(r) for r in rows)
+        result = c.post('/api/import', data=body).get_json()
+        self.assertEqual(result['imported'], {'areas': 0, 'objectives': 1, 'tasks': 2})
+        objectives = sorted(c.get('/api/objectives').get_json(), key=lambda o: o['order_index'])
+        self.assertEqual([(o['key'], o['order_index']) for o in objectives], [('o1', 0), ('o2', 1)])
+        tasks = {t['key']: t for t in c.get('/api/tasks').get_json()}
+        self.assertEqual(tasks['t2']['text'], 'T2 again')
+        self.assertEqual(tasks['t4']['objective_key'], 'o2')
+        # a row moved to another parent closes the gap it leaves behind
+        c.post('/api/tasks', json={"key": "t7", "text": "T7", "area_key": "a1"})
+        c.post('/api/tasks', json={"key": "t8", "text": "T8", "area_key": "a1"})
+        moved = {"entity": "tasks", "key": "t2", "text": "T2", "objective_key": "o2", "date_time_created": "x"}
+        self.assertEqual(c.post('/api/import', data=json.dumps(moved)).status_code, 200)
+        tasks = {t['key']: t for t in c.get('/api/tasks').get_json()}
+        self.assertEqual([tasks[k]['order_index'] for k in ('t7', 't8')], [0, 1])
+        self.assertEqual((tasks['t2']['objective_key'], tasks['t2']['order_index']), ('o2', 1))
+
+        # invalid lines and dangling parents reject the whole import
+        bad = '\n'.join([
+            json.dumps({"entity": "tasks", "key": "t5", "text": "T5", "objective_key": "nope",
+                        "date_time_created": "x"}),
+            json.dumps({"entity": "tasks", "key": "t6", "text": "T6", "date_time_created": "x"}),
+        ])
+        resp = c.post('/api/import', data=bad)
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.get_json()['errors'][0]['line'], 2)
+        resp = c.post('/api/import', data=bad.splitlines()[0])
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(resp.get_json()['errors'][0]['key'], 't5')
+        self.assertNotIn('t5', [t['key'] for t in c.get('/api/tasks').get_json()])
+        self.assertEqual(c.post('/api/import?mode=merge', data='').status_code, 400)
+
+    def test_import_reads_the_upload_before_writing(self):
+        events = []
+        get_db = app.app.get_db
+
+        def get_logged_db():
+            events.append('db')
+            return get_db()
+
+        class Upload(io.BytesIO):
+            def readinto(self, buffer):
+                events.append('read')
+                return super().readinto(buffer)
+
+            def read(self, *args):
+                events.append('read')
+                return super().read(*args)
+
+        self.addCleanup(setattr, app.app, 'get_db', get_db)
+        app.app.get_db = get_logged_db
+        body = json.dumps({"entity": "areas", "key": "a1", "text": "Area", "date_time_created": "x"}).encode()
+        resp = self.client.post('/api/import', input_stream=Upload(body), content_length=len(body))
+        self.assertEqual(resp.status_code, 200)
+        self.assertIn('db', events)
+        self.assertNotIn('read', events[events.index('db'):])
+
+    def test_backups(self):
+        c = self.client
+        backups = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, backups)
+        for name, value in (('backups', BackupScheduler(self.db_path, backups, interval=0)),
+                            ('admin_token', 'secret'), ('metrics', Registry())):
+            self.addCleanup(setattr, app.app, name, getattr(app.app, name))
+            setattr(app.app, name, value)
+        auth = {'Authorization': 'Bearer secret'}
+        c.post('/api/areas', json={"key": "a1", "text": "Area"})
+
+        self.assertEqual(c.get('/api/backups').status_code, 401)
+        self.assertEqual(c.get('/api/backups', headers={'Authorization': 'Bearer nope'}).status_code, 401)
+        resp = c.post('/api/backups', headers=auth)
+        self.assertEqual(resp.status_code, 201)
+        name = resp.get_json()['name']
+        self.assertEqual([s['name'] for s in c.get('/api/backups', headers=auth).get_json()['snapshots']], [name])
+
+        c.delete('/api/areas/a1')
+        since = c.get('/api/changes').get_json()['version']
+        resp = c.post(f'/api/backups/{name}/restore', headers=auth)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual([a['key'] for a in c.get('/api/areas').get_json()], ['a1'])
+        self.assertTrue(c.get(f'/api/changes?since={since}').get_json()['reset'])
+        self.assertEqual(c.post('/api/backups/nope.db/restore', headers=auth).status_code, 404)
+
+        text = c.get('/metrics').get_data(as_text=True)
+        self.assertIn('bigpicture_backups_total{result="ok"} 1', text)
+        self.assertIn('bigpicture_backup_snapshots 2', text)
+
+        app.app.admin_token = None
+        self.assertEqual(c.get('/api/backups', headers=auth).status_code, 403)
+
     def test_dragging_task_preserves_order(self):
         c = self.client
         # setup two objectives with multiple tasks
@@ -346,5 +1015,31 @@ class APITestCase(unittest.TestCase):
         self.assertEqual(orders_for('o1'), [0, 1])
         self.assertEqual(orders_for('o2'), [0, 1, 2])
 
+class RankOrderingAPITestCase(APITestCase):
+    """Run the API tests again with ORDERING_MODE=rank."""
+
+    def setUp(self):
+        super().setUp()
+        self.original_ordering = app.app.ordering
+        app.app.ordering = RankOrdering()
+
+    def tearDown(self):
+        app.app.ordering = self.original_ordering
+        super().tearDown()
+
+    def test_move_does_not_rewrite_siblings(self):
+        c = self.client
+        c.post('/api/areas', json={"key": "a1", "text": "Area"})
+        for i in range(5):
+            c.post('/api/tasks', json={"key": f"t{i}", "text": "T", "area_key": "a1"})
+        c.patch('/api/tasks/t4', json={"order_index": 0})
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM tasks WHERE order_index != 0').fetchone()[0], 0)
+        conn.close()
+        tasks = sorted(c.get('/api/tasks').get_json(), key=lambda t: t['order_index'])
+        self.assertEqual([(t['key'], t['order_index']) for t in tasks],
+                         [('t4', 0), ('t0', 1), ('t1', 2), ('t2', 3), ('t3', 4)])
+
+
 if __name__ == '__main__':
     unittest.main()
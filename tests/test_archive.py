@@ -0,0 +1,191 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import backend.app as app
+import backend.database as database
+from backend.archive import Archiver, archive_counts, restore_row
+from backend.ordering import IndexOrdering, RankOrdering
+from backend.services import OperationError
+
+# built without schema setup, which would create tasks.db in the working
+# directory; every test points get_db at a database of its own
+app.app = app.create_app({'DATABASE_SETUP': False})
+
+OLD = '2020-01-01T00:00:00-08:00'
+RECENT = '2999-01-01T00:00:00-08:00'
+
+
+class ArchiveTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'tasks.db')
+        database.init_db(self.path)
+        self.conn = database.connect(self.path)
+        self.addCleanup(self.conn.close)
+        with self.conn:
+            self.conn.execute("INSERT INTO areas (key, text, date_time_created) VALUES ('a1', 'Area', 'now')")
+            self.conn.executemany(
+                'INSERT INTO objectives (key, area_key, text, date_time_created, status, date_time_completed, '
+                "order_index) VALUES (?, 'a1', 'Objective', 'now', ?, ?, ?)",
+                [('o0', 'complete', OLD, 0), ('o1', 'complete', OLD, 1), ('o2', 'open', None, 2)],
+            )
+            # o0 is done; o1 still has an open task
+            self.conn.executemany(
+                'INSERT INTO tasks (key, objective_key, text, date_time_created, status, date_time_completed, '
+                "order_index) VALUES (?, ?, 'Task', 'now', ?, ?, ?)",
+                [('o0t0', 'o0', 'complete', OLD, 0), ('o0t1', 'o0', 'complete', OLD, 1),
+                 ('o1t0', 'o1', 'complete', OLD, 0), ('o1t1', 'o1', 'open', None, 1)],
+            )
+            # imported without a completion time; archived under o0's
+            self.conn.execute(
+                "INSERT INTO tasks (key, objective_key, text, date_time_created, status, order_index) "
+                "VALUES ('o0t2', 'o0', 'Task', 'now', 'complete', 2)"
+            )
+            # every third area task completed long ago, one recently
+            self.conn.executemany(
+                'INSERT INTO tasks (key, area_key, text, date_time_created, status, date_time_completed, '
+                "order_index) VALUES (?, 'a1', 'Task', 'now', ?, ?, ?)",
+                [(f't{i}', 'complete' if i % 3 == 0 else 'open', OLD if i % 3 == 0 else None, i)
+                 for i in range(10)],
+            )
+            self.conn.execute("UPDATE tasks SET date_time_completed = ? WHERE key = 't9'", (RECENT,))
+
+    def run_in_transaction(self, fn, *args):
+        with self.conn:
+            return fn(self.conn, *args)
+
+    def keys(self, table, where='1'):
+        return [r[0] for r in self.conn.execute(f'SELECT key FROM {table} WHERE {where} ORDER BY order_index')]
+
+    def test_archives_in_batches_and_closes_gaps(self):
+        archiver = Archiver(self.run_in_transaction, IndexOrdering(), max_age_days=30, batch_rows=2)
+        # o0 with its three tasks, o1t0, t0, t3 and t6
+        self.assertEqual(archiver.run_once(), 8)
+        self.assertGreater(archiver.stats()['batches'], 2)
+        self.assertEqual(archive_counts(self.conn), {'objectives': 1, 'tasks': 7})
+        self.assertEqual(self.conn.execute(
+            "SELECT date_time_completed FROM archived_tasks WHERE key = 'o0t2'").fetchone()[0], OLD)
+        self.assertEqual(self.keys('objectives'), ['o1', 'o2'])
+        self.assertEqual(self.keys('tasks', "area_key = 'a1'"), ['t1', 't2', 't4', 't5', 't7', 't8', 't9'])
+        # dense positions again, and only the active rows were shifted
+        for where in ("area_key = 'a1'", "objective_key = 'o1'"):
+            indexes = [r[0] for r in self.conn.execute(
+                f'SELECT order_index FROM tasks WHERE {where} ORDER BY order_index')]
+            self.assertEqual(indexes, list(range(len(indexes))))
+        self.assertEqual([r[0] for r in self.conn.execute('SELECT order_index FROM objectives ORDER BY key')], [0, 1])
+        # clients see the archived rows as deleted
+        self.assertEqual(self.conn.execute(
+            "SELECT COUNT(*) FROM tombstones WHERE key IN ('o0', 'o0t0', 't0')").fetchone()[0], 3)
+        self.assertEqual(archiver.run_once(), 0)
+
+    def test_restore(self):
+        ordering = IndexOrdering()
+        Archiver(self.run_in_transaction, ordering, max_age_days=30).run_once()
+        with self.assertRaises(OperationError) as raised:
+            restore_row(self.conn, ordering, 'tasks', 'o0t1')
+        self.assertEqual(raised.exception.status, 409)
+        with self.assertRaises(OperationError) as raised:
+            restore_row(self.conn, ordering, 'tasks', 't1')
+        self.assertEqual(raised.exception.status, 404)
+
+        with self.conn:
+            self.assertEqual(restore_row(self.conn, ordering, 'objectives', 'o0'), {'objectives': 1, 'tasks': 3})
+            self.assertEqual(restore_row(self.conn, ordering, 'tasks', 't3'), {'objectives': 0, 'tasks': 1})
+        self.assertEqual(self.keys('objectives'), ['o1', 'o2', 'o0'])
+        self.assertEqual(self.keys('tasks', "objective_key = 'o0'"), ['o0t0', 'o0t1', 'o0t2'])
+        self.assertEqual(self.keys('tasks', "area_key = 'a1'")[-1], 't3')
+        self.assertEqual(self.conn.execute(
+            "SELECT status, date_time_completed FROM tasks WHERE key = 't3'").fetchone()[:], ('complete', OLD))
+        self.assertEqual(archive_counts(self.conn), {'objectives': 0, 'tasks': 3})
+
+    def test_rank_ordering(self):
+        ordering = RankOrdering()
+        database.sync_mode(self.conn, 'rank')
+        Archiver(self.run_in_transaction, ordering, max_age_days=30).run_once()
+        rows = ordering.children(self.conn, 'tasks', ('area_key', 'a1'))
+        self.assertEqual([row['order_index'] for row in rows], list(range(7)))
+        with self.conn:
+            restore_row(self.conn, ordering, 'tasks', 't0')
+        self.assertEqual(ordering.children(self.conn, 'tasks', ('area_key', 'a1'))[-1]['key'], 't0')
+
+
+class ArchiveAPITestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'tasks.db')
+        database.init_db(self.path)
+        conn = database.connect(self.path)
+        with conn:
+            conn.execute("INSERT INTO areas (key, text, date_time_created) VALUES ('a1', 'Area', 'now')")
+            conn.executemany(
+                'INSERT INTO tasks (key, area_key, text, date_time_created, status, date_time_completed, '
+                "order_index) VALUES (?, 'a1', 'Task', 'now', 'complete', ?, ?)",
+                [(f't{i}', f'2020-01-{i + 1:02d}T00:00:00-08:00', i) for i in range(5)],
+            )
+        conn.close()
+        self.addCleanup(setattr, app.app, 'get_db', app.app.get_db)
+        self.addCleanup(setattr, app.app, 'archiver', app.app.archiver)
+        app.app.get_db = lambda: database.connect(self.path)
+
+        def run(fn, *args):
+            conn = database.connect(self.path)
+            try:
+                with conn:
+                    return fn(conn, *args)
+            finally:
+                conn.close()
+        app.app.archiver = Archiver(run, app.app.ordering, max_age_days=30)
+        self.client = app.app.test_client()
+
+    def test_page_and_restore(self):
+        app.app.archiver.run_once()
+        self.assertEqual(self.client.get('/api/tasks').get_json(), [])
+        status = self.client.get('/api/archive').get_json()
+        self.assertEqual((status['tasks'], status['archiver']['moved']), (5, 5))
+
+        resp = self.client.get('/api/archive/tasks?limit=2')
+        self.assertEqual([t['key'] for t in resp.get_json()], ['t0', 't1'])
+        self.assertIn('archived_at', resp.get_json()[0])
+        self.assertNotIn('order_index', resp.get_json()[0])
+        resp = self.client.get(f"/api/archive/tasks?limit=2&cursor={resp.headers['X-Next-Cursor']}")
+        self.assertEqual([t['key'] for t in resp.get_json()], ['t2', 't3'])
+        resp = self.client.get('/api/archive/tasks?completed_after=2020-01-05')
+        self.assertEqual([t['key'] for t in resp.get_json()], ['t4'])
+
+        resp = self.client.post('/api/archive/tasks/t3/restore')
+        self.assertEqual(resp.get_json(), {'status': 'success', 'restored': {'objectives': 0, 'tasks': 1}})
+        self.assertEqual([t['key'] for t in self.client.get('/api/tasks').get_json()], ['t3'])
+        self.assertNotIn('t3', [t['key'] for t in self.client.get('/api/archive/tasks').get_json()])
+        self.assertEqual(self.client.post('/api/archive/tasks/t3/restore').status_code, 404)
+        self.assertEqual(self.client.get('/api/archive/areas').status_code, 404)
+
+    def test_undo_skips_archived_parents(self):
+        conn = database.connect(self.path)
+        with conn:
+            conn.execute(
+                'INSERT INTO objectives (key, area_key, text, date_time_created, status, date_time_completed) '
+                "VALUES ('o1', 'a1', 'Objective', 'now', 'complete', '2020-01-01T00:00:00-08:00')"
+            )
+            conn.executemany(
+                'INSERT INTO tasks (key, objective_key, text, date_time_created, status, date_time_completed, '
+                "order_index) VALUES (?, 'o1', 'Task', 'now', 'complete', '2020-01-01T00:00:00-08:00', ?)",
+                [('o1t0', 0), ('o1t1', 1)],
+            )
+        conn.close()
+        self.assertEqual(self.client.delete('/api/tasks/o1t1').status_code, 200)
+        self.client.patch('/api/areas/a1', json={"text": "Renamed"})
+        app.app.archiver.run_once()
+
+        # the deletion would re-insert o1t1 under the archived o1
+        self.assertEqual(self.client.get('/api/history').get_json()['undo_log']['groups'], 1)
+        self.assertEqual(self.client.post('/api/undo').status_code, 200)
+        self.assertEqual(self.client.get('/api/areas').get_json()[0]['text'], 'Area')
+        self.assertEqual(self.client.post('/api/undo').status_code, 404)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import tempfile
+import threading
+import unittest
+
+import backend.app as app
+import backend.database as database
+
+# built without schema setup, which would create tasks.db in the working
+# directory; every test points get_db at a database of its own.  Ahead of
+# the asgi import, which serves this app.
+app.app = app.create_app({'DATABASE_SETUP': False})
+
+from backend.asgi import WSGIBridge  # noqa: E402
+
+
+def call(bridge, method, path, body=b'', headers=(), disconnect_after=None):
+    """Run one request through ``bridge``; returns ``(status, headers, chunks)``."""
+    sent = []
+
+    async def run():
+        parts = [body[:len(body) // 2], body[len(body) // 2:]]
+        gone = asyncio.Event()
+
+        async def receive():
+            if parts:
+                return {'type': 'http.request', 'body': parts.pop(0), 'more_body': bool(parts)}
+            await gone.wait()
+            return {'type': 'http.disconnect'}
+
+        async def send(message):
+            sent.append(message)
+            chunks = [m for m in sent if m['type'] == 'http.response.body']
+            if disconnect_after is not None and len(chunks) >= disconnect_after:
+                gone.set()
+
+        path_info, _, query = path.partition('?')
+        scope = {
+            'type': 'http', 'method': method, 'path': path_info, 'query_string': query.encode(),
+            'headers': [(k.lower().encode(), v.encode()) for k, v in headers],
+            'server': ('testserver', 80), 'client': ('127.0.0.1', 5000),
+        }
+        await bridge(scope, receive, send)
+
+    asyncio.run(run())
+    start = sent[0]
+    return start['status'], dict(start['headers']), [m['body'] for m in sent[1:]]
+
+
+class WSGIBridgeTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        path = os.path.join(self.dir, 'tasks.db')
+        database.init_db(path)
+        self.addCleanup(setattr, app.app, 'get_db', app.app.get_db)
+        app.app.get_db = lambda: database.connect(path)
+        self.threads = []
+
+        def wsgi_app(environ, start_response):
+            self.threads.append(threading.current_thread().name)
+            return app.app(environ, start_response)
+
+        self.bridge = WSGIBridge(wsgi_app, threads=2, stream_threads=2)
+        self.addCleanup(self.bridge.close)
+
+    def test_requests_and_the_writer_thread(self):
+        status, _, chunks = call(self.bridge, 'GET', '/api/test')
+        self.assertEqual((status, json.loads(chunks[0])['status']), (200, 'ok'))
+        body = json.dumps({'key': 'a1', 'text': 'Area 1'}).encode()
+        status, _, _ = call(self.bridge, 'POST', '/api/areas', body, [('Content-Type', 'application/json')])
+        self.assertEqual(status, 200)
+        status, headers, chunks = call(self.bridge, 'GET', '/api/areas?limit=5')
+        self.assertEqual([a['text'] for a in json.loads(b''.join(chunks))], ['Area 1'])
+        self.assertEqual(headers[b'content-type'], b'application/json')
+        self.assertTrue(self.threads[0].startswith('asgi-reader'))
+        self.assertTrue(self.threads[1].startswith('asgi-writer'))
+
+    def test_streamed_body(self):
+        body = json.dumps({'key': 'a1', 'text': 'Area 1'}).encode()
+        call(self.bridge, 'POST', '/api/areas', body, [('Content-Type', 'application/json')])
+        status, headers, chunks = call(self.bridge, 'GET', '/api/export')
+        self.assertEqual(status, 200)
+        self.assertNotIn(b'content-length', headers)
+        lines = [json.loads(line) for line in b''.join(chunks).splitlines()]
+        self.assertEqual([line.get('entity') for line in lines], [None, 'areas'])
+
+    def test_stream_closes_when_the_client_leaves(self):
+        closed = threading.Event()
+
+        def endless(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/plain')])
+
+            def chunks():
+                try:
+                    while True:
+                        time.sleep(0.01)
+                        yield b'tick\n'
+                finally:
+                    closed.set()
+            return chunks()
+
+        bridge = WSGIBridge(endless, threads=1, stream_threads=1)
+        self.addCleanup(bridge.close)
+        _, _, chunks = call(bridge, 'GET', '/', disconnect_after=3)
+        self.assertEqual(chunks[:3], [b'tick\n'] * 3)
+        self.assertTrue(closed.wait(2))
+
+
+if __name__ == '__main__':
+    unittest.main()
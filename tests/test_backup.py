@@ -0,0 +1,169 @@
+import os
+import time
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+import backend.database as database
+from backend.backup import BackupScheduler, list_snapshots, prune_snapshots, restore, snapshot
+from backend.migrations import LATEST_VERSION, schema_version
+from backend.sync import high_water, tombstone_floor
+
+
+class BackupTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'tasks.db')
+        self.backups = os.path.join(self.dir, 'backups')
+        database.init_db(self.path)
+        conn = database.connect(self.path)
+        with conn:
+            conn.execute("INSERT INTO areas (key, text, date_time_created) VALUES ('a1', 'Area', 'now')")
+            conn.executemany(
+                "INSERT INTO tasks (key, area_key, text, date_time_created, order_index) VALUES (?, 'a1', ?, 'now', ?)",
+                [(f't{i}', 'x' * 200, i) for i in range(2000)],
+            )
+        conn.close()
+
+    def count(self, path, table='tasks'):
+        conn = sqlite3.connect(path)
+        try:
+            return conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+        finally:
+            conn.close()
+
+    def test_snapshot_while_writing(self):
+        stop = threading.Event()
+
+        def write():
+            conn = database.connect(self.path)
+            i = 0
+            while not stop.is_set():
+                with conn:
+                    conn.execute("UPDATE tasks SET text = ? WHERE key = 't0'", (f'edit {i}',))
+                i += 1
+            conn.close()
+
+        writer = threading.Thread(target=write)
+        writer.start()
+        try:
+            # tiny steps, so the writer forces restarts and the one-step fallback
+            entry = snapshot(self.path, self.backups, pages=4, sleep=0.001, max_restarts=2)
+        finally:
+            stop.set()
+            writer.join()
+        copy = os.path.join(self.backups, entry['name'])
+        self.assertEqual(self.count(copy), 2000)
+        self.assertFalse(os.path.exists(copy + '-wal'))
+        self.assertEqual([s['name'] for s in list_snapshots(self.backups)], [entry['name']])
+        self.assertEqual(os.listdir(self.backups), [entry['name']])
+
+    def test_retention_keeps_the_newest(self):
+        names = []
+        for i in range(4):
+            names.append(snapshot(self.path, self.backups)['name'])
+            os.utime(os.path.join(self.backups, names[-1]), (time.time() - (4 - i) * 86400,) * 2)
+        self.assertEqual(prune_snapshots(self.backups, keep=3, max_age_days=0), [names[0]])
+        self.assertEqual(prune_snapshots(self.backups, keep=0, max_age_days=1.5), [names[2], names[1]])
+        # past every limit, but the only copy left
+        self.assertEqual(prune_snapshots(self.backups, keep=1, max_age_days=0.1), [])
+
+    def test_restore_fences_versions(self):
+        name = snapshot(self.path, self.backups)['name']
+        conn = database.connect(self.path)
+        with conn:
+            conn.execute("DELETE FROM tasks WHERE key != 't0'")
+        before = high_water(conn)
+        instance = conn.execute("SELECT value FROM meta WHERE name = 'instance_id'").fetchone()[0]
+        conn.close()
+
+        saved = restore(name, self.backups, self.path)
+        self.assertEqual(self.count(self.path), 2000)
+        self.assertEqual(self.count(os.path.join(self.backups, saved['name'])), 1)
+        conn = database.connect(self.path)
+        self.assertGreater(high_water(conn), before)
+        self.assertGreater(tombstone_floor(conn), before)
+        self.assertNotEqual(conn.execute("SELECT value FROM meta WHERE name = 'instance_id'").fetchone()[0], instance)
+        conn.close()
+        with self.assertRaises(FileNotFoundError):
+            restore('../tasks.db', self.backups, self.path)
+
+    def test_restore_is_one_write_transaction(self):
+        name = snapshot(self.path, self.backups)['name']
+        # as if taken by the previous release
+        old = sqlite3.connect(os.path.join(self.backups, name))
+        old.execute(f'PRAGMA user_version = {LATEST_VERSION - 1}')
+        old.close()
+        statements = []
+
+        def run(fn, *args):
+            conn = database.connect(self.path)
+            conn.set_trace_callback(statements.append)
+            try:
+                with conn:
+                    return fn(conn, *args)
+            finally:
+                conn.close()
+
+        restore(name, self.backups, self.path, run)
+        writes = [s for s in statements if s.split()[0] in ('BEGIN', 'INSERT', 'UPDATE', 'DELETE', 'COMMIT')]
+        self.assertEqual(writes[0], 'BEGIN IMMEDIATE')
+        self.assertEqual(writes[-1], 'COMMIT')
+        self.assertEqual(sum(s == 'COMMIT' for s in writes), 1)
+        # the fence commits with the copy
+        self.assertTrue(writes[-3].startswith('UPDATE meta SET value = ') and 'tombstone_floor' in writes[-3])
+        self.assertEqual(os.listdir(self.backups).count(f'.{name}.restore'), 0)
+
+        conn = database.connect(self.path)
+        self.assertEqual(schema_version(conn), LATEST_VERSION)
+        fence = high_water(conn)
+        with conn:
+            conn.execute("INSERT INTO areas (key, text, date_time_created) VALUES ('a2', 'Garden', 'now')")
+        # triggers and the search index work on the restored tables
+        self.assertEqual(high_water(conn), fence + 1)
+        self.assertEqual(conn.execute(
+            "SELECT COUNT(*) FROM search_index WHERE search_index MATCH '\"gard\"*'").fetchone()[0], 1)
+        conn.close()
+
+    def test_scheduler_skips_recent_snapshots(self):
+        scheduler = BackupScheduler(self.path, self.backups, interval=3600)
+        self.assertEqual(len(scheduler.run_due()), 1)
+        self.assertEqual(scheduler.run_due(), [])
+        self.assertEqual(len(list_snapshots(self.backups)), 1)
+
+    def test_scheduler_backs_up_every_tenant(self):
+        tenants = os.path.join(self.dir, 'tenants')
+        os.makedirs(tenants)
+        for tenant in ('acme', 'other'):
+            shutil.copy(self.path, os.path.join(tenants, f'{tenant}.db'))
+        # not a tenant database
+        open(os.path.join(tenants, 'notes.txt'), 'w').close()
+        scheduler = BackupScheduler(self.path, self.backups, interval=3600, tenant_dir=tenants)
+        self.assertEqual(len(scheduler.run_due()), 2)
+        self.assertEqual(scheduler.run_due(), [])
+        for tenant in ('acme', 'other'):
+            snapshots = list_snapshots(os.path.join(self.backups, tenant))
+            self.assertEqual(len(snapshots), 1)
+            self.assertEqual(self.count(os.path.join(self.backups, tenant, snapshots[0]['name'])), 2000)
+        self.assertEqual(list_snapshots(self.backups), [])
+        counts = [labels['tenant'] for name, _, labels, _ in scheduler.gauges() if name == 'bigpicture_backup_snapshots']
+        self.assertEqual(sorted(counts), ['acme', 'other'])
+        with self.assertRaises(FileNotFoundError):
+            scheduler.location('../tasks')
+
+        # a restore touches only its tenant
+        conn = database.connect(os.path.join(tenants, 'acme.db'))
+        with conn:
+            conn.execute("DELETE FROM tasks")
+        conn.close()
+        path, directory = scheduler.location('acme')
+        restore(list_snapshots(directory)[0]['name'], directory, path)
+        self.assertEqual(self.count(path), 2000)
+        self.assertEqual(len(list_snapshots(directory)), 2)
+        self.assertEqual(len(list_snapshots(os.path.join(self.backups, 'other'))), 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+import os
+import io
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+
+from bench import compare
+from bench.generate import generate
+from bench.results import percentile, save, summarize
+
+
+def dump(path):
+    conn = sqlite3.connect(path)
+    try:
+        return {
+            table: conn.execute(f'SELECT * FROM {table} ORDER BY 1').fetchall()
+            for table in ('areas', 'objectives', 'tasks', 'undo_log')
+        }
+    finally:
+        conn.close()
+
+
+class GenerateTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_same_arguments_give_the_same_board(self):
+        first, second, other = (os.path.join(self.dir, name) for name in ('a.db', 'b.db', 'c.db'))
+        counts = generate(first, areas=3, objectives=4, tasks=5, area_tasks=2, undo_groups=50)
+        self.assertEqual(counts['areas'], 3)
+        self.assertEqual(counts['objectives'], 12)
+        self.assertEqual(counts['tasks'], 3 * 4 * 5 + 3 * 2)
+        self.assertGreaterEqual(counts['undo_log'], 50)
+        generate(second, areas=3, objectives=4, tasks=5, area_tasks=2, undo_groups=50)
+        generate(other, areas=3, objectives=4, tasks=5, area_tasks=2, undo_groups=50, seed=1)
+        self.assertEqual(dump(first), dump(second))
+        self.assertNotEqual(dump(first)['tasks'], dump(other)['tasks'])
+
+        conn = sqlite3.connect(first)
+        statuses = dict(conn.execute('SELECT status, COUNT(*) FROM tasks GROUP BY status').fetchall())
+        self.assertEqual(set(statuses), {'open', 'complete', 'secondary'})
+        # completed tasks carry a completion time, open ones do not
+        self.assertEqual(conn.execute(
+            "SELECT COUNT(*) FROM tasks WHERE (status = 'complete') != (date_time_completed IS NOT NULL)"
+        ).fetchone()[0], 0)
+        conn.close()
+
+    def test_refuses_to_overwrite(self):
+        path = os.path.join(self.dir, 'board.db')
+        open(path, 'w').close()
+        with self.assertRaises(FileExistsError):
+            generate(path)
+
+
+class ResultsTestCase(unittest.TestCase):
+    def test_percentiles_use_nearest_rank(self):
+        values = [i / 1000 for i in range(1, 101)]
+        self.assertEqual(percentile(values, 0.5), 0.05)
+        self.assertEqual(percentile(values, 0.99), 0.099)
+        self.assertEqual(percentile([], 0.5), 0.0)
+        summary = summarize(values, elapsed=2.0, errors=1)
+        self.assertEqual((summary['n'], summary['errors']), (100, 1))
+        self.assertEqual((summary['p50_ms'], summary['p95_ms'], summary['max_ms']), (50.0, 95.0, 100.0))
+        self.assertEqual(summary['throughput_rps'], 50.0)
+
+
+class CompareTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def write(self, name, results):
+        path = os.path.join(self.dir, name)
+        save(path, 'micro', {key: {'p95_ms': value} for key, value in results.items()}, {})
+        return path
+
+    def run_compare(self, *args):
+        out = io.StringIO()
+        with redirect_stdout(out):
+            status = compare.main(list(args))
+        return status, out.getvalue()
+
+    def test_gate_fails_only_on_real_regressions(self):
+        baseline = self.write('base.json', {'GET /api/tree': 10.0, 'GET /api/test': 0.2, 'GET /api/areas': 1.0})
+        # 5% slower, and a 50% slowdown that is under the absolute floor
+        fine = self.write('fine.json', {'GET /api/tree': 10.5, 'GET /api/test': 0.3, 'GET /api/areas': 1.0})
+        self.assertEqual(self.run_compare(baseline, fine)[0], 0)
+
+        slow = self.write('slow.json', {'GET /api/tree': 12.0, 'GET /api/test': 0.2, 'GET /api/search': 3.0})
+        status, out = self.run_compare(baseline, slow)
+        self.assertEqual(status, 1)
+        self.assertIn('GET /api/tree', [line.split('  ')[0] for line in out.splitlines() if 'REGRESSION' in line])
+        self.assertIn('missing from baseline', out)
+        self.assertIn('missing from current', out)
+        self.assertEqual(self.run_compare(baseline, slow, '--max-regression', '0.25')[0], 0)
+
+    def test_throughput_drops_regress(self):
+        before = {'results': {'all': {'throughput_rps': 1000.0}}}
+        after = {'results': {'all': {'throughput_rps': 800.0}}}
+        self.assertEqual(compare.compare(before, after, 'throughput_rps')[1], ['all'])
+        self.assertEqual(compare.compare(after, before, 'throughput_rps')[1], [])
+
+
+if __name__ == '__main__':
+    unittest.main()
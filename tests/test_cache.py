@@ -0,0 +1,30 @@
+import unittest
+
+from backend.cache import ResponseCache
+
+
+class ResponseCacheTestCase(unittest.TestCase):
+    def test_lru_eviction_by_entries(self):
+        cache = ResponseCache(max_bytes=1000, max_entries=2)
+        cache.put('a', b'1', [])
+        cache.put('b', b'2', [])
+        cache.get('a')
+        cache.put('c', b'3', [])
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), (b'1', []))
+        self.assertEqual(cache.stats()['evictions'], 1)
+
+    def test_byte_cap(self):
+        cache = ResponseCache(max_bytes=10, max_entries=100)
+        cache.put('a', b'x' * 6, [])
+        cache.put('b', b'y' * 6, [])
+        self.assertIsNone(cache.get('a'))
+        self.assertEqual(cache.stats()['bytes'], 6)
+        # bodies larger than the whole cache are never stored
+        cache.put('c', b'z' * 11, [])
+        self.assertIsNone(cache.get('c'))
+        self.assertEqual(cache.stats()['entries'], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
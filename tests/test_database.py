@@ -0,0 +1,348 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+import backend.database as database
+from backend.migrations import LATEST_VERSION, migrate, schema_version
+from backend.pool import ConnectionPool, PoolTimeout, WriterQueue
+
+
+class ConnectionPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        self.pool = ConnectionPool(lambda: database.connect(self.db_path), size=2, timeout=0.2)
+
+    def tearDown(self):
+        self.pool.close_all()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_connections_are_configured_and_reused(self):
+        conn = self.pool.acquire()
+        self.assertIs(conn.row_factory, sqlite3.Row)
+        self.assertEqual(conn.execute('PRAGMA foreign_keys').fetchone()[0], 1)
+        self.pool.release(conn)
+        self.assertIs(self.pool.acquire(), conn)
+        stats = self.pool.stats()
+        self.assertEqual(stats['created'], 1)
+        self.assertEqual(stats['in_use'], 1)
+        self.assertEqual(stats['idle'], 0)
+
+    def test_pool_is_bounded(self):
+        first = self.pool.acquire()
+        self.pool.acquire()
+        with self.assertRaises(PoolTimeout):
+            self.pool.acquire()
+        self.assertEqual(self.pool.stats()['timeouts'], 1)
+
+        # a waiting thread gets the connection as soon as it is released
+        got = []
+        waiter = threading.Thread(target=lambda: got.append(self.pool.acquire()))
+        waiter.start()
+        time.sleep(0.05)
+        self.pool.release(first)
+        waiter.join()
+        self.assertEqual(got, [first])
+
+    def test_release_rolls_back_and_recycles(self):
+        conn = self.pool.acquire()
+        conn.execute('CREATE TABLE t (x INTEGER)')
+        conn.execute('INSERT INTO t VALUES (1)')
+        self.pool.release(conn)
+        self.assertFalse(conn.in_transaction)
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM t').fetchone()[0], 0)
+
+        # connections returned after an error are closed, not reused
+        self.pool.release(self.pool.acquire(), discard=True)
+        self.assertIsNot(self.pool.acquire(), conn)
+        self.assertEqual(self.pool.stats()['recycled'], 1)
+
+    def test_max_age(self):
+        pool = ConnectionPool(lambda: database.connect(self.db_path), size=1, max_age=0.01)
+        conn = pool.acquire()
+        time.sleep(0.02)
+        pool.release(conn)
+        self.assertEqual(pool.stats()['idle'], 0)
+        self.assertIsNot(pool.acquire(), conn)
+
+
+class WriterQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        with database.connect(self.db_path) as conn:
+            conn.execute('CREATE TABLE t (x INTEGER)')
+        self.writer = WriterQueue(lambda: database.connect(self.db_path), timeout=0.5)
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def test_storage_profile_pragmas(self):
+        conn = database.connect(self.db_path)
+        self.assertEqual(
+            conn.execute('PRAGMA busy_timeout').fetchone()[0],
+            int(database.STORAGE_PROFILE['busy_timeout']),
+        )
+
+    def test_writers_take_turns_on_one_connection(self):
+        conn = self.writer.acquire()
+        order = []
+
+        def write(n):
+            c = self.writer.acquire()
+            order.append(n)
+            self.assertIs(c, conn)
+            self.writer.release(c)
+
+        threads = [threading.Thread(target=write, args=(n,)) for n in range(3)]
+        for t in threads:
+            t.start()
+            time.sleep(0.02)
+        self.assertEqual(order, [])
+        self.writer.release(conn)
+        for t in threads:
+            t.join()
+        self.assertEqual(order, [0, 1, 2])
+        self.assertEqual(self.writer.stats()['writes'], 4)
+
+    def test_run_commits_and_release_rolls_back(self):
+        self.writer.run(lambda conn: conn.execute('INSERT INTO t VALUES (1)'))
+        conn = self.writer.acquire()
+        conn.execute('INSERT INTO t VALUES (2)')
+        self.writer.release(conn)
+        reader = database.connect(self.db_path)
+        self.assertEqual([r['x'] for r in reader.execute('SELECT x FROM t')], [1])
+
+
+class TenantRouterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.router = database.TenantRouter(self.dir, max_open=2, idle_timeout=0)
+        self.addCleanup(self.router.close_all)
+
+    def test_schema_is_created_on_first_access(self):
+        shard = self.router.acquire('acme')
+        self.assertEqual(shard.path, os.path.join(self.dir, 'acme.db'))
+        conn = shard.pool.acquire()
+        self.assertEqual(schema_version(conn), LATEST_VERSION)
+        shard.pool.release(conn)
+        self.router.release(shard)
+        self.assertIs(self.router.acquire('acme'), shard)
+
+    def test_least_recently_used_idle_shard_is_closed(self):
+        a = self.router.acquire('a')
+        b = self.router.acquire('b')
+        self.router.release(b)
+        # 'a' is still in use, so 'b' makes room
+        self.router.acquire('c')
+        self.assertEqual(self.router.stats()['open'], 2)
+        self.assertIsNot(self.router.acquire('b'), b)
+        self.assertEqual(self.router.stats()['evicted'], 1)
+        self.assertEqual(self.router.stats()['open'], 3)
+        self.router.release(a)
+
+    def test_idle_shards_expire(self):
+        router = database.TenantRouter(self.dir, idle_timeout=0.01)
+        router.release(router.acquire('a'))
+        time.sleep(0.02)
+        router.release(router.acquire('b'))
+        self.assertEqual(router.stats()['open'], 1)
+        self.assertEqual(router.stats()['expired'], 1)
+        router.close_all()
+
+    def test_tenants_write_independently(self):
+        a = self.router.acquire('a')
+        b = self.router.acquire('b')
+        conn = a.writer.acquire()
+        conn.execute("INSERT INTO areas (key, text, date_time_created) VALUES ('x', 'A', 'now')")
+        # 'a' holds its write lock; 'b' still writes without waiting
+        b.writer.run(lambda c: c.execute("INSERT INTO areas (key, text, date_time_created) VALUES ('x', 'B', 'now')"))
+        conn.commit()
+        a.writer.release(conn)
+        texts = [s.writer.run(lambda c: c.execute('SELECT text FROM areas').fetchone()[0]) for s in (a, b)]
+        self.assertEqual(texts, ['A', 'B'])
+        self.assertEqual(self.router.run_all(lambda c: c.execute('SELECT COUNT(*) FROM areas').fetchone()[0]), 2)
+
+    def test_run_all_visits_closed_tenants(self):
+        for tenant in ('a', 'b'):
+            shard = self.router.acquire(tenant)
+            shard.writer.run(lambda c: c.execute(
+                "INSERT INTO areas (key, text, date_time_created) VALUES ('x', 'A', 'now')"))
+            self.router.release(shard)
+        self.router.close_all()
+        self.router.release(self.router.acquire('c'))
+        count = self.router.run_all(lambda c: c.execute('SELECT COUNT(*) FROM areas').fetchone()[0])
+        self.assertEqual(count, 2)
+        # opened for the call only; 'c' was open already and stays so
+        self.assertEqual((self.router.stats()['open'], self.router.tenants()), (1, ['a', 'b', 'c']))
+
+
+class TenantRoutingTestCase(unittest.TestCase):
+    def setUp(self):
+        import backend.app as app
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        for name, value in (('TENANT_DIR', self.dir), ('_router', None)):
+            self.addCleanup(setattr, database, name, getattr(database, name))
+            setattr(database, name, value)
+        self.addCleanup(lambda: database._router and database._router.close_all())
+        # built without schema setup against DATABASE_URL; other suites
+        # point get_db at a single test database
+        tenant_app = app.create_app({'DATABASE_SETUP': False})
+        tenant_app.get_db = database.get_db
+        tenant_app.admin_token = 'secret'
+        self.app = tenant_app
+        self.client = tenant_app.test_client()
+        self.admin = {'Authorization': 'Bearer secret'}
+
+    def test_requests_are_routed_by_header(self):
+        self.assertEqual(self.client.get('/api/areas').status_code, 400)
+        self.assertEqual(self.client.get('/api/areas', headers={'X-Tenant': '../etc'}).status_code, 400)
+        # headers only name tenants an admin created; no file per guess
+        self.assertEqual(self.client.get('/api/areas', headers={'X-Tenant': 'acme'}).status_code, 404)
+        self.assertEqual(os.listdir(self.dir), [])
+        self.assertEqual(self.client.post('/api/tenants', json={'tenant': 'acme'}).status_code, 401)
+        for tenant, status in (('acme', 201), ('other', 201), ('acme', 200), ('../etc', 400), (7, 400)):
+            resp = self.client.post('/api/tenants', json={'tenant': tenant}, headers=self.admin)
+            self.assertEqual(resp.status_code, status, tenant)
+        self.assertEqual(self.client.get('/api/tenants', headers=self.admin).get_json(), {'tenants': ['acme', 'other']})
+        resp = self.client.post('/api/areas', json={'key': 'a1', 'text': 'Acme'}, headers={'X-Tenant': 'acme'})
+        self.assertEqual(resp.status_code, 200)
+        acme = self.client.get('/api/areas', headers={'X-Tenant': 'acme'}).get_json()
+        other = self.client.get('/api/areas', headers={'X-Tenant': 'other'}).get_json()
+        self.assertEqual([a['text'] for a in acme], ['Acme'])
+        self.assertEqual(other, [])
+        self.assertTrue({'acme.db', 'other.db'} <= set(os.listdir(self.dir)))
+        self.assertEqual(self.client.get('/api/test').status_code, 200)
+
+    def test_signed_tokens(self):
+        self.addCleanup(setattr, database, 'TENANT_SECRET', database.TENANT_SECRET)
+        database.TENANT_SECRET = 's3cret'
+        token = database.tenant_token('acme')
+        self.assertEqual(self.client.get('/api/areas', headers={'X-Tenant': 'acme'}).status_code, 401)
+        self.assertEqual(self.client.get('/api/areas', headers={'Authorization': f'Bearer {token}x'}).status_code, 401)
+        self.assertEqual(self.client.get('/api/areas', headers={'Authorization': f'Bearer {token}'}).status_code, 200)
+        self.assertIn('acme.db', os.listdir(self.dir))
+
+    def test_backups_per_tenant(self):
+        from backend.backup import BackupScheduler
+        backups = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, backups)
+        self.app.backups = BackupScheduler(database.DB_PATH, backups, tenant_dir=self.dir)
+        for tenant in ('acme', 'other'):
+            self.client.post('/api/tenants', json={'tenant': tenant}, headers=self.admin)
+        acme = dict(self.admin, **{'X-Tenant': 'acme'})
+        self.client.post('/api/areas', json={'key': 'a1', 'text': 'Acme'}, headers=acme)
+        self.assertEqual(self.client.get('/api/backups', headers=self.admin).status_code, 400)
+        self.assertEqual(self.client.get('/api/backups', headers={'X-Tenant': 'acme'}).status_code, 401)
+        resp = self.client.post('/api/backups', headers=acme)
+        self.assertEqual(resp.status_code, 201)
+        name = resp.get_json()['name']
+        listed = self.client.get('/api/backups', headers=acme).get_json()
+        self.assertEqual(listed['directory'], os.path.join(backups, 'acme'))
+        self.assertEqual([s['name'] for s in listed['snapshots']], [name])
+        other = self.client.get('/api/backups', headers=dict(self.admin, **{'X-Tenant': 'other'})).get_json()
+        self.assertEqual(other['snapshots'], [])
+
+        self.client.post('/api/areas', json={'key': 'a2', 'text': 'Later'}, headers=acme)
+        resp = self.client.post(f'/api/backups/{name}/restore', headers=acme)
+        self.assertEqual(resp.status_code, 200)
+        areas = self.client.get('/api/areas', headers={'X-Tenant': 'acme'}).get_json()
+        self.assertEqual([a['text'] for a in areas], ['Acme'])
+        # the snapshot is only in acme's directory
+        resp = self.client.post(f'/api/backups/{name}/restore', headers=dict(self.admin, **{'X-Tenant': 'other'}))
+        self.assertEqual(resp.status_code, 404)
+
+        # with signed tokens the admin token moves to its own header
+        self.addCleanup(setattr, database, 'TENANT_SECRET', database.TENANT_SECRET)
+        database.TENANT_SECRET = 's3cret'
+        signed = {'Authorization': f"Bearer {database.tenant_token('acme')}"}
+        self.assertEqual(self.client.get('/api/backups', headers=signed).status_code, 401)
+        listed = self.client.get('/api/backups', headers=dict(signed, **{'X-Admin-Token': 'secret'})).get_json()
+        self.assertEqual(len(listed['snapshots']), 2)
+
+
+class MigrationTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+
+    def tearDown(self):
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+        if os.path.exists(self.db_path + '.lock'):
+            os.unlink(self.db_path + '.lock')
+
+    def test_prepare_db_runs_setup_once(self):
+        self.assertFalse(database.schema_current(self.db_path))
+        self.assertTrue(database.prepare_db(self.db_path))
+        self.assertTrue(database.schema_current(self.db_path))
+        self.assertFalse(database.prepare_db(self.db_path))
+        # a database left behind by an older release is migrated again
+        conn = sqlite3.connect(self.db_path)
+        conn.execute(f'PRAGMA user_version = {LATEST_VERSION - 1}')
+        conn.close()
+        self.assertFalse(database.schema_current(self.db_path))
+        self.assertTrue(database.prepare_db(self.db_path))
+
+    def test_upgrades_existing_database(self):
+        # a database created before versioning: tables exist, version is 0
+        conn = sqlite3.connect(self.db_path)
+        conn.execute('CREATE TABLE areas (key TEXT PRIMARY KEY, text TEXT NOT NULL, '
+                     'date_time_created TEXT NOT NULL, order_index INTEGER NOT NULL DEFAULT 0)')
+        conn.execute("INSERT INTO areas VALUES ('a1', 'Area', '2021-01-01T00:00:00', 0)")
+        conn.commit()
+        conn.close()
+
+        database.init_db(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(schema_version(conn), LATEST_VERSION)
+        self.assertEqual(conn.execute('SELECT key FROM areas').fetchall(), [('a1',)])
+        indexes = {r[0] for r in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        self.assertTrue({'idx_tasks_area_order', 'idx_tasks_objective_order', 'idx_objectives_area_order'} <= indexes)
+        # existing rows get versions below the next change
+        self.assertEqual(conn.execute("SELECT version FROM areas").fetchall(), [(1,)])
+        conn.execute("INSERT INTO areas (key, text, date_time_created) VALUES ('a2', 'Area', 'now')")
+        self.assertEqual(conn.execute("SELECT version FROM areas WHERE key = 'a2'").fetchone(), (2,))
+        # running again is a no-op
+        self.assertEqual(migrate(conn), [])
+        self.assertEqual(conn.execute(
+            "SELECT key FROM search_docs WHERE id IN (SELECT rowid FROM search_index WHERE search_index MATCH 'area')"
+        ).fetchall(), [('a1',), ('a2',)])
+        conn.close()
+
+    def test_init_db_rebuilds_stale_search_index(self):
+        database.init_db(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("INSERT INTO areas (key, text, date_time_created) VALUES ('a1', 'Area', 'now')")
+        conn.execute('DELETE FROM search_docs')
+        conn.commit()
+        conn.close()
+        database.init_db(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        self.assertEqual(conn.execute(
+            "SELECT COUNT(*) FROM search_index WHERE search_index MATCH 'area'"
+        ).fetchone(), (1,))
+        conn.close()
+
+    def test_sibling_queries_use_indexes(self):
+        database.init_db(self.db_path)
+        conn = sqlite3.connect(self.db_path)
+        for sql in (
+            'SELECT MAX(order_index) FROM tasks WHERE objective_key = ?',
+            'UPDATE tasks SET order_index = order_index - 1 WHERE area_key = ? AND order_index > ?',
+            'SELECT MAX(order_index) FROM objectives WHERE area_key = ?',
+            'SELECT * FROM tasks WHERE version > ?',
+            'SELECT * FROM tombstones WHERE version > ?',
+        ):
+            plan = ' '.join(r[3] for r in conn.execute('EXPLAIN QUERY PLAN ' + sql, ('k', 0)[:sql.count('?')]))
+            self.assertIn('USING', plan, sql)
+        conn.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import json
+import os
+import tempfile
+import unittest
+
+import backend.database as database
+from backend.events import ChangeFeed, prune_changes
+
+
+def parse(chunk):
+    """Return ``(event, data)`` for one rendered Server-Sent Event."""
+    fields = dict(line.split(': ', 1) for line in chunk.strip().split('\n') if not line.startswith(':'))
+    return fields.get('event'), json.loads(fields['data']) if 'data' in fields else None
+
+
+class ChangeFeedTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        database.init_db(self.db_path)
+        self.conn = database.connect(self.db_path)
+        self.feed = ChangeFeed(lambda: database.connect(self.db_path), interval=0, buffer_size=3, heartbeat=0.01)
+
+    def tearDown(self):
+        self.conn.close()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def write(self, *statements):
+        for sql in statements:
+            self.conn.execute(sql)
+        self.conn.commit()
+
+    def test_poll_fans_out_committed_changes(self):
+        subscriber = self.feed.subscribe()
+        self.write("INSERT INTO areas (key, text, date_time_created) VALUES ('a1', 'A', 'now')")
+        self.conn.execute("UPDATE areas SET text = 'B' WHERE key = 'a1'")
+        # nothing is visible before the commit
+        self.assertEqual(self.feed.poll(), 1)
+        self.conn.commit()
+        self.assertEqual(self.feed.poll(), 1)
+        self.assertEqual(self.feed.poll(), 0)
+        records, overflowed = subscriber.take(0)
+        self.assertFalse(overflowed)
+        self.assertEqual([(r['op'], r['fields'].get('text')) for r in records], [('insert', 'A'), ('update', 'B')])
+        self.assertEqual(records[1]['fields'], {'text': 'B'})
+
+    def test_stream_resumes_and_catches_up_after_overflow(self):
+        self.write(*[f"INSERT INTO areas (key, text, date_time_created) VALUES ('a{i}', 'A', 'now')" for i in range(3)])
+        stream = self.feed.stream(since=1)
+        self.assertEqual([parse(next(stream))[1]['key'] for _ in range(2)], ['a1', 'a2'])
+        self.assertEqual(next(stream), ': heartbeat\n\n')
+
+        # more changes than the buffer holds are re-read from the table
+        self.write(*[f"UPDATE areas SET text = 'x{i}' WHERE key = 'a0'" for i in range(5)])
+        self.feed.poll()
+        events = [parse(next(stream)) for _ in range(5)]
+        self.assertEqual([data['fields']['text'] for _, data in events], [f'x{i}' for i in range(5)])
+        self.assertEqual([data['version'] for _, data in events], list(range(4, 9)))
+        stream.close()
+
+    def test_reset_when_history_was_pruned(self):
+        self.write(*[f"INSERT INTO areas (key, text, date_time_created) VALUES ('a{i}', 'A', 'now')" for i in range(3)])
+        self.assertEqual(prune_changes(self.conn, keep=1), 2)
+        self.conn.commit()
+        event, data = parse(next(self.feed.stream(since=0)))
+        self.assertEqual((event, data), ('reset', {'version': 3}))
+
+    def test_history_pruner_bounds_the_log(self):
+        from backend.app import create_app
+        # pruned on a timer, whether or not a stream ever polls
+        self.assertIn(prune_changes, create_app({'DATABASE_SETUP': False}).history_pruner.jobs)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,66 @@
+import os
+import tempfile
+import unittest
+
+import backend.database as database
+import backend.history as history
+
+
+class HistoryTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        database.init_db(self.db_path)
+        self.conn = database.connect(self.db_path)
+
+    def tearDown(self):
+        self.conn.close()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def count(self, table='undo_log'):
+        return self.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def test_entries_join_the_callers_transaction(self):
+        history.log_action_for_undo(self.conn, 'UPDATE', 'areas', 'a1', {'key': 'a1'})
+        self.assertTrue(self.conn.in_transaction)
+        self.conn.rollback()
+        self.assertEqual(self.count(), 0)
+
+    def test_buffer_writes_one_group_and_clears_redo(self):
+        history.write_history(self.conn, [('INSERT', 'tasks', 't0', {'key': 't0'})], 'redo_log')
+        undo = history.UndoBuffer()
+        for key in ('t1', 't2', 't3'):
+            undo(self.conn, 'DELETE', 'tasks', key, {'key': key})
+        self.assertEqual(self.count(), 0)
+        group_id = undo.write(self.conn)
+        self.assertEqual(self.count('redo_log'), 0)
+        self.assertIsNone(undo.write(self.conn))
+
+        entries = history.pop_group(self.conn)
+        self.assertEqual([key for _, _, key, _ in entries], ['t3', 't2', 't1'])
+        self.assertEqual(entries[0][3], {'key': 't3'})
+        self.assertEqual(self.count(), 0)
+        self.assertEqual(history.pop_group(self.conn), [])
+        self.assertIsNotNone(group_id)
+
+    def test_compression(self):
+        data = {'key': 'k', 'text': 'x' * 1000}
+        packed = history.encode_data(data, compress=True)
+        self.assertIsInstance(packed, bytes)
+        self.assertLess(len(packed), 100)
+        self.assertEqual(history.decode_data(packed), data)
+        self.assertEqual(history.decode_data(history.encode_data({'key': 'k'}, compress=True)), {'key': 'k'})
+
+    def test_prune_by_count_and_age(self):
+        for n in range(5):
+            history.log_action_for_undo(self.conn, 'UPDATE', 'tasks', f't{n}', {'key': f't{n}'})
+        self.conn.execute("UPDATE undo_log SET timestamp = '2000-01-01T00:00:00' WHERE record_key = 't0'")
+        self.assertEqual(history.prune_history(self.conn, max_groups=0, max_age_days=30), 1)
+        self.assertEqual(history.prune_history(self.conn, max_groups=2, max_age_days=0), 2)
+        keys = [r[0] for r in self.conn.execute('SELECT record_key FROM undo_log ORDER BY id')]
+        self.assertEqual(keys, ['t3', 't4'])
+        self.assertEqual(history.history_stats(self.conn)['undo_log'], {'entries': 2, 'groups': 2})
+
+
+if __name__ == '__main__':
+    unittest.main()
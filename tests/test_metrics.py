@@ -0,0 +1,63 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from backend.metrics import InstrumentedConnection, Registry, RequestStats, render, unwrap
+
+
+class RegistryTestCase(unittest.TestCase):
+    def test_render_counters_and_histograms(self):
+        registry = Registry()
+        labels = {'route': '/api/tasks', 'method': 'GET'}
+        registry.inc('bigpicture_http_requests_total', {**labels, 'status': '200'})
+        registry.inc('bigpicture_http_requests_total', {**labels, 'status': '200'})
+        registry.observe('bigpicture_http_request_duration_seconds', labels, 0.003)
+        registry.observe('bigpicture_http_request_duration_seconds', labels, 0.2)
+        text = render(registry.samples(), [('bigpicture_history_entries', 'Entries.', {'table': 'undo_log'}, 4)])
+        self.assertIn('bigpicture_http_requests_total{method="GET",route="/api/tasks",status="200"} 2', text)
+        self.assertIn('bigpicture_http_request_duration_seconds_bucket{method="GET",route="/api/tasks",le="0.005"} 1', text)
+        self.assertIn('bigpicture_http_request_duration_seconds_bucket{method="GET",route="/api/tasks",le="0.25"} 2', text)
+        self.assertIn('bigpicture_http_request_duration_seconds_count{method="GET",route="/api/tasks"} 2', text)
+        self.assertIn('# TYPE bigpicture_history_entries gauge\nbigpicture_history_entries{table="undo_log"} 4', text)
+
+    def test_workers_are_summed_through_the_directory(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        labels = {'route': '/api/tree'}
+        other = Registry()
+        other.inc('bigpicture_sqlite_rows_total', labels, 5)
+        other.observe('bigpicture_sqlite_request_seconds', labels, 0.002)
+        other.flush(directory, force=True)
+        # as if written by another worker process
+        os.rename(os.path.join(directory, f'metrics-{os.getpid()}.json'), os.path.join(directory, 'metrics-1.json'))
+
+        registry = Registry()
+        registry.inc('bigpicture_sqlite_rows_total', labels, 2)
+        registry.observe('bigpicture_sqlite_request_seconds', labels, 0.002)
+        merged = registry.collect(directory)
+        key = (('route', '/api/tree'),)
+        self.assertEqual(merged[('bigpicture_sqlite_rows_total', key)], 7)
+        self.assertEqual(sum(merged[('bigpicture_sqlite_request_seconds', key)][:-1]), 2)
+
+
+class InstrumentedConnectionTestCase(unittest.TestCase):
+    def test_records_statements_rows_and_commits(self):
+        raw = sqlite3.connect(':memory:')
+        conn = InstrumentedConnection(raw, RequestStats())
+        with conn:
+            conn.execute('CREATE TABLE t (x)')
+            conn.executemany('INSERT INTO t VALUES (?)', [(i,) for i in range(5)])
+        self.assertEqual(conn.execute('SELECT COUNT(*) FROM t').fetchone()[0], 5)
+        self.assertEqual(len([row for row in conn.execute('SELECT x FROM t')]), 5)
+        self.assertEqual(conn.execute('SELECT x FROM t WHERE x > 2').fetchall(), [(3,), (4,)])
+        self.assertEqual((conn.stats.statements, conn.stats.rows), (5, 8))
+        self.assertGreater(conn.stats.commit, 0)
+        self.assertFalse(conn.in_transaction)
+        self.assertIs(unwrap(conn), raw)
+        raw.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,123 @@
+import os
+import random
+import sqlite3
+import tempfile
+import unittest
+
+import backend.database as database
+import backend.ordering as ordering
+
+
+class RankKeyTestCase(unittest.TestCase):
+    def test_rank_between_orders_strictly(self):
+        rng = random.Random(0)
+        ranks = [ordering.rank_between()]
+        for _ in range(500):
+            i = rng.randint(0, len(ranks))
+            lo = ranks[i - 1] if i > 0 else None
+            hi = ranks[i] if i < len(ranks) else None
+            new = ordering.rank_between(lo, hi)
+            self.assertFalse(new.endswith('0'))
+            if lo is not None:
+                self.assertLess(lo, new)
+            if hi is not None:
+                self.assertLess(new, hi)
+            ranks.insert(i, new)
+        self.assertEqual(ranks, sorted(ranks))
+
+    def test_appending_grows_keys_slowly(self):
+        rank = None
+        for _ in range(1000):
+            rank = ordering.rank_between(rank, None)
+        self.assertLess(len(rank), 20)
+
+    def test_spread_ranks(self):
+        ranks = ordering.spread_ranks(5000)
+        self.assertEqual(ranks, sorted(ranks))
+        self.assertEqual(len(set(ranks)), 5000)
+        self.assertLessEqual(max(len(r) for r in ranks), 3)
+
+
+class RankOrderingTestCase(unittest.TestCase):
+    def setUp(self):
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        database.init_db(self.db_path)
+        self.conn = database.connect(self.db_path)
+        self.conn.execute("INSERT INTO areas (key, text, date_time_created) VALUES ('a1', 'A', 'now')")
+        for i in range(10):
+            self.conn.execute(
+                "INSERT INTO tasks (key, area_key, text, date_time_created, order_index) VALUES (?, 'a1', 'T', 'now', ?)",
+                (f't{i}', i),
+            )
+        self.conn.commit()
+
+    def tearDown(self):
+        self.conn.close()
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def keys(self, strategy):
+        rows = self.conn.execute(
+            f"SELECT {strategy.columns('tasks', 't')} FROM tasks t WHERE t.area_key = 'a1' ORDER BY position_"
+        ).fetchall()
+        return [(r['key'], strategy.as_dict(r)['order_index']) for r in rows]
+
+    def test_switching_mode_carries_order_over(self):
+        self.conn.execute("UPDATE tasks SET order_index = 9 - order_index")
+        self.conn.commit()
+        self.assertTrue(ordering.sync_mode(self.conn, 'rank'))
+        self.assertEqual(self.keys(ordering.RankOrdering()), [(f't{9 - i}', i) for i in range(10)])
+        self.assertFalse(ordering.sync_mode(self.conn, 'rank'))
+
+    def test_move_writes_only_the_moved_row(self):
+        ordering.sync_mode(self.conn, 'rank')
+        strategy = ordering.RankOrdering()
+        parent = ('area_key', 'a1')
+        version = "SELECT value FROM meta WHERE name = 'data_version'"
+        before = self.conn.execute(version).fetchone()[0]
+        placement = strategy.move(self.conn, 'tasks', 't9', parent, 9, parent, 2)
+        self.conn.execute('UPDATE tasks SET rank = ? WHERE key = ?', (placement['rank'], 't9'))
+        # every row write bumps data_version once
+        self.assertEqual(self.conn.execute(version).fetchone()[0] - before, 1)
+        self.assertEqual([k for k, _ in self.keys(strategy)][:4], ['t0', 't1', 't9', 't2'])
+        self.assertEqual(strategy.fetch(self.conn, 'tasks', 't9')['order_index'], 2)
+
+    def test_long_ranks_are_rebalanced(self):
+        ordering.sync_mode(self.conn, 'rank')
+        scheduled = []
+        strategy = ordering.RankOrdering(max_length=4, on_long_rank=lambda *args: scheduled.append(args))
+        parent = ('area_key', 'a1')
+        # keep squeezing rows into the same gap
+        for n in range(30):
+            key = f't{2 + n % 8}'
+            current = strategy.fetch(self.conn, 'tasks', key)['order_index']
+            placement = strategy.move(self.conn, 'tasks', key, parent, current, parent, 1)
+            self.conn.execute('UPDATE tasks SET rank = ? WHERE key = ?', (placement['rank'], key))
+        self.assertIn(('tasks', parent), scheduled)
+        order = [k for k, _ in self.keys(strategy)]
+        ordering.renumber(self.conn, 'tasks', parent)
+        self.assertEqual([k for k, _ in self.keys(strategy)], order)
+        longest = self.conn.execute('SELECT MAX(length(rank)) FROM tasks').fetchone()[0]
+        self.assertLessEqual(longest, 2)
+
+
+
+class IndexBatchTestCase(RankOrderingTestCase):
+    def test_batch_shifts_siblings_once(self):
+        batch = ordering.IndexOrdering().batch()
+        parent = ('area_key', 'a1')
+        for key, index in (('t9', 0), ('t8', 1)):
+            old = batch.fetch(self.conn, 'tasks', key)['order_index']
+            placement = batch.move(self.conn, 'tasks', key, parent, old, parent, index)
+            self.conn.execute('UPDATE tasks SET order_index = ? WHERE key = ?', (placement['order_index'], key))
+        self.assertEqual(batch.fetch(self.conn, 'tasks', 't0')['order_index'], 2)
+        placement = batch.append(self.conn, 'tasks', parent, 'new')
+        self.assertEqual(placement, {'order_index': 10})
+        # the moved rows were written already; only t0..t7 shift
+        self.assertEqual(batch.flush(self.conn), 8)
+        self.assertEqual(batch.flush(self.conn), 0)
+        expected = ['t9', 't8'] + [f't{i}' for i in range(8)]
+        self.assertEqual(self.keys(ordering.IndexOrdering()), [(k, i) for i, k in enumerate(expected)])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import backend.database as database
+from backend.archive import Archiver, restore_row
+from backend.ordering import IndexOrdering
+from backend.progress import check_progress, expected_progress, read_progress
+
+
+class ProgressTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'tasks.db')
+        database.init_db(self.path)
+        self.conn = database.connect(self.path)
+        self.addCleanup(self.conn.close)
+        with self.conn:
+            self.conn.execute("INSERT INTO areas (key, text, date_time_created) VALUES ('a1', 'Area', 'now')")
+            self.conn.execute(
+                "INSERT INTO objectives (key, area_key, text, date_time_created, status, date_time_completed) "
+                "VALUES ('o1', 'a1', 'Objective', 'now', 'complete', '2020-01-01')"
+            )
+            self.conn.executemany(
+                "INSERT INTO tasks (key, objective_key, text, date_time_created, status, date_time_completed, "
+                "order_index) VALUES (?, 'o1', 'Task', 'now', 'complete', '2020-01-01', ?)",
+                [(f't{i}', i) for i in range(3)],
+            )
+            self.conn.execute(
+                "INSERT INTO tasks (key, area_key, text, date_time_created, status, date_time_completed) "
+                "VALUES ('x1', 'a1', 'Task', 'now', 'complete', '2020-01-01')"
+            )
+
+    def stored(self):
+        return {(r[0], r[1]): tuple(r[2:]) for r in self.conn.execute('SELECT * FROM progress')}
+
+    def run_in_transaction(self, fn, *args):
+        with self.conn:
+            return fn(self.conn, *args)
+
+    def test_archived_tasks_still_count_as_done(self):
+        ordering = IndexOrdering()
+        Archiver(self.run_in_transaction, ordering, max_age_days=30).run_once()
+        # the objective left with its tasks; the area keeps its own task
+        self.assertEqual(self.stored(), {('areas', 'a1'): (0, 0, 0, 1)})
+        area = read_progress(self.conn)['areas']['a1']
+        self.assertEqual((area['total'], area['percent_complete']), (1, 100.0))
+
+        with self.conn:
+            restore_row(self.conn, ordering, 'objectives', 'o1')
+        self.assertEqual(self.stored(), {('areas', 'a1'): (0, 0, 0, 1), ('objectives', 'o1'): (0, 3, 0, 0)})
+        self.assertEqual(check_progress(self.conn), 0)
+
+    def test_check_repairs_drift(self):
+        self.assertEqual(
+            {key: tuple(counts.values()) for key, counts in expected_progress(self.conn).items()}, self.stored()
+        )
+        with self.conn:
+            self.conn.execute("UPDATE progress SET open = 5 WHERE entity = 'objectives'")
+            self.conn.execute("DELETE FROM progress WHERE entity = 'areas'")
+            self.conn.execute("INSERT INTO progress (entity, key, open) VALUES ('objectives', 'gone', 2)")
+        with self.conn:
+            self.assertEqual(check_progress(self.conn), 3)
+        self.assertEqual(self.stored(), {('areas', 'a1'): (0, 1, 0, 0), ('objectives', 'o1'): (0, 3, 0, 0)})
+
+
+if __name__ == '__main__':
+    unittest.main()
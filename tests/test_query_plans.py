@@ -0,0 +1,193 @@
+"""Fail when a route reads ``tasks`` or ``objectives`` without an index.
+
+A database is seeded with ``QUERY_AUDIT_TASKS`` tasks (default 10000) and
+every route that works on part of the board is exercised through a traced
+connection; each distinct statement is explained once per route.  Reads
+of the whole board (an unpaginated list, the whole ``/api/tree``)
+necessarily read whole tables and are not audited; pages of the whole
+list are.
+"""
+import os
+import sqlite3
+import tempfile
+import unittest
+
+import backend.app as app
+import backend.database as database
+from backend.metrics import InstrumentedConnection, RequestStats
+from backend.ordering import RankOrdering, spread_ranks
+from backend.tracing import QueryTracer
+from backend.utils import encode_cursor
+
+# built without schema setup, which would create tasks.db in the working
+# directory; every test points get_db at a database of its own
+app.app = app.create_app({'DATABASE_SETUP': False})
+
+QUERY_AUDIT_TASKS = int(os.environ.get('QUERY_AUDIT_TASKS', 10000))
+AREAS = 20
+OBJECTIVES_PER_AREA = 10
+
+
+def seed(path, tasks=QUERY_AUDIT_TASKS):
+    conn = database.connect(path)
+    now = '2021-01-01T00:00:00'
+    objectives = AREAS * OBJECTIVES_PER_AREA
+    with conn:
+        ranks = spread_ranks(max(AREAS, OBJECTIVES_PER_AREA, tasks))
+        conn.executemany(
+            'INSERT INTO areas (key, text, date_time_created, order_index, rank) VALUES (?, ?, ?, ?, ?)',
+            [(f'a{i}', f'Area {i}', now, i, ranks[i]) for i in range(AREAS)],
+        )
+        conn.executemany(
+            'INSERT INTO objectives (key, area_key, text, date_time_created, status, order_index, rank) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [(f'o{i}', f'a{i % AREAS}', f'Objective {i}', now, 'open', i // AREAS, ranks[i // AREAS])
+             for i in range(objectives)],
+        )
+        # a quarter of the tasks sit directly under an area
+        rows = []
+        for i in range(tasks):
+            if i % 4:
+                parent, index = (None, f'o{i % objectives}'), i // objectives
+            else:
+                parent, index = (f'a{i % AREAS}', None), i // AREAS
+            rows.append((f't{i}', *parent, f'Task {i} of the seeded board', now,
+                         'complete' if i % 3 == 0 else 'open', index, ranks[index]))
+        conn.executemany(
+            'INSERT INTO tasks (key, area_key, objective_key, text, date_time_created, status, order_index, rank) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            rows,
+        )
+    conn.close()
+
+
+class QueryPlanAuditTestCase(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.db_fd, cls.template = tempfile.mkstemp()
+        database.init_db(cls.template)
+        seed(cls.template)
+
+    @classmethod
+    def tearDownClass(cls):
+        os.close(cls.db_fd)
+        os.unlink(cls.template)
+
+    def setUp(self):
+        # every test works on its own copy of the seeded database
+        self.db_fd, self.db_path = tempfile.mkstemp()
+        source = sqlite3.connect(self.template)
+        target = sqlite3.connect(self.db_path)
+        source.backup(target)
+        source.close()
+        target.close()
+
+        self.connections = []
+
+        def get_traced_db():
+            conn = database.connect(self.db_path)
+            traced = InstrumentedConnection(conn, RequestStats(), traces=[])
+            self.connections.append(traced)
+            return traced
+        self.original_get_db = app.app.get_db
+        app.app.get_db = get_traced_db
+        self.original_get_pacific_time = app.app.get_pacific_time
+        app.app.get_pacific_time = lambda: "2021-01-01T00:00:00"
+        self.tracer = QueryTracer(slow_ms=float('inf'), audit=True)
+        self.client = app.app.test_client()
+
+    def tearDown(self):
+        app.app.get_db = self.original_get_db
+        app.app.get_pacific_time = self.original_get_pacific_time
+        os.close(self.db_fd)
+        os.unlink(self.db_path)
+
+    def call(self, method, url, **kwargs):
+        resp = self.client.open(url, method=method, **kwargs)
+        self.assertLess(resp.status_code, 500, f'{method} {url}: {resp.get_data(as_text=True)}')
+        explain_conn = database.connect(self.db_path)
+        for conn in self.connections:
+            self.tracer.finish(explain_conn, conn.traces, f"{method} {url.split('?')[0]}")
+            conn.connection.close()
+        explain_conn.close()
+        self.connections = []
+        return resp
+
+    def test_routes_use_indexes(self):
+        call = self.call
+        call('GET', '/api/areas?limit=5')
+        call('GET', '/api/objectives?area_key=a1')
+        call('GET', '/api/tasks?area_key=a1')
+        resp = call('GET', '/api/tasks?limit=5')
+        resp = call('GET', f"/api/tasks?limit=5&cursor={resp.headers['X-Next-Cursor']}")
+        # past the objectives' tasks, into those filed under areas
+        resp = call('GET', f"/api/tasks?limit=5&cursor={encode_cursor(['a0', None, -1, ''])}")
+        self.assertEqual([t['area_key'] for t in resp.get_json()], ['a0'] * 5)
+        call('GET', '/api/tasks?status=complete&limit=5')
+        resp = call('GET', '/api/tasks?objective_key=o1&status=open&limit=5')
+        call('GET', f"/api/tasks?objective_key=o1&limit=5&cursor={resp.headers['X-Next-Cursor']}")
+        call('GET', '/api/tree?area_key=a2')
+        call('GET', '/api/stats?area_key=a2')
+        call('GET', '/api/analytics?unit=week&area_key=a2')
+        call('GET', '/api/search?q=seed&status=open&limit=10')
+        version = call('GET', '/api/changes?limit=1').get_json()['version']
+        call('GET', f'/api/changes?since={version}&limit=100')
+
+        call('POST', '/api/areas', json={"key": "new-area", "text": "New"})
+        call('POST', '/api/objectives', json={"key": "new-obj", "area_key": "a1", "text": "New"})
+        call('POST', '/api/tasks', json={"key": "new-task", "text": "New", "objective_key": "o1"})
+        call('PATCH', '/api/tasks/t5', json={"text": "Edited"})
+        call('PATCH', '/api/tasks/t6', json={"status": "complete"})
+        call('PATCH', '/api/tasks/t7', json={"objective_key": "o2", "order_index": 3})
+        call('PATCH', '/api/tasks/t9', json={"area_key": "a3", "order_index": 0})
+        call('PATCH', '/api/objectives/o3', json={"order_index": 0})
+        call('PATCH', '/api/objectives/o4', json={"area_key": "a5", "order_index": 1})
+        call('PATCH', '/api/areas/a4', json={"text": "Renamed", "order_index": 0})
+        call('DELETE', '/api/tasks/t10')
+        call('DELETE', '/api/objectives/o6')
+        call('DELETE', '/api/areas/a7')
+        call('POST', '/api/undo')
+        call('POST', '/api/undo')
+        call('POST', '/api/redo')
+        call('GET', '/api/history')
+        call('POST', '/api/batch', json={"operations": [
+            {"op": "update", "entity": "tasks", "key": "t11", "data": {"order_index": 0}},
+            {"op": "delete", "entity": "tasks", "key": "t12"},
+            {"op": "create", "entity": "tasks", "key": "batch-task", "data": {"text": "B", "area_key": "a1"}},
+        ]})
+        call('POST', '/api/undo')
+
+        self.assertEqual(
+            self.tracer.violations, [],
+            'full scans:\n' + '\n'.join(f'{endpoint}: {line}\n    {" ".join(sql.split())}'
+                                        for endpoint, sql, line in self.tracer.violations),
+        )
+
+
+class RankQueryPlanAuditTestCase(QueryPlanAuditTestCase):
+    """The same audit with ORDERING_MODE=rank."""
+
+    def setUp(self):
+        super().setUp()
+        self.original_ordering = app.app.ordering
+        app.app.ordering = RankOrdering()
+
+    def tearDown(self):
+        app.app.ordering = self.original_ordering
+        super().tearDown()
+
+
+class FullScanTestCase(unittest.TestCase):
+    def test_detects_scans_through_aliases(self):
+        from backend.tracing import full_scans
+        sql = 'SELECT * FROM tasks t LEFT JOIN objectives o ON t.objective_key = o.key WHERE t.text = ?'
+        self.assertEqual(full_scans(sql, ['SCAN t', 'SEARCH o USING INDEX sqlite_autoindex_objectives_1 (key=?)']),
+                         ['SCAN t'])
+        self.assertEqual(full_scans(sql, ['SEARCH t USING INDEX idx_tasks_area_order (area_key=?)']), [])
+        # walking an index in order still visits every row
+        self.assertEqual(len(full_scans(sql, ['SCAN t USING INDEX idx_tasks_area_order'])), 1)
+        self.assertEqual(full_scans('SELECT * FROM areas', ['SCAN areas']), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import backend.database as database
+from backend.ordering import IndexOrdering
+from backend.readmodel import ReadModel
+
+
+class ReadModelTestCase(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+        self.path = os.path.join(self.dir, 'tasks.db')
+        database.init_db(self.path)
+        self.reader = database.connect(self.path)
+        self.writer = database.connect(self.path)
+        self.addCleanup(self.reader.close)
+        self.addCleanup(self.writer.close)
+        with self.writer:
+            self.writer.execute("INSERT INTO areas (key, text, date_time_created) VALUES ('a1', 'Area', 'now')")
+            self.writer.executemany(
+                "INSERT INTO tasks (key, area_key, text, date_time_created, order_index) VALUES (?, 'a1', ?, 'now', ?)",
+                [(f't{i}', f'task {i}', i) for i in range(50)],
+            )
+
+    def test_picks_up_writes_of_other_connections(self):
+        model = ReadModel()
+        items, _ = model.page(self.reader, 'tasks', {}, IndexOrdering())
+        self.assertEqual(len(items), 50)
+        loaded = model.stats()['rows_loaded']
+        # unchanged: no delta query at all
+        model.page(self.reader, 'tasks', {}, IndexOrdering())
+        self.assertEqual(model.stats()['refreshes'], 0)
+
+        with self.writer:
+            self.writer.execute("UPDATE tasks SET text = 'edited' WHERE key = 't7'")
+            self.writer.execute("DELETE FROM tasks WHERE key = 't9'")
+        items, _ = model.page(self.reader, 'tasks', {'limit': 10}, IndexOrdering())
+        self.assertEqual(items[7]['text'], 'edited')
+        self.assertNotIn('t9', [item['key'] for item in items])
+        stats = model.stats()
+        self.assertEqual((stats['refreshes'], stats['rows_loaded'] - loaded, stats['rows_deleted']), (1, 1, 1))
+        self.assertGreater(stats['bytes'], 0)
+
+    def test_falls_back_to_sql_when_too_large(self):
+        now = [0]
+        model = ReadModel(max_bytes=5000, retry=60, clock=lambda: now[0])
+        self.assertIsNone(model.page(self.reader, 'tasks', {}, IndexOrdering()))
+        stats = model.stats()
+        self.assertTrue(stats['overflowed'])
+        self.assertEqual((stats['bytes'], stats['rows']['tasks']), (0, 0))
+
+        # retried after the backoff, but only once the board changed
+        now[0] = 61
+        self.assertIsNone(model.page(self.reader, 'tasks', {}, IndexOrdering()))
+        with self.writer:
+            self.writer.execute("DELETE FROM tasks WHERE key != 't0'")
+        # the next retry waits twice as long
+        now[0] = 120
+        self.assertIsNone(model.page(self.reader, 'tasks', {}, IndexOrdering()))
+        now[0] = 182
+        items, _ = model.page(self.reader, 'tasks', {}, IndexOrdering())
+        self.assertEqual([item['key'] for item in items], ['t0'])
+        stats = model.stats()
+        self.assertEqual((stats['overflowed'], stats['overflows'], stats['rows']['tasks']), (False, 1, 1))
+
+
+if __name__ == '__main__':
+    unittest.main()
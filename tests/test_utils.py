@@ -22,6 +22,15 @@ class ParseJsonTestCase(unittest.TestCase):
             self.assertEqual(data, {'key': 'val'})
             self.assertIsNone(error)
 
+class CursorTestCase(unittest.TestCase):
+    def test_round_trip(self):
+        values = ['', 'o1', 3, 'task-key']
+        self.assertEqual(utils.decode_cursor(utils.encode_cursor(values)), values)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            utils.decode_cursor('not a cursor')
+
 class ShiftOrderTestCase(unittest.TestCase):
     def test_shift_after_delete(self):
         conn = sqlite3.connect(':memory:')